@@ -23,16 +23,21 @@ from __future__ import absolute_import
 
 import os
 import sys
+import copy
 import logging
 import argparse
+import threading
+import Queue
 from datetime import datetime
 import json
 from abc import ABCMeta, abstractmethod
 import psycopg2
 
 from ..datacube import DataCube
+from ..lock_manager import LockManager
 from ..cube_util import DatasetError, DatasetSkipError, parse_date_from_string
 from .collection import Collection
+from .tile_contents import WARP_ENGINES
 from .abstract_dataset import AbstractDataset
 from .abstract_bandstack import AbstractBandstack
 
@@ -59,6 +64,37 @@ class IngesterDataCube(DataCube):
         return self.my_args
 
 
+class IngestStatistics(object):
+    """Thread-safe counters for the ingest throughput summary."""
+
+    def __init__(self):
+        self.start_datetime = datetime.now()
+        self.dataset_count = 0
+        self.tile_count = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def add_dataset(self, tile_list):
+        """Record a successfully ingested dataset and the tiles it produced."""
+
+        tile_bytes = sum(_get_tile_bytes(tile_contents) for tile_contents in tile_list)
+        with self._lock:
+            self.dataset_count += 1
+            self.tile_count += len(tile_list)
+            self.bytes_written += tile_bytes
+
+    def log_summary(self):
+        """Log datasets/hour, tiles/hour and bytes written since start-up."""
+
+        elapsed_time = datetime.now() - self.start_datetime
+        elapsed_hours = max(elapsed_time.total_seconds(), 1.0) / 3600.0
+        LOGGER.info("Ingest throughput: %d datasets, %d tiles, %d bytes written in %s " +
+                    "(%.1f datasets/hour, %.1f tiles/hour, %.1f MB/hour).",
+                    self.dataset_count, self.tile_count, self.bytes_written, elapsed_time,
+                    self.dataset_count / elapsed_hours, self.tile_count / elapsed_hours,
+                    self.bytes_written / elapsed_hours / (1024 * 1024))
+
+
 class AbstractIngester(object):
     """
     Partially abstract base class for ingester objects. Needs to
@@ -77,6 +113,7 @@ class AbstractIngester(object):
     #
 
     CATALOG_MAX_TRIES = 3  # Max no. of attempts for the catalog transaction.
+    STAGE_END = None  # Sentinel put on the tile queue to stop a tile stage worker.
 
     #
     # Constructor
@@ -95,6 +132,7 @@ class AbstractIngester(object):
             using self.datacube.
         """
         self.ingestion_start_datetime = datetime.now()
+        self.ingest_statistics = IngestStatistics()
         
         self.args = self.arg_parser().parse_args()
 
@@ -156,6 +194,26 @@ class AbstractIngester(object):
         _arg_parser.add_argument('--synctype', dest='sync_type',
                                  default=None, help=sync_type_help)
 
+        warp_engine_help = 'Tile reprojection engine: "gdalwarp" runs a'\
+            ' gdalwarp subprocess per tile, "gdal" warps all tiles of a'\
+            ' dataset in-process from one open band stack.'
+        _arg_parser.add_argument('--warpengine', dest='warp_engine',
+                                 default=None, choices=WARP_ENGINES,
+                                 help=warp_engine_help)
+
+        tiling_workers_help = 'Number of worker threads used to reproject'\
+            ' the tile footprints of a dataset concurrently (default 1).'
+        _arg_parser.add_argument('--tilingworkers', dest='tiling_workers',
+                                 default=None, type=int,
+                                 help=tiling_workers_help)
+
+        ingest_workers_help = 'Number of datasets ingested concurrently. Each'\
+            ' worker has its own database connection; catalogued datasets are'\
+            ' passed to the tiling workers through a bounded queue (default 1).'
+        _arg_parser.add_argument('--ingestworkers', dest='ingest_workers',
+                                 default=None, type=int,
+                                 help=ingest_workers_help)
+
         return _arg_parser
 
     #
@@ -176,10 +234,15 @@ class AbstractIngester(object):
 
         dataset_list = self.preprocess_dataset(dataset_list)
 
-        for dataset_path in dataset_list:
-            self.ingest_individual_dataset(dataset_path)
+        workers = min(self.get_ingest_workers(), len(dataset_list))
+        if workers > 1:
+            self.ingest_concurrently(dataset_list, workers)
+        else:
+            for dataset_path in dataset_list:
+                self.ingest_individual_dataset(dataset_path)
 
         self.log_ingestion_process_complete(source_dir, datetime.now() - start_datetime)
+        self.ingest_statistics.log_summary()
 
     def ingest_individual_dataset(self, dataset_path):
         """Ingests a single dataset at 'dataset_path' into the collection.
@@ -198,7 +261,7 @@ class AbstractIngester(object):
 
             dataset_record = self.catalog(dataset)
 
-            self.tile(dataset_record, dataset)
+            tile_list = self.tile(dataset_record, dataset)
 
             #self.mosaic(dataset_record)
 
@@ -213,6 +276,167 @@ class AbstractIngester(object):
             LOGGER.error('Unexpected error during path %r', dataset_path)
             raise
         else:
+            self.ingest_statistics.add_dataset(tile_list or [])
+            self.log_dataset_ingest_complete(dataset_path, datetime.now() - start_datetime)
+
+    def ingest_concurrently(self, dataset_list, workers):
+        """Ingest the datasets in 'dataset_list' with 'workers' concurrent workers.
+
+        Ingestion is split into two stages joined by a bounded queue. The
+        catalog stage opens, checks and catalogs each dataset; the tile stage
+        tiles and stores the catalogued datasets. Each stage runs 'workers'
+        threads, and every thread is a shallow copy of this ingester with its
+        own datacube (sharing this ingester's configuration), database
+        connection, collection and lock owner id. The queue holds at most
+        'workers' catalogued datasets, so cataloguing cannot run far ahead
+        of tiling.
+
+        DatasetErrors and DatasetSkipErrors are logged and skipped as for
+        ingest_individual_dataset. Any other exception stops the scheduler
+        (work in progress is allowed to finish) and is re-raised.
+        """
+
+        LOGGER.info('Ingesting %d datasets with %d concurrent workers',
+                    len(dataset_list), workers)
+
+        path_queue = Queue.Queue()
+        for dataset_path in dataset_list:
+            path_queue.put(dataset_path)
+        tile_queue = Queue.Queue(maxsize=workers)
+
+        abort_event = threading.Event()
+        error_list = []
+
+        def run_catalog_stage(worker):
+            while not abort_event.is_set():
+                try:
+                    dataset_path = path_queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    catalogued = worker.catalog_stage(dataset_path)
+                except Exception as err:
+                    error_list.append(err)
+                    abort_event.set()
+                    break
+                if catalogued is not None:
+                    tile_queue.put(catalogued)
+
+        def run_tile_stage(worker):
+            while True:
+                catalogued = tile_queue.get()
+                if catalogued is self.STAGE_END:
+                    break
+                if abort_event.is_set():
+                    continue  # Keep draining so catalog workers are not blocked
+                try:
+                    worker.tile_stage(*catalogued)
+                except Exception as err:
+                    error_list.append(err)
+                    abort_event.set()
+
+        catalog_workers = [self.create_worker(index) for index in range(workers)]
+        tile_workers = [self.create_worker(workers + index) for index in range(workers)]
+
+        catalog_threads = [threading.Thread(target=run_catalog_stage, args=(worker,),
+                                            name='catalog-%d' % index)
+                           for (index, worker) in enumerate(catalog_workers)]
+        tile_threads = [threading.Thread(target=run_tile_stage, args=(worker,),
+                                         name='tile-%d' % index)
+                        for (index, worker) in enumerate(tile_workers)]
+
+        try:
+            for thread in catalog_threads + tile_threads:
+                thread.start()
+
+            for thread in catalog_threads:
+                thread.join()
+
+            for dummy_thread in tile_threads:
+                tile_queue.put(self.STAGE_END)
+
+            for thread in tile_threads:
+                thread.join()
+        finally:
+            for worker in catalog_workers + tile_workers:
+                worker.collection.cleanup()
+                worker.datacube.db_connection.close()
+                worker.datacube.db_connection = None
+                worker.datacube.lock_manager.close()
+
+        if error_list:
+            raise error_list[0]
+
+    def create_worker(self, worker_index):
+        """Return a copy of this ingester for use by a scheduler worker thread.
+
+        The copy shares this ingester's arguments, configuration and
+        statistics, but has its own database connection, collection
+        (transaction stack and temporary tile directory), lock owner id and
+        lock manager (advisory locks are held per database session).
+        """
+
+        worker_datacube = copy.copy(self.datacube)
+        worker_datacube.process_id = '%s:%d' % (self.datacube.process_id, worker_index)
+        worker_datacube.db_connection = worker_datacube.create_connection()
+        worker_datacube.lock_manager = LockManager(worker_datacube)
+
+        worker = copy.copy(self)
+        worker.datacube = worker_datacube
+        worker.collection = Collection(worker_datacube)
+
+        return worker
+
+    def catalog_stage(self, dataset_path):
+        """Scheduler catalog stage: open, check and catalog one dataset.
+
+        Returns a (dataset_path, dataset, dataset_record, start_datetime)
+        tuple for the tile stage, or None if the dataset was skipped.
+        """
+
+        start_datetime = datetime.now()
+        try:
+            dataset = self.open_dataset(dataset_path)
+
+            self.collection.check_metadata(dataset)
+
+            self.filter_on_metadata(dataset)
+
+            dataset_record = self.catalog(dataset)
+
+        except DatasetError as err:
+            self.log_dataset_fail(dataset_path, err, datetime.now() - start_datetime)
+
+        except DatasetSkipError as err:
+            self.log_dataset_skip(dataset_path, err, datetime.now() - start_datetime)
+
+        except:
+            LOGGER.error('Unexpected error during path %r', dataset_path)
+            raise
+        else:
+            return dataset_path, dataset, dataset_record, start_datetime
+
+        return None
+
+    def tile_stage(self, dataset_path, dataset, dataset_record, start_datetime):
+        """Scheduler tile stage: tile and store one catalogued dataset."""
+
+        try:
+            dataset_record.set_collection(self.collection)
+
+            tile_list = self.tile(dataset_record, dataset)
+
+        except DatasetError as err:
+            self.log_dataset_fail(dataset_path, err, datetime.now() - start_datetime)
+
+        except DatasetSkipError as err:
+            self.log_dataset_skip(dataset_path, err, datetime.now() - start_datetime)
+
+        except:
+            LOGGER.error('Unexpected error during path %r', dataset_path)
+            raise
+        else:
+            self.ingest_statistics.add_dataset(tile_list or [])
             self.log_dataset_ingest_complete(dataset_path, datetime.now() - start_datetime)
 
     def filter_on_metadata(self, dataset):
@@ -262,7 +486,10 @@ class AbstractIngester(object):
         return dataset_record
 
     def tile(self, dataset_record, dataset):
-        """Create tiles for a newly created or updated dataset."""
+        """Create tiles for a newly created or updated dataset.
+
+        Returns the list of stored tile contents.
+        """
 
         tile_list = []
         for tile_type_id in dataset_record.list_tile_types():
@@ -279,6 +506,8 @@ class AbstractIngester(object):
             with self.collection.transaction():
                 dataset_record.store_tiles(tile_list)
 
+        return tile_list
+
     def mosaic(self, dataset_record):
         """Create mosaics for a newly tiled dataset."""
 
@@ -408,6 +637,21 @@ class AbstractIngester(object):
 
         return min_row, max_row
 
+    def get_ingest_workers(self):
+        """Return the number of datasets to ingest concurrently.
+
+        This is the 'ingest_workers' value from the config file or command
+        line (--ingestworkers). It defaults to 1, which ingests the datasets
+        one at a time in this process.
+        """
+
+        try:
+            workers = int(self.datacube.ingest_workers)
+        except (AttributeError, TypeError, ValueError):
+            workers = 1
+
+        return max(workers, 1)
+
     def get_tile_type_set(self):
         """Return the allowable tile types for an ingest as a set.
 
@@ -495,6 +739,15 @@ class AbstractIngester(object):
     # pylint: enable=missing-docstring, no-self-use
 
 
+def _get_tile_bytes(tile_contents):
+    """Return the size in bytes of a stored tile file (0 if it is not there)."""
+
+    try:
+        return os.path.getsize(tile_contents.get_output_path())
+    except (AttributeError, OSError):
+        return 0
+
+
 def _find_files(source_path, matcher):
     """
     Find source files in the given path that return true using the given matcher.
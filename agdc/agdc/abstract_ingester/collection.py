@@ -31,11 +31,12 @@ from __future__ import absolute_import
 import logging
 import os
 import time
+import random
 import shutil
 import re
 
 from ..cube_util import DatasetError, create_directory
-from .tile_contents import TileContents
+from .tile_contents import TileContents, WARP_ENGINE_GDALWARP
 from .acquisition_record import AcquisitionRecord
 from .ingest_db_wrapper import IngestDBWrapper
 
@@ -197,10 +198,34 @@ class Collection(object):
             tile_type_info,
             tile_footprint,
             self.get_temp_tile_directory(),
-            band_stack
+            band_stack,
+            warp_engine=self.get_warp_engine()
         )
         return tile_contents
 
+    def get_warp_engine(self):
+        """Return the warp engine used to reproject tiles.
+
+        This is the 'warp_engine' value from the config file or command
+        line (--warpengine), defaulting to a gdalwarp subprocess per tile.
+        """
+
+        return getattr(self.datacube, 'warp_engine', None) or WARP_ENGINE_GDALWARP
+
+    def get_tiling_workers(self):
+        """Return the number of worker threads used to tile each dataset.
+
+        This is the 'tiling_workers' value from the config file or command
+        line (--tilingworkers), defaulting to 1 (serial tiling).
+        """
+
+        try:
+            workers = int(self.datacube.tiling_workers)
+        except (AttributeError, TypeError, ValueError):
+            workers = 1
+
+        return max(workers, 1)
+
     def current_transaction(self):
         """Returns the current transaction."""
 
@@ -453,6 +478,11 @@ class Lock(object):
     locks. It handles acquiring and releasing the locks as well as
     waiting and retries if the locks cannot be acquired.
 
+    The whole list is locked (or not) in one call to the datacube's lock
+    manager. Between tries the wait grows exponentially from min_wait up to
+    wait, with random jitter so that competing processes do not retry in
+    step.
+
     Not that this will not work for nested locks/with statements in the
     same process that attempt to lock the same object, because the
     locking mechanism  does not count the number of times an object has
@@ -460,13 +490,15 @@ class Lock(object):
     """
 
     DEFAULT_WAIT = 10
-    DEFAULT_RETRIES = 6
+    DEFAULT_MIN_WAIT = 0.25
+    DEFAULT_RETRIES = 15
 
     def __init__(self,
                  datacube,
                  lock_list,
                  wait=DEFAULT_WAIT,
-                 retries=DEFAULT_RETRIES):
+                 retries=DEFAULT_RETRIES,
+                 min_wait=DEFAULT_MIN_WAIT):
 
         """Initialise the lock object.
 
@@ -477,19 +509,20 @@ class Lock(object):
                 that is being locked.
 
         Keyword Arguments:
-            wait: The amount of time to wait, in seconds, before again trying
-                to acquire the locks.
+            wait: The maximum amount of time to wait, in seconds, before
+                again trying to acquire the locks.
             retries: The maximum number of attempts before giving up and
                 raising an exception.
+            min_wait: The upper limit of the (random) wait before the first
+                retry. This doubles with each retry up to 'wait'.
         """
 
         self.datacube = datacube
         # Sort the list so that locks are always acquired in the same order.
-        # This avoids mini-deadlocks and resulting retries when acquiring
-        # multiple locks.
         self.lock_list = sorted(lock_list)
         self.wait = wait
         self.retries = retries
+        self.min_wait = min_wait
 
     def __enter__(self):
         """Auto-called on 'with' statement entry.
@@ -502,16 +535,15 @@ class Lock(object):
         clause (though there are no interface methods at the moment).
         """
 
-        for dummy_tries in range(self.retries + 1):
-            try:
-                self.__acquire_locks(self.lock_list)
+        for tries in range(self.retries + 1):
+            if self.datacube.lock_objects(self.lock_list):
                 break
-            except LockError:
-                time.sleep(self.wait)
+            if tries < self.retries:
+                time.sleep(self.get_backoff(tries))
         else:
             raise LockError(("Unable to lock objects after %s tries: " %
                              self.retries) +
-                            self.lock_list)
+                            ', '.join(self.lock_list))
 
         return self
 
@@ -523,37 +555,16 @@ class Lock(object):
         exception to be re-raised.
         """
 
-        for object_to_unlock in self.lock_list:
-            self.datacube.unlock_object(object_to_unlock)
+        self.datacube.unlock_objects(self.lock_list)
 
-    def __acquire_locks(self, lock_list):
-        """Acquire all the locks on the lock_list.
+    def get_backoff(self, tries):
+        """Return the time to wait after failed try number 'tries' (from 0).
 
-        Either sucessfully acquires *all* the locks or raises a
-        LockError and releases all the locks obtained so far.
+        This is "full jitter" exponential backoff: a random time up to
+        min_wait * 2**tries, capped at wait.
         """
 
-        # Recursive algorithm.
-        #
-        # If the list is empty do nothing, otherwise ...
-        if lock_list:
-            # See if we can lock the object at the head of the list ...
-            if self.datacube.lock_object(lock_list[0]):
-                # If yes, then attempt to lock the rest (tail) of the list
-                # using a recursive call ...
-                try:
-                    self.__acquire_locks(lock_list[1:])
-                except:
-                    # If locking the tail does not work then release the
-                    # lock we have on the head, and re-raise the exception.
-                    self.datacube.unlock_object(lock_list[0])
-                    raise
-            else:
-                # If we cannot lock the head then raise an exception
-                # (which will cause all previous calls in the chain to
-                # release their locks and re-raise the exception, in reverse
-                # order).
-                raise LockError()
+        return random.uniform(0, min(self.wait, self.min_wait * 2 ** tries))
 
 
 #
@@ -31,7 +31,10 @@ from __future__ import absolute_import
 import logging
 import os
 import re
+import sys
+from datetime import timedelta
 from math import floor
+from multiprocessing.pool import ThreadPool
 
 from osgeo import osr
 
@@ -41,6 +44,7 @@ from .ingest_db_wrapper import TC_PENDING, TC_SINGLE_SCENE, TC_SUPERSEDED
 from .ingest_db_wrapper import TC_MOSAIC
 from .mosaic_contents import MosaicContents
 from .tile_record import TileRecord, TileRepository
+from .tile_contents import release_warp_source
 
 
 # Set up logger.
@@ -103,6 +107,18 @@ class DatasetRecord(object):
 
         self.dataset_id = self.dataset_dict['dataset_id']
 
+    def set_collection(self, collection):
+        """Attach the record to another collection and its database connection.
+
+        This is used by the concurrent ingest scheduler to hand a dataset
+        catalogued by one worker over to the worker which tiles it, so that
+        the tile records are written inside the tiling worker's transaction.
+        """
+
+        self.collection = collection
+        self.datacube = collection.datacube
+        self.db = IngestDBWrapper(self.datacube.db_connection)
+
     def remove_mosaics(self, dataset_filter):
         """Remove mosaics associated with the dataset.
 
@@ -162,6 +178,8 @@ class DatasetRecord(object):
                 if os.path.isfile(mosaic_pathname):
                     self.collection.mark_tile_for_removal(mosaic_pathname)
 
+        self.db.refresh_tile_index(dataset_filter)
+
     def remove_tiles(self):
         """Remove the tiles associated with the dataset.
 
@@ -178,6 +196,8 @@ class DatasetRecord(object):
             self.db.remove_tile_record(tile_id)
             self.collection.mark_tile_for_removal(tile_pathname)
 
+        self.db.refresh_tile_index([self.dataset_id])
+
     def update(self):
         """Update the dataset record in the database.
 
@@ -191,25 +211,41 @@ class DatasetRecord(object):
     def make_tiles(self, tile_type_id, band_stack):
         """Tile the dataset, returning a list of tile_content objects.
 
+        Tile footprints are independent of each other until store_tiles is
+        called, so if the collection allows more than one tiling worker they
+        are reprojected concurrently in a thread pool (gdalwarp subprocesses
+        and in-process GDAL warps both run outside the GIL). The returned list
+        is in footprint order whichever mode is used.
+
         :rtype list of TileContents
         """
 
-        tile_list = []
         tile_footprint_list = sorted(self.get_coverage(tile_type_id))
         LOGGER.info('%d tile footprints cover dataset', len(tile_footprint_list))
 
-        for tile_footprint in tile_footprint_list:
-            tile_contents = self.collection.create_tile_contents(
-                tile_type_id,
-                tile_footprint,
-                band_stack
-                )
-            tile_contents.reproject()
+        workers = min(self.collection.get_tiling_workers(), len(tile_footprint_list))
 
-            if tile_contents.has_data():
-                tile_list.append(tile_contents)
+        try:
+            if workers > 1:
+                LOGGER.info('Tiling with %d worker threads', workers)
+                tile_result_list = self.__make_tiles_in_pool(
+                    tile_type_id, band_stack, tile_footprint_list, workers)
             else:
-                tile_contents.remove()
+                tile_result_list = [self.__make_one_tile(tile_type_id, tile_footprint, band_stack)
+                                    for tile_footprint in tile_footprint_list]
+        finally:
+            release_warp_source(band_stack)
+
+        warp_time_list = [tile_contents.warp_time for (tile_contents, _) in tile_result_list
+                          if getattr(tile_contents, 'warp_time', None) is not None]
+        if warp_time_list:
+            total_warp_time = sum(warp_time_list, timedelta())
+            LOGGER.info('%d tiles warped in %s (mean %s, max %s per tile)',
+                        len(warp_time_list), total_warp_time,
+                        total_warp_time / len(warp_time_list), max(warp_time_list))
+
+        tile_list = [tile_contents for (tile_contents, has_data) in tile_result_list
+                     if has_data]
 
         LOGGER.info('%d non-empty tiles created', len(tile_list))
         return tile_list
@@ -219,11 +255,17 @@ class DatasetRecord(object):
 
         'tile_list' is a list of tile_contents objects. This
         method will create the corresponding database records and
-        mark tiles for creation when the transaction commits.
+        mark tiles for creation when the transaction commits. The
+        records are persisted as one batch (see TileRepository.persist_tiles)
+        and the tile index rows of the acquisition are refreshed.
 
         :type tile_list: list of TileContents
         """
-        return [self.create_tile_record(tile_contents) for tile_contents in tile_list]
+        tile_record_list = [self.__make_tile_record(tile_contents)
+                            for tile_contents in tile_list]
+        TileRepository(self.collection).persist_tiles(tile_record_list)
+        self.db.refresh_tile_index([self.dataset_id])
+        return tile_record_list
 
     def create_mosaics(self, dataset_filter):
         """Create mosaics associated with the dataset.
@@ -260,6 +302,8 @@ class DatasetRecord(object):
                 for tr in tile_record_list:
                     self.db.update_tile_class(tr['tile_id'], TC_SINGLE_SCENE)
 
+        self.db.refresh_tile_index(dataset_filter)
+
     def get_removal_overlaps(self):
         """Returns a list of overlapping dataset ids for mosaic removal."""
 
@@ -299,8 +343,14 @@ class DatasetRecord(object):
 
         The created object will be responsible for inserting tile table records
         into the database for reprojected or mosaiced tiles."""
+        tile = self.__make_tile_record(tile_contents)
+        TileRepository(self.collection).persist_tile(tile)
+        return tile
+
+    def __make_tile_record(self, tile_contents):
+        """Mark a tile for creation and return its (unpersisted) TileRecord."""
         self.collection.mark_tile_for_creation(tile_contents)
-        tile = TileRecord(
+        return TileRecord(
             self.dataset_id,
             tile_footprint=tile_contents.tile_footprint,
             tile_type_id=tile_contents.tile_type_id,
@@ -308,8 +358,6 @@ class DatasetRecord(object):
             size_mb=tile_contents.get_output_size_mb(),
             tile_extents=tile_contents.tile_extents
         )
-        TileRepository(self.collection).persist_tile(tile)
-        return tile
 
     def mark_as_tiled(self):
         """Flag the dataset record as tiled in the database.
@@ -362,6 +410,66 @@ class DatasetRecord(object):
     # worker methods
     #
 
+    def __make_one_tile(self, tile_type_id, tile_footprint, band_stack):
+        """Reproject one tile footprint and check it for data.
+
+        Returns a (tile_contents, has_data) tuple. Empty tiles, and tiles
+        that fail part way through, are cleaned up with TileContents.remove().
+        """
+
+        tile_contents = self.collection.create_tile_contents(
+            tile_type_id,
+            tile_footprint,
+            band_stack
+            )
+        try:
+            tile_contents.reproject()
+            has_data = tile_contents.has_data()
+        except:
+            tile_contents.remove()
+            raise
+
+        if not has_data:
+            tile_contents.remove()
+
+        return tile_contents, has_data
+
+    def __make_tiles_in_pool(self, tile_type_id, band_stack, tile_footprint_list, workers):
+        """Run __make_one_tile for each footprint in a pool of worker threads.
+
+        All footprints are allowed to finish. If any of them failed, the
+        tiles which did succeed are removed and the first error is re-raised,
+        so the caller sees the same outcome as a failure in serial tiling.
+        """
+
+        pool = ThreadPool(workers)
+        try:
+            async_result_list = [pool.apply_async(self.__make_one_tile,
+                                                  (tile_type_id, tile_footprint, band_stack))
+                                 for tile_footprint in tile_footprint_list]
+            pool.close()
+            pool.join()
+        finally:
+            pool.terminate()
+
+        tile_result_list = []
+        first_exc_info = None
+        for tile_footprint, async_result in zip(tile_footprint_list, async_result_list):
+            try:
+                tile_result_list.append(async_result.get())
+            except Exception as err:
+                LOGGER.error('Tiling failed for tile %s: %s', tile_footprint, err)
+                first_exc_info = first_exc_info or sys.exc_info()
+
+        if first_exc_info is not None:
+            for tile_contents, has_data in tile_result_list:
+                if has_data:
+                    tile_contents.remove()
+            # Re-raise with the traceback it was caught with
+            raise first_exc_info[0], first_exc_info[1], first_exc_info[2]
+
+        return tile_result_list
+
     def __check_update_ok(self):
         """Checks if an update is possible, raises a DatasetError otherwise.
 
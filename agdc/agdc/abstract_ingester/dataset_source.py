@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+"""
+    dataset_source.py - access to the files making up a dataset.
+
+    A dataset is either a directory on disk (DirectorySource) or an ESPA
+    surface reflectance archive read in place through GDAL's /vsitar/ and
+    /vsigzip/ virtual file systems (ArchiveSource). Both present the same
+    interface to the dataset classes: a list of file names, a GDAL-readable
+    path for each file, the file contents and the dataset size.
+"""
+from __future__ import absolute_import
+
+import os
+import re
+import logging
+
+from osgeo import gdal
+
+from EOtools.execute import execute
+from ..cube_util import DatasetError
+from ..pqa_builder import build_pqa
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Constants
+#
+
+ARCHIVE_EXTENSIONS = ('.tar.gz', '.tgz', '.tar')
+
+# Renames applied to *.tif archive members so that they match the band
+# file patterns of a staged (untarred) dataset. These are the renames done
+# by ingest_dir.sh: sr_band -> B, then .tif -> 0.TIF (LS5/LS7) or .TIF (LS8).
+LS57_RENAME_RULES = ((r'sr_band', 'B'), (r'\.tif', '0.TIF'))
+LS8_RENAME_RULES = ((r'sr_band', 'B'), (r'\.tif', '.TIF'))
+
+XML_MEMBER_PATTERN = r'\w*\.xml$'
+PQA_FILE_PATTERN = r'%s_PQA_\w*\.tif$'
+
+#
+# Utility functions
+#
+
+
+def is_archive(path):
+    """Return True if path looks like a dataset archive."""
+
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def vsi_archive_path(archive_path):
+    """Return the GDAL virtual file system path for the root of an archive.
+
+    Gzipped archives are chained through /vsigzip/ so that GDAL decompresses
+    them as a stream rather than needing them staged on disk.
+    """
+
+    archive_path = os.path.abspath(archive_path)
+    if archive_path.lower().endswith(('.gz', '.tgz')):
+        return '/vsitar//vsigzip/' + archive_path
+    return '/vsitar/' + archive_path
+
+
+def get_scene_id(filename_list):
+    """Return the scene id (e.g. LE71130802015092ASA00) for a list of ESPA files.
+
+    This is the leading run of upper case letters and digits of the first
+    file name, as used by ingest_dir.sh.
+    """
+
+    for filename in sorted(filename_list):
+        match = re.match(r'([A-Z0-9]+)', os.path.basename(filename))
+        if match:
+            return match.group(1)
+
+    raise DatasetError('Unable to find a scene id in %s' % filename_list)
+
+
+def find_archive_datasets(archive_list, pqa_dir=None):
+    """Find the datasets in a list of ESPA archives.
+
+    Each archive gives a surface reflectance dataset (the archive path). If
+    pqa_dir is given, the PQA file for the archive's scene is also a
+    dataset: its metadata is read from the archive. PQA files missing from
+    pqa_dir are built from the archive's masks.
+
+    Returns a tuple (dataset_list, pqa_archive_dict), where pqa_archive_dict
+    maps each PQA dataset path to its archive.
+    """
+
+    dataset_list = []
+    pqa_archive_dict = {}
+
+    for archive_path in archive_list:
+        archive_path = os.path.abspath(archive_path)
+        if not is_archive(archive_path):
+            LOGGER.warning('Skipping %s: not a dataset archive', archive_path)
+            continue
+
+        dataset_list.append(archive_path)
+
+        if pqa_dir:
+            source = ArchiveSource(archive_path)
+            scene_id = get_scene_id(source.list_files())
+            pqa_list = [filename for filename in os.listdir(pqa_dir)
+                        if re.match(PQA_FILE_PATTERN % scene_id, filename)]
+            if pqa_list:
+                pqa_path = os.path.join(os.path.abspath(pqa_dir), pqa_list[0])
+            else:
+                try:
+                    pqa_path = build_pqa(source.vsi_path + '/' + scene_id,
+                                         os.path.abspath(pqa_dir))
+                except DatasetError as err:
+                    LOGGER.warning('No PQA for scene %s: %s', scene_id, err)
+                    continue
+            dataset_list.append(pqa_path)
+            pqa_archive_dict[pqa_path] = archive_path
+
+    return dataset_list, pqa_archive_dict
+
+
+def open_archive_source(dataset_path, pqa_archive_dict, rename_rules):
+    """Return the ArchiveSource for a dataset found by find_archive_datasets."""
+
+    archive_path = pqa_archive_dict.get(dataset_path)
+    if archive_path is None:
+        # Surface reflectance dataset: all archive members, renamed
+        return ArchiveSource(dataset_path, rename_rules=rename_rules)
+
+    # PQA dataset: the built PQA file plus the archive's XML metadata
+    return ArchiveSource(archive_path,
+                         member_pattern=XML_MEMBER_PATTERN,
+                         extra_files={os.path.basename(dataset_path): dataset_path})
+
+
+def _rename(filename, rename_rules):
+    """Apply rename rules to a .tif file name (first match of each rule only)."""
+
+    if not filename.lower().endswith('.tif'):
+        return filename
+
+    for pattern, replacement in rename_rules:
+        filename = re.sub(pattern, replacement, filename, count=1)
+
+    return filename
+
+#
+# Dataset source classes
+#
+
+
+class DirectorySource(object):
+    """Dataset files in a directory on disk."""
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+
+    def is_valid(self):
+        """Return True if the dataset directory exists."""
+        return os.path.isdir(self.dataset_dir)
+
+    def list_files(self):
+        """Return the names of the files in the dataset."""
+        return os.listdir(self.dataset_dir)
+
+    def get_path(self, filename):
+        """Return a GDAL-readable path for a file in the dataset."""
+        return os.path.join(self.dataset_dir, filename)
+
+    def read_file(self, filename):
+        """Return the contents of a file in the dataset."""
+        with open(self.get_path(filename), 'rb') as dataset_file:
+            return dataset_file.read()
+
+    def get_size_kb(self):
+        """The size of the dataset in kilobytes as an integer."""
+        command = "du -sk %s | cut -f1" % self.dataset_dir
+        LOGGER.debug('executing "%s"', command)
+        result = execute(command)
+
+        if result['returncode'] != 0:
+            raise DatasetError('Unable to calculate directory size: ' +
+                               '"%s" failed: %s' % (command, result['stderr']))
+
+        LOGGER.debug('stdout = %s', result['stdout'])
+
+        return int(result['stdout'])
+
+
+class ArchiveSource(object):
+    """Dataset files read in place from a (gzipped) tar archive.
+
+    Nothing is extracted to disk: file paths are GDAL /vsitar/ paths and
+    file contents are read with the GDAL VSI file functions. Member names
+    can be renamed (see _rename) so that they match the band file patterns
+    expected for a staged dataset, restricted to those matching
+    member_pattern, and supplemented with extra files on disk (e.g. a PQA
+    file built from the archive).
+    """
+
+    def __init__(self, archive_path, rename_rules=(), member_pattern=None, extra_files=None):
+        self.archive_path = os.path.abspath(archive_path)
+        self.vsi_path = vsi_archive_path(self.archive_path)
+
+        member_list = gdal.ReadDir(self.vsi_path)
+        if member_list is None:
+            raise DatasetError('Unable to read archive %s' % self.archive_path)
+
+        self._path_dict = {}
+        for member in member_list:
+            if member.endswith('/') or member in ('.', '..'):
+                continue
+            if member_pattern and not re.match(member_pattern, member):
+                continue
+            self._path_dict[_rename(member, rename_rules)] = self.vsi_path + '/' + member
+
+        self._extra_files = dict(extra_files or {})
+        self._path_dict.update(self._extra_files)
+
+    def is_valid(self):
+        """Return True if the archive exists."""
+        return os.path.isfile(self.archive_path)
+
+    def list_files(self):
+        """Return the (renamed) names of the files in the dataset."""
+        return sorted(self._path_dict.keys())
+
+    def get_path(self, filename):
+        """Return a GDAL-readable path for a file in the dataset."""
+        return self._path_dict[filename]
+
+    def read_file(self, filename):
+        """Return the contents of a file in the dataset."""
+        path = self.get_path(filename)
+
+        handle = gdal.VSIFOpenL(path, 'rb')
+        if handle is None:
+            raise DatasetError('Unable to open %s' % path)
+        try:
+            gdal.VSIFSeekL(handle, 0, os.SEEK_END)
+            size = gdal.VSIFTellL(handle)
+            gdal.VSIFSeekL(handle, 0, os.SEEK_SET)
+            return gdal.VSIFReadL(1, size, handle)
+        finally:
+            gdal.VSIFCloseL(handle)
+
+    def get_size_kb(self):
+        """The size of the dataset in kilobytes as an integer.
+
+        This is the (compressed) archive size plus any extra files.
+        """
+        size = os.path.getsize(self.archive_path)
+        size += sum(os.path.getsize(path) for path in self._extra_files.values())
+        return int(size / 1024)
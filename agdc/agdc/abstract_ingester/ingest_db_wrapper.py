@@ -35,6 +35,7 @@ from __future__ import absolute_import
 
 import logging
 import datetime
+import psycopg2.extras
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from psycopg2.extensions import ISOLATION_LEVEL_READ_COMMITTED
 
@@ -106,6 +107,28 @@ class IngestDBWrapper(dbutil.ConnectionWrapper):
 
         return result
 
+    def execute_sql_values(self, sql, argslist, template=None):
+        """Executes an sql command with a multi-row VALUES list.
+
+        The operation string 'sql' contains a single '%s' placeholder,
+        which is expanded to a VALUES list built from the sequence of
+        rows 'argslist' (formatted by 'template', see
+        psycopg2.extras.execute_values). All rows are sent in one
+        statement. Returns a list of the rows returned by the command
+        (e.g. by a RETURNING clause), or an empty list."""
+
+        if not argslist:
+            return []
+
+        cur = self.conn.cursor()
+        self.log_sql(sql)
+        psycopg2.extras.execute_values(cur, sql, argslist,
+                                       template=template,
+                                       page_size=len(argslist))
+        result = cur.fetchall() if cur.description else []
+
+        return result
+
     @staticmethod
     def log_sql(sql_query_string):
         """Logs an sql query to the logger at debug level.
@@ -563,6 +586,76 @@ class IngestDBWrapper(dbutil.ConnectionWrapper):
                "RETURNING x_index;")
         self.execute_sql_single(sql, footprint_dict)
 
+    def get_tile_ids(self, tile_key_list):
+        """Finds the ids of a batch of tile records in the database.
+
+        tile_key_list is a list of (dataset_id, x_index, y_index,
+        tile_type_id) tuples. Returns a dictionary mapping the keys
+        matching a tile record to its tile_id. Keys with no tile record
+        are left out."""
+
+        if not tile_key_list:
+            return {}
+
+        sql = ("SELECT dataset_id, x_index, y_index, tile_type_id, tile_id\n" +
+               "FROM tile\n" +
+               "WHERE (dataset_id, x_index, y_index, tile_type_id) IN\n" +
+               "    %(tile_key_list)s;")
+        params = {'tile_key_list': tuple(tile_key_list)}
+        result = self.execute_sql_multi(sql, params)
+        return dict((tuple(row[:4]), row[4]) for row in result)
+
+    def get_existing_tile_footprints(self, footprint_key_list):
+        """Finds which of a batch of tile footprints are in the database.
+
+        footprint_key_list is a list of (x_index, y_index, tile_type_id)
+        tuples. Returns the set of those keys present in the tile_footprint
+        table."""
+
+        if not footprint_key_list:
+            return set()
+
+        sql = ("SELECT x_index, y_index, tile_type_id FROM tile_footprint\n" +
+               "WHERE (x_index, y_index, tile_type_id) IN\n" +
+               "    %(footprint_key_list)s;")
+        params = {'footprint_key_list': tuple(footprint_key_list)}
+        result = self.execute_sql_multi(sql, params)
+        return set(tuple(row) for row in result)
+
+    def insert_tile_footprints(self, footprint_dict_list):
+        """Inserts a batch of entries into the tile_footprint table.
+
+        This is the multi-row version of insert_tile_footprint. Entries
+        already in the table are skipped (ON CONFLICT DO NOTHING), so
+        concurrent ingests can insert the same footprints safely. Returns
+        the number of entries inserted."""
+
+        column_list = ['x_index',
+                       'y_index',
+                       'tile_type_id',
+                       'x_min',
+                       'y_min',
+                       'x_max',
+                       'y_max',
+                       'bbox']
+
+        columns = "(" + ",\n".join(column_list) + ")"
+
+        value_list = []
+        for column in column_list:
+            if column == 'bbox':
+                value_list.append('NULL')
+            else:
+                value_list.append("%(" + column + ")s")
+        template = "(" + ", ".join(value_list) + ")"
+
+        sql = ("INSERT INTO tile_footprint " + columns + "\n" +
+               "VALUES %s\n" +
+               "ON CONFLICT DO NOTHING\n" +
+               "RETURNING x_index;")
+        result = self.execute_sql_values(sql, footprint_dict_list, template)
+        return len(result)
+
     def insert_tile_record(self, tile_dict):
         """Creates a new tile record in the database.
 
@@ -601,6 +694,42 @@ class IngestDBWrapper(dbutil.ConnectionWrapper):
         tile_id = result[0]
         return tile_id
 
+    def insert_tile_records(self, tile_dict_list):
+        """Creates a batch of new tile records in the database.
+
+        This is the multi-row version of insert_tile_record, sending all
+        the records in one statement. Returns a dictionary mapping
+        (dataset_id, x_index, y_index, tile_type_id) to the tile_id of
+        each new record."""
+
+        column_list = ['tile_id',
+                       'x_index',
+                       'y_index',
+                       'tile_type_id',
+                       'dataset_id',
+                       'tile_pathname',
+                       'tile_class_id',
+                       'tile_size',
+                       'ctime']
+        columns = "(" + ",\n".join(column_list) + ")"
+
+        value_list = []
+        for column in column_list:
+            if column == 'tile_id':
+                value_list.append("nextval('tile_id_seq')")
+            elif column == 'ctime':
+                value_list.append('now()')
+            else:
+                value_list.append("%(" + column + ")s")
+        template = "(" + ", ".join(value_list) + ")"
+
+        sql = ("INSERT INTO tile " + columns + "\n" +
+               "VALUES %s\n" +
+               "RETURNING dataset_id, x_index, y_index, tile_type_id, tile_id;")
+
+        result = self.execute_sql_values(sql, tile_dict_list, template)
+        return dict((tuple(row[:4]), row[4]) for row in result)
+
     def get_overlapping_dataset_ids(self,
                                     dataset_id,
                                     delta_t=ONE_HOUR,
@@ -764,3 +893,19 @@ class IngestDBWrapper(dbutil.ConnectionWrapper):
                   'new_tile_class_id': new_tile_class_id
                   }
         self.execute_sql_single(sql, params)
+
+    def refresh_tile_index(self, dataset_id_list):
+        """Refresh the tile index rows of the acquisitions of the datasets.
+
+        This replaces the rows of the denormalised tile_index table (used
+        by the api queries) for every acquisition of the datasets in
+        'dataset_id_list' with the current tiles. It should be called in
+        the transaction that creates, removes, or reclassifies the tiles."""
+
+        sql = ("SELECT refresh_tile_index(ARRAY(\n" +
+               "    SELECT DISTINCT acquisition_id FROM dataset\n" +
+               "    WHERE dataset_id IN %(dataset_filter)s\n" +
+               "    ));"
+               )
+        params = {'dataset_filter': tuple(dataset_id_list)}
+        self.execute_sql_single(sql, params)
@@ -308,3 +308,5 @@ class PreTiledIngester(SourceFileIngester):
         with self.collection.lock_datasets([dataset_record.dataset_id]):
             with self.collection.transaction():
                 dataset_record.store_tiles([tile_contents])
+
+        return [tile_contents]
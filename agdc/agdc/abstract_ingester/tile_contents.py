@@ -32,6 +32,7 @@ import shutil
 import logging
 import os
 import re
+import threading
 from datetime import datetime
 
 from osgeo import gdal
@@ -57,20 +58,41 @@ GDAL_CACHEMAX_MB = 500
 # Working buffers (in MB)
 # GDAL_WM_MB = 500
 
+#
+# Warp engines used by TileContents.reproject:
+#
+# WARP_ENGINE_GDALWARP runs a gdalwarp subprocess per tile,
+# WARP_ENGINE_GDAL warps in-process from a band stack handle shared by all tiles.
+#
+
+WARP_ENGINE_GDALWARP = 'gdalwarp'
+WARP_ENGINE_GDAL = 'gdal'
+WARP_ENGINES = (WARP_ENGINE_GDALWARP, WARP_ENGINE_GDAL)
+
 
 class TileContents(object):
     """TileContents database interface class."""
     # pylint: disable=too-many-instance-attributes
     def __init__(self, tile_output_path, tile_type_info,
-                 tile_footprint, provisional_directory, band_stack):
+                 tile_footprint, provisional_directory, band_stack,
+                 warp_engine=WARP_ENGINE_GDALWARP):
         """Set the tile_footprint over which we want to resample this dataset.
 
         :type band_stack: AbstractBandstack
+        :type warp_engine: str
+        :param warp_engine: One of WARP_ENGINES, selects how reproject() warps the tile.
         """
+        if warp_engine not in WARP_ENGINES:
+            raise DatasetError('Unknown warp engine %r (expected one of %s)' %
+                               (warp_engine, ', '.join(WARP_ENGINES)))
+
         self.tile_type_id = tile_type_info['tile_type_id']
         self.tile_type_info = tile_type_info
         self.tile_footprint = tile_footprint
         self._band_stack = band_stack
+        self.warp_engine = warp_engine
+        # Elapsed time of the last reproject() call (None if no warp was done)
+        self.warp_time = None
 
         self.tile_output_path = tile_output_path
 
@@ -103,12 +125,22 @@ class TileContents(object):
 
     def reproject(self):
         """Reproject the scene dataset into tile coordinate reference system
-        and extent. This method uses gdalwarp to do the reprojection."""
+        and extent. This method uses gdalwarp, either as a subprocess or
+        in-process depending on the warp engine, to do the reprojection."""
 
         # Work-around to allow existing code to work with netCDF subdatasets as GDAL band stacks
         temp_tile_output_path = self.nc_temp_tile_output_path or self._temp_tile_output_path
 
-        _reproject(self.tile_type_info, self.tile_footprint, self._band_stack, temp_tile_output_path)
+        if self.warp_engine == WARP_ENGINE_GDAL:
+            self.warp_time = _reproject_in_process(self.tile_type_info, self.tile_footprint,
+                                                   self._band_stack, temp_tile_output_path)
+        else:
+            self.warp_time = _reproject(self.tile_type_info, self.tile_footprint,
+                                        self._band_stack, temp_tile_output_path)
+
+        if self.warp_time is not None:
+            LOGGER.info('Warp time for tile %s (%s) = %s', self.tile_footprint,
+                        self.warp_engine, self.warp_time)
 
         # Work-around to allow existing code to work with netCDF subdatasets as GDAL band stacks
         if self.nc_temp_tile_output_path:
@@ -202,8 +234,13 @@ def _make_format_spec(tile_type_info):
     return format_spec
 
 
-def _create_reproject_command(band_stack, first_file_number, nodata_value, temp_tile_output_path, tile_footprint,
-                             tile_type_info):
+def _create_warp_options(band_stack, first_file_number, nodata_value, tile_footprint, tile_type_info):
+    """Return the gdalwarp options (excluding source and destination) for a tile.
+
+    These are shared by the gdalwarp subprocess and the in-process warp engine
+    so that both produce identical tiles. An empty list is returned if the
+    tile footprint is not a valid cell.
+    """
 
     resampling_method = (
         band_stack.band_dict[first_file_number]['resampling_method']
@@ -227,13 +264,7 @@ def _create_reproject_command(band_stack, first_file_number, nodata_value, temp_
     if not _is_valid(int(tile_extents[0]),int(tile_extents[1])):
         return []
 
-
-    reproject_cmd = [
-        "gdalwarp",
-        '--config', 'GDAL_CACHEMAX', str(GDAL_CACHEMAX_MB),
-        # Changing the warp memory size altered pixel values. Disable until further tests are performed.
-        # '-wm', str(GDAL_WM_MB),
-        "-q",
+    warp_options = [
         "-of",
         "%s" % tile_type_info['file_format'],
         "-t_srs",
@@ -251,8 +282,27 @@ def _create_reproject_command(band_stack, first_file_number, nodata_value, temp_
         "-r",
         "%s" % resampling_method,
     ]
-    reproject_cmd.extend(nodata_spec)
-    reproject_cmd.extend(_make_format_spec(tile_type_info))
+    warp_options.extend(nodata_spec)
+    warp_options.extend(_make_format_spec(tile_type_info))
+    return warp_options
+
+
+def _create_reproject_command(band_stack, first_file_number, nodata_value, temp_tile_output_path, tile_footprint,
+                             tile_type_info):
+
+    warp_options = _create_warp_options(band_stack, first_file_number, nodata_value,
+                                        tile_footprint, tile_type_info)
+    if len(warp_options) == 0:
+        return []
+
+    reproject_cmd = [
+        "gdalwarp",
+        '--config', 'GDAL_CACHEMAX', str(GDAL_CACHEMAX_MB),
+        # Changing the warp memory size altered pixel values. Disable until further tests are performed.
+        # '-wm', str(GDAL_WM_MB),
+        "-q",
+    ]
+    reproject_cmd.extend(warp_options)
     reproject_cmd.extend([
         "-overwrite",
         "%s" % band_stack.vrt_name,
@@ -262,6 +312,9 @@ def _create_reproject_command(band_stack, first_file_number, nodata_value, temp_
 
 
 def _reproject(tile_type_info, tile_footprint, band_stack, output_path):
+    """Reproject a tile by running gdalwarp in a subprocess.
+
+    Returns the elapsed warp time, or None if the footprint was skipped."""
 
     nodata_value = band_stack.nodata_list[0]
 
@@ -272,11 +325,12 @@ def _reproject(tile_type_info, tile_footprint, band_stack, output_path):
     reproject_cmd = _create_reproject_command(band_stack, first_file_number, nodata_value,
                                              output_path, tile_footprint, tile_type_info)
     if len(reproject_cmd) == 0:
-        return
+        return None
 
     command_string = ' '.join(reproject_cmd)
 
     LOGGER.info('Performing gdalwarp for tile %s', tile_footprint)
+    warp_start_datetime = datetime.now()
     retry = True
     while retry:
         LOGGER.debug('command_string = %s', command_string)
@@ -318,6 +372,120 @@ def _reproject(tile_type_info, tile_footprint, band_stack, output_path):
         else:
             retry = False  # No retry on success
 
+    return datetime.now() - warp_start_datetime
+
+
+#
+# In-process warp engine.
+#
+# The scene VRT is opened once per band stack and the handle is kept in
+# _WARP_SOURCE_DICT until release_warp_source is called, so every tile
+# footprint of a dataset is warped from the same GDAL dataset and block
+# cache. GDAL dataset handles must not be shared between threads, so the
+# dictionary is keyed by (VRT name, thread id) and each tiling worker
+# thread gets its own handle.
+#
+
+_WARP_SOURCE_DICT = {}
+_WARP_SOURCE_LOCK = threading.Lock()
+
+
+def _get_warp_source(band_stack):
+    """Return an open GDAL dataset for the band stack VRT, opening it if needed."""
+
+    key = (band_stack.vrt_name, threading.current_thread().ident)
+    with _WARP_SOURCE_LOCK:
+        source_dataset = _WARP_SOURCE_DICT.get(key)
+    if source_dataset is None:
+        gdal.SetConfigOption('GDAL_CACHEMAX', str(GDAL_CACHEMAX_MB))
+        source_dataset = gdal.Open(band_stack.vrt_name)
+        if source_dataset is None:
+            raise DatasetError('Unable to open band stack %s: %s' %
+                               (band_stack.vrt_name, gdal.GetLastErrorMsg()))
+        with _WARP_SOURCE_LOCK:
+            _WARP_SOURCE_DICT[key] = source_dataset
+        LOGGER.debug('Opened warp source %s', band_stack.vrt_name)
+
+    return source_dataset
+
+
+def release_warp_source(band_stack):
+    """Close the in-process warp sources for a band stack (if any were opened)."""
+
+    vrt_name = getattr(band_stack, 'vrt_name', None)
+    with _WARP_SOURCE_LOCK:
+        for key in [key for key in _WARP_SOURCE_DICT if key[0] == vrt_name]:
+            LOGGER.debug('Closing warp source %s', vrt_name)
+            del _WARP_SOURCE_DICT[key]
+
+
+def _warp_in_process(source_dataset, output_path, warp_options):
+    """Run a single gdal.Warp call, returning True on success."""
+
+    if os.path.exists(output_path):  # Equivalent of gdalwarp -overwrite
+        os.remove(output_path)
+
+    gdal.ErrorReset()
+    output_dataset = gdal.Warp(output_path, source_dataset,
+                               options=gdal.WarpOptions(options=warp_options))
+    if output_dataset is None:
+        return False
+
+    output_dataset.FlushCache()
+    del output_dataset
+    return True
+
+
+def _reproject_in_process(tile_type_info, tile_footprint, band_stack, output_path):
+    """Reproject a tile with gdal.Warp from the shared band stack handle.
+
+    This uses exactly the same warp options as the gdalwarp subprocess.
+    Returns the elapsed warp time, or None if the footprint was skipped."""
+
+    nodata_value = band_stack.nodata_list[0]
+    first_file_number = band_stack.band_dict.keys()[0]
+    warp_options = _create_warp_options(band_stack, first_file_number, nodata_value,
+                                        tile_footprint, tile_type_info)
+    if len(warp_options) == 0:
+        return None
+
+    source_dataset = _get_warp_source(band_stack)
+
+    LOGGER.info('Performing in-process warp for tile %s', tile_footprint)
+    LOGGER.debug('warp_options = %s', ' '.join(warp_options))
+    start_datetime = datetime.now()
+
+    if not _warp_in_process(source_dataset, output_path, warp_options):
+        error_message = gdal.GetLastErrorMsg()
+
+        # Work-around for GDAL error writing LZW-compressed GeoTIFFs
+        if (error_message.find('LZW') > -1  # LZW-related error
+            and tile_type_info['file_format'] == 'GTiff'  # Output format is GeoTIFF
+            and 'COMPRESS=LZW' in tile_type_info['format_options']):  # LZW compression requested
+
+            LOGGER.info('Creating compressed GeoTIFF tile via temporary uncompressed GeoTIFF')
+            uncompressed_tile_path = output_path + '.tmp'
+            uncompressed_options = [option.replace('COMPRESS=LZW', 'COMPRESS=NONE')
+                                    for option in warp_options]
+            if not _warp_in_process(source_dataset, uncompressed_tile_path, uncompressed_options):
+                raise DatasetError('Unable to perform in-process warp for tile %s: %s' %
+                                   (tile_footprint, gdal.GetLastErrorMsg()))
+
+            translate_options = ['-of', 'GTiff'] + _make_format_spec(tile_type_info)
+            output_dataset = gdal.Translate(output_path, uncompressed_tile_path,
+                                            options=gdal.TranslateOptions(options=translate_options))
+            if output_dataset is None:
+                raise DatasetError('Unable to translate %s to %s: %s' %
+                                   (uncompressed_tile_path, output_path, gdal.GetLastErrorMsg()))
+            del output_dataset
+        else:
+            raise DatasetError('Unable to perform in-process warp for tile %s: %s' %
+                               (tile_footprint, error_message))
+
+    elapsed_time = datetime.now() - start_datetime
+    LOGGER.debug('in-process warp time = %s', elapsed_time)
+    return elapsed_time
+
 
 def _nc2vrt(nc_path, vrt_path):
     """Create a VRT file to present a netCDF file with multiple subdatasets to GDAL as a band stack"""
@@ -30,8 +30,6 @@ from __future__ import absolute_import
 
 import logging
 
-import psycopg2
-
 from .ingest_db_wrapper import IngestDBWrapper, TC_PENDING
 from agdc.cube_util import get_file_size_mb
 
@@ -78,8 +76,45 @@ class TileRepository(object):
         """
         :type tile: TileRecord
         """
-        # Fill a dictionary with data for the tile
-        tile_dict = {
+        self.persist_tiles([tile])
+
+    def persist_tiles(self, tile_list):
+        """Persist a batch of tiles with a fixed number of database round trips.
+
+        The footprints are checked in one query and any missing ones
+        inserted in one statement, then the tiles are checked for existing
+        records in one query and inserted in one statement. The tile_id of
+        each tile is set.
+
+        :type tile_list: list of TileRecord
+        """
+        if not tile_list:
+            return
+
+        self._update_tile_footprints(tile_list)
+
+        tile_dict_list = [self._make_tile_dict(tile) for tile in tile_list]
+        tile_key_list = [(tile_dict['dataset_id'],
+                          tile_dict['x_index'],
+                          tile_dict['y_index'],
+                          tile_dict['tile_type_id']) for tile_dict in tile_dict_list]
+
+        # If there was any existing tile corresponding to a tile_dict then
+        # it should already have been removed.
+        if (len(set(tile_key_list)) != len(tile_key_list) or
+                self.db.get_tile_ids(tile_key_list)):
+            raise AssertionError("Attempt to recreate an existing tile.")
+
+        # Make the tile record entries on the database:
+        tile_id_dict = self.db.insert_tile_records(tile_dict_list)
+        for tile, tile_key in zip(tile_list, tile_key_list):
+            tile.tile_id = tile_id_dict[tile_key]
+
+    @staticmethod
+    def _make_tile_dict(tile):
+        """Fill a dictionary with data for the tile."""
+
+        return {
             'x_index': tile.tile_footprint[0],
             'y_index': tile.tile_footprint[1],
             'tile_type_id': tile.tile_type_id,
@@ -91,24 +126,15 @@ class TileRepository(object):
             'tile_size': tile.size_mb
         }
 
-        self._update_tile_footprint(tile, tile_dict)
-
-        # Make the tile record entry on the database:
-        tile.tile_id = self.db.get_tile_id(tile_dict)
-        if tile.tile_id is None:
-            tile.tile_id = self.db.insert_tile_record(tile_dict)
-        else:
-            # If there was any existing tile corresponding to tile_dict then
-            # it should already have been removed.
-            raise AssertionError("Attempt to recreate an existing tile.")
-        tile_dict['tile_id'] = tile.tile_id
+    def _update_tile_footprints(self, tile_list):
+        """Update the tile footprint entries in the database"""
 
-    def _update_tile_footprint(self, tile, tile_dict):
-        """Update the tile footprint entry in the database"""
-
-        if not self.db.tile_footprint_exists(tile_dict):
-            # We may need to create a new footprint record.
-            footprint_dict = {
+        footprint_dict = {}
+        for tile in tile_list:
+            footprint_key = (tile.tile_footprint[0],
+                             tile.tile_footprint[1],
+                             tile.tile_type_id)
+            footprint_dict[footprint_key] = {
                 'x_index': tile.tile_footprint[0],
                 'y_index': tile.tile_footprint[1],
                 'tile_type_id': tile.tile_type_id,
@@ -119,21 +145,20 @@ class TileRepository(object):
                 'bbox': 'Populate this within sql query?'
             }
 
-            # Create an independent database connection for this transaction.
-            my_db = IngestDBWrapper(self.datacube.create_connection())
-            try:
-                with self.collection.transaction(my_db):
-                    if not my_db.tile_footprint_exists(footprint_dict):
-                        my_db.insert_tile_footprint(footprint_dict)
-
-            except psycopg2.IntegrityError:
-                # If we get an IntegrityError we assume the tile_footprint
-                # is already in the database, and we do not need to add it.
-
-                # FIXME! This is migrated from the old codebase, but is clearly unsafe.
-                # The query should return a count of inserted records to distinguish already-present records
-                # from actual integrity errors (which are important).
-                pass
-
-            finally:
-                my_db.close()
+        existing_set = self.db.get_existing_tile_footprints(footprint_dict.keys())
+        missing_list = [footprint_dict[key] for key in sorted(footprint_dict)
+                        if key not in existing_set]
+        if not missing_list:
+            return
+
+        # Create an independent database connection for this transaction,
+        # so that the footprints are committed (and visible to concurrent
+        # ingests) independently of the dataset transaction. Footprints
+        # inserted by someone else in the meantime are skipped by the
+        # ON CONFLICT clause rather than raising an IntegrityError.
+        my_db = IngestDBWrapper(self.datacube.create_connection())
+        try:
+            with self.collection.transaction(my_db):
+                my_db.insert_tile_footprints(missing_list)
+        finally:
+            my_db.close()
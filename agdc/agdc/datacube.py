@@ -38,6 +38,8 @@ import inspect
 from EOtools.execute import execute
 from EOtools.utils import log_multiline
 
+from .lock_manager import LockManager
+
 # Set top level standard output
 console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setLevel(logging.INFO)
@@ -205,6 +207,9 @@ where tile_type_id = %(tile_type_id)s
 
         self.db_connection = None
 
+        # Advisory locks for this process, on a connection opened on first use
+        self.lock_manager = LockManager(self)
+
         self.process_id = os.getenv('PBS_O_HOST', socket.gethostname()) + ':' + os.getenv('PBS_JOBID', str(os.getpid()))
         def open_config(config_file):
             assert os.path.exists(config_file), config_file + " does not exist"
@@ -366,108 +371,40 @@ order by tile_type_id,satellite_name, sensor_name, level_name, tile_layer
     def __del__(self):
         if self.db_connection:
             self.db_connection.close()
+        if getattr(self, 'lock_manager', None):
+            self.lock_manager.close()
 
 
     def lock_object(self, lock_object, lock_type_id=1, lock_status_id=None, lock_detail=None):
-        # Need separate non-persistent connection for lock mechanism to allow independent transaction commits
-        lock_connection = self.create_connection()
-
-        lock_cursor = lock_connection.cursor()
-        result = None
-        sql = """-- Insert lock record if doesn't already exist
-insert into lock(
-  lock_type_id,
-  lock_object,
-  lock_owner,
-  lock_status_id)
-select
-  %(lock_type_id)s,
-  %(lock_object)s,
-  %(lock_owner)s,
-  %(lock_status_id)s
-where not exists
-  (select
-    lock_type_id,
-    lock_object
-  from lock
-  where lock_type_id = %(lock_type_id)s
-    and lock_object = %(lock_object)s);
-
--- Update lock record if it is not owned or owned by this process
-update lock
-set lock_owner = %(lock_owner)s,
-  lock_status_id = %(lock_status_id)s,
-  lock_detail = %(lock_detail)s
-  where lock_type_id = %(lock_type_id)s
-    and lock_object = %(lock_object)s
-    and (lock_owner is null or lock_owner = %(lock_owner)s);
-"""
-        params = {'lock_type_id': lock_type_id,
-                  'lock_object': lock_object,
-                  'lock_owner': self.process_id,
-                  'lock_status_id': lock_status_id,
-                  'lock_detail': lock_detail
-                  }
-
-        log_multiline(logger.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
-
-        # Need to specifically check object lock record for this process and specified status
-        try:
-            lock_cursor.execute(sql, params)
-            result = self.check_object_locked(lock_object=lock_object,
-                                              lock_type_id=lock_type_id,
-                                              lock_status_id=lock_status_id,
-                                              lock_owner=self.process_id,
-                                              lock_connection=lock_connection)
-        finally:
-            lock_connection.close()
-
-        if result:
-            logger.debug('Locked object %s', lock_object)
-        else:
-            logger.debug('Unable to lock object %s', lock_object)
-
-        return result
-
+        """Lock a single object. Returns the lock record if locked, None otherwise."""
+        if not self.lock_manager.lock_objects([lock_object], lock_type_id, lock_status_id, lock_detail):
+            return None
 
+        return {'lock_type_id': lock_type_id,
+                'lock_object': lock_object,
+                'lock_owner': self.process_id,
+                'lock_status_id': lock_status_id,
+                'lock_detail': lock_detail
+                }
 
     def unlock_object(self, lock_object, lock_type_id=1):
-        # Need separate non-persistent connection for lock mechanism to allow independent transaction commits
-        lock_connection = self.create_connection()
+        """Unlock a single object. Returns True if it was locked by this process."""
+        return self.lock_manager.unlock_objects([lock_object], lock_type_id)
 
-        lock_cursor = lock_connection.cursor()
-        result = False
-        sql = """-- Delete lock object if it is owned by this process
-delete from lock
-where lock_type_id = %(lock_type_id)s
-  and lock_object = %(lock_object)s
-  and lock_owner = %(lock_owner)s;
-"""
-        params = {'lock_type_id': lock_type_id,
-                  'lock_object': lock_object,
-                  'lock_owner': self.process_id
-                  }
+    def lock_objects(self, lock_list, lock_type_id=1, lock_status_id=None, lock_detail=None):
+        """Lock all the objects in lock_list (in one round trip), or none of them.
 
-        log_multiline(logger.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
-        try:
-            lock_cursor.execute(sql, params)
-            result = not self.check_object_locked(lock_object,
-                                                  lock_type_id)
-        finally:
-            lock_connection.close()
-
-        if result:
-            logger.debug('Unlocked object %s', lock_object)
-        else:
-            logger.debug('Unable to unlock object %s', lock_object)
+        Returns True if all the objects were locked.
+        """
+        return self.lock_manager.lock_objects(lock_list, lock_type_id, lock_status_id, lock_detail)
 
-        return result
+    def unlock_objects(self, lock_list, lock_type_id=1):
+        """Unlock all the objects in lock_list (in one round trip)."""
+        return self.lock_manager.unlock_objects(lock_list, lock_type_id)
 
     def check_object_locked(self, lock_object, lock_type_id=1, lock_status_id=None, lock_owner=None, lock_connection=None):
-        # Check whether we need to create a new connection and do it if required
-        create_connection = not lock_connection
-        # Need separate non-persistent connection for lock mechanism to allow independent transaction commits
-        lock_connection = lock_connection or self.create_connection()
+        # Lock records are read on the lock manager's connection unless one is supplied
+        lock_connection = lock_connection or self.lock_manager.get_connection()
 
         lock_cursor = lock_connection.cursor()
         result = None
@@ -490,31 +427,26 @@ select
                   }
 
         log_multiline(logger.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
-        try:
-            lock_cursor.execute(sql, params)
-            record = lock_cursor.fetchone()
-            if record:
-                result = {'lock_type_id': lock_type_id,
-                  'lock_object': record[0],
-                  'lock_owner': record[1],
-                  'lock_status_id': record[2],
-                  'lock_detail': record[3]
-                  }
-        finally:
-            # Only close connection if it was created in this function
-            if create_connection:
-                lock_connection.close()
+        lock_cursor.execute(sql, params)
+        record = lock_cursor.fetchone()
+        if record:
+            result = {'lock_type_id': lock_type_id,
+              'lock_object': record[0],
+              'lock_owner': record[1],
+              'lock_status_id': record[2],
+              'lock_detail': record[3]
+              }
 
         return result
 
     def clear_all_locks(self, lock_object=None, lock_type_id=1, lock_owner=None):
         """
         USE WITH CAUTION - This will affect all processes using specified lock type
-        """
-        # Need separate non-persistent connection for lock mechanism to allow independent transaction commits
-        lock_connection = self.create_connection()
 
-        lock_cursor = lock_connection.cursor()
+        This clears the lock records only: advisory locks are released when
+        their owner unlocks them or its lock connection closes.
+        """
+        lock_cursor = self.lock_manager.get_connection().cursor()
         sql = """-- Delete ALL lock objects matching any supplied parameters
 delete from lock
 where (%(lock_type_id)s is null or lock_type_id = %(lock_type_id)s)
@@ -527,10 +459,7 @@ where (%(lock_type_id)s is null or lock_type_id = %(lock_type_id)s)
                   }
 
         log_multiline(logger.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
-        try:
-            lock_cursor.execute(sql, params)
-        finally:
-            lock_connection.close()
+        lock_cursor.execute(sql, params)
 
     def check_files_ready(self, filename_list):
         logger.debug('Checking files %s', filename_list)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+    lock_manager.py - object locks for the datacube.
+
+    Locks are PostgreSQL session level advisory locks held on one
+    long-lived connection per lock owner, keyed on a hash of the lock type
+    and lock object. A whole list of objects is locked or unlocked in one
+    round trip, and the database releases the locks of an owner whose
+    connection dies. Each lock held is also recorded in the lock table, for
+    reporting and for check_object_locked.
+"""
+from __future__ import absolute_import
+
+import threading
+import hashlib
+import struct
+import logging
+
+from EOtools.utils import log_multiline
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Utility functions
+#
+
+
+def get_lock_key(lock_type_id, lock_object):
+    """Return the advisory lock key (a signed 64 bit integer) for an object."""
+
+    if isinstance(lock_object, unicode):
+        lock_object = lock_object.encode('utf-8')
+    digest = hashlib.md5('%s:%s' % (lock_type_id, lock_object)).digest()
+    return struct.unpack('>q', digest[:8])[0]
+
+#
+# Lock manager class
+#
+
+
+class LockManager(object):
+    """Advisory lock manager for a datacube lock owner.
+
+    Advisory locks belong to a database session, not a lock owner, so each
+    lock owner (datacube.process_id) must have its own LockManager. Locks
+    are not counted: locking an object already held by this manager only
+    updates its lock record, and one unlock releases it.
+    """
+
+    def __init__(self, datacube):
+        self.datacube = datacube
+        self.lock_connection = None
+        # (lock_type_id, lock_object) -> advisory lock key
+        self.held_locks = {}
+        self._mutex = threading.Lock()
+
+    def get_connection(self):
+        """Return the lock connection, opening it if required."""
+
+        if self.lock_connection is None or self.lock_connection.closed:
+            # Any advisory locks were released with the old connection.
+            self.held_locks.clear()
+            self.lock_connection = self.datacube.create_connection()
+
+        return self.lock_connection
+
+    def close(self):
+        """Close the lock connection, releasing all the locks held."""
+
+        with self._mutex:
+            if self.lock_connection is not None and not self.lock_connection.closed:
+                if self.held_locks:
+                    self.__unlock(sorted(self.held_locks))
+                self.lock_connection.close()
+            self.lock_connection = None
+            self.held_locks.clear()
+
+    def lock_objects(self, lock_list, lock_type_id=1, lock_status_id=None, lock_detail=None):
+        """Lock all the objects on lock_list, or none of them.
+
+        Returns True if all the locks were acquired. Otherwise the locks
+        acquired by this call are released again and False is returned.
+        """
+
+        with self._mutex:
+            lock_connection = self.get_connection()
+            object_list = sorted(set(lock_list))
+            new_list = [lock_object for lock_object in object_list
+                        if (lock_type_id, lock_object) not in self.held_locks]
+            key_dict = dict((lock_object, get_lock_key(lock_type_id, lock_object))
+                            for lock_object in new_list)
+
+            sql = """-- Try to lock each new object, and record the locks if all were acquired
+with acquired as (
+  select
+    lock_object,
+    pg_try_advisory_lock(lock_key) as locked
+  from unnest(%(new_objects)s::text[], %(lock_keys)s::bigint[]) as l(lock_object, lock_key)
+  ),
+recorded as (
+  insert into lock(
+    lock_type_id,
+    lock_object,
+    lock_owner,
+    lock_status_id,
+    lock_detail)
+  select
+    %(lock_type_id)s,
+    lock_object,
+    %(lock_owner)s,
+    %(lock_status_id)s,
+    %(lock_detail)s
+  from unnest(%(lock_objects)s::text[]) as lock_object
+  where (select coalesce(bool_and(locked), true) from acquired)
+  on conflict (lock_type_id, lock_object) do update
+  set lock_owner = excluded.lock_owner,
+    lock_status_id = excluded.lock_status_id,
+    lock_detail = excluded.lock_detail
+  returning lock_object
+  )
+select lock_object, locked from acquired;
+"""
+            params = {'lock_type_id': lock_type_id,
+                      'new_objects': new_list,
+                      'lock_keys': [key_dict[lock_object] for lock_object in new_list],
+                      'lock_objects': object_list,
+                      'lock_owner': self.datacube.process_id,
+                      'lock_status_id': lock_status_id,
+                      'lock_detail': lock_detail
+                      }
+
+            lock_cursor = lock_connection.cursor()
+            log_multiline(LOGGER.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
+            lock_cursor.execute(sql, params)
+            acquired_list = [lock_object for (lock_object, locked) in lock_cursor.fetchall()
+                             if locked]
+
+            for lock_object in acquired_list:
+                self.held_locks[(lock_type_id, lock_object)] = key_dict[lock_object]
+
+            if len(acquired_list) == len(new_list):
+                LOGGER.debug('Locked objects %s', object_list)
+                return True
+
+            # Nothing was recorded, so only the advisory locks need releasing
+            self.__unlock([(lock_type_id, lock_object) for lock_object in acquired_list])
+            LOGGER.debug('Unable to lock objects %s', object_list)
+            return False
+
+    def unlock_objects(self, lock_list, lock_type_id=1):
+        """Unlock the objects on lock_list held by this manager.
+
+        Returns True if all the objects were held (and are now unlocked).
+        """
+
+        with self._mutex:
+            object_list = sorted(set(lock_list))
+            held_list = [(lock_type_id, lock_object) for lock_object in object_list
+                         if (lock_type_id, lock_object) in self.held_locks]
+            if held_list:
+                self.__unlock(held_list)
+
+            result = len(held_list) == len(object_list)
+            if result:
+                LOGGER.debug('Unlocked objects %s', object_list)
+            else:
+                LOGGER.debug('Unable to unlock objects %s', object_list)
+
+            return result
+
+    def __unlock(self, held_list):
+        """Release held locks and delete their lock records.
+
+        held_list is a list of (lock_type_id, lock_object) keys of
+        self.held_locks.
+        """
+
+        sql = """-- Release advisory locks and delete the lock records owned by this process
+with released as (
+  select pg_advisory_unlock(lock_key) as unlocked
+  from unnest(%(lock_keys)s::bigint[]) as lock_key
+  ),
+deleted as (
+  delete from lock
+  using unnest(%(lock_type_ids)s::integer[], %(lock_objects)s::text[])
+    as l(lock_type_id, lock_object)
+  where lock.lock_type_id = l.lock_type_id
+    and lock.lock_object = l.lock_object
+    and lock.lock_owner = %(lock_owner)s
+  returning lock.lock_object
+  )
+select count(*) from released;
+"""
+        params = {'lock_keys': [self.held_locks[held] for held in held_list],
+                  'lock_type_ids': [lock_type_id for (lock_type_id, _) in held_list],
+                  'lock_objects': [lock_object for (_, lock_object) in held_list],
+                  'lock_owner': self.datacube.process_id
+                  }
+
+        lock_cursor = self.get_connection().cursor()
+        log_multiline(LOGGER.debug, lock_cursor.mogrify(sql, params), 'SQL', '\t')
+        lock_cursor.execute(sql, params)
+        lock_cursor.fetchall()
+
+        for held in held_list:
+            del self.held_locks[held]
@@ -21,6 +21,8 @@ from agdc.abstract_ingester import AbstractDataset
 from agdc.abstract_ingester import AbstractBandstack
 from agdc.abstract_ingester import AbstractIngester
 from agdc.ls7_ingester.ls7dataset import LS7Dataset
+from agdc.abstract_ingester.dataset_source import find_archive_datasets, open_archive_source
+from agdc.abstract_ingester.dataset_source import LS57_RENAME_RULES
 from agdc.cube_util import DatasetError, DatasetSkipError, parse_date_from_string
 
 logging.basicConfig(filename='/tilestore/logs/ls7_ingest.log',
@@ -56,6 +58,17 @@ class LS7Ingester(AbstractIngester):
                                  default=False, action='store_const',
                                  const=True, help=follow_symlinks_help)
 
+        archive_help = 'Source is a comma separated list of ESPA .tar.gz'\
+            ' archives, read in place without untarring.'
+        _arg_parser.add_argument('--archive', dest='archive',
+                                 default=False, action='store_const',
+                                 const=True, help=archive_help)
+
+        pqa_dir_help = 'Directory containing PQA files built from the'\
+            ' archives (with --archive).'
+        _arg_parser.add_argument('--pqadir', dest='pqa_dir',
+                                 default=None, help=pqa_dir_help)
+
         return _arg_parser
 
     def find_datasets(self, source_dir):
@@ -69,6 +82,11 @@ class LS7Ingester(AbstractIngester):
 
         LOGGER.info('Searching for datasets in %s', source_dir)
         
+        if self.args.archive:
+            dataset_list, self.pqa_archive_dict = find_archive_datasets(
+                [archive for archive in source_dir.split(',') if archive],
+                self.args.pqa_dir)
+            return dataset_list
 
         dataset_list = [os.path.abspath(scenedir)
                         for scenedir in source_dir.split(',')
@@ -91,4 +109,10 @@ class LS7Ingester(AbstractIngester):
            its metadata read.
         """
 
+        if self.args.archive:
+            source = open_archive_source(dataset_path,
+                                         getattr(self, 'pqa_archive_dict', {}),
+                                         LS57_RENAME_RULES)
+            return LS7Dataset(dataset_path, source=source)
+
         return LS7Dataset(dataset_path)
@@ -22,21 +22,27 @@ import xml.etree.ElementTree as ET
 
 from agdc.cube_util import DatasetError
 from agdc.abstract_ingester import AbstractDataset
+from agdc.abstract_ingester.dataset_source import DirectorySource
 from agdc.landsat_ingester.landsat_bandstack import LandsatBandstack
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
 class LS7Dataset(AbstractDataset):
-    def __init__(self, dataset_path):
+    def __init__(self, dataset_path, source=None):
         """Opens the dataset and extracts metadata.
 
         Most of the metadata is kept in self._ds which is
         a EOtools.DatasetDrivers.SceneDataset object. Some extra metadata is
         extracted and kept the instance attributes.
+
+        source is the dataset_source object giving access to the dataset
+        files. It defaults to the directory dataset_path; pass an
+        ArchiveSource to read the dataset straight out of an archive.
         """
 
         self._dataset_path = dataset_path
+        self._source = source or DirectorySource(dataset_path)
         LOGGER.info('Opening Dataset %s', self._dataset_path)
         
         #self._ds = SceneDataset(default_metadata_required=False, utm_fix=True)
@@ -73,7 +79,7 @@ class LS7Dataset(AbstractDataset):
         """
         self.band_dict = {}
         self._eAccess=eAccessLevel
-        filelist = [filename for filename in os.listdir(self._dataset_path)
+        filelist = [filename for filename in self._source.list_files()
                     if re.match('\w*_PQA_\w*.tif', filename)]
         nodata_value = -9999 #TODO: Make this pull from database
         if len(filelist) > 0:
@@ -128,10 +134,10 @@ class LS7Dataset(AbstractDataset):
         self._spatial_ref.ImportFromWkt(RootBand.GetProjection())
         
         #read in the xml file
-        filelist = [filename for filename in os.listdir(self._dataset_path)
+        filelist = [filename for filename in self._source.list_files()
                     if re.match('\w*.xml', filename)]
-        print "XML File: "+os.path.join(self._dataset_path,filelist[0])
-        xmlRoot = ET.parse(os.path.join(self._dataset_path,filelist[0])).getroot()
+        print "XML File: "+self._source.get_path(filelist[0])
+        xmlRoot = ET.fromstring(self._source.read_file(filelist[0]))
         print "Root element: "+xmlRoot.tag
         for child in xmlRoot:
             print child.tag, child.attrib
@@ -282,17 +288,17 @@ class LS7Dataset(AbstractDataset):
         otherwise."""
 
         dataset_dir = self._dataset_path
-        if not os.path.isdir(dataset_dir):
+        if not self._source.is_valid():
             
             raise DatasetError('%s is not a valid directory' % dataset_dir)
         print "File pattern: "+file_pattern
-        filelist = [filename for filename in os.listdir(dataset_dir)
+        filelist = [filename for filename in self._source.list_files()
                     if re.match(file_pattern, filename)]
         if not len(filelist) == 1:
             raise DatasetError('Unable to find unique match ' +
                                'for file pattern %s' % file_pattern)
 
-        return os.path.join(dataset_dir, filelist[0])    
+        return self._source.get_path(filelist[0])    
     
     
     def get_dataset_path(self):
@@ -368,17 +374,7 @@ class LS7Dataset(AbstractDataset):
     
     def get_dataset_size(self):
         """The size of the dataset in kilobytes as an integer."""
-        command = "du -sk %s | cut -f1" % self.get_dataset_path()
-        LOGGER.debug('executing "%s"', command)
-        result = execute(command)
-
-        if result['returncode'] != 0:
-            raise DatasetError('Unable to calculate directory size: ' +
-                               '"%s" failed: %s' % (command, result['stderr']))
-
-        LOGGER.debug('stdout = %s', result['stdout'])
-
-        return int(result['stdout'])
+        return self._source.get_size_kb()
 
     
     def get_ll_lon(self):
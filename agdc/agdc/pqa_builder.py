@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+    pqa_builder.py - build PQA files from Landsat surface reflectance masks.
+
+    Each PQA bit is a function of one surface reflectance mask. The bits
+    depending on a mask are fused into a single lookup table indexed by
+    the mask value, so a PQA block is the sum of one table lookup per
+    mask. The masks are read and the PQA written in blocks of rows, so
+    memory use is bounded whatever the scene size.
+
+    Usage: python -m agdc.pqa_builder <sceneID> [<output_dir>]
+    <sceneID> may be prefixed with a directory or a GDAL virtual file system
+    path (e.g. /vsitar//vsigzip/<archive>/<sceneID>).
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import logging
+
+import numpy
+from osgeo import gdal
+
+from .cube_util import DatasetError
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Constants
+#
+
+# Surface reflectance products have no saturated pixels, so bits 0 to 7
+# are always set. Bits 14 and 15 are unused.
+PQA_BASE_VALUE = 255
+
+PQA_SUFFIX = '_PQA_1111111111111100.tif'
+
+# Reference band for the PQA geotransform and projection.
+REFERENCE_BAND = '_sr_band1.tif'
+
+DEFAULT_BLOCK_ROWS = 512
+
+# PQA bits: bit number -> (mask file suffix, clear function). The clear
+# function maps an array of mask values to 1 (clear) or 0 (flagged); it
+# is evaluated once over all possible mask values to build the lookup
+# tables. Bits 8 to 13 are contiguity, land/water, ACCA cloud, FMASK
+# cloud, ACCA cloud shadow and FMASK cloud shadow.
+#
+# CFMASK values are 0 clear, 1 water, 2 cloud shadow, 3 snow, 4 cloud and
+# 255 fill. The LS5/LS7 *_qa masks are 255 where flagged, 0 otherwise.
+
+LS57_PQA_BITS = {
+    8: ('_sr_fill_qa.tif', lambda value: value != 255),
+    9: ('_sr_land_water_qa.tif', lambda value: value != 255),
+    10: ('_sr_cloud_qa.tif', lambda value: value != 255),
+    11: ('_cfmask.tif', lambda value: value != 4),
+    12: ('_sr_cloud_shadow_qa.tif', lambda value: value != 255),
+    13: ('_cfmask.tif', lambda value: value != 2),
+    }
+
+# LS8 sr_cloud flags cloud in bit 1 and cloud shadow in bit 3 (as the
+# old build_pqa_ls8.py 'b10&2==0', which Python parses as '(b10&2)==0').
+LS8_PQA_BITS = {
+    8: ('_cfmask.tif', lambda value: value != 255),
+    9: ('_cfmask.tif', lambda value: value != 1),
+    10: ('_sr_cloud.tif', lambda value: (value & 2) == 0),
+    11: ('_cfmask.tif', lambda value: value != 4),
+    12: ('_sr_cloud.tif', lambda value: (value & 8) == 0),
+    13: ('_cfmask.tif', lambda value: value != 2),
+    }
+
+PQA_BITS = {'ls5': LS57_PQA_BITS,
+            'ls7': LS57_PQA_BITS,
+            'ls8': LS8_PQA_BITS}
+
+# Scene id prefixes for each instrument.
+SCENE_PREFIXES = {'LT5': 'ls5',
+                  'LE7': 'ls7',
+                  'LC8': 'ls8'}
+
+#
+# Utility functions
+#
+
+
+def get_instrument(scene_id):
+    """Return the instrument (ls5, ls7 or ls8) for a scene id."""
+
+    prefix = os.path.basename(scene_id)[:3]
+    try:
+        return SCENE_PREFIXES[prefix]
+    except KeyError:
+        raise DatasetError('Unable to determine the instrument for scene %s' % scene_id)
+
+
+def make_lookup_tables(pqa_bits, table_sizes=None):
+    """Return a dictionary mapping mask suffix -> PQA lookup table.
+
+    Each table is indexed by mask value and holds the sum of the PQA bits
+    that depend on that mask. table_sizes maps mask suffix -> number of
+    possible mask values (default 256).
+    """
+
+    table_sizes = table_sizes or {}
+    lut_dict = {}
+    for bit, (suffix, clear) in pqa_bits.items():
+        table_size = table_sizes.get(suffix, 256)
+        if suffix not in lut_dict:
+            lut_dict[suffix] = numpy.zeros(table_size, dtype=numpy.uint16)
+        clear_array = clear(numpy.arange(table_size)).astype(numpy.uint16)
+        lut_dict[suffix] += clear_array * numpy.uint16(1 << bit)
+
+    return lut_dict
+
+
+def compute_pqa(mask_dict, lut_dict):
+    """Return the uint16 PQA array for a block of masks.
+
+    mask_dict maps mask suffix -> array of (unsigned integer) mask values.
+    """
+
+    pqa_array = None
+    for suffix, lut in lut_dict.items():
+        bits = lut.take(mask_dict[suffix])
+        if pqa_array is None:
+            pqa_array = bits + numpy.uint16(PQA_BASE_VALUE)
+        else:
+            pqa_array += bits
+
+    return pqa_array
+
+
+def _mask_table_size(band):
+    """Return the lookup table size needed for the values of a mask band."""
+
+    if band.DataType == gdal.GDT_Byte:
+        return 256
+    elif band.DataType == gdal.GDT_UInt16:
+        return 65536
+    raise DatasetError('Unsupported mask data type %s' %
+                       gdal.GetDataTypeName(band.DataType))
+
+
+def build_pqa(scene_id, output_dir='', instrument=None, block_rows=DEFAULT_BLOCK_ROWS):
+    """Build the PQA file for a scene and return its path.
+
+    scene_id is the path prefix of the surface reflectance files (it may
+    be a GDAL virtual file system path). The PQA file is written to
+    output_dir as an unsigned 16 bit GeoTIFF. Raises DatasetError if any
+    of the masks are missing.
+    """
+
+    instrument = instrument or get_instrument(scene_id)
+    pqa_bits = PQA_BITS[instrument]
+    suffix_list = sorted(set(suffix for (suffix, _) in pqa_bits.values()))
+
+    reference_path = scene_id + REFERENCE_BAND
+    missing_list = [path for path in [reference_path] +
+                    [scene_id + suffix for suffix in suffix_list]
+                    if gdal.VSIStatL(path) is None]
+    if missing_list:
+        raise DatasetError('Surface reflectance mask(s) missing for scene %s: %s' %
+                           (scene_id, ', '.join(missing_list)))
+
+    pqa_path = os.path.join(output_dir, os.path.basename(scene_id) + PQA_SUFFIX)
+    LOGGER.info('Building PQA %s', pqa_path)
+
+    reference_dataset = gdal.Open(reference_path)
+    mask_datasets = dict((suffix, gdal.Open(scene_id + suffix)) for suffix in suffix_list)
+    mask_bands = dict((suffix, dataset.GetRasterBand(1))
+                      for (suffix, dataset) in mask_datasets.items())
+
+    x_size = reference_dataset.RasterXSize
+    y_size = reference_dataset.RasterYSize
+
+    # One lookup table per mask, sized for the mask data type
+    lut_dict = make_lookup_tables(pqa_bits,
+                                  dict((suffix, _mask_table_size(band))
+                                       for (suffix, band) in mask_bands.items()))
+
+    if os.path.exists(pqa_path):
+        os.remove(pqa_path)
+
+    driver = gdal.GetDriverByName('GTiff')
+    pqa_dataset = driver.Create(pqa_path, x_size, y_size, 1, gdal.GDT_UInt16)
+    if pqa_dataset is None:
+        raise DatasetError('Unable to create PQA file %s' % pqa_path)
+    pqa_dataset.SetGeoTransform(reference_dataset.GetGeoTransform())
+    pqa_dataset.SetProjection(reference_dataset.GetProjection())
+    pqa_band = pqa_dataset.GetRasterBand(1)
+
+    for y_offset in range(0, y_size, block_rows):
+        rows = min(block_rows, y_size - y_offset)
+        mask_dict = dict((suffix, band.ReadAsArray(0, y_offset, x_size, rows))
+                         for (suffix, band) in mask_bands.items())
+        pqa_band.WriteArray(compute_pqa(mask_dict, lut_dict), 0, y_offset)
+
+    pqa_band.FlushCache()
+    pqa_band = None
+    pqa_dataset = None
+
+    return pqa_path
+
+
+def main(argv=None, instrument=None):
+    """Command line interface compatible with preprocess/build_pqa_*.py."""
+
+    argv = sys.argv if argv is None else argv
+
+    if len(argv) < 2:
+        print 'SceneId not entered'
+        print 'Usage: python build_pqa.py <sceneID> [<output_dir>]'
+        print 'Example: python build_pqa.py LE71130802015092ASA00'
+        return 0
+
+    scene_id = str(argv[1])
+    output_dir = argv[2] if len(argv) > 2 else ''
+
+    print 'Started creating PQA for sceneID', scene_id
+    try:
+        build_pqa(scene_id, output_dir, instrument)
+    except DatasetError as err:
+        print err
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+    pqa_mask.py - good pixel masks from PQA with dilated cloud and shadow.
+
+    The ACCA and FMASK cloud and cloud shadow bits (10 to 13) of a PQA
+    value are 0 where flagged. The flagged pixels of each bit are dilated
+    by a square of (2 * dilation + 1) pixels, i.e. the same as repeated
+    erosion of the clear pixels with a 3x3 structuring element.
+
+    The four bits are packed into one byte per pixel and dilated together
+    by OR-ing shifted copies of the array, one axis at a time. The good
+    pixel mask is then a lookup of the adjusted PQA value in a table of
+    the good pixel values. The PQA is read and processed in blocks of
+    rows, each with a halo of dilation rows either side.
+"""
+from __future__ import absolute_import
+
+import logging
+
+import numpy
+from osgeo import gdal
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Constants
+#
+
+# Bit 6 (saturation for band 62) is always 0 for Landsat 5, so it is
+# ignored.
+PQA_IGNORE_BITS = 64
+
+# ACCA cloud, FMASK cloud, ACCA cloud shadow and FMASK cloud shadow.
+PQA_DILATE_FIRST_BIT = 10
+PQA_DILATE_BIT_COUNT = 4
+
+DEFAULT_GOOD_PIXEL_MASKS = [32767, 16383, 2457]
+DEFAULT_DILATION = 3
+DEFAULT_BLOCK_ROWS = 512
+
+#
+# Module level cache of good pixel lookup tables keyed by good pixel masks.
+#
+
+_GOOD_PIXEL_TABLE_DICT = {}
+
+#
+# Functions
+#
+
+
+def get_good_pixel_table(good_pixel_masks):
+    """Return a boolean lookup table over all PQA values of the good pixels."""
+
+    key = tuple(sorted(set(int(mask) for mask in good_pixel_masks)))
+
+    if key not in _GOOD_PIXEL_TABLE_DICT:
+        table = numpy.zeros(65536, dtype=numpy.bool_)
+        table[list(key)] = True
+        _GOOD_PIXEL_TABLE_DICT[key] = table
+
+    return _GOOD_PIXEL_TABLE_DICT[key]
+
+
+def dilate_flags(flags, dilation):
+    """Dilate each bit of an array of bit flags by a square of
+    (2 * dilation + 1) pixels.
+
+    Pixels outside the array are taken as not flagged.
+    """
+
+    for axis in (0, 1):
+        source = flags
+        flags = source.copy()
+        for offset in range(1, min(dilation, source.shape[axis] - 1) + 1):
+            forward = [slice(None), slice(None)]
+            backward = [slice(None), slice(None)]
+            forward[axis] = slice(offset, None)
+            backward[axis] = slice(None, -offset)
+            flags[tuple(forward)] |= source[tuple(backward)]
+            flags[tuple(backward)] |= source[tuple(forward)]
+
+    return flags
+
+
+def compute_pqa_mask(pqa_array, good_pixel_masks=DEFAULT_GOOD_PIXEL_MASKS,
+                     dilation=DEFAULT_DILATION, halo=(0, 0)):
+    """Return the good pixel mask of a PQA array.
+
+    halo is the number of (context) rows at the top and bottom of
+    pqa_array that are used for the dilation but not returned.
+    """
+
+    pqa_array = pqa_array.astype(numpy.uint16) | PQA_IGNORE_BITS
+
+    # Flags are 1 where the bits are 0
+    flags = (~(pqa_array >> PQA_DILATE_FIRST_BIT) &
+             ((1 << PQA_DILATE_BIT_COUNT) - 1)).astype(numpy.uint8)
+
+    if dilation:
+        flags = dilate_flags(flags, dilation)
+
+    rows = slice(halo[0], pqa_array.shape[0] - halo[1])
+
+    pqa_array = pqa_array[rows] & ~(flags[rows].astype(numpy.uint16) <<
+                                    PQA_DILATE_FIRST_BIT)
+
+    return get_good_pixel_table(good_pixel_masks)[pqa_array]
+
+
+def read_pqa_mask(pqa_dataset_path, good_pixel_masks=DEFAULT_GOOD_PIXEL_MASKS,
+                  dilation=DEFAULT_DILATION, block_rows=DEFAULT_BLOCK_ROWS):
+    """Read a PQA dataset and return its good pixel mask."""
+
+    pqa_gdal_dataset = gdal.Open(pqa_dataset_path)
+    assert pqa_gdal_dataset, 'Unable to open PQA GeoTIFF file %s' % pqa_dataset_path
+    pqa_band = pqa_gdal_dataset.GetRasterBand(1)
+
+    x_size = pqa_gdal_dataset.RasterXSize
+    y_size = pqa_gdal_dataset.RasterYSize
+
+    pqa_mask = numpy.empty((y_size, x_size), dtype=numpy.bool_)
+
+    for y_offset in range(0, y_size, block_rows):
+        rows = min(block_rows, y_size - y_offset)
+
+        # Read dilation rows either side of the block (where there are any)
+        halo_top = min(dilation, y_offset)
+        halo_bottom = min(dilation, y_size - y_offset - rows)
+
+        pqa_array = pqa_band.ReadAsArray(0, y_offset - halo_top, x_size,
+                                         rows + halo_top + halo_bottom)
+
+        pqa_mask[y_offset:y_offset + rows] = compute_pqa_mask(
+            pqa_array, good_pixel_masks, dilation, (halo_top, halo_bottom))
+
+    del pqa_band, pqa_gdal_dataset
+
+    return pqa_mask
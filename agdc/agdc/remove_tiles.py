@@ -313,9 +313,26 @@ WHERE
             print '\t%s' % tile_path
 
 
+    def get_tile_index_sql(self, params):
+        ''' Return SQL to refresh the tile index of the acquisitions of the nominated datasets and updated tiles'''
+        if not (params['acquisition_list'] or params['tiles_to_be_updated_tuple']):
+            return ''
+
+        return """
+-- Refresh the tile index of the affected acquisitions
+select refresh_tile_index(%(acquisition_list)s::bigint[]""" + \
+(""" || array(
+    select acquisition_id
+    from dataset
+    where dataset_id in (select dataset_id from tile where tile_id in %(tiles_to_be_updated_tuple)s)
+    )""" if params['tiles_to_be_updated_tuple'] else '') + \
+""");
+"""
+
     def flag_records(self):
         params = {'tiles_to_be_deleted_tuple': tuple(sorted(self.tile_records_to_delete.keys())),
-                  'tiles_to_be_updated_tuple': tuple(sorted(self.tile_records_to_update.keys()))
+                  'tiles_to_be_updated_tuple': tuple(sorted(self.tile_records_to_update.keys())),
+                  'acquisition_list': sorted(self.acquisition_records.keys())
                   }
 
         if (params['tiles_to_be_deleted_tuple']
@@ -334,7 +351,8 @@ update tile
 set tile_class_id = 1 -- Change 3->1
 where tile_class_id = 3
 and tile_id in %(tiles_to_be_updated_tuple)s;
-""" if params['tiles_to_be_updated_tuple'] else '')
+""" if params['tiles_to_be_updated_tuple'] else '') + \
+self.get_tile_index_sql(params)
 
             log_multiline(logger.debug, self.db_cursor.mogrify(sql, params), 'SQL', '\t')
 
@@ -353,7 +371,8 @@ and tile_id in %(tiles_to_be_updated_tuple)s;
         params = {'tiles_to_be_deleted_tuple': tuple(sorted(self.tile_records_to_delete.keys())),
                   'tiles_to_be_updated_tuple': tuple(sorted(self.tile_records_to_update.keys())),
                   'dataset_tuple': tuple(sorted(self.dataset_records.keys())),
-                  'acquisition_tuple': tuple(sorted(self.acquisition_records.keys()))
+                  'acquisition_tuple': tuple(sorted(self.acquisition_records.keys())),
+                  'acquisition_list': sorted(self.acquisition_records.keys())
                   }
 
         if (params['tiles_to_be_deleted_tuple']
@@ -397,7 +416,8 @@ and not exists (
     where acquisition_id in %(acquisition_tuple)s
     and dataset_id not in %(dataset_tuple)s
     );
-""" if params['dataset_tuple'] else '')
+""" if params['dataset_tuple'] else '') + \
+self.get_tile_index_sql(params)
             log_multiline(logger.debug, self.db_cursor.mogrify(sql, params), 'SQL', '\t')
 
             if self.dryrun:
@@ -35,16 +35,19 @@ import psycopg2
 from osgeo import gdal, osr, gdalconst
 from copy import copy
 from datetime import datetime, time, timedelta
-from scipy import ndimage
 import numpy
 import numpy.ma as ma
 import shutil
 from time import sleep
+from multiprocessing import Pool
 
 from EOtools.execute import execute
 from EOtools.utils import log_multiline
 from agdc import DataCube
 from agdc.band_lookup import BandLookup
+from agdc.vrt_stack import get_stack_geometry, get_source_properties, write_stack_vrt
+from agdc.lock_manager import LockManager
+from agdc.pqa_mask import read_pqa_mask
 
 PQA_CONTIGUITY = 256 # contiguity = bit 8
 DEFAULT_BAND_LOOKUP_SCHEME = 'LANDSAT-UNADJUSTED'
@@ -60,6 +63,28 @@ if not logger.level:
     logger.setLevel(logging.DEBUG) # Default logging level for all modules
     logger.addHandler(console_handler)
 
+# Worker process state for Stacker.stack_derived. The stacker is inherited by the (forked) workers, which
+# each open their own database and lock connections. The inherited connections are kept referenced so that
+# they are never finalised (which would close the parent's sessions) in a worker.
+_worker_stacker = None
+_inherited_connections = []
+
+def _init_stacker_worker(stacker):
+    global _worker_stacker
+
+    _inherited_connections.extend([stacker.db_connection, stacker.lock_manager.lock_connection])
+
+    stacker.db_connection = stacker.create_connection()
+    stacker.lock_manager = LockManager(stacker)
+
+    _worker_stacker = stacker
+
+def _derive_datasets_worker(derive_args):
+    return _worker_stacker.derive_datasets(*derive_args)
+
+def _stack_derived_files_worker(stack_args):
+    return _worker_stacker.stack_derived_files(*stack_args)
+
 class Stacker(DataCube):
 
     def parse_args(self):
@@ -128,6 +153,9 @@ class Stacker(DataCube):
         _arg_parser.add_argument('-l', '--levels', dest='levels',
             required=False, default=None,
             help='Comma-separated list of level names which must be present for a timeslice to be included, e.g: NBAR,PQA')
+        _arg_parser.add_argument('--processes', dest='processes',
+            required=False, default=None,
+            help='Number of processes to derive timeslices with (default=1)')
 
         args, unknown_args = _arg_parser.parse_known_args()
         return args
@@ -192,6 +220,12 @@ class Stacker(DataCube):
         except:
             self.row = None
 
+        # Number of processes for stack_derived
+        try:
+            self.processes = int(self.processes)
+        except:
+            self.processes = 1
+
         # Other variables set from config file only - not used
         try:
             self.min_path = int(self.min_path)
@@ -220,91 +254,214 @@ class Stacker(DataCube):
         self.band_lookup_dict = band_lookup.band_lookup_dict[self.band_lookup_scheme]
 
     def stack_files(self, timeslice_info_list, stack_dataset_path, band1_vrt_path=None, overwrite=False):
+        """Write a VRT temporal stack with one band per timeslice dataset.
+
+        The VRT XML, including band metadata and nodata values, is generated in-process from the tile
+        geometry of the tile type and written once. Only the first source is opened (for its data type).
+        band1_vrt_path is no longer used and is retained for compatibility.
+        """
         if os.path.exists(stack_dataset_path) and not overwrite:
             logger.debug('Stack VRT file %s already exists', stack_dataset_path)
             return
 
-        band_no = timeslice_info_list[0]['tile_layer'] # Should all be the same
-        build_vrt = True
-        if band_no == 1: # First band
-            intermediate_path = stack_dataset_path # No post-processing required
-        elif band1_vrt_path: # band1_vrt_path provided - use this as source for new VRT
-            intermediate_path = band1_vrt_path
-            build_vrt = False
-        else: # No band1_vrt_path provided
-            intermediate_path = re.sub('\.vrt$', '.tmp', stack_dataset_path)
-
-        file_list_path = re.sub('\.vrt$', '.txt', stack_dataset_path)
-        if build_vrt:
-            logger.info('Creating %d layer stack VRT file %s', len(timeslice_info_list), stack_dataset_path)
-            list_file = open(file_list_path, 'w')
-            list_file.write('\n'.join([timeslice_info['tile_pathname'] for timeslice_info in timeslice_info_list]))
-            list_file.close()
-            del list_file
-
-            command_string = 'gdalbuildvrt'
-            if not self.debug:
-                command_string += ' -q'
-#            command_string += ' -separate -overwrite %s \\\n%s' % (
-#                intermediate_path,
-#                ' \\\n'.join([timeslice_info['tile_pathname'] for timeslice_info in timeslice_info_list])
-#                )
-            command_string += ' -separate -input_file_list %s -overwrite %s' % (
-                file_list_path,
-                intermediate_path
-                )
-            if not self.debug:
-                command_string += '\nrm %s' % file_list_path
-        else:
-            command_string = ''
-
-        if band_no > 1: # Need to post process intermediate VRT file
-            if command_string:
-                command_string += '\n'
-            command_string += 'cat %s | sed s/\<SourceBand\>1\<\\\\/SourceBand\>/\<SourceBand\>%d\<\\\\/SourceBand\>/g > %s' % (intermediate_path, band_no, stack_dataset_path)
-#                command_string += '\nchmod 777 %s' % stack_dataset_path
-            if build_vrt: # Intermediate file created for band > 1
-                if not self.debug: # Remove temporary intermediate file just created
-                    command_string += '\nrm %s' % intermediate_path
-            else:
-                logger.info('Creating %d layer stack VRT file %s from %s', len(timeslice_info_list), stack_dataset_path, intermediate_path)
+        logger.info('Creating %d layer stack VRT file %s', len(timeslice_info_list), stack_dataset_path)
 
+        # All timeslices are the same band of the same cell and tile type
+        first_timeslice_info = timeslice_info_list[0]
+        tile_type_info = self.tile_type_dict[first_timeslice_info.get('tile_type_id') or self.default_tile_type_id]
 
-        logger.debug('command_string = %s', command_string)
+        geometry = get_stack_geometry(tile_type_info, first_timeslice_info['x_index'], first_timeslice_info['y_index'])
+        source_properties = get_source_properties(first_timeslice_info['tile_pathname'], first_timeslice_info['tile_layer'])
 
-        result = execute(command_string=command_string)
+        write_stack_vrt(stack_dataset_path, timeslice_info_list, geometry, source_properties)
 
-        if result['stdout']:
-            log_multiline(logger.info, result['stdout'], 'stdout from ' + command_string, '\t')
 
-        if result['stderr']:
-            log_multiline(logger.debug, result['stderr'], 'stderr from ' + command_string, '\t')
+    def get_cell_stack_info(self, cells=None, tile_type_ids=None,
+                            satellites=None, sensors=None,
+                            paths=None, rows=None,
+                            date_ranges=None,
+                            disregard_incomplete_data=False,
+                            levels=[],
+                            check_files=True
+                            ):
+        """
+        Function which returns the stack info dicts of many cells from a single query
 
-        if result['returncode']:
-            raise Exception('%s failed', command_string)
+        Arguments:
+            cells: Optional list of (x_index, y_index) tuples of the cells to stack
+            tile_type_ids: Optional list of tile_type_id values to search
+            satellites, sensors: Optional lists of satellite and sensor strings to filter result set
+            paths, rows: Optional lists of WRS paths and rows of source scenes
+            date_ranges: Optional list of (start_datetime, end_datetime) tuples delineating temporal ranges.
+                Either datetime may be None for an open ended range
+            disregard_incomplete_data: Boolean flag indicating whether to constrain results to timeslices with
+                both NBAR and PQA data
+            levels: List of level names which must all be present for a timeslice to be included
+            check_files: Boolean flag indicating whether to check that all tile files exist. The check is
+                made with one directory listing per tile directory rather than one stat per tile
 
-        temporal_stack_dataset = gdal.Open(stack_dataset_path)
-        assert temporal_stack_dataset, 'Unable to open VRT %s' % stack_dataset_path
+        Returns:
+            cell_stack_info_dict: Dict keyed by (tile_type_id, x_index, y_index) containing a stack_info_dict
+                for each cell as returned by stack_tile (i.e. keyed by start_datetime and level_name)
+        """
+        db_cursor2 = self.db_connection.cursor()
 
-        for band_index in range(len(timeslice_info_list)):
-            band = temporal_stack_dataset.GetRasterBand(band_index + 1)
+        date_ranges = date_ranges or [(None, None)]
 
-            # Copy dict and convert to strings for metadata
-            metadata_dict = dict(timeslice_info_list[band_index])
-            for key in metadata_dict.keys():
-                metadata_dict[key] = str(metadata_dict[key])
+        params = {'tile_type_ids': tuple(tile_type_ids) if tile_type_ids else None,
+                  'tile_indices': tuple(tuple(cell) for cell in cells) if cells else None,
+                  'satellites': tuple(satellites) if satellites else None,
+                  'sensors': tuple(sensors) if sensors else None,
+                  'x_refs': tuple(paths) if paths else None,
+                  'y_refs': tuple(rows) if rows else None
+              }
+        for range_index, (start_datetime, end_datetime) in enumerate(date_ranges):
+            params['start_datetime_%d' % range_index] = start_datetime
+            params['end_datetime_%d' % range_index] = end_datetime
+        log_multiline(logger.debug, params, 'params', '\t')
 
-            band.SetMetadata(metadata_dict)
-            log_multiline(logger.debug, band.GetMetadata(), 'band.GetMetadata()', '\t')
+        sql = """-- Retrieve all tile details for specified tile range
+select
+  tile_type_id,
+  x_index,
+  y_index,
+  start_datetime,
+  end_datetime,
+  satellite_tag,
+  sensor_name,
+  tile_pathname,
+  x_ref as path,
+  y_ref as start_row,
+  case when tile_class_id = 4 then y_ref + 1 else y_ref end as end_row, -- This will not work for mosaics with >2 source tiles
+  level_name,
+  nodata_value,
+  gcp_count,
+  cloud_cover
 
-            # Need to set nodata values for each band - can't seem to do it in gdalbuildvrt
-            nodata_value = timeslice_info_list[band_index]['nodata_value']
-            if nodata_value is not None:
-                logger.debug('nodata_value = %s', nodata_value)
-                band.SetNoDataValue(nodata_value)
+from acquisition
+join dataset using(acquisition_id)
+join tile using(dataset_id)
+join satellite using(satellite_id)
+join sensor using(satellite_id, sensor_id)
+join processing_level using(level_id)
 
-        temporal_stack_dataset.FlushCache()
+where (tile_class_id = 1 or tile_class_id = 4) -- Only good non-overlapped and mosaic tiles"""
+        if params['tile_type_ids']:
+            sql += """
+  and tile_type_id in %(tile_type_ids)s"""
+        if params['tile_indices']:
+            sql += """
+  and (x_index, y_index) in %(tile_indices)s"""
+        if params['satellites']:
+            sql += """
+  and satellite_tag in %(satellites)s"""
+        if params['sensors']:
+            sql += """
+  and sensor_name in %(sensors)s"""
+        if params['x_refs']:
+            sql += """
+  and x_ref in %(x_refs)s"""
+        if params['y_refs']:
+            sql += """
+  and y_ref in %(y_refs)s"""
+        sql += """
+  and (""" + """
+    or """.join(["""((%%(start_datetime_%d)s is null or start_datetime >= %%(start_datetime_%d)s)
+      and (%%(end_datetime_%d)s is null or end_datetime < %%(end_datetime_%d)s))""" % ((range_index,) * 4)
+                 for range_index in range(len(date_ranges))]) + """
+  )
+order by
+  tile_type_id,
+  x_index,
+  y_index,
+  start_datetime,
+  end_datetime,
+  level_name,
+  satellite_tag,
+  sensor_name;
+"""
+        log_multiline(logger.debug, db_cursor2.mogrify(sql, params), 'SQL', '\t')
+        db_cursor2.execute(sql, params)
+
+        cell_stack_info_dict = {}
+
+        for record in db_cursor2:
+            tile_info = {'tile_type_id': record[0],
+                'x_index': record[1],
+                'y_index': record[2],
+                'start_datetime': record[3],
+                'end_datetime': record[4],
+                'satellite_tag': record[5],
+                'sensor_name': record[6],
+                'tile_pathname': record[7],
+                'path': record[8],
+                'start_row': record[9],
+                'end_row': record[10], # Copy of row field
+                'level_name': record[11],
+                'nodata_value': record[12],
+                'gcp_count': record[13],
+                'cloud_cover': record[14]
+                }
 
+            # Create nested dict keyed by cell, start_datetime and level_name
+            stack_info_dict = cell_stack_info_dict.setdefault((tile_info['tile_type_id'],
+                                                               tile_info['x_index'],
+                                                               tile_info['y_index']), {})
+
+            timeslice_dict = stack_info_dict.setdefault(tile_info['start_datetime'], {})
+
+            if tile_info['level_name'] not in timeslice_dict:
+                timeslice_dict[tile_info['level_name']] = tile_info
+
+        if check_files:
+            missing_pathnames = self.find_missing_files([tile_info['tile_pathname']
+                                                         for stack_info_dict in cell_stack_info_dict.values()
+                                                         for timeslice_dict in stack_info_dict.values()
+                                                         for tile_info in timeslice_dict.values()])
+            assert not missing_pathnames, 'Files for %d tiles do not exist (e.g. %s)' % (len(missing_pathnames),
+                                                                                          missing_pathnames[0])
+
+        for cell_key in cell_stack_info_dict.keys():
+            stack_info_dict = cell_stack_info_dict[cell_key]
+            logger.debug('stack_info_dict for cell %s has %s timeslices', cell_key, len(stack_info_dict))
+
+            if disregard_incomplete_data:
+                stack_info_dict = {start_datetime: stack_info_dict[start_datetime]
+                                   for start_datetime in stack_info_dict.keys()
+                                   if {'NBAR','PQA'} <= set(stack_info_dict[start_datetime].keys()) # Both NBAR & PQA
+                                   }
+                logger.debug('stack_info_dict for cell %s has %s timeslices after removal of incomplete datasets',
+                             cell_key, len(stack_info_dict))
+
+            if levels:
+                stack_info_dict = {start_datetime: stack_info_dict[start_datetime]
+                                   for start_datetime in stack_info_dict.keys()
+                                   if set(levels) <= set(stack_info_dict[start_datetime].keys()) # All specified levels exist
+                                   }
+
+            cell_stack_info_dict[cell_key] = stack_info_dict
+
+        logger.info('Found stack info for %d cells', len(cell_stack_info_dict))
+
+        return cell_stack_info_dict
+
+    @staticmethod
+    def find_missing_files(pathnames):
+        """Return the (sorted) pathnames which do not exist, listing each directory once rather than
+        calling stat for each file"""
+        directory_dict = {}
+        for pathname in pathnames:
+            directory_dict.setdefault(os.path.dirname(pathname), set()).add(os.path.basename(pathname))
+
+        missing_pathnames = []
+        for directory, filenames in directory_dict.items():
+            try:
+                missing_filenames = filenames - set(os.listdir(directory or '.'))
+            except OSError:
+                missing_filenames = filenames
+            missing_pathnames += [os.path.join(directory, filename) for filename in missing_filenames]
+
+        return sorted(missing_pathnames)
 
     def stack_tile(self, x_index, y_index, stack_output_dir=None,
                    start_datetime=None, end_datetime=None,
@@ -314,7 +471,8 @@ class Stacker(DataCube):
                    row=None,
                    create_band_stacks=True,
                    disregard_incomplete_data=False,
-                   levels=[]
+                   levels=[],
+                   check_files=True
                    ):
         """
         Function which returns a data structure and optionally creates band-wise VRT dataset stacks
@@ -332,6 +490,8 @@ class Stacker(DataCube):
             disregard_incomplete_data: Boolean flag indicating whether to constrain results to tiles with
                 complete L1T, NBAR and PQA data. This ensures identical numbers of stack layers but
                 introduces a hard-coded constraint around processing levels.
+            levels: List of level names which must all be present for a timeslice to be included
+            check_files: Boolean flag indicating whether to check that all tile files exist
         """
 
         assert stack_output_dir or not create_band_stacks, 'Output directory must be supplied for temporal stack generation'
@@ -509,185 +669,30 @@ class Stacker(DataCube):
         # stack_tile method body
         #
 
-        db_cursor2 = self.db_connection.cursor()
-
-        # Compose tuples from single values (TEMPORARY ONLY)
-        #TODO: Change stack_tile parameters to allow multi-value tuples
-        tile_type_ids_tuple = (tile_type_id,) if tile_type_id is not None else None
-        tile_indices_tuple = ((x_index, y_index),) if x_index is not None and y_index is not None else None
-        satellites_tuple = (satellite,) if satellite is not None else None
-        sensors_tuple = (sensor,) if sensor is not None else None
-        paths_tuple = (path,) if path is not None else None
-        rows_tuple = (row,) if row is not None else None
-
-        params = {'tile_type_ids': tile_type_ids_tuple,
-                  'tile_indices': tile_indices_tuple,
-                  'satellites': satellites_tuple,
-                  'sensors': sensors_tuple,
-                  'x_refs': paths_tuple,
-                  'y_refs': rows_tuple,
-                  'start_datetime': start_datetime,
-                  'end_datetime': end_datetime
-              }
-        log_multiline(logger.debug, params, 'params', '\t')
-
-        sql = """-- Retrieve all tile details for specified tile range
-select
-  tile_type_id,
-  x_index,
-  y_index,
-  start_datetime,
-  end_datetime,
-  satellite_tag,
-  sensor_name,
-  tile_pathname,
-  x_ref as path,
-  y_ref as start_row,
-  case when tile_class_id = 4 then y_ref + 1 else y_ref end as end_row, -- This will not work for mosaics with >2 source tiles
-  level_name,
-  nodata_value,
-  gcp_count,
-  cloud_cover
-
-from acquisition
-join dataset using(acquisition_id)
-join tile using(dataset_id)
-join satellite using(satellite_id)
-join sensor using(satellite_id, sensor_id)
-join processing_level using(level_id)
-
-where (tile_class_id = 1 or tile_class_id = 4) -- Only good non-overlapped and mosaic tiles"""
-        if params['tile_type_ids']:
-            sql += """
-  and tile_type_id in %(tile_type_ids)s"""
-        if params['tile_indices']:
-            sql += """
-  and (x_index, y_index) in %(tile_indices)s"""
-        if params['satellites']:
-            sql += """
-  and satellite_tag in %(satellites)s"""
-        if params['sensors']:
-            sql += """
-  and sensor_name in %(sensors)s"""
-        if params['x_refs']:
-            sql += """
-  and x_ref in %(x_refs)s"""
-        if params['y_refs']:
-            sql += """
-  and y_ref in %(y_refs)s"""
-        sql += """
-  and (%(start_datetime)s is null or start_datetime >= %(start_datetime)s)
-  and (%(end_datetime)s is null or end_datetime < %(end_datetime)s)
-order by
-  tile_type_id,
-  x_index,
-  y_index,
-  start_datetime,
-  end_datetime,
-  level_name,
-  satellite_tag,
-  sensor_name;
-"""
-        log_multiline(logger.debug, db_cursor2.mogrify(sql, params), 'SQL', '\t')
-        db_cursor2.execute(sql, params)
-
+        cell_stack_info_dict = self.get_cell_stack_info(
+            cells=[(x_index, y_index)] if x_index is not None and y_index is not None else None,
+            tile_type_ids=[tile_type_id] if tile_type_id is not None else None,
+            satellites=[satellite] if satellite is not None else None,
+            sensors=[sensor] if sensor is not None else None,
+            paths=[path] if path is not None else None,
+            rows=[row] if row is not None else None,
+            date_ranges=[(start_datetime, end_datetime)],
+            disregard_incomplete_data=disregard_incomplete_data,
+            levels=levels,
+            check_files=check_files)
+
+        # There is only one cell unless x_index and y_index weren't given, in which case the first tile found
+        # for each timeslice and level is kept
         stack_info_dict = {}
-
-        for record in db_cursor2:
-            assert record, 'No data found for this tile and temporal range'
-            tile_info = {'tile_type_id': record[0],
-                'x_index': record[1],
-                'y_index': record[2],
-                'start_datetime': record[3],
-                'end_datetime': record[4],
-                'satellite_tag': record[5],
-                'sensor_name': record[6],
-                'tile_pathname': record[7],
-                'path': record[8],
-                'start_row': record[9],
-                'end_row': record[10], # Copy of row field
-                'level_name': record[11],
-                'nodata_value': record[12],
-                'gcp_count': record[13],
-                'cloud_cover': record[14]
-                }
-#            log_multiline(logger.debug, band_tile_info, 'band_tile_info', '\t')
-
-            assert os.path.exists(tile_info['tile_pathname']), 'File for tile %s does not exist' % tile_info['tile_pathname']
-
-            # Create nested dict keyed by start_datetime and level_name
-            timeslice_dict = stack_info_dict.get(tile_info['start_datetime']) or {}
-            if not timeslice_dict:
-                stack_info_dict[tile_info['start_datetime']] = timeslice_dict
-
-            level_dict = timeslice_dict.get(tile_info['level_name']) or {}
-            if not level_dict:
-                level_dict = tile_info
-                timeslice_dict[tile_info['level_name']] = level_dict
-
-
-            #===================================================================
-            # # If this tile is NOT a continuation of the last one
-            # if (not last_band_tile_info # First tile
-            #     or (band_tile_info['band_tag'] != last_band_tile_info['band_tag'])
-            #     or (band_tile_info['satellite_tag'] != last_band_tile_info['satellite_tag'])
-            #     or (band_tile_info['sensor_name'] != last_band_tile_info['sensor_name'])
-            #     or (band_tile_info['path'] != last_band_tile_info['path'])
-            #     or ((band_tile_info['start_datetime'] - last_band_tile_info['end_datetime']) > timedelta(0, 3600)) # time difference > 1hr
-            #     ):
-            #     # Record timeslice information for previous timeslice if it exists
-            #     if timeslice_info:
-            #         record_timeslice_information(timeslice_info, mosaic_file_list, stack_dict)
-            #
-            #     # Start recording a new band if necessary
-            #     if (not last_band_tile_info or (band_tile_info['band_tag'] != last_band_tile_info['band_tag'])):
-            #         stack_dict = {}
-            #         level_dict = band_stack_dict.get(band_tile_info['level_name']) or {}
-            #         if not level_dict:
-            #             band_stack_dict[band_tile_info['level_name']] = level_dict
-            #
-            #         level_dict[band_tile_info['band_tag']] = stack_dict
-            #
-            #     # Start a new timeslice
-            #     mosaic_file_list = [band_tile_info['tile_pathname']]
-            #     timeslice_info = band_tile_info
-            # else: # Tile IS a continuation of the last one - same timeslice
-            #     mosaic_file_list.append(band_tile_info['tile_pathname'])
-            #     timeslice_info['end_datetime'] = band_tile_info['end_datetime']
-            #     timeslice_info['end_row'] = band_tile_info['end_row']
-            #
-            # last_band_tile_info = band_tile_info
-            #===================================================================
-
-        #=======================================================================
-        # # Check for no results, otherwise record the last timeslice
-        # if not timeslice_info:
-        #     return {}
-        # else:
-        #     record_timeslice_information(timeslice_info, mosaic_file_list, stack_dict)
-        #
-        # log_multiline(logger.debug, band_stack_dict, 'band_stack_dict', '\t')
-        #=======================================================================
+        for cell_key in sorted(cell_stack_info_dict.keys()):
+            for start_datetime, cell_timeslice_dict in cell_stack_info_dict[cell_key].items():
+                timeslice_dict = stack_info_dict.setdefault(start_datetime, {})
+                for level_name, tile_info in cell_timeslice_dict.items():
+                    timeslice_dict.setdefault(level_name, tile_info)
 
         log_multiline(logger.debug, stack_info_dict, 'stack_info_dict', '\t')
         logger.debug('stack_info_dict has %s timeslices', len(stack_info_dict))
 
-        if disregard_incomplete_data:
-            stack_info_dict = {start_datetime: stack_info_dict[start_datetime]
-                               for start_datetime in stack_info_dict.keys()
-#                               if {'L1T', 'ORTHO'} & set(stack_info_dict[start_datetime].keys()) # Either L1T or ORTHO
-#                               and {'NBAR','PQA'} <= set(stack_info_dict[start_datetime].keys()) # Both NBAR & PQA
-                               if {'NBAR','PQA'} <= set(stack_info_dict[start_datetime].keys()) # Both NBAR & PQA
-                               }
-            logger.debug('stack_info_dict has %s timeslices after removal of incomplete datasets', len(stack_info_dict))
-
-        if levels:
-            stack_info_dict = {start_datetime: stack_info_dict[start_datetime]
-                               for start_datetime in stack_info_dict.keys()
-                               if set(levels) <= set(stack_info_dict[start_datetime].keys()) # All specified levels exist
-                               }
-
-
         if (stack_output_dir):
             self.create_directory(stack_output_dir)
 
@@ -769,101 +774,19 @@ order by
 
                 logger.debug('stack_filename = %s', stack_filename)
 
-                # Open the first tile as the template dataset
-                template_dataset = gdal.Open(file_stack_dict.values()[0]['tile_pathname'])
-
-                raster_size = {'x': template_dataset.RasterXSize, 'y': template_dataset.RasterYSize}
-                block_size = dict(zip(['x','y'], template_dataset.GetRasterBand(1).GetBlockSize()))
-
-                gdal_driver = gdal.GetDriverByName("VRT")
-
-                #Set datatype formats appropriate to Create() and numpy
-                gdal_dtype = template_dataset.GetRasterBand(1).DataType
-                dtype_name = gdal.GetDataTypeName(gdal_dtype)
-
-                vrt_dataset = gdal_driver.Create(stack_filename,
-                                                 raster_size['x'],
-                                                 raster_size['y'],
-                                                 0)
-
-                vrt_dataset.SetGeoTransform(template_dataset.GetGeoTransform())
-                vrt_dataset.SetProjection(template_dataset.GetProjection())
-
-                del template_dataset # All values read - not needed any more
-
-                for start_datetime in sorted(file_stack_dict.keys()):
-                    tile_info = file_stack_dict[start_datetime]
-
-                    vrt_dataset.AddBand(gdal_dtype)
-                    output_band = vrt_dataset.GetRasterBand(vrt_dataset.RasterCount)
-
-                    complex_source = '<ComplexSource>' + \
-                    '<SourceFilename relativeToVRT="0">%s</SourceFilename>' % tile_info['tile_pathname'] + \
-                    '<SourceBand>%i</SourceBand>' % tile_info['tile_layer'] + \
-                    '<SourceProperties RasterXSize="%i" RasterYSize="%i" DataType="%s" BlockXSize="%i" BlockYSize="%i"/>' % (raster_size['x'], raster_size['y'],
-                                                                                                                             dtype_name, block_size['x'],
-                                                                                                                             block_size['y']) + \
-                    '<SrcRect xOff="%i" yOff="%i" xSize="%i" ySize="%i"/>' % (0, 0, raster_size['x'], raster_size['y']) + \
-                    '<DstRect xOff="%i" yOff="%i" xSize="%i" ySize="%i"/>' % (0, 0, raster_size['x'], raster_size['y']) + \
-                    ('<NODATA>%d</NODATA>' % tile_info['nodata_value'] if tile_info['nodata_value'] is not None else "") + \
-                    '</ComplexSource>'
-
-                    log_multiline(logger.debug, complex_source, 'complex_source', '\t')
-                    output_band.SetMetadataItem("source_0", complex_source, "new_vrt_sources")
-                    output_band.SetMetadata({key: str(tile_info[key]) for key in tile_info.keys()})
-                    # No data value needs to be set separately
-                    if tile_info['nodata_value'] is not None:
-                        output_band.SetNoDataValue(tile_info['nodata_value'])
+                self.stack_files(timeslice_info_list=[file_stack_dict[start_datetime]
+                                                      for start_datetime in sorted(file_stack_dict.keys())],
+                                 stack_dataset_path=stack_filename,
+                                 overwrite=True)
 
         return stack_info_dict
 
     def get_pqa_mask(self, pqa_dataset_path, good_pixel_masks=[32767,16383,2457], dilation=3):
-        pqa_gdal_dataset = gdal.Open(pqa_dataset_path)
-        assert pqa_gdal_dataset, 'Unable to open PQA GeoTIFF file %s' % pqa_dataset_path
-        pqa_array = pqa_gdal_dataset.GetRasterBand(1).ReadAsArray()
-        del pqa_gdal_dataset
-
-        log_multiline(logger.debug, pqa_array, 'pqa_array', '\t')
-
-        # Ignore bit 6 (saturation for band 62) - always 0 for Landsat 5
-        pqa_array = pqa_array | 64
-
-    #    logger.debug('pqa_array = %s', pqa_array)
-
-        # Dilating both the cloud and cloud shadow masks
-        s = [[1,1,1],[1,1,1],[1,1,1]]
-        acca = (pqa_array & 1024) >> 10
-        erode = ndimage.binary_erosion(acca, s, iterations=dilation, border_value=1)
-        dif = erode - acca
-        dif[dif < 0] = 1
-        pqa_array += (dif << 10)
-        del acca
-        fmask = (pqa_array & 2048) >> 11
-        erode = ndimage.binary_erosion(fmask, s, iterations=dilation, border_value=1)
-        dif = erode - fmask
-        dif[dif < 0] = 1
-        pqa_array += (dif << 11)
-        del fmask
-        acca_shad = (pqa_array & 4096) >> 12
-        erode = ndimage.binary_erosion(acca_shad, s, iterations=dilation, border_value=1)
-        dif = erode - acca_shad
-        dif[dif < 0] = 1
-        pqa_array += (dif << 12)
-        del acca_shad
-        fmask_shad = (pqa_array & 8192) >> 13
-        erode = ndimage.binary_erosion(fmask_shad, s, iterations=dilation, border_value=1)
-        dif = erode - fmask_shad
-        dif[dif < 0] = 1
-        pqa_array += (dif << 13)
-
-        #=======================================================================
-        # pqa_mask = ma.getmask(ma.masked_equal(pqa_array, int(good_pixel_masks[0])))
-        # for good_pixel_mask in good_pixel_masks[1:]:
-        #    pqa_mask = ma.mask_or(pqa_mask, ma.getmask(ma.masked_equal(pqa_array, int(good_pixel_mask))))
-        #=======================================================================
-        pqa_mask = numpy.zeros(pqa_array.shape, dtype=numpy.bool)
-        for good_pixel_mask in good_pixel_masks:
-            pqa_mask[pqa_array == good_pixel_mask] = True
+        """Return a boolean mask of the good pixels of a PQA dataset, with the ACCA & FMASK cloud and
+        cloud shadow dilated by dilation pixels (see agdc.pqa_mask)"""
+        pqa_mask = read_pqa_mask(pqa_dataset_path, good_pixel_masks, dilation)
+
+        log_multiline(logger.debug, pqa_mask, 'pqa_mask', '\t')
 
         return pqa_mask
 
@@ -950,7 +873,19 @@ order by
                       start_datetime=None, end_datetime=None,
                       satellite=None, sensor=None,
                       tile_type_id=None,
-                      create_stacks=True):
+                      create_stacks=True,
+                      stack_info_dict=None,
+                      processes=None):
+        """Derive datasets for each timeslice of a cell and optionally stack them.
+
+        stack_info_dict may be given (e.g. one of the per-cell dicts returned by get_cell_stack_info)
+        to avoid querying the database for the cell again.
+
+        With more than one process (the processes argument, or --processes), derive_datasets is called
+        for the timeslices in a pool of worker processes, as are the stack_files calls. Each worker has
+        its own database and lock connections. derive_datasets must then not rely on changes it makes
+        to the stacker object, since these are made to a worker's copy.
+        """
 
         tile_type_id = tile_type_id or self.default_tile_type_id
         tile_type_info = self.tile_type_dict[tile_type_id]
@@ -963,29 +898,30 @@ order by
                       'satellite': satellite,
                       'sensor': sensor}
 
-        # Create intermediate mosaics and return dict with stack info
-        stack_info_dict = self.stack_tile(x_index=x_index,
-                                         y_index=y_index,
-                                         stack_output_dir=stack_output_dir,
-                                         start_datetime=start_datetime,
-                                         end_datetime=end_datetime,
-                                         satellite=satellite,
-                                         sensor=sensor,
-                                         tile_type_id=None,
-                                         create_band_stacks=False,
-                                         disregard_incomplete_data=False)
-
-        # Create intermediate mosaics and return dict with stack info
-        logger.debug('self.stack_tile(x_index=%s, y_index=%s, stack_output_dir=%s, start_datetime=%s, end_datetime=%s, satellite=%s, sensor=%s, tile_type_id=%s, create_band_stacks=%s, disregard_incomplete_data=%s) called',
-                                         x_index, y_index,
-                                         stack_output_dir,
-                                         start_datetime,
-                                         end_datetime,
-                                         satellite,
-                                         sensor,
-                                         None,
-                                         False,
-                                         False)
+        if stack_info_dict is None:
+            # Create intermediate mosaics and return dict with stack info
+            stack_info_dict = self.stack_tile(x_index=x_index,
+                                             y_index=y_index,
+                                             stack_output_dir=stack_output_dir,
+                                             start_datetime=start_datetime,
+                                             end_datetime=end_datetime,
+                                             satellite=satellite,
+                                             sensor=sensor,
+                                             tile_type_id=None,
+                                             create_band_stacks=False,
+                                             disregard_incomplete_data=False)
+
+            # Create intermediate mosaics and return dict with stack info
+            logger.debug('self.stack_tile(x_index=%s, y_index=%s, stack_output_dir=%s, start_datetime=%s, end_datetime=%s, satellite=%s, sensor=%s, tile_type_id=%s, create_band_stacks=%s, disregard_incomplete_data=%s) called',
+                                             x_index, y_index,
+                                             stack_output_dir,
+                                             start_datetime,
+                                             end_datetime,
+                                             satellite,
+                                             sensor,
+                                             None,
+                                             False,
+                                             False)
 
         log_multiline(logger.debug, stack_info_dict, 'stack_info_dict', '\t')
 
@@ -995,45 +931,87 @@ order by
         # Find all datetimes
         start_datetimes = sorted(stack_info_dict.keys())
 
-        # Iterate through sorted start_datetimes
-        derived_stack_dict = {}
+        derive_args_list = []
         for start_datetime in start_datetimes:
             # Create input_dataset_dict dict for deriver_function
             input_dataset_dict = dict(stack_info_dict[start_datetime])
 
             input_dataset_dict.update(static_info_dict) # Add static data to dict passed to function
 
+            derive_args_list.append((input_dataset_dict, stack_output_info, tile_type_info))
+
+        processes = processes or self.processes
+
+        pool = None
+        if processes > 1 and len(derive_args_list) > 1:
+            logger.info('Deriving %d timeslices with %d processes', len(derive_args_list), processes)
+            pool = Pool(processes, _init_stacker_worker, (self,))
+
+        try:
             # Create derived datasets and receive name(s) of timeslice file(s) keyed by stack file name(s)
-            output_dataset_info = self.derive_datasets(input_dataset_dict, stack_output_info, tile_type_info)
-
-            if output_dataset_info is not None:
-                for output_stack_path in output_dataset_info:
-                    # Create a new list for each stack if it doesn't already exist
-                    stack_list = derived_stack_dict.get(output_stack_path, [])
-                    if not stack_list:
-                        derived_stack_dict[output_stack_path] = stack_list
-
-                    stack_list.append(output_dataset_info[output_stack_path])
-
-        log_multiline(logger.debug, derived_stack_dict, 'derived_stack_dict', '\t')
-
-        # Individual tile processing is finished. now build stack(s)
-        if create_stacks:
-            for output_stack_path in sorted(derived_stack_dict.keys()):
-                if os.path.exists(output_stack_path) and not self.refresh:
-                    logger.info('Skipped existing stack file %s', output_stack_path)
-                    continue
-
-                if (self.lock_object(output_stack_path)):
-                    logger.debug('Creating temporal stack %s', output_stack_path)
-                    self.stack_files(timeslice_info_list=derived_stack_dict[output_stack_path],
-                                 stack_dataset_path=output_stack_path,
-                                 band1_vrt_path=None, overwrite=True)
-                    self.unlock_object(output_stack_path)
-                    logger.info('VRT stack file %s created', output_stack_path)
+            if pool:
+                # imap returns the results in timeslice order. Timeslices are sent in chunks to cut the
+                # per task overhead.
+                chunksize = max(1, len(derive_args_list) // (processes * 4))
+                output_dataset_info_list = pool.imap(_derive_datasets_worker, derive_args_list, chunksize)
+            else:
+                output_dataset_info_list = (self.derive_datasets(*derive_args) for derive_args in derive_args_list)
+
+            # Iterate through output dataset info in start_datetime order
+            derived_stack_dict = {}
+            for output_dataset_info in output_dataset_info_list:
+                if output_dataset_info is not None:
+                    for output_stack_path in output_dataset_info:
+                        # Create a new list for each stack if it doesn't already exist
+                        stack_list = derived_stack_dict.get(output_stack_path, [])
+                        if not stack_list:
+                            derived_stack_dict[output_stack_path] = stack_list
+
+                        stack_list.append(output_dataset_info[output_stack_path])
+
+            log_multiline(logger.debug, derived_stack_dict, 'derived_stack_dict', '\t')
+
+            # Individual tile processing is finished. now build stack(s)
+            if create_stacks:
+                stack_args_list = []
+                for output_stack_path in sorted(derived_stack_dict.keys()):
+                    if os.path.exists(output_stack_path) and not self.refresh:
+                        logger.info('Skipped existing stack file %s', output_stack_path)
+                        continue
+
+                    stack_args_list.append((output_stack_path, derived_stack_dict[output_stack_path]))
+
+                if pool:
+                    pool.map(_stack_derived_files_worker, stack_args_list)
+                else:
+                    for stack_args in stack_args_list:
+                        self.stack_derived_files(*stack_args)
+
+        except:
+            if pool:
+                pool.terminate()
+                pool.join()
+            raise
+
+        if pool:
+            pool.close()
+            pool.join()
 
         return derived_stack_dict
 
+    def stack_derived_files(self, output_stack_path, timeslice_info_list):
+        """Lock and create a derived temporal stack. Returns True if the stack was created."""
+        if not self.lock_object(output_stack_path):
+            return False
+
+        logger.debug('Creating temporal stack %s', output_stack_path)
+        self.stack_files(timeslice_info_list=timeslice_info_list,
+                         stack_dataset_path=output_stack_path,
+                         band1_vrt_path=None, overwrite=True)
+        self.unlock_object(output_stack_path)
+        logger.info('VRT stack file %s created', output_stack_path)
+        return True
+
 
     def derive_datasets(self, input_dataset_dict, stack_output_info, tile_type_info):
         """ Abstract function for calling in stack_derived() function. Should be overridden
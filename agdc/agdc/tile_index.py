@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+    tile_index.py - maintain the denormalised tile index table.
+
+    The tile_index table (see database/sql/v7__tile_index.sql) holds one
+    row per acquisition, cell, tile type and tile class with the NBAR,
+    PQA and FC tile of each. The ingester refreshes the rows of the
+    acquisitions it changes; run this module to rebuild the whole index,
+    e.g. after tiles have been changed outside the ingester:
+
+        python -m agdc.tile_index [-C <config file>]
+"""
+from __future__ import absolute_import
+
+import logging
+import sys
+from datetime import datetime
+
+from agdc import DataCube
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Functions
+#
+
+
+def rebuild_tile_index(db_connection):
+    """Replace all the rows of the tile index and update its statistics."""
+
+    db_cursor = db_connection.cursor()
+    db_cursor.execute('select rebuild_tile_index();')
+    db_cursor.execute('analyze tile_index;')
+    db_cursor.execute('select count(*) from tile_index;')
+    row_count = db_cursor.fetchone()[0]
+    db_cursor.close()
+
+    db_connection.commit()
+
+    return row_count
+
+
+def main():
+    """Rebuild the tile index of the configured database."""
+
+    logging.basicConfig(stream=sys.stdout, format='%(message)s',
+                        level=logging.INFO)
+
+    datacube = DataCube()
+
+    start_datetime = datetime.now()
+    row_count = rebuild_tile_index(datacube.db_connection)
+
+    LOGGER.info('Rebuilt tile index of %d rows in %s',
+                row_count, datetime.now() - start_datetime)
+
+#
+# Main program
+#
+
+if __name__ == '__main__':
+    main()
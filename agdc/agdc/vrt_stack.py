@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""
+    vrt_stack.py - write VRT temporal stacks directly.
+
+    A temporal stack is a VRT with one band per timeslice, each band taken
+    from one band of a tile file. Every tile of a tile type shares the same
+    pixel grid, so the stack geometry and the source windows follow from
+    the tile type and cell index held in the database. The VRT XML is
+    generated in-process and written once; only the data type and block
+    size are read from a source, and that from the first one only.
+"""
+from __future__ import absolute_import
+
+import os
+import logging
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+from osgeo import gdal, osr
+
+#
+# Set up logger.
+#
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+#
+# Module level cache of projection WKT keyed by tile type crs.
+#
+
+_PROJECTION_DICT = {}
+
+#
+# Functions
+#
+
+
+def get_stack_geometry(tile_type_info, x_index, y_index):
+    """Return the raster size, geotransform and projection of a cell.
+
+    tile_type_info is a tile type dict as held in DataCube.tile_type_dict.
+    """
+
+    x_origin = float(tile_type_info['x_origin'])
+    y_origin = float(tile_type_info['y_origin'])
+    x_size = float(tile_type_info['x_size'])
+    y_size = float(tile_type_info['y_size'])
+
+    # Tiles are north up, so the origin of the geotransform is the
+    # top left corner of the cell.
+    geotransform = (x_origin + x_index * x_size,
+                    float(tile_type_info['x_pixel_size']),
+                    0.0,
+                    y_origin + (y_index + 1) * y_size,
+                    0.0,
+                    -float(tile_type_info['y_pixel_size']))
+
+    return {'x_pixels': int(tile_type_info['x_pixels']),
+            'y_pixels': int(tile_type_info['y_pixels']),
+            'geotransform': geotransform,
+            'projection': get_projection_wkt(tile_type_info['crs'])}
+
+
+def get_projection_wkt(crs):
+    """Return the WKT of a crs (e.g. 'EPSG:4326')."""
+
+    if crs not in _PROJECTION_DICT:
+        spatial_reference = osr.SpatialReference()
+        spatial_reference.SetFromUserInput(crs)
+        _PROJECTION_DICT[crs] = spatial_reference.ExportToWkt()
+
+    return _PROJECTION_DICT[crs]
+
+
+def get_source_properties(tile_pathname, band_no):
+    """Return the data type name and block size of a band of a tile file.
+
+    All the sources of a stack are the same band of the same product, so
+    this need only be called for one of them.
+    """
+
+    dataset = gdal.Open(tile_pathname)
+    assert dataset, 'Unable to open dataset %s' % tile_pathname
+
+    band = dataset.GetRasterBand(band_no)
+    assert band, 'Unable to open band %d of %s' % (band_no, tile_pathname)
+
+    source_properties = {'data_type': gdal.GetDataTypeName(band.DataType),
+                         'block_size': tuple(band.GetBlockSize())}
+
+    del band, dataset
+
+    return source_properties
+
+
+def _add_text_element(parent, tag, text, **attributes):
+    """Add a child element with text to an XML element."""
+
+    element = ElementTree.SubElement(parent, tag, **attributes)
+    element.text = text
+    return element
+
+
+def make_stack_vrt(timeslice_info_list, geometry, source_properties):
+    """Return the XML of a VRT stack of the timeslices.
+
+    timeslice_info_list is a list of timeslice dicts (as produced by
+    Stacker.stack_tile or Stacker.derive_datasets), one per band, each
+    with at least tile_pathname, tile_layer and nodata_value. Every entry
+    of a timeslice dict is written as band metadata.
+    """
+
+    x_pixels = geometry['x_pixels']
+    y_pixels = geometry['y_pixels']
+    data_type = source_properties['data_type']
+    block_size = source_properties.get('block_size')
+
+    vrt = ElementTree.Element('VRTDataset',
+                              rasterXSize=str(x_pixels),
+                              rasterYSize=str(y_pixels))
+    _add_text_element(vrt, 'SRS', geometry['projection'])
+    _add_text_element(vrt, 'GeoTransform',
+                      ', '.join(['%.16e' % value
+                                 for value in geometry['geotransform']]))
+
+    source_properties_attributes = {'RasterXSize': str(x_pixels),
+                                    'RasterYSize': str(y_pixels),
+                                    'DataType': data_type}
+    if block_size:
+        source_properties_attributes['BlockXSize'] = str(block_size[0])
+        source_properties_attributes['BlockYSize'] = str(block_size[1])
+
+    window_attributes = {'xOff': '0', 'yOff': '0',
+                         'xSize': str(x_pixels), 'ySize': str(y_pixels)}
+
+    for band_index, timeslice_info in enumerate(timeslice_info_list):
+        nodata_value = timeslice_info['nodata_value']
+
+        band = ElementTree.SubElement(vrt, 'VRTRasterBand',
+                                      dataType=data_type,
+                                      band=str(band_index + 1))
+
+        metadata = ElementTree.SubElement(band, 'Metadata')
+        for key in sorted(timeslice_info.keys()):
+            _add_text_element(metadata, 'MDI', str(timeslice_info[key]),
+                              key=key)
+
+        if nodata_value is not None:
+            _add_text_element(band, 'NoDataValue', str(nodata_value))
+
+        # As gdalbuildvrt, a complex source is only needed to carry the
+        # source no data value.
+        source = ElementTree.SubElement(
+            band, 'ComplexSource' if nodata_value is not None else 'SimpleSource')
+        _add_text_element(source, 'SourceFilename',
+                          timeslice_info['tile_pathname'],
+                          relativeToVRT='0')
+        _add_text_element(source, 'SourceBand',
+                          str(timeslice_info['tile_layer']))
+        ElementTree.SubElement(source, 'SourceProperties',
+                               **source_properties_attributes)
+        ElementTree.SubElement(source, 'SrcRect', **window_attributes)
+        ElementTree.SubElement(source, 'DstRect', **window_attributes)
+        if nodata_value is not None:
+            _add_text_element(source, 'NODATA', str(nodata_value))
+
+    return ElementTree.tostring(vrt)
+
+
+def write_stack_vrt(stack_dataset_path, timeslice_info_list, geometry,
+                    source_properties):
+    """Write a VRT stack of the timeslices.
+
+    The file is written to a temporary file and renamed so a reader never
+    sees a partial stack.
+    """
+
+    vrt_xml = make_stack_vrt(timeslice_info_list, geometry, source_properties)
+
+    stack_dir = os.path.dirname(os.path.abspath(stack_dataset_path))
+    handle, temp_path = tempfile.mkstemp(dir=stack_dir, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as vrt_file:
+            vrt_file.write(vrt_xml)
+        os.chmod(temp_path, 0o644)
+        os.rename(temp_path, stack_dataset_path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    LOGGER.debug('Wrote %d layer stack VRT file %s',
+                 len(timeslice_info_list), stack_dataset_path)
@@ -57,6 +57,7 @@ from datacube.api.query import list_tiles_as_list
 from datacube.api.utils import PqaMask, get_dataset_metadata, get_dataset_data, get_dataset_data_with_pq, empty_array
 from datacube.api.utils import NDV, UINT16_MAX
 from datacube.api.workflow import writeable_dir
+from datacube.api.writer import RasterWriter
 from datacube.config import Config
 from enum import Enum
 
@@ -484,28 +485,16 @@ class SummariseDatasetTimeSeriesWorkflow():
 
                 # Create the output file
 
-                if not os.path.exists(path):
+                if not raster:
                     _log.info("Creating raster [%s]", path)
 
-                    driver = gdal.GetDriverByName("GTiff")
-                    assert driver
-
-                    raster = driver.Create(path, metadata.shape[0], metadata.shape[1], len(bands), gdal.GDT_Int16)
-                    assert raster
-
-                    raster.SetGeoTransform(metadata.transform)
-                    raster.SetProjection(metadata.projection)
-
-                    for b in bands:
-                        raster.GetRasterBand(b.value).SetNoDataValue(ndv)
+                    raster = RasterWriter(path, metadata.shape[0], metadata.shape[1], len(bands), gdal.GDT_Int16,
+                                          metadata.transform, metadata.projection, ndv)
 
                 _log.info("Writing band [%s] data to raster [%s]", band.name, path)
                 _log.debug("Current MAX RSS  usage is [%d] MB",  resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
 
-                raster.GetRasterBand(band.value).WriteArray(masked_summary.filled(ndv), xoff=x, yoff=y)
-                raster.GetRasterBand(band.value).ComputeStatistics(True)
-
-                raster.FlushCache()
+                raster.write(band.value, masked_summary.filled(ndv), x_offset=x, y_offset=y)
 
                 masked_summary = None
                 _log.debug("NONE-ing the masked summary")
@@ -515,6 +504,9 @@ class SummariseDatasetTimeSeriesWorkflow():
             _log.debug("Just NONE-ed the stack")
             _log.debug("Current MAX RSS  usage is [%d] MB",  resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
 
+        if raster:
+            raster.close()
+
         raster = None
 
         _log.debug("Just NONE'd the raster")
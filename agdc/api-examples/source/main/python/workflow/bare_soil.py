@@ -26,8 +26,8 @@ import luigi
 import numpy
 import os
 from datacube.api.model import DatasetType, Fc25Bands, Ls57Arg25Bands, Satellite
-from datacube.api.utils import NDV, empty_array, get_mask_pqa, get_dataset_data_masked, calculate_ndvi, get_mask_wofs
-from datacube.api.utils import propagate_using_selected_pixel, get_dataset_metadata, raster_create, date_to_integer
+from datacube.api.utils import NDV, get_mask_pqa, get_dataset_data, calculate_ndvi, get_mask_wofs
+from datacube.api.utils import BestPixelComposite, get_dataset_metadata, raster_create, date_to_integer
 from datacube.api.workflow.cell import Workflow, SummaryTask, CellTask
 
 
@@ -96,22 +96,19 @@ class BareSoilCellTask(CellTask):
         shape = (4000, 4000)
         no_data_value = NDV
 
-        best_pixel_fc = dict()
+        # Select the pixel with the greatest bare soil fraction and carry the NBAR and FC bands and the satellite/date
+        # "provenance" from it
 
-        for band in Fc25Bands:
-            # best_pixel_fc[band] = empty_array(shape=shape, dtype=numpy.int16, ndv=INT16_MIN)
-            best_pixel_fc[band] = empty_array(shape=shape, dtype=numpy.int16, ndv=NDV)
+        composite = BestPixelComposite(shape=shape, maximise=True)
 
-        best_pixel_nbar = dict()
+        for band in Fc25Bands:
+            composite.add_band(band, dtype=numpy.int16, ndv=NDV)
 
         for band in Ls57Arg25Bands:
-            best_pixel_nbar[band] = empty_array(shape=shape, dtype=numpy.int16, ndv=NDV)
-
-        best_pixel_satellite = empty_array(shape=shape, dtype=numpy.int16, ndv=NDV)
-        best_pixel_date = empty_array(shape=shape, dtype=numpy.int32, ndv=NDV)
+            composite.add_band(band, dtype=numpy.int16, ndv=NDV)
 
-        current_satellite = empty_array(shape=shape, dtype=numpy.int16, ndv=NDV)
-        current_date = empty_array(shape=shape, dtype=numpy.int32, ndv=NDV)
+        composite.add_band("SAT", dtype=numpy.int16, ndv=NDV)
+        composite.add_band("DATE", dtype=numpy.int32, ndv=NDV)
 
         SATELLITE_DATA_VALUES = {Satellite.LS5: 5, Satellite.LS7: 7, Satellite.LS8: 8}
 
@@ -127,94 +124,59 @@ class BareSoilCellTask(CellTask):
 
             _log.info("Processing [%s]", fc.path)
 
-            data = dict()
+            # Only the selected pixels are carried so the data doesn't need masking - the mask just limits which
+            # pixels can be selected
 
-            # Create an initial "no mask" mask
-
-            mask = numpy.ma.make_mask_none((4000, 4000))
-            # _log.info("### mask is [%s]", mask[1000][1000])
+            mask = None
 
             # Add the PQA mask if we are doing PQA masking
 
             if self.mask_pqa_apply:
                 mask = get_mask_pqa(pqa, pqa_masks=self.mask_pqa_mask, mask=mask)
-                # _log.info("### mask PQA is [%s]", mask[1000][1000])
 
             # Add the WOFS mask if we are doing WOFS masking
 
             if self.mask_wofs_apply and wofs:
                 mask = get_mask_wofs(wofs, wofs_masks=self.mask_wofs_mask, mask=mask)
-                # _log.info("### mask PQA is [%s]", mask[1000][1000])
 
             # Get NBAR dataset
 
-            data[DatasetType.ARG25] = get_dataset_data_masked(nbar, mask=mask)
-            # _log.info("### NBAR/RED is [%s]", data[DatasetType.ARG25][Ls57Arg25Bands.RED][1000][1000])
+            data_nbar = get_dataset_data(nbar)
 
             # Get the NDVI dataset
 
-            data[DatasetType.NDVI] = calculate_ndvi(data[DatasetType.ARG25][Ls57Arg25Bands.RED],
-                                                    data[DatasetType.ARG25][Ls57Arg25Bands.NEAR_INFRARED])
-            # _log.info("### NDVI is [%s]", data[DatasetType.NDVI][1000][1000])
-
-            # Add the NDVI value range mask (to the existing mask)
-
-            mask = self.get_mask_range(data[DatasetType.NDVI], min_val=0.0, max_val=0.3, mask=mask)
-            # _log.info("### mask NDVI is [%s]", mask[1000][1000])
+            ndvi = calculate_ndvi(data_nbar[Ls57Arg25Bands.RED], data_nbar[Ls57Arg25Bands.NEAR_INFRARED])
 
             # Get FC25 dataset
 
-            data[DatasetType.FC25] = get_dataset_data_masked(fc, mask=mask)
-            # _log.info("### FC/BS is [%s]", data[DatasetType.FC25][Fc25Bands.BARE_SOIL][1000][1000])
+            data_fc = get_dataset_data(fc)
 
-            # Add the bare soil value range mask (to the existing mask)
+            # The pixels that can be selected - not masked and the NDVI and bare soil values in range
 
-            mask = self.get_mask_range(data[DatasetType.FC25][Fc25Bands.BARE_SOIL], min_val=0, max_val=8000, mask=mask)
-            # _log.info("### mask BS is [%s]", mask[1000][1000])
+            valid = self.get_valid_range(ndvi, min_val=0.0, max_val=0.3)
 
-            # Apply the final mask to the FC25 bare soil data
+            del ndvi
 
-            data_bare_soil = numpy.ma.MaskedArray(data=data[DatasetType.FC25][Fc25Bands.BARE_SOIL], mask=mask).filled(NDV)
-            # _log.info("### bare soil is [%s]", data_bare_soil[1000][1000])
+            valid &= self.get_valid_range(data_fc[Fc25Bands.BARE_SOIL], min_val=0, max_val=8000)
 
-            # Compare the bare soil value from this dataset to the current "best" value
+            if mask is not None:
+                valid &= ~mask
 
-            best_pixel_fc[Fc25Bands.BARE_SOIL] = numpy.fmax(best_pixel_fc[Fc25Bands.BARE_SOIL], data_bare_soil)
-            # _log.info("### best pixel bare soil is [%s]", best_pixel_fc[Fc25Bands.BARE_SOIL][1000][1000])
+            del mask
 
-            # Now update the other best pixel datasets/bands to grab the pixels we just selected
+            values = dict()
 
-            for band in Ls57Arg25Bands:
-                best_pixel_nbar[band] = propagate_using_selected_pixel(best_pixel_fc[Fc25Bands.BARE_SOIL],
-                                                                       data_bare_soil,
-                                                                       data[DatasetType.ARG25][band],
-                                                                       best_pixel_nbar[band])
+            values.update(data_nbar)
+            values.update(data_fc)
 
-            for band in [Fc25Bands.PHOTOSYNTHETIC_VEGETATION, Fc25Bands.NON_PHOTOSYNTHETIC_VEGETATION, Fc25Bands.UNMIXING_ERROR]:
-                best_pixel_fc[band] = propagate_using_selected_pixel(best_pixel_fc[Fc25Bands.BARE_SOIL],
-                                                                     data_bare_soil,
-                                                                     data[DatasetType.FC25][band],
-                                                                     best_pixel_fc[band])
+            values["SAT"] = SATELLITE_DATA_VALUES[fc.satellite]
+            values["DATE"] = date_to_integer(tile.end_datetime)
 
-            # And now the other "provenance" data
+            selected = composite.update(data_fc[Fc25Bands.BARE_SOIL], values, valid=valid)
 
-            # Satellite "provenance" data
+            _log.debug("Selected [%d] pixels from [%s]", selected, fc.path)
 
-            current_satellite.fill(SATELLITE_DATA_VALUES[fc.satellite])
-
-            best_pixel_satellite = propagate_using_selected_pixel(best_pixel_fc[Fc25Bands.BARE_SOIL],
-                                                                  data_bare_soil,
-                                                                  current_satellite,
-                                                                  best_pixel_satellite)
-
-            # Date "provenance" data
-
-            current_date.fill(date_to_integer(tile.end_datetime))
-
-            best_pixel_date = propagate_using_selected_pixel(best_pixel_fc[Fc25Bands.BARE_SOIL],
-                                                             data_bare_soil,
-                                                             current_date,
-                                                             best_pixel_date)
+            del data_nbar, data_fc, values, valid
 
             # Grab the metadata from the input datasets for use later when creating the output datasets
 
@@ -229,7 +191,7 @@ class BareSoilCellTask(CellTask):
         # FC composite
 
         raster_create(self.get_dataset_filename("FC"),
-                      [best_pixel_fc[b] for b in Fc25Bands],
+                      [composite.bands[b] for b in Fc25Bands],
                       metadata_fc.transform, metadata_fc.projection,
                       metadata_fc.bands[Fc25Bands.BARE_SOIL].no_data_value,
                       metadata_fc.bands[Fc25Bands.BARE_SOIL].data_type)
@@ -237,7 +199,7 @@ class BareSoilCellTask(CellTask):
         # NBAR composite
 
         raster_create(self.get_dataset_filename("NBAR"),
-                      [best_pixel_nbar[b] for b in Ls57Arg25Bands],
+                      [composite.bands[b] for b in Ls57Arg25Bands],
                       metadata_nbar.transform, metadata_nbar.projection,
                       metadata_nbar.bands[Ls57Arg25Bands.BLUE].no_data_value,
                       metadata_nbar.bands[Ls57Arg25Bands.BLUE].data_type)
@@ -245,31 +207,23 @@ class BareSoilCellTask(CellTask):
         # Satellite "provenance" composites
 
         raster_create(self.get_dataset_filename("SAT"),
-                      [best_pixel_satellite],
+                      [composite.bands["SAT"]],
                       metadata_nbar.transform, metadata_nbar.projection, no_data_value,
                       gdal.GDT_Int16)
 
         # Date "provenance" composites
 
         raster_create(self.get_dataset_filename("DATE"),
-                      [best_pixel_date],
+                      [composite.bands["DATE"]],
                       metadata_nbar.transform, metadata_nbar.projection, no_data_value,
                       gdal.GDT_Int32)
 
     @staticmethod
-    def get_mask_range(input_data, min_val, max_val, mask=None, ndv=NDV):
-
-        # Create an empty mask if none provided - just to avoid an if below :)
-        if mask is None:
-            mask = numpy.ma.make_mask_none(numpy.shape(input_data))
-
-        # Mask out any no data values
-        data = numpy.ma.masked_equal(input_data, ndv)
+    def get_valid_range(input_data, min_val, max_val, ndv=NDV):
 
-        # Mask out values outside the given range
-        mask = numpy.ma.mask_or(mask, numpy.ma.masked_outside(data, min_val, max_val, copy=False).mask)
+        # Valid where the value is in the given range and isn't the no data value
 
-        return mask
+        return (input_data >= min_val) & (input_data <= max_val) & (input_data != ndv)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import gdal
+import logging
+import luigi
+import numpy
+import os
+import osr
+from datacube.api.model import DatasetType, Ls57Arg25Bands
+from datacube.api.workflow import TileListCsvTask
+from datacube.api.workflow.cell_chunk import Workflow, SummaryTask, CellTask, CellChunkTask
+from datacube.api.utils import NDV, empty_array, get_mask_pqa, get_mask_wofs, get_dataset_data_masked, date_to_integer
+from datacube.api.utils import calculate_medoid_composite, log_mem
+from datacube.api.writer import RasterWriter
+
+
+_log = logging.getLogger()
+
+
+# The medoid mosaic is calculated from the bands common to all the satellites
+
+BANDS = [b for b in Ls57Arg25Bands]
+
+# Outputs - the NBAR medoid composite and the "provenance" date of the selected observations
+
+OUTPUTS = ["NBAR", "DATE"]
+
+
+class MedoidMosaicWorkflow(Workflow):
+
+    def __init__(self):
+
+        Workflow.__init__(self, name="Medoid Mosaic")
+
+    def create_summary_tasks(self):
+
+        return [MedoidMosaicSummaryTask(x_min=self.x_min, x_max=self.x_max, y_min=self.y_min, y_max=self.y_max,
+                                        acq_min=self.acq_min, acq_max=self.acq_max, satellites=self.satellites,
+                                        output_directory=self.output_directory, csv=self.csv, dummy=self.dummy,
+                                        mask_pqa_apply=self.mask_pqa_apply, mask_pqa_mask=self.mask_pqa_mask,
+                                        mask_wofs_apply=self.mask_wofs_apply, mask_wofs_mask=self.mask_wofs_mask,
+                                        chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y)]
+
+
+class MedoidMosaicSummaryTask(SummaryTask):
+
+    def create_cell_tasks(self, x, y):
+
+        return MedoidMosaicCellTask(x=x, y=y, acq_min=self.acq_min, acq_max=self.acq_max, satellites=self.satellites,
+                                    output_directory=self.output_directory, csv=self.csv, dummy=self.dummy,
+                                    mask_pqa_apply=self.mask_pqa_apply, mask_pqa_mask=self.mask_pqa_mask,
+                                    mask_wofs_apply=self.mask_wofs_apply, mask_wofs_mask=self.mask_wofs_mask,
+                                    chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y)
+
+
+def get_medoid_filename(output_directory, satellites, dataset, x, y, acq_min, acq_max, extension="tif", chunk=None):
+
+    from datacube.api.workflow import format_date
+    from datacube.api.utils import get_satellite_string
+
+    filename = "{satellites}_MEDOID_{dataset}_{x:03d}_{y:04d}_{acq_min}_{acq_max}".format(
+        satellites=get_satellite_string(satellites), dataset=dataset, x=x, y=y,
+        acq_min=format_date(acq_min), acq_max=format_date(acq_max))
+
+    if chunk:
+        filename += "_{ulx:04d}_{uly:04d}_{lrx:04d}_{lry:04d}".format(ulx=chunk[0], uly=chunk[1], lrx=chunk[2], lry=chunk[3])
+
+    return os.path.join(output_directory, "{filename}.{extension}".format(filename=filename, extension=extension))
+
+
+class MedoidMosaicCellTask(CellTask):
+
+    def create_cell_chunk_task(self, x_offset, y_offset):
+
+        return MedoidMosaicCellChunkTask(x=self.x, y=self.y, acq_min=self.acq_min, acq_max=self.acq_max,
+                                         satellites=self.satellites,
+                                         output_directory=self.output_directory, csv=self.csv, dummy=self.dummy,
+                                         mask_pqa_apply=self.mask_pqa_apply, mask_pqa_mask=self.mask_pqa_mask,
+                                         mask_wofs_apply=self.mask_wofs_apply, mask_wofs_mask=self.mask_wofs_mask,
+                                         chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y,
+                                         x_offset=x_offset, y_offset=y_offset)
+
+    def output(self):
+
+        return [luigi.LocalTarget(get_medoid_filename(self.output_directory, self.satellites, dataset, self.x, self.y,
+                                                      self.acq_min, self.acq_max)) for dataset in OUTPUTS]
+
+    def run(self):
+
+        _log.info("Aggregating chunks into medoid mosaic")
+
+        transform = (self.x, 0.00025, 0.0, self.y+1, 0.0, -0.00025)
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+
+        projection = srs.ExportToWkt()
+
+        for dataset, target, band_names, data_type in [("NBAR", self.output()[0], [b.name for b in BANDS], gdal.GDT_Int16),
+                                                       ("DATE", self.output()[1], ["DATE"], gdal.GDT_Int32)]:
+
+            raster = RasterWriter(target.path, 4000, 4000, len(band_names), data_type, transform, projection, NDV,
+                                  dataset_metadata=self.generate_raster_metadata(), band_ids=band_names)
+
+            for x_offset, y_offset in self.get_chunks():
+
+                filename = get_medoid_filename(self.output_directory, self.satellites, dataset, self.x, self.y,
+                                               self.acq_min, self.acq_max, extension="npy",
+                                               chunk=(x_offset, y_offset,
+                                                      x_offset + self.chunk_size_x, y_offset + self.chunk_size_y))
+
+                _log.debug("Writing chunk [%4d|%4d] from [%s]", x_offset, y_offset, filename)
+
+                data = numpy.load(filename)
+
+                for index in range(len(band_names)):
+                    raster.write(index + 1, data[index], x_offset, y_offset)
+
+                del data
+
+            raster.close()
+
+    def generate_raster_metadata(self):
+        return {
+            "X_INDEX": "{x:03d}".format(x=self.x),
+            "Y_INDEX": "{y:04d}".format(y=self.y),
+            "DATASET_TYPE": "MEDOID MOSAIC",
+            "ACQUISITION_DATE": "{acq_min} to {acq_max}".format(acq_min=self.acq_min, acq_max=self.acq_max),
+            "SATELLITE": " ".join([s.name for s in self.satellites]),
+            "PIXEL_QUALITY_FILTER": self.mask_pqa_apply and " ".join([mask.name for mask in self.mask_pqa_mask]) or "",
+            "WATER_FILTER": self.mask_wofs_apply and " ".join([mask.name for mask in self.mask_wofs_mask]) or ""
+        }
+
+
+class MedoidMosaicCellChunkTask(CellChunkTask):
+
+    def requires(self):
+
+        if self.csv:
+            yield TileListCsvTask(x_min=self.x, x_max=self.x, y_min=self.y, y_max=self.y,
+                                  acq_min=self.acq_min, acq_max=self.acq_max, satellites=self.satellites,
+                                  dataset_types=self.get_dataset_types(), path=self.get_tile_csv_filename())
+
+    @staticmethod
+    def get_dataset_types():
+
+        return [DatasetType.ARG25, DatasetType.PQ25]
+
+    def get_chunk_filename(self, dataset):
+
+        return get_medoid_filename(self.output_directory, self.satellites, dataset, self.x, self.y,
+                                   self.acq_min, self.acq_max, extension="npy",
+                                   chunk=(self.x_offset, self.y_offset,
+                                          self.x_offset + self.chunk_size_x, self.y_offset + self.chunk_size_y))
+
+    def output(self):
+
+        return [luigi.LocalTarget(self.get_chunk_filename(dataset)) for dataset in OUTPUTS]
+
+    def run(self):
+
+        x_size = min(self.chunk_size_x, 4000 - self.x_offset)
+        y_size = min(self.chunk_size_y, 4000 - self.y_offset)
+
+        stack = list()
+        dates = list()
+
+        for tile in self.get_tiles():
+
+            if DatasetType.ARG25 not in tile.datasets:
+                continue
+
+            nbar = tile.datasets[DatasetType.ARG25]
+            pqa = DatasetType.PQ25 in tile.datasets and tile.datasets[DatasetType.PQ25] or None
+            wofs = DatasetType.WATER in tile.datasets and tile.datasets[DatasetType.WATER] or None
+
+            _log.info("Reading chunk [%4d|%4d] of [%s]", self.x_offset, self.y_offset, nbar.path)
+
+            mask = None
+
+            if self.mask_pqa_apply and pqa:
+                mask = get_mask_pqa(pqa, self.mask_pqa_mask, x=self.x_offset, y=self.y_offset,
+                                    x_size=x_size, y_size=y_size)
+
+            if self.mask_wofs_apply and wofs:
+                mask = get_mask_wofs(wofs, self.mask_wofs_mask, x=self.x_offset, y=self.y_offset,
+                                     x_size=x_size, y_size=y_size, mask=mask)
+
+            bands = [nbar.bands[b.name] for b in BANDS]
+
+            data = get_dataset_data_masked(nbar, bands=bands, x=self.x_offset, y=self.y_offset,
+                                           x_size=x_size, y_size=y_size, mask=mask, ndv=NDV)
+
+            stack.append([data[b] for b in bands])
+            dates.append(date_to_integer(tile.end_datetime))
+
+            del data
+
+        log_mem("Before medoid")
+
+        if stack:
+            composite, index = calculate_medoid_composite(numpy.array(stack, dtype=numpy.int16), ndv=NDV)
+            date = numpy.where(index >= 0, numpy.array(dates, dtype=numpy.int32)[index], NDV)
+
+        else:
+            composite = empty_array((len(BANDS), y_size, x_size), dtype=numpy.int16, ndv=NDV)
+            date = empty_array((y_size, x_size), dtype=numpy.int32, ndv=NDV)
+
+        del stack
+
+        log_mem("After medoid")
+
+        numpy.save(self.get_chunk_filename("NBAR"), composite)
+        numpy.save(self.get_chunk_filename("DATE"), date[numpy.newaxis])
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    MedoidMosaicWorkflow().run()
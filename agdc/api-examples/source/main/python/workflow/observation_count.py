@@ -26,7 +26,7 @@ import numpy
 import os
 from gdalconst import GDT_Int16
 from datacube.api.model import DatasetType, Pq25Bands
-from datacube.api.utils import NDV, empty_array, PqaMask, get_dataset_data
+from datacube.api.utils import NDV, empty_array, PqaMask, get_dataset_data, get_dataset_ndv, calculate_mask_pqa
 from datacube.api.utils import get_dataset_metadata, raster_create
 from datacube.api.workflow.cell import Workflow, SummaryTask, CellTask
 
@@ -113,22 +113,17 @@ class ObservationCountCellTask(CellTask):
             # Count any pixels that are no NDV - don't think we should actually have any but anyway
             #
 
-            # Mask out any no data pixels - should actually be none but anyway
-            pqa = numpy.ma.masked_equal(data, NDV)
-
-            # Count the data pixels - i.e. pixels that were NOT masked out
-            observation_count += numpy.where(data.mask, 0, 1)
+            observation_count += data != get_dataset_ndv(pqa)
 
             #
             # Count and pixels that are not masked due to pixel quality
             #
 
             for mask in masks:
-                # Apply the particular pixel mask
-                pqm = numpy.ma.masked_where(numpy.bitwise_and(data, mask) != mask, data)
+                # Count the pixels that are not masked out by the particular pixel mask
+                observation_count_clear[mask] += ~calculate_mask_pqa(data, [mask])
 
-                # Count the pixels that were not masked out
-                observation_count_clear[mask] += numpy.where(pqm.mask, 0, 1)
+            del data
 
             if not metadata:
                 metadata = get_dataset_metadata(pqa)
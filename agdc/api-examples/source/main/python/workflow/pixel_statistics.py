@@ -20,12 +20,18 @@
 __author__ = "Simon Oldfield"
 
 
+import gdal
 import luigi
 import logging
+import numpy
 import os
+import osr
 from datacube.api.model import DatasetType
+from datacube.api.statistics import Statistic, StatisticsAccumulator, statistic_arg
+from datacube.api.utils import get_mask_pqa, get_dataset_data_masked, get_dataset_ndv, log_mem
 from datacube.api.workflow.cell_dataset_band_chunk import Workflow, SummaryTask, CellTask, CellDatasetBandTask
 from datacube.api.workflow.cell_dataset_band_chunk import CellDatasetBandChunkTask
+from datacube.api.writer import RasterWriter
 
 
 _log = logging.getLogger()
@@ -40,6 +46,33 @@ class PixelStatisticsWorkflow(Workflow):
 
         Workflow.__init__(self, name="Pixel Statistics Workflow")
 
+        self.statistics = None
+
+    def setup_arguments(self):
+
+        # Call method on super class
+        Workflow.setup_arguments(self)
+
+        self.parser.add_argument("--statistic", help="The statistic(s) to calculate", action="store",
+                                 dest="statistics", type=statistic_arg, nargs="+", choices=Statistic,
+                                 default=[s for s in Statistic], metavar=" ".join([s.name for s in Statistic]))
+
+    def process_arguments(self, args):
+
+        # Call method on super class
+        Workflow.process_arguments(self, args)
+
+        self.statistics = args.statistics
+
+    def log_arguments(self):
+
+        # Call method on super class
+        Workflow.log_arguments(self)
+
+        _log.info("""
+        statistics = {statistics}
+        """.format(statistics=" ".join([s.name for s in self.statistics])))
+
     def create_summary_tasks(self):
 
         return [PixelStatisticsSummaryTask(x_min=self.x_min, x_max=self.x_max, y_min=self.y_min, y_max=self.y_max,
@@ -47,11 +80,14 @@ class PixelStatisticsWorkflow(Workflow):
                                                output_directory=self.output_directory, csv=self.csv, dummy=self.dummy,
                                                mask_pqa_apply=self.mask_pqa_apply, mask_pqa_mask=self.mask_pqa_mask,
                                                dataset_type=self.dataset_type, bands=self.bands,
+                                               statistics=self.statistics,
                                                chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y)]
 
 
 class PixelStatisticsSummaryTask(SummaryTask):
 
+    statistics = luigi.Parameter(is_list=True)
+
     def create_cell_tasks(self, x, y):
 
         return PixelStatisticsCellTask(x=x, y=y, acq_min=self.acq_min, acq_max=self.acq_max,
@@ -59,11 +95,14 @@ class PixelStatisticsSummaryTask(SummaryTask):
                                            output_directory=self.output_directory, csv=self.csv, dummy=self.dummy,
                                            mask_pqa_apply=self.mask_pqa_apply, mask_pqa_mask=self.mask_pqa_mask,
                                            dataset_type=self.dataset_type, bands=self.bands,
+                                           statistics=self.statistics,
                                            chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y)
 
 
 class PixelStatisticsCellTask(CellTask):
 
+    statistics = luigi.Parameter(is_list=True)
+
     def create_cell_dataset_band_task(self, band):
 
         return PixelStatisticsCellDatasetBandTask(x=self.x, y=self.y, acq_min=self.acq_min, acq_max=self.acq_max,
@@ -73,11 +112,14 @@ class PixelStatisticsCellTask(CellTask):
                                                       mask_pqa_apply=self.mask_pqa_apply,
                                                       mask_pqa_mask=self.mask_pqa_mask,
                                                       dataset_type=self.dataset_type, band=band,
+                                                      statistics=self.statistics,
                                                       chunk_size_x=self.chunk_size_x, chunk_size_y=self.chunk_size_y)
 
 
 class PixelStatisticsCellDatasetBandTask(CellDatasetBandTask):
 
+    statistics = luigi.Parameter(is_list=True)
+
     def create_cell_dataset_band_chunk_task(self, x_offset, y_offset):
         
         return PixelStatisticsCellDatasetBandChunkTask(x=self.x, y=self.y, acq_min=self.acq_min,
@@ -88,6 +130,7 @@ class PixelStatisticsCellDatasetBandTask(CellDatasetBandTask):
                                                            mask_pqa_apply=self.mask_pqa_apply,
                                                            mask_pqa_mask=self.mask_pqa_mask,
                                                            dataset_type=self.dataset_type, band=self.band,
+                                                           statistics=self.statistics,
                                                            chunk_size_x=self.chunk_size_x,
                                                            chunk_size_y=self.chunk_size_y,
                                                            x_offset=x_offset, y_offset=y_offset)
@@ -111,15 +154,51 @@ class PixelStatisticsCellDatasetBandTask(CellDatasetBandTask):
 
     def run(self):
 
-        print "****", self.output().path
+        _log.info("Aggregating chunks into [%s]", self.output().path)
+
+        transform = (self.x, 0.00025, 0.0, self.y+1, 0.0, -0.00025)
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)
+
+        projection = srs.ExportToWkt()
+
+        # One band per statistic
+
+        raster = RasterWriter(self.output().path, 4000, 4000, len(self.statistics), gdal.GDT_Float32, transform,
+                              projection, numpy.nan, dataset_metadata=self.generate_raster_metadata(),
+                              band_ids=[s.name for s in self.statistics])
+
+        for chunk in self.requires():
+
+            _log.debug("Writing chunk [%4d|%4d] from [%s]", chunk.x_offset, chunk.y_offset, chunk.output().path)
+
+            data = numpy.load(chunk.output().path)
 
-        # For now just create an empty output
-        from datacube.api.workflow import dummy
-        dummy(self.output().path)
+            for index in range(len(self.statistics)):
+                raster.write(index + 1, data[index], chunk.x_offset, chunk.y_offset)
+
+            del data
+
+        raster.close()
+
+    def generate_raster_metadata(self):
+        return {
+            "X_INDEX": "{x:03d}".format(x=self.x),
+            "Y_INDEX": "{y:04d}".format(y=self.y),
+            "DATASET_TYPE": "{dataset_type} STATISTICS".format(dataset_type=self.dataset_type.name),
+            "BAND": self.band,
+            "ACQUISITION_DATE": "{acq_min} to {acq_max}".format(acq_min=self.acq_min, acq_max=self.acq_max),
+            "SATELLITE": " ".join([s.name for s in self.satellites]),
+            "PIXEL_QUALITY_FILTER": self.mask_pqa_apply and " ".join([mask.name for mask in self.mask_pqa_mask]) or "",
+            "STATISTICS": " ".join([s.name for s in self.statistics])
+        }
 
 
 class PixelStatisticsCellDatasetBandChunkTask(CellDatasetBandChunkTask):
 
+    statistics = luigi.Parameter(is_list=True)
+
     def output(self):
 
         from datacube.api.workflow import format_date
@@ -128,7 +207,7 @@ class PixelStatisticsCellDatasetBandChunkTask(CellDatasetBandChunkTask):
         acq_min = format_date(self.acq_min)
         acq_max = format_date(self.acq_max)
 
-        filename = "{satellites}_OUTPUT_{x:03d}_{y:04d}_{acq_min}_{acq_max}_{band}_{ulx:04d}_{uly:04d}_{lrx:04d}_{lry:04d}.tif".format(
+        filename = "{satellites}_OUTPUT_{x:03d}_{y:04d}_{acq_min}_{acq_max}_{band}_{ulx:04d}_{uly:04d}_{lrx:04d}_{lry:04d}.npy".format(
             satellites=get_satellite_string(self.satellites), x=self.x, y=self.y, acq_min=acq_min, acq_max=acq_max,
             band=self.band,
             ulx=self.x_offset, uly=self.y_offset,
@@ -142,11 +221,47 @@ class PixelStatisticsCellDatasetBandChunkTask(CellDatasetBandChunkTask):
 
     def run(self):
 
-        print "****", self.output().path
+        x_size = min(self.chunk_size_x, 4000 - self.x_offset)
+        y_size = min(self.chunk_size_y, 4000 - self.y_offset)
+
+        # The statistics are accumulated a tile at a time - only the percentiles need the whole stack
+
+        accumulator = StatisticsAccumulator((y_size, x_size), statistics=self.statistics)
+
+        for tile in self.get_tiles():
+
+            if self.dataset_type not in tile.datasets:
+                continue
+
+            dataset = tile.datasets[self.dataset_type]
+            pqa = DatasetType.PQ25 in tile.datasets and tile.datasets[DatasetType.PQ25] or None
+
+            _log.info("Reading chunk [%4d|%4d] of [%s]", self.x_offset, self.y_offset, dataset.path)
+
+            mask = None
+
+            if self.mask_pqa_apply and pqa:
+                mask = get_mask_pqa(pqa, self.mask_pqa_mask, x=self.x_offset, y=self.y_offset,
+                                    x_size=x_size, y_size=y_size)
+
+            band = dataset.bands[self.band]
+
+            ndv = get_dataset_ndv(dataset)
+
+            data = get_dataset_data_masked(dataset, bands=[band], x=self.x_offset, y=self.y_offset,
+                                           x_size=x_size, y_size=y_size, mask=mask, ndv=ndv)
+
+            accumulator.add(numpy.where(data[band] == ndv, numpy.nan, data[band]))
+
+            del data
+
+        log_mem("Before statistics")
+
+        statistics = accumulator.get_all()
+
+        numpy.save(self.output().path, numpy.array([statistics[s] for s in self.statistics], dtype=numpy.float32))
 
-        # For now just create an empty output
-        from datacube.api.workflow import dummy
-        dummy(self.output().path)
+        log_mem("After statistics")
 
 
 if __name__ == '__main__':
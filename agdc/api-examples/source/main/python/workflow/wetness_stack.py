@@ -30,6 +30,7 @@ from datacube.api.workflow.cell import Workflow, SummaryTask, CellTask
 from datacube.api.model import DatasetType, TciBands
 from datacube.api.utils import log_mem
 from datacube.api.workflow import format_date
+from datacube.api.writer import RasterWriter, get_geotiff_options
 
 
 _log = logging.getLogger()
@@ -89,19 +90,11 @@ class WetnessCellTask(CellTask):
 
         projection = srs.ExportToWkt()
 
-        driver = gdal.GetDriverByName("GTiff")
-        assert driver
-
         # TODO
 
-        raster = driver.Create(self.output().path, 4000, 4000, len(tiles), gdal.GDT_Float32, options=["BIGTIFF=YES", "INTERLEAVE=BAND"])
-        assert raster
-
-        # TODO
-        raster.SetGeoTransform(transform)
-        raster.SetProjection(projection)
-
-        raster.SetMetadata(self.generate_raster_metadata())
+        raster = RasterWriter(self.output().path, 4000, 4000, len(tiles), gdal.GDT_Float32, transform, projection,
+                              numpy.nan, options=get_geotiff_options(gdal.GDT_Float32, bigtiff=True),
+                              dataset_metadata=self.generate_raster_metadata())
 
         for index, tile in enumerate(tiles, start=1):
 
@@ -121,19 +114,14 @@ class WetnessCellTask(CellTask):
 
             log_mem("After get data")
 
-            band = raster.GetRasterBand(index)
-
-            band.SetDescription(os.path.basename(filename))
-            band.SetNoDataValue(numpy.nan)
-            band.WriteArray(data)
-            band.ComputeStatistics(True)
-            band.SetMetadata({"ACQ_DATE": format_date(tile.end_datetime), "SATELLITE": tile.datasets[DatasetType.TCI].satellite.name})
+            raster.write_band(index, data)
+            raster.set_band_metadata(index, description=os.path.basename(filename),
+                                     metadata={"ACQ_DATE": format_date(tile.end_datetime),
+                                               "SATELLITE": tile.datasets[DatasetType.TCI].satellite.name})
 
-            band.FlushCache()
-            del band
+            del data
 
-        raster.FlushCache()
-        del raster
+        raster.close()
 
     def generate_raster_metadata(self):
         return {
@@ -29,33 +29,16 @@ from datacube.api.model import DatasetType, TciBands
 from datacube.api.workflow import TileListCsvTask
 from datacube.api.workflow.tile import TileTask
 from datacube.api.workflow.cell_chunk import Workflow, SummaryTask, CellTask, CellChunkTask
-from enum import Enum
 import gdal
 from datacube.api.utils import get_dataset_metadata, get_mask_pqa, get_mask_wofs, get_dataset_ndv, log_mem
 from datacube.api.utils import get_dataset_data_masked, raster_create
+from datacube.api.statistics import Statistic, StatisticsAccumulator
+from datacube.api.writer import RasterWriter
 
 
 _log = logging.getLogger()
 
 
-class Statistic(Enum):
-    __order__ = "COUNT COUNT_OBSERVED MIN MAX MEAN SUM STANDARD_DEVIATION VARIANCE PERCENTILE_25 PERCENTILE_50 PERCENTILE_75 PERCENTILE_90 PERCENTILE_95"
-
-    COUNT = "COUNT"
-    COUNT_OBSERVED = "COUNT_OBSERVED"
-    MIN = "MIN"
-    MAX = "MAX"
-    MEAN = "MEAN"
-    SUM = "SUM"
-    STANDARD_DEVIATION = "STANDARD_DEVIATION"
-    VARIANCE = "VARIANCE"
-    PERCENTILE_25 = "PERCENTILE_25"
-    PERCENTILE_50 = "PERCENTILE_50"
-    PERCENTILE_75 = "PERCENTILE_75"
-    PERCENTILE_90 = "PERCENTILE_90"
-    PERCENTILE_95 = "PERCENTILE_95"
-
-
 class WetnessWorkflow(Workflow):
 
     def __init__(self):
@@ -140,24 +123,16 @@ class WetnessCellTask(CellTask):
 
         projection = srs.ExportToWkt()
 
-        driver = gdal.GetDriverByName("GTiff")
-        assert driver
+        # statistics = [Statistic.COUNT, Statistic.MIN]
+        statistics = [s for s in Statistic]
 
         # Create the output TIF
 
         # TODO
 
-        raster = driver.Create(self.output().path, 4000, 4000, len(Statistic), gdal.GDT_Float32)
-        assert raster
-
-        # TODO
-        raster.SetGeoTransform(transform)
-        raster.SetProjection(projection)
-
-        raster.SetMetadata(self.generate_raster_metadata())
-
-        # statistics = [Statistic.COUNT, Statistic.MIN]
-        statistics = [s for s in Statistic]
+        raster = RasterWriter(self.output().path, 4000, 4000, len(statistics), gdal.GDT_Float32, transform, projection,
+                              numpy.nan, dataset_metadata=self.generate_raster_metadata(),
+                              band_ids=[s.name for s in statistics])
 
         import itertools
 
@@ -165,13 +140,6 @@ class WetnessCellTask(CellTask):
 
             _log.info("Doing statistic [%s] which is band [%s]", statistic.name, index)
 
-            band = raster.GetRasterBand(index)
-            assert band
-
-            # TODO
-            band.SetNoDataValue(numpy.nan)
-            band.SetDescription(statistic.name)
-
             for x_offset, y_offset in itertools.product(range(0, 4000, self.chunk_size_x),
                                                         range(0, 4000, self.chunk_size_y)):
                 filename = os.path.join(self.output_directory,
@@ -189,17 +157,11 @@ class WetnessCellTask(CellTask):
                 _log.info("Writing it to (%d,%d)", x_offset, y_offset)
 
                 # write the chunk to the TIF at the offset
-                band.WriteArray(data, x_offset, y_offset)
-
-                band.FlushCache()
-
-            band.ComputeStatistics(True)
-            band.FlushCache()
+                raster.write(index, data, x_offset, y_offset)
 
-            del band
+                del data
 
-        raster.FlushCache()
-        del raster
+        raster.close()
 
         # TODO delete .npy files?
 
@@ -288,7 +250,9 @@ class WetnessCellChunkTask(CellChunkTask):
 
     def run(self):
 
-        stack = list()
+        # The statistics are accumulated a tile at a time so only the percentiles need the whole stack
+
+        accumulator = None
 
         for tile in self.get_tiles():
 
@@ -300,148 +264,31 @@ class WetnessCellChunkTask(CellChunkTask):
 
             filename = os.path.join(self.output_directory, filename)
 
-            print "+++", filename
-
-            log_mem("Before get data")
+            _log.info("Reading chunk [%4d|%4d] of [%s]", self.x_offset, self.y_offset, filename)
 
             data = read_dataset_data(filename, bands=[TciBands.WETNESS],
                                      x=self.x_offset, y=self.y_offset,
                                      x_size=self.chunk_size_x, y_size=self.chunk_size_y)
 
-            log_mem("After get data")
+            if accumulator is None:
+                accumulator = StatisticsAccumulator(numpy.shape(data), statistics=[s for s in Statistic])
 
-            # stack.append(data[TciBands.WETNESS])
-            stack.append(data)
+            accumulator.add(data)
 
             del data
 
-            log_mem("After adding data to stack and deleting it")
+            log_mem("After adding data to statistics")
 
-        if len(stack) == 0:
+        if accumulator is None:
             return
 
-        stack = numpy.array(stack)
-        stack_depth, stack_size_y, stack_size_x = numpy.shape(stack)
-
-        _log.info("stack depth [%d] x_size [%d] y size [%d]", stack_depth, stack_size_x, stack_size_y)
-
-        log_mem("Before COUNT")
-
-        # COUNT
-        print "COUNT"
-        stack_stat = numpy.empty((stack_size_y, stack_size_x), dtype=numpy.float32)
-        stack_stat.fill(stack_depth)
-        numpy.save(self.get_statistic_filename(Statistic.COUNT), stack_stat)
-        del stack_stat
-
-        log_mem("Before MIN")
-
-        # MIN
-        print "MIN"
-        stack_stat = numpy.nanmin(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.MIN), stack_stat)
-        del stack_stat
-
-        log_mem("Before MAX")
-
-        # MAX
-        print "MAX"
-        stack_stat = numpy.nanmax(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.MAX), stack_stat)
-        del stack_stat
-
-        log_mem("Before MEAN")
-
-        # MEAN
-        print "MEAN"
-        stack_stat = numpy.nanmean(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.MEAN), stack_stat)
-        del stack_stat
-
-        log_mem("Before SUM")
-
-        # SUM
-        print "SUM"
-        stack_stat = numpy.nansum(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.SUM), stack_stat)
-        del stack_stat
-
-        log_mem("Before STD")
-
-        # STANDARD_DEVIATION
-        print "STD"
-        stack_stat = numpy.nanstd(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.STANDARD_DEVIATION), stack_stat)
-        del stack_stat
-
-        log_mem("Before VAR")
-
-        # VARIANCE
-        print "VAR"
-        stack_stat = numpy.nanvar(stack, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.VARIANCE), stack_stat)
-        del stack_stat
-
-        # log_mem("Before PERCENTILES")
-        #
-        # # PERCENTILES
-        # print "PERCENTILES"
-        # stack_stat = numpy.nanpercentile(stack, [25, 50, 75, 90, 95], axis=0)
-        #
-        # for index, statistic in enumerate([Statistic.PERCENTILE_25, Statistic.PERCENTILE_50,
-        #                                    Statistic.PERCENTILE_75, Statistic.PERCENTILE_90,
-        #                                    Statistic.PERCENTILE_95]):
-        #     numpy.save(self.get_statistic_filename(statistic), stack_stat[index])
-        #
-        # del stack_stat
-
-        log_mem("Before P25")
-
-        # PERCENTILE_25
-        print "P25"
-        stack_stat = numpy.nanpercentile(stack, 25, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.PERCENTILE_25), stack_stat)
-        del stack_stat
-
-        log_mem("Before P50")
-
-        # PERCENTILE_50
-        print "P50"
-        stack_stat = numpy.nanpercentile(stack, 50, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.PERCENTILE_50), stack_stat)
-        del stack_stat
-
-        log_mem("Before P75")
-
-        # PERCENTILE_75
-        print "P75"
-        stack_stat = numpy.nanpercentile(stack, 75, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.PERCENTILE_75), stack_stat)
-        del stack_stat
-
-        log_mem("Before P90")
-
-        # PERCENTILE_90
-        print "P90"
-        stack_stat = numpy.nanpercentile(stack, 90, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.PERCENTILE_90), stack_stat)
-        del stack_stat
-
-        log_mem("Before P95")
-
-        # PERCENTILE_95
-        print "P95"
-        stack_stat = numpy.nanpercentile(stack, 95, axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.PERCENTILE_95), stack_stat)
-        del stack_stat
+        _log.info("stack depth [%d] x_size [%d] y size [%d]", accumulator.count, accumulator.shape[1],
+                  accumulator.shape[0])
 
-        log_mem("Before OBSERVED COUNT")
+        log_mem("Before statistics")
 
-        # COUNT OBSERVED - note the copy=False is modifying the array so this is done last
-        print "COUNT OBSERVED"
-        stack_stat = numpy.ma.masked_invalid(stack, copy=False).count(axis=0)
-        numpy.save(self.get_statistic_filename(Statistic.COUNT_OBSERVED), stack_stat)
-        del stack_stat
+        for statistic, stack_stat in accumulator.get_all().iteritems():
+            numpy.save(self.get_statistic_filename(statistic), stack_stat)
 
         log_mem("DONE")
 
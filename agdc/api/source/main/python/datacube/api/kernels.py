@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import numpy
+
+
+_log = logging.getLogger(__name__)
+
+
+# numexpr is optional - if it is available the index expressions are evaluated with it (in a single pass without
+# temporaries) otherwise with numpy
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+# Spectral index kernels
+#
+# An index is an arithmetic expression of the input bands.  It is evaluated (in float32) a block of rows at a time
+# into a preallocated output array - so the temporaries are the size of a block rather than the whole array.
+#
+# The output is the no data value where any input is the no data value or where the result isn't finite (e.g. the
+# denominator is 0).
+
+DEFAULT_BLOCK_ROWS = 256
+
+DEFAULT_DTYPE = numpy.float32
+
+
+def use_numexpr():
+    return numexpr is not None
+
+
+def evaluate_index(expression, bands, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS,
+                   dtype=DEFAULT_DTYPE, numexpr_enabled=True):
+
+    """
+    Evaluate an index expression of the bands a block of rows at a time
+
+    :param expression: The index expression in terms of the band names e.g. "(nir - red) / (nir + red)"
+    :type expression: str
+    :param bands: band name -> data (all the same shape)
+    :type bands: dict[str, numpy.array]
+    :param input_ndv: The no data value of the bands
+    :param output_ndv: The no data value of the output
+    :param out: Optional output array (default is a new array of dtype)
+    :type out: numpy.array
+    :param block_rows: Number of rows to evaluate at a time
+    :type block_rows: int
+    :param dtype: The data type the expression is evaluated in
+    :param numexpr_enabled: Whether to use numexpr (if it is available)
+    :type numexpr_enabled: bool
+    :return: The index
+    :rtype: numpy.array
+    """
+
+    names = sorted(bands)
+
+    shape = numpy.shape(bands[names[0]])
+
+    if out is None:
+        out = numpy.empty(shape, dtype=dtype)
+
+    rows = shape[0]
+
+    for start in range(0, rows, block_rows):
+
+        block = slice(start, min(start + block_rows, rows))
+
+        data = dict((name, numpy.asarray(bands[name])[block]) for name in names)
+
+        valid = numpy.ones(numpy.shape(data[names[0]]), dtype=numpy.bool_)
+
+        for name in names:
+            valid &= data[name] != input_ndv
+            data[name] = data[name].astype(dtype)
+
+        with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+
+            if numexpr_enabled and use_numexpr():
+                result = numexpr.evaluate(expression, local_dict=data)
+
+            else:
+                result = eval(expression, {"__builtins__": None}, data)
+
+            valid &= numpy.isfinite(result)
+
+        out[block] = numpy.where(valid, result, output_ndv)
+
+    return out
+
+
+def normalised_difference(a, b, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS):
+
+    """
+    Calculate the normalised difference (A - B) / (A + B)
+    """
+
+    return evaluate_index("(a - b) / (a + b)", {"a": a, "b": b}, input_ndv, output_ndv, out=out, block_rows=block_rows)
+
+
+def ndvi(red, nir, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS):
+
+    """
+    Calculate NDVI - (NIR - RED) / (NIR + RED)
+    """
+
+    return normalised_difference(nir, red, input_ndv, output_ndv, out=out, block_rows=block_rows)
+
+
+def evi(red, blue, nir, l, c1, c2, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS):
+
+    """
+    Calculate EVI - 2.5 * (NIR - RED) / (NIR + C1 * RED - C2 * BLUE + L)
+    """
+
+    expression = "2.5 * (nir - red) / (nir + {c1!r} * red - {c2!r} * blue + {l!r})".format(
+        c1=float(c1), c2=float(c2), l=float(l))
+
+    return evaluate_index(expression, {"red": red, "blue": blue, "nir": nir}, input_ndv, output_ndv, out=out,
+                          block_rows=block_rows)
+
+
+def nbr(nir, swir, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS):
+
+    """
+    Calculate NBR - (NIR - SWIR 2) / (NIR + SWIR 2)
+    """
+
+    return normalised_difference(nir, swir, input_ndv, output_ndv, out=out, block_rows=block_rows)
+
+
+def linear_combination(bands, coefficients, scale, input_ndv, output_ndv, out=None, block_rows=DEFAULT_BLOCK_ROWS):
+
+    """
+    Calculate the sum of coefficient * (band / scale) over the bands with a coefficient (e.g. a tasselled cap index)
+
+    :param bands: band -> data
+    :type bands: dict
+    :param coefficients: band -> coefficient
+    :type coefficients: dict
+    :param scale: the scale of the band values (e.g. 10000 for reflectance)
+    """
+
+    names = dict()
+    terms = list()
+
+    for band in sorted(bands, key=lambda b: b.value):
+        if band in coefficients:
+            name = "b{value}".format(value=len(names))
+            names[name] = bands[band]
+            terms.append("{coefficient!r} * {name}".format(coefficient=float(coefficients[band]), name=name))
+
+    expression = "({terms}) / {scale!r}".format(terms=" + ".join(terms), scale=float(scale))
+
+    return evaluate_index(expression, names, input_ndv, output_ndv, out=out, block_rows=block_rows)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import cPickle
+import hashlib
+import logging
+import numpy
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from enum import Enum
+
+
+_log = logging.getLogger(__name__)
+
+
+# AOI mask caches hold the rasterised mask of a vector feature for a cell.
+#
+# Masks are keyed on a hash of the feature geometry (so a changed vector file gives new masks) and the cell and its
+# pixel grid (i.e. the tile type).  They are stored bit-packed and zlib compressed both in memory and on disk.  A cell
+# wholly inside or outside the feature isn't rasterised at all - only the fact is stored.
+
+AOI_MASK_CACHE_VERSION = 1
+
+DEFAULT_AOI_MASK_CACHE_DIRECTORY = os.path.expanduser("~/.datacube/aoi_masks")
+
+DEFAULT_AOI_MASK_CACHE_SIZE = 256
+
+
+class AoiMaskState(Enum):
+    __order__ = "INSIDE OUTSIDE PARTIAL"
+
+    INSIDE = "INSIDE"
+    OUTSIDE = "OUTSIDE"
+    PARTIAL = "PARTIAL"
+
+
+def get_cell_polygon(x, y, width, height, pixel_size_x, pixel_size_y):
+
+    """
+    Return the polygon of the cell's pixel grid
+
+    :rtype: ogr.Geometry
+    """
+
+    import ogr
+
+    ulx, uly = x, y + 1
+    lrx, lry = x + width * pixel_size_x, y + 1 + height * pixel_size_y
+
+    return ogr.CreateGeometryFromWkt(
+        "POLYGON(({ulx!r} {uly!r}, {lrx!r} {uly!r}, {lrx!r} {lry!r}, {ulx!r} {lry!r}, {ulx!r} {uly!r}))".format(
+            ulx=float(ulx), uly=float(uly), lrx=float(lrx), lry=float(lry)))
+
+
+def get_aoi_mask_state(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y):
+
+    """
+    Return whether the cell is wholly inside, wholly outside or partially inside the feature
+
+    :rtype: AoiMaskState
+    """
+
+    import ogr
+
+    geometry = ogr.CreateGeometryFromWkb(geometry_wkb)
+    cell = get_cell_polygon(x, y, width, height, pixel_size_x, pixel_size_y)
+
+    if not geometry.Intersects(cell):
+        return AoiMaskState.OUTSIDE
+
+    if geometry.Contains(cell):
+        return AoiMaskState.INSIDE
+
+    return AoiMaskState.PARTIAL
+
+
+def rasterise_aoi_mask(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y, epsg):
+
+    """
+    Rasterise the feature over the cell
+
+    :return: The mask (True outside the feature)
+    :rtype: numpy.array
+    """
+
+    import gdal
+    import ogr
+    import osr
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+
+    driver = gdal.GetDriverByName("MEM")
+    assert driver
+
+    raster = driver.Create("", width, height, 1, gdal.GDT_Byte)
+    assert raster
+
+    raster.SetGeoTransform((x, pixel_size_x, 0.0, y+1, 0.0, pixel_size_y))
+    raster.SetProjection(srs.ExportToWkt())
+
+    # Rasterise the (already transformed) geometry from an in memory layer rather than re-opening the vector file
+
+    vector = ogr.GetDriverByName("Memory").CreateDataSource("")
+    assert vector
+
+    layer = vector.CreateLayer("aoi", srs=srs)
+    assert layer
+
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(ogr.CreateGeometryFromWkb(geometry_wkb))
+    layer.CreateFeature(feature)
+
+    gdal.RasterizeLayer(raster, [1], layer, burn_values=[1])
+
+    del feature, layer, vector
+
+    band = raster.GetRasterBand(1)
+    assert band
+
+    data = band.ReadAsArray()
+
+    del band, raster
+
+    _log.debug("Rasterised [%s] AOI mask for cell [%03d,%04d]", numpy.shape(data), x, y)
+
+    return data != 1
+
+
+def pack_mask(mask):
+
+    """
+    Bit-pack and compress a mask
+    """
+
+    return zlib.compress(numpy.packbits(mask).tostring())
+
+
+def unpack_mask(data, shape):
+
+    """
+    Decompress and unpack a mask
+    """
+
+    size = shape[0] * shape[1]
+
+    return numpy.unpackbits(numpy.fromstring(zlib.decompress(data), dtype=numpy.uint8))[:size].reshape(
+        shape).view(numpy.bool_)
+
+
+class AoiMaskCache(object):
+
+    """
+    A size bounded, thread safe, LRU cache of AOI masks backed by (optional) per mask files in a directory
+    """
+
+    def __init__(self, directory=DEFAULT_AOI_MASK_CACHE_DIRECTORY, max_size=DEFAULT_AOI_MASK_CACHE_SIZE):
+
+        """
+        :param directory: The cache directory (None for an in memory cache only)
+        :type directory: str
+        :param max_size: The maximum number of masks held in memory
+        :type max_size: int
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # key -> (state, shape, packed mask)
+        self._masks = OrderedDict()
+
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y, epsg):
+
+        h = hashlib.sha1(geometry_wkb)
+        h.update(repr((AOI_MASK_CACHE_VERSION, x, y, width, height, pixel_size_x, pixel_size_y, epsg)))
+
+        return h.hexdigest()
+
+    def get_filename(self, key, x, y):
+
+        return os.path.join(self.directory, "aoi_{x:03d}_{y:04d}_{key}.mask".format(x=x, y=y, key=key))
+
+    def read(self, filename):
+
+        try:
+            with open(filename, "rb") as f:
+                entry = cPickle.load(f)
+
+        except (IOError, EOFError, cPickle.UnpicklingError) as e:
+            _log.debug("Unable to read AOI mask cache [%s] [%s]", filename, e)
+            return None
+
+        if entry.get("version") != AOI_MASK_CACHE_VERSION:
+            return None
+
+        return AoiMaskState[entry["state"]], entry["shape"], entry["data"]
+
+    def write(self, filename, state, shape, data):
+
+        # Write atomically so concurrent processes never read a partial file - but failing to write isn't fatal
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            handle, temp_filename = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+
+            try:
+                with os.fdopen(handle, "wb") as f:
+                    cPickle.dump({"version": AOI_MASK_CACHE_VERSION, "state": state.name, "shape": shape,
+                                  "data": data}, f, cPickle.HIGHEST_PROTOCOL)
+
+                os.rename(temp_filename, filename)
+
+            except Exception:
+                if os.path.exists(temp_filename):
+                    os.remove(temp_filename)
+                raise
+
+        except (IOError, OSError) as e:
+            _log.warn("Unable to write AOI mask cache [%s] [%s]", filename, e)
+
+    def get_mask(self, geometry_wkb, x, y, width=4000, height=4000, pixel_size_x=0.00025, pixel_size_y=-0.00025,
+                 epsg=4326):
+
+        """
+        Return the AOI mask of the feature for the cell
+
+        :param geometry_wkb: The feature geometry (in the cell's projection)
+        :type geometry_wkb: str
+        :param x: X index of the cell
+        :type x: int
+        :param y: Y index of the cell
+        :type y: int
+        :param width: Width of the mask
+        :type width: int
+        :param height: Height of the mask
+        :type height: int
+        :param pixel_size_x: X pixel size
+        :type pixel_size_x: float
+        :param pixel_size_y: Y pixel size
+        :type pixel_size_y: float
+        :param epsg: The projection of the cell
+        :type epsg: int
+        :return: The mask (True outside the feature)
+        :rtype: numpy.array
+        """
+
+        key = self.get_key(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y, epsg)
+
+        with self._lock:
+            entry = self._masks.pop(key, None)
+
+            if entry:
+                self._masks[key] = entry
+                self.hits += 1
+
+        if not entry and self.directory:
+            entry = self.read(self.get_filename(key, x, y))
+
+            if entry:
+                self.disk_hits += 1
+                self._store(key, entry)
+
+        if not entry:
+            self.misses += 1
+
+            state = get_aoi_mask_state(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y)
+
+            _log.debug("AOI mask for cell [%03d,%04d] is [%s]", x, y, state.name)
+
+            data = None
+
+            if state == AoiMaskState.PARTIAL:
+                data = pack_mask(rasterise_aoi_mask(geometry_wkb, x, y, width, height, pixel_size_x, pixel_size_y,
+                                                    epsg))
+
+            entry = (state, (height, width), data)
+
+            self._store(key, entry)
+
+            if self.directory:
+                self.write(self.get_filename(key, x, y), *entry)
+
+        state, shape, data = entry
+
+        if state == AoiMaskState.INSIDE:
+            return numpy.zeros(shape, dtype=numpy.bool_)
+
+        if state == AoiMaskState.OUTSIDE:
+            return numpy.ones(shape, dtype=numpy.bool_)
+
+        return unpack_mask(data, shape)
+
+    def _store(self, key, entry):
+
+        with self._lock:
+            self._masks.pop(key, None)
+            self._masks[key] = entry
+
+            while len(self._masks) > self.max_size:
+                self._masks.popitem(last=False)
+
+    def clear(self):
+
+        with self._lock:
+            self._masks.clear()
+
+    def get_stats(self):
+
+        """
+        Return the cache statistics
+
+        :return: hits (memory and disk), misses and the number of masks in memory
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "masks": len(self._masks)}
+
+
+_aoi_mask_cache = AoiMaskCache()
+
+
+def get_aoi_mask_cache():
+
+    """
+    Return the process wide AOI mask cache
+
+    :rtype: AoiMaskCache
+    """
+
+    return _aoi_mask_cache
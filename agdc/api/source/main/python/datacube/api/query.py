@@ -23,8 +23,12 @@ __author__ = "Simon Oldfield"
 import logging
 import psycopg2
 import psycopg2.extras
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 import sys
 import os
+import itertools
+import threading
+import time
 from collections import namedtuple
 from datacube.api.utils import extract_feature_geometry_wkb
 from datacube.config import Config
@@ -123,23 +127,68 @@ def print_tile(tile):
                ",".join("|".join([ds.type_id, ds.path]) for ds in tile.datasets))
 
 
-def connect_to_db(config=None):
+DEFAULT_POOL_SIZE = 4
+
+# Seconds get waits for a pooled connection when they are all in use (None to wait forever)
+DEFAULT_POOL_TIMEOUT = 300
+
+# Idle pooled connections older than this (in seconds) are checked with a query before reuse
+POOL_HEALTH_CHECK_INTERVAL = 60
+
+# Rows fetched at a time by the streaming (named) cursors of the *_as_generator functions
+DEFAULT_ITERSIZE = 2000
+
+SEARCH_PATH_SQL = "set search_path to public, {schema}".format(schema="gis, topology, ztmp")
+
+
+def get_default_config():
 
     """
-    Connect to the AGDC DB
+    Get the default configuration ($HOME/.datacube/config), reading it once per process
 
-    :param config: Configuration
+    :return: Configuration
+    :rtype: datacube.config.Config
+    """
+
+    global _default_config
+
+    if not _default_config:
+        _default_config = Config(os.path.expandvars("$HOME/.datacube/config"))
+        _log.debug(_default_config.to_str())
+
+    return _default_config
+
+_default_config = None
+
+
+def get_use_tile_index(config=None):
+
+    """
+    Return whether to query the (denormalised) tile index table rather than the tile tables - the use_tile_index
+    option of the QUERY section of the configuration
+
+    :param config: Config
     :type config: datacube.config.Config
+    :rtype: bool
+    """
+
+    return (config or get_default_config()).get_query_use_tile_index()
+
+
+def get_connection_string(config=None):
 
-    :return: DB connection and cursor
-    :rtype: (psycopg2.connection, psycopg2.cursor)
     """
+    Get the DB connection string for a configuration
 
-    connection = cursor = None
+    :param config: Configuration (default configuration if not specified)
+    :type config: datacube.config.Config
+
+    :return: Connection string
+    :rtype: str
+    """
 
     if not config:
-        config = Config(os.path.expandvars("$HOME/.datacube/config"))
-        _log.debug(config.to_str())
+        config = get_default_config()
 
     connection_string = ""
 
@@ -153,14 +202,337 @@ def connect_to_db(config=None):
                                                                                      user=config.get_db_username(),
                                                                                      password=config.get_db_password())
 
-    connection = psycopg2.connect(connection_string)
+    return connection_string
+
+
+def connect_to_db(config=None):
+
+    """
+    Connect to the AGDC DB
+
+    This always opens a new connection - use get_db_connection to use a pooled one.
+
+    :param config: Configuration
+    :type config: datacube.config.Config
+
+    :return: DB connection and cursor
+    :rtype: (psycopg2.connection, psycopg2.cursor)
+    """
+
+    connection = psycopg2.connect(get_connection_string(config))
 
     cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cursor.execute("set search_path to public, {schema}".format(schema="gis, topology, ztmp"))
+    cursor.execute(SEARCH_PATH_SQL)
 
     return connection, cursor
 
 
+class ConnectionPoolTimeoutError(Exception):
+
+    """
+    Raised when no pooled connection becomes available within the timeout
+    """
+
+    pass
+
+
+class ConnectionPool(object):
+
+    """
+    A pool of connections to the AGDC DB for one connection string
+
+    Connections are created lazily, up to max_size (get waits up to timeout seconds for one to be returned when they
+    are all in use). A connection is checked before reuse - closed or broken connections are discarded, as are
+    connections that fail a test query after being idle for longer than POOL_HEALTH_CHECK_INTERVAL.
+    """
+
+    def __init__(self, connection_string, max_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT):
+
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.timeout = timeout
+
+        # Connections can't be shared with a forked process
+        self.pid = os.getpid()
+
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def get(self, timeout=None):
+
+        """
+        Get a connection from the pool
+
+        :param timeout: Seconds to wait for a connection when they are all in use (default the pool's timeout)
+        :type timeout: float
+
+        :return: DB connection
+        :rtype: psycopg2.connection
+
+        :raise ConnectionPoolTimeoutError: If no connection became available within the timeout
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._condition:
+
+            while True:
+
+                while self._idle:
+                    connection, last_used = self._idle.pop()
+
+                    if self._is_healthy(connection, last_used):
+                        return connection
+
+                    self._discard(connection)
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+
+                remaining = deadline - time.time()
+
+                if remaining <= 0:
+                    raise ConnectionPoolTimeoutError(
+                        "No connection available after waiting {timeout} seconds - all {max_size} connections to "
+                        "the AGDC DB are in use".format(timeout=timeout, max_size=self.max_size))
+
+                self._condition.wait(remaining)
+
+        try:
+            connection = psycopg2.connect(self.connection_string)
+
+            # Session setting so commit it - it would be undone by the rollback when the connection is returned
+            connection.cursor().execute(SEARCH_PATH_SQL)
+            connection.commit()
+
+            return connection
+
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def put(self, connection):
+
+        """
+        Return a connection to the pool, ending any transaction in progress
+
+        :param connection: DB connection from get
+        :type connection: psycopg2.connection
+        """
+
+        with self._condition:
+
+            try:
+                if not connection.closed:
+                    connection.rollback()
+                    self._idle.append((connection, time.time()))
+                    self._condition.notify()
+                    return
+
+            except psycopg2.Error as e:
+                _log.debug("Discarding pooled connection [%s]", e)
+
+            self._discard(connection)
+
+    def close(self):
+
+        """
+        Close the idle connections in the pool
+        """
+
+        with self._condition:
+
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._discard(connection)
+
+    def _is_healthy(self, connection, last_used):
+
+        if connection.closed or connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+
+        if time.time() - last_used < POOL_HEALTH_CHECK_INTERVAL:
+            return True
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute("select 1")
+            cursor.close()
+            connection.rollback()
+            return True
+
+        except psycopg2.Error as e:
+            _log.debug("Pooled connection failed health check [%s]", e)
+            return False
+
+    def _discard(self, connection):
+
+        # Called with the condition held
+
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+        self._size -= 1
+        self._condition.notify()
+
+
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(config=None, max_size=DEFAULT_POOL_SIZE):
+
+    """
+    Get the connection pool for a configuration, creating it if required
+
+    Pools are per process - a pool inherited from a parent process is replaced (not closed, as the parent owns the
+    connections).
+
+    :param config: Configuration (default configuration if not specified)
+    :type config: datacube.config.Config
+    :param max_size: The maximum number of connections if the pool is created
+    :type max_size: int
+
+    :return: Connection pool
+    :rtype: ConnectionPool
+    """
+
+    connection_string = get_connection_string(config)
+
+    with _connection_pools_lock:
+
+        pool = _connection_pools.get(connection_string)
+
+        if not pool or pool.pid != os.getpid():
+            pool = _connection_pools[connection_string] = ConnectionPool(connection_string, max_size)
+
+        return pool
+
+
+def get_db_connection(config=None, itersize=None):
+
+    """
+    Get a pooled connection to the AGDC DB
+
+    Return it with release_db_connection when done.
+
+    If itersize is given the cursor is a named (server side) cursor returning plain tuples, which fetches itersize
+    rows at a time as it is iterated - use it with stream_records. Otherwise it is a client side DictCursor.
+
+    :param config: Configuration
+    :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time by a streaming cursor
+    :type itersize: int
+
+    :return: DB connection and cursor
+    :rtype: (psycopg2.connection, psycopg2.cursor)
+    """
+
+    pool = get_connection_pool(config)
+
+    connection = pool.get()
+
+    try:
+        if not itersize:
+            return connection, connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+
+        cursor = connection.cursor(name="agdc_query_{id}".format(id=next(_cursor_ids)))
+        cursor.itersize = itersize
+
+        return connection, cursor
+
+    except Exception:
+        # Don't lose the pool's slot
+        pool.put(connection)
+        raise
+
+_cursor_ids = itertools.count()
+
+
+def make_record_class(column_names):
+
+    """
+    Make a tuple subclass for result rows which can also be indexed by column name (like a DictRow)
+
+    :param column_names: The column names of the result
+    :type column_names: list[str]
+    :return: Record class
+    :rtype: type
+    """
+
+    column_index = dict((name, i) for i, name in enumerate(column_names))
+
+    class Record(tuple):
+
+        __slots__ = ()
+
+        def __getitem__(self, key):
+            if isinstance(key, basestring):
+                key = column_index[key]
+            return tuple.__getitem__(self, key)
+
+    return Record
+
+
+def stream_records(cursor):
+
+    """
+    Yield the rows of an executed (streaming) cursor as records indexable by column name
+
+    :param cursor: Cursor from get_db_connection
+    :type cursor: psycopg2.cursor
+    """
+
+    record_class = None
+
+    for row in cursor:
+
+        # The description of a named cursor is only available once rows have been fetched
+
+        if not record_class:
+            record_class = make_record_class([column[0] for column in cursor.description])
+
+        yield record_class(row)
+
+
+def release_db_connection(connection, cursor=None, config=None):
+
+    """
+    Return a connection from get_db_connection to the pool
+
+    :param connection: DB connection (nothing is done if None)
+    :type connection: psycopg2.connection
+    :param cursor: The cursor returned with the connection (closed if not None)
+    :type cursor: psycopg2.cursor
+    :param config: Configuration the connection was got with
+    :type config: datacube.config.Config
+    """
+
+    if not connection:
+        return
+
+    if cursor and not cursor.closed:
+        try:
+            cursor.close()
+        except psycopg2.Error:
+            pass
+
+    get_connection_pool(config).put(connection)
+
+
 def to_file_ify_sql(sql):
 
     """
@@ -191,6 +563,263 @@ LS8_PRE_WRS_2_ACQ_MAX = date(2013, 4, 10)
 LS8_PRE_WRS_2_EXCLUSION = SatelliteDateExclusion(satellite=Satellite.LS8,
                                                  acq_min=LS8_PRE_WRS_2_ACQ_MIN, acq_max=LS8_PRE_WRS_2_ACQ_MAX)
 
+###
+# TILE INDEX...
+###
+
+# The tile_index table (see database/sql/v7__tile_index.sql) has one row per acquisition, cell, tile type and tile
+# class with the acquisition, satellite and NBAR, PQA and FC tile columns.  The tile index flavours of the queries select
+# from it (aliased as nbar) rather than joining acquisition, satellite and a tile/dataset sub-query per level.  The
+# static (DSM/DEM) levels have no acquisition so are still joined by cell.
+
+# The tile index column of the tile of each dataset type
+
+_TILE_INDEX_DATASET_COLUMNS = [
+    (DatasetType.ARG25, "nbar.nbar_tile_pathname"),
+    (DatasetType.PQ25, "nbar.pqa_tile_pathname"),
+    (DatasetType.FC25, "nbar.fc_tile_pathname"),
+    (DatasetType.NDVI, "nbar.nbar_tile_pathname"),
+    (DatasetType.EVI, "nbar.nbar_tile_pathname"),
+    (DatasetType.NBR, "nbar.nbar_tile_pathname"),
+    (DatasetType.TCI, "nbar.nbar_tile_pathname"),
+    (DatasetType.DSM, "dsm.tile_pathname"),
+    (DatasetType.DEM, "dem.tile_pathname"),
+    (DatasetType.DEM_HYDROLOGICALLY_ENFORCED, "dem_h.tile_pathname"),
+    (DatasetType.DEM_SMOOTHED, "dem_s.tile_pathname")
+]
+
+# The acquisition levels (other than NBAR) held in the tile index
+
+_TILE_INDEX_LEVEL_COLUMNS = [
+    (DatasetType.PQ25, "nbar.pqa_tile_pathname"),
+    (DatasetType.FC25, "nbar.fc_tile_pathname")
+]
+
+# The static levels joined to the tile index by cell
+
+_TILE_INDEX_STATIC_LEVELS = [
+    (DatasetType.DSM, "dsm", ProcessingLevel.DSM),
+    (DatasetType.DEM, "dem", ProcessingLevel.DEM),
+    (DatasetType.DEM_HYDROLOGICALLY_ENFORCED, "dem_h", ProcessingLevel.DEM_H),
+    (DatasetType.DEM_SMOOTHED, "dem_s", ProcessingLevel.DEM_S)
+]
+
+
+def _build_tile_index_datasets_sql(dataset_types):
+
+    """
+    Build the datasets array column of the tile index flavour of the tiles queries
+
+    :type dataset_types: list[datacube.api.model.DatasetType]
+    :rtype: str
+    """
+
+    datasets = ["['{name}', {column}]".format(name=dataset_type.value, column=column)
+                for dataset_type, column in _TILE_INDEX_DATASET_COLUMNS if dataset_type in dataset_types]
+
+    return """
+            ARRAY[
+                {datasets}
+                ] as datasets
+        """.format(datasets=",\n                ".join(datasets))
+
+
+def _build_tile_index_from_sql(dataset_types, missing=False):
+
+    """
+    Build the from clause of the tile index flavour of the queries
+
+    :type dataset_types: list[datacube.api.model.DatasetType]
+    :param missing: Outer join the static levels (to find those that are missing)
+    :type missing: bool
+    :rtype: str
+    """
+
+    sql = """
+        from tile_index as nbar
+        """
+
+    for dataset_type, alias, _ in _TILE_INDEX_STATIC_LEVELS:
+        if dataset_type in dataset_types:
+            sql += """
+        {join}
+            (
+            select
+                tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
+            from tile
+            join dataset on dataset.dataset_id=tile.dataset_id
+            where dataset.level_id = %(level_{alias})s
+            ) as {alias} on
+                    {alias}.x_index=nbar.x_index and {alias}.y_index=nbar.y_index
+                and {alias}.tile_type_id=nbar.tile_type_id and {alias}.tile_class_id=nbar.tile_class_id
+        """.format(join=missing and "left outer join" or "join", alias=alias)
+
+    return sql
+
+
+def _build_tile_index_where_sql(dataset_types, months=None, exclude=None, missing=False):
+
+    """
+    Build the where clause of the tile index flavour of the queries
+
+    :type dataset_types: list[datacube.api.model.DatasetType]
+    :type months: list[datacube.api.query.Month]
+    :type exclude: list[datacube.api.query.SatelliteDateExclusion]
+    :param missing: Select the tiles where (all) the other dataset types are missing rather than present
+    :type missing: bool
+    :rtype: str
+    """
+
+    # The acquisition date range is on the end datetime itself (rather than its date) so it can use the indexes
+
+    sql = """
+        where
+            nbar.tile_type_id = ANY(%(tile_type)s) and nbar.tile_class_id = ANY(%(tile_class)s) -- mandatory
+            and nbar.satellite_tag = ANY(%(satellite)s)
+            and nbar.x_index = ANY(%(x)s) and nbar.y_index = ANY(%(y)s)
+            and nbar.end_datetime >= %(acq_min)s::date and nbar.end_datetime < %(acq_max)s::date + 1
+            and nbar.nbar_tile_pathname is not null
+        """
+
+    for dataset_type, column in _TILE_INDEX_LEVEL_COLUMNS:
+        if dataset_type in dataset_types:
+            sql += " and {column} is {test}null".format(column=column, test=not missing and "not " or "")
+
+    if missing:
+        for dataset_type, alias, _ in _TILE_INDEX_STATIC_LEVELS:
+            if dataset_type in dataset_types:
+                sql += " and {alias}.x_index is null".format(alias=alias)
+
+    if exclude:
+        for index, exclusion in enumerate(exclude):
+
+            if type(exclusion) is SatelliteDateExclusion:
+                sql += " and (nbar.satellite_tag <> %(exclude_satellite_{0})s".format(index)
+
+                if exclusion.acq_min and exclusion.acq_max:
+                    sql += " or nbar.end_datetime not between %(exclude_acq_min_{0})s and %(exclude_acq_max_{0})s".format(index)
+
+                elif exclusion.acq_min:
+                    sql += " or nbar.end_datetime < %(exclude_acq_min_{0})s".format(index)
+
+                elif exclusion.acq_max:
+                    sql += " or nbar.end_datetime > %(exclude_acq_max_{0})s".format(index)
+
+                sql += ")"
+
+    if months:
+        sql += " and nbar.end_datetime_month = ANY(%(month)s)"
+
+    return sql
+
+
+def _build_tile_index_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None):
+
+    """
+    Build the parameters of the tile index flavour of the queries
+
+    :rtype: dict
+    """
+
+    params = {"tile_type": [TILE_TYPE.value],
+              "tile_class": [tile_class.value for tile_class in TILE_CLASSES],
+              "satellite": [satellite.value for satellite in satellites],
+              "x": x, "y": y,
+              "acq_min": acq_min, "acq_max": acq_max}
+
+    for dataset_type, alias, level in _TILE_INDEX_STATIC_LEVELS:
+        if dataset_type in dataset_types:
+            params["level_{alias}".format(alias=alias)] = level.value
+
+    if exclude:
+        for index, exclusion in enumerate(exclude):
+            if type(exclusion) is SatelliteDateExclusion:
+
+                params["exclude_satellite_{0}".format(index)] = exclusion.satellite.value
+
+                if exclusion.acq_min:
+                    params["exclude_acq_min_{0}".format(index)] = exclusion.acq_min
+
+                if exclusion.acq_max:
+                    params["exclude_acq_max_{0}".format(index)] = exclusion.acq_max
+
+    if months:
+        params["month"] = [month.value for month in months]
+
+    return params
+
+
+def build_list_cells_tile_index_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None,
+                                               exclude=None, sort=SortType.ASC, missing=False):
+
+    """
+    Build the SQL query string and parameters required to return the cells matching the criteria from the tile index
+
+    :param missing: Return the cells with tiles where the (non NBAR) dataset types are missing
+    :type missing: bool
+
+    See build_list_cells_sql_and_params for the other parameters.
+
+    :return: The SQL query and params
+    :rtype: (str, dict)
+    """
+
+    sql = """
+        select distinct nbar.x_index, nbar.y_index
+        """
+
+    sql += _build_tile_index_from_sql(dataset_types, missing=missing)
+
+    sql += _build_tile_index_where_sql(dataset_types, months=months, exclude=exclude, missing=missing)
+
+    sql += """
+        order by nbar.x_index {sort}, nbar.y_index {sort}
+    """.format(sort=sort.value)
+
+    return sql, _build_tile_index_params(x, y, satellites, acq_min, acq_max, dataset_types, months, exclude)
+
+
+def build_list_tiles_tile_index_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None,
+                                               exclude=None, sort=SortType.ASC, missing=False):
+
+    """
+    Build the SQL query string and parameters required to return the tiles matching the criteria from the tile index
+
+    :param missing: Return the (NBAR) tiles where the other dataset types are missing
+    :type missing: bool
+
+    See build_list_tiles_sql_and_params for the other parameters.
+
+    :return: The SQL query and params
+    :rtype: (str, dict)
+    """
+
+    sql = """
+        select
+            nbar.acquisition_id, nbar.satellite_tag as satellite, nbar.start_datetime, nbar.end_datetime,
+            nbar.end_datetime_year, nbar.end_datetime_month,
+            nbar.x_index, nbar.y_index, point(nbar.x_index, nbar.y_index) as xy, nbar.dataset_path,
+        """
+
+    sql += _build_tile_index_datasets_sql(missing and [DatasetType.ARG25] or dataset_types)
+
+    sql += _build_tile_index_from_sql(dataset_types, missing=missing)
+
+    sql += _build_tile_index_where_sql(dataset_types, months=months, exclude=exclude, missing=missing)
+
+    if missing:
+        sql += """
+        order by nbar.x_index {sort}, nbar.y_index {sort}
+    """.format(sort=sort.value)
+
+    else:
+        sql += """
+        order by nbar.x_index, nbar.y_index, nbar.end_datetime {sort}, satellite asc
+    """.format(sort=sort.value)
+
+    return sql, _build_tile_index_params(x, y, satellites, acq_min, acq_max, dataset_types, months, exclude)
+
+
 ###
 # CELLS...
 ###
@@ -271,7 +900,7 @@ def list_cells_as_list(x, y, satellites, acq_min, acq_max, dataset_types, months
 
 
 def list_cells_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None,
-                            sort=SortType.ASC, config=None):
+                            sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of cells matching the criteria as a SINGLE-USE generator
@@ -296,6 +925,8 @@ def list_cells_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, m
     :type sort: datacube.api.query.SortType
     :param config: Config
     :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time
+    :type itersize: int
 
     :return: List of cells
     :rtype: list[datacube.api.model.Cell]
@@ -306,29 +937,32 @@ def list_cells_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, m
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
         sql, params = build_list_cells_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min, acq_max=acq_max,
                                                       dataset_types=dataset_types, months=months, exclude=exclude,
-                                                      sort=sort)
+                                                      sort=sort, use_tile_index=get_use_tile_index(config))
 
         _log.debug(cursor.mogrify(sql, params))
         print cursor.mogrify(sql, params)
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Cell.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -367,11 +1001,11 @@ def list_cells_to_file(x, y, satellites, acq_min, acq_max, dataset_types, filena
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
         sql, params = build_list_cells_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min, acq_max=acq_max,
                                                       dataset_types=dataset_types, months=months, exclude=exclude,
-                                                      sort=sort)
+                                                      sort=sort, use_tile_index=get_use_tile_index(config))
 
         sql = to_file_ify_sql(sql)
 
@@ -384,16 +1018,19 @@ def list_cells_to_file(x, y, satellites, acq_min, acq_max, dataset_types, filena
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
 def build_list_cells_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None,
-                                    sort=SortType.ASC):
+                                    sort=SortType.ASC, use_tile_index=False):
 
     """
     Build the SQL query string and parameters required to return the cells matching the criteria
@@ -416,11 +1053,18 @@ def build_list_cells_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_
     :type exclude: list[datacube.api.query.SatelliteDateExclusion]
     :param sort: Sort order
     :type sort: datacube.api.query.SortType
+    :param use_tile_index: Query the (denormalised) tile index table rather than the tile tables
+    :type use_tile_index: bool
 
     :return: The SQL query and params
     :rtype: (str, dict)
     """
 
+    if use_tile_index:
+        return build_list_cells_tile_index_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min,
+                                                          acq_max=acq_max, dataset_types=dataset_types, months=months,
+                                                          exclude=exclude, sort=sort)
+
     sql = """
         SELECT DISTINCT nbar.x_index, nbar.y_index
         FROM acquisition
@@ -542,7 +1186,7 @@ def build_list_cells_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_
                 esql += " and (satellite.satellite_tag <> %(exclude_satellite_{0})s".format(index)
 
                 if exclusion.acq_min and exclusion.acq_max:
-                    esql += " or end_datetime not between %(exclude_acq_min_{0})s and %(exclude_acq_min_{0})s".format(index)
+                    esql += " or end_datetime not between %(exclude_acq_min_{0})s and %(exclude_acq_max_{0})s".format(index)
 
                 elif exclusion.acq_min:
                     esql += " or end_datetime < %(exclude_acq_min_{0})s".format(index)
@@ -674,7 +1318,7 @@ def list_cells_missing_as_list(x, y, satellites, acq_min, acq_max, dataset_types
     return list(list_cells_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort, config))
 
 
-def list_cells_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None):
+def list_cells_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of cells matching the criteria AS A REUSABLE LIST rather than as a one-use-generator
@@ -698,6 +1342,8 @@ def list_cells_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_
     :type sort: datacube.api.query.SortType
     :param config: Config
     :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time
+    :type itersize: int
 
     :return: List of cells
     :rtype: list[datacube.api.model.Cell]
@@ -708,26 +1354,30 @@ def list_cells_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
-        sql, params = build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort)
+        sql, params = build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort,
+                                                              use_tile_index=get_use_tile_index(config))
 
         _log.debug(cursor.mogrify(sql, params))
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Cell.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -764,9 +1414,10 @@ def list_cells_missing_to_file(x, y, satellites, acq_min, acq_max, dataset_types
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
-        sql, params = build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort)
+        sql, params = build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort,
+                                                              use_tile_index=get_use_tile_index(config))
 
         sql = to_file_ify_sql(sql)
 
@@ -779,15 +1430,19 @@ def list_cells_missing_to_file(x, y, satellites, acq_min, acq_max, dataset_types
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
-def build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC):
+def build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC,
+                                            use_tile_index=False):
 
     """
     Build the SQL query string and parameters required to return the cells matching the criteria
@@ -806,11 +1461,18 @@ def build_list_cells_missing_sql_and_params(x, y, satellites, acq_min, acq_max,
     :type dataset_types: list[datacube.api.model.DatasetType]
     :param sort: Sort order
     :type sort: datacube.api.query.SortType
+    :param use_tile_index: Query the (denormalised) tile index table rather than the tile tables
+    :type use_tile_index: bool
 
     :return: The SQL query and params
     :rtype: (str, dict)
     """
 
+    if use_tile_index:
+        return build_list_cells_tile_index_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min,
+                                                          acq_max=acq_max, dataset_types=dataset_types, sort=sort,
+                                                          missing=True)
+
     sql = """
         select distinct nbar.x_index, nbar.y_index
         from acquisition
@@ -1065,7 +1727,7 @@ def list_tiles_as_list(x, y, satellites, acq_min, acq_max, dataset_types, months
 
 
 def list_tiles_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None,
-                            sort=SortType.ASC, config=None):
+                            sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of tiles matching the criteria as a SINGLE-USE generator
@@ -1090,6 +1752,8 @@ def list_tiles_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, m
     :type sort: datacube.api.query.SortType
     :param config: Config
     :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time
+    :type itersize: int
 
     :return: List of tiles
     :rtype: list[datacube.api.model.Tile]
@@ -1100,28 +1764,31 @@ def list_tiles_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, m
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
         sql, params = build_list_tiles_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min, acq_max=acq_max,
                                                       dataset_types=dataset_types, months=months, exclude=exclude,
-                                                      sort=sort)
+                                                      sort=sort, use_tile_index=get_use_tile_index(config))
 
         _log.debug(cursor.mogrify(sql, params))
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Tile.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -1160,11 +1827,11 @@ def list_tiles_to_file(x, y, satellites, acq_min, acq_max, dataset_types, filena
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
         sql, params = build_list_tiles_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min, acq_max=acq_max,
                                                       dataset_types=dataset_types, months=months, exclude=exclude,
-                                                      sort=sort)
+                                                      sort=sort, use_tile_index=get_use_tile_index(config))
 
         sql = to_file_ify_sql(sql)
 
@@ -1177,15 +1844,19 @@ def list_tiles_to_file(x, y, satellites, acq_min, acq_max, dataset_types, filena
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
-def build_list_tiles_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None, sort=SortType.ASC):
+def build_list_tiles_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, months=None, exclude=None, sort=SortType.ASC,
+                                    use_tile_index=False):
 
     """
     Build the SQL query string and parameters required to return the tiles matching the criteria
@@ -1208,11 +1879,18 @@ def build_list_tiles_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_
     :type exclude: list[datacube.api.query.SatelliteDateExclusion]
     :param sort: Sort order
     :type sort: datacube.api.query.SortType
+    :param use_tile_index: Query the (denormalised) tile index table rather than the tile tables
+    :type use_tile_index: bool
 
     :return: The SQL query and params
     :rtype: (str, dict)
     """
 
+    if use_tile_index:
+        return build_list_tiles_tile_index_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min,
+                                                          acq_max=acq_max, dataset_types=dataset_types, months=months,
+                                                          exclude=exclude, sort=sort)
+
     sql = """
         select
             acquisition.acquisition_id, satellite_tag as satellite, start_datetime, end_datetime,
@@ -1424,7 +2102,7 @@ def build_list_tiles_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_
                 esql += " and (satellite.satellite_tag <> %(exclude_satellite_{0})s".format(index)
 
                 if exclusion.acq_min and exclusion.acq_max:
-                    esql += " or end_datetime not between %(exclude_acq_min_{0})s and %(exclude_acq_min_{0})s".format(index)
+                    esql += " or end_datetime not between %(exclude_acq_min_{0})s and %(exclude_acq_max_{0})s".format(index)
 
                 elif exclusion.acq_min:
                     esql += " or end_datetime < %(exclude_acq_min_{0})s".format(index)
@@ -1563,7 +2241,7 @@ def list_tiles_missing_as_list(x, y, satellites, acq_min, acq_max, dataset_types
     return list(list_tiles_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort, config))
 
 
-def list_tiles_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None):
+def list_tiles_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of tiles matching the criteria as a SINGLE-USE generator
@@ -1590,6 +2268,8 @@ def list_tiles_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_
     :type sort: datacube.api.query.SortType
     :param config: Config
     :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time
+    :type itersize: int
 
     :return: List of tiles
     :rtype: list[datacube.api.model.Tile]
@@ -1600,26 +2280,30 @@ def list_tiles_missing_as_generator(x, y, satellites, acq_min, acq_max, dataset_
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
-        sql, params = build_list_tiles_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort)
+        sql, params = build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort,
+                                                              use_tile_index=get_use_tile_index(config))
 
         _log.debug(cursor.mogrify(sql, params))
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Tile.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -1659,9 +2343,10 @@ def list_tiles_missing_to_file(x, y, satellites, acq_min, acq_max, dataset_types
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
-        sql, params = build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort)
+        sql, params = build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort,
+                                                              use_tile_index=get_use_tile_index(config))
 
         sql = to_file_ify_sql(sql)
 
@@ -1674,15 +2359,19 @@ def list_tiles_missing_to_file(x, y, satellites, acq_min, acq_max, dataset_types
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
-def build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC):
+def build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC,
+                                            use_tile_index=False):
 
     """
     Build the SQL query string and parameters required to return the cells matching the criteria
@@ -1701,16 +2390,23 @@ def build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max,
     :type dataset_types: list[datacube.api.model.DatasetType]
     :param sort: Sort order
     :type sort: datacube.api.query.SortType
+    :param use_tile_index: Query the (denormalised) tile index table rather than the tile tables
+    :type use_tile_index: bool
 
     :return: The SQL query and params
     :rtype: (str, dict)
     """
 
+    if use_tile_index:
+        return build_list_tiles_tile_index_sql_and_params(x=x, y=y, satellites=satellites, acq_min=acq_min,
+                                                          acq_max=acq_max, dataset_types=dataset_types, sort=sort,
+                                                          missing=True)
+
     sql = """
         select
             acquisition.acquisition_id, satellite_tag as satellite, start_datetime, end_datetime,
             extract(year from end_datetime) as end_datetime_year, extract(month from end_datetime) as end_datetime_month,
-            NBAR.x_index, NBAR.y_index, point(NBAR.x_index, NBAR.y_index) as xy,
+            NBAR.x_index, NBAR.y_index, point(NBAR.x_index, NBAR.y_index) as xy, NBAR.dataset_path,
             ARRAY[
                 ['ARG25', NBAR.tile_pathname]
                 ] as datasets
@@ -1722,7 +2418,7 @@ def build_list_tiles_missing_sql_and_params(x, y, satellites, acq_min, acq_max,
         join
             (
             select
-                dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
+                dataset.dataset_path, dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
             from tile
             join dataset on dataset.dataset_id=tile.dataset_id
             where dataset.level_id = %(level_nbar)s
@@ -1926,7 +2622,7 @@ def list_tiles_dtm_as_list(x, y, datasets, sort=SortType.ASC, config=None):
     return list(list_tiles(x, y, datasets, sort, config))
 
 
-def list_tiles_dtm_as_generator(x, y, datasets, sort=SortType.ASC, config=None):
+def list_tiles_dtm_as_generator(x, y, datasets, sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of cells matching the criteria as a SINGLE-USE generator
@@ -1940,6 +2636,7 @@ def list_tiles_dtm_as_generator(x, y, datasets, sort=SortType.ASC, config=None):
     :type host: str
     :type port: int
     :type sort: SortType
+    :type itersize: int
     :rtype: list[datacube.api.model.Tile]
     """
 
@@ -1948,7 +2645,7 @@ def list_tiles_dtm_as_generator(x, y, datasets, sort=SortType.ASC, config=None):
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
         sql = """
             select
@@ -2012,18 +2709,21 @@ def list_tiles_dtm_as_generator(x, y, datasets, sort=SortType.ASC, config=None):
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Tile.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -2038,7 +2738,7 @@ def visit_tiles(x, y, satellites, years, datasets, func=print_tile, sort=SortTyp
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
         sql = """
             select
@@ -2106,11 +2806,14 @@ def visit_tiles(x, y, satellites, years, datasets, func=print_tile, sort=SortTyp
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -2121,64 +2824,95 @@ def list_tiles_wkt(wkt, satellites, years, datasets, sort=SortType.ASC, config=N
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
-        sql = """
-            select
-                acquisition.acquisition_id, satellite_tag as satellite, start_datetime, end_datetime,
-                extract(year from end_datetime)::integer as end_datetime_year, extract(month from end_datetime)::integer as end_datetime_month,
-                nbar.x_index, nbar.y_index, point(nbar.x_index, nbar.y_index) as xy,
-                ARRAY[
-                    ['ARG25', nbar.tile_pathname],
-                    ['PQ25', pq.tile_pathname],
-                    ['FC25', fc.tile_pathname]
-                    ] as datasets
-            from acquisition
-            join satellite on satellite.satellite_id=acquisition.satellite_id
-            join
-                (
+        if get_use_tile_index(config):
+            sql = """
                 select
-                    dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
-                from tile
-                join dataset on dataset.dataset_id=tile.dataset_id
-                where dataset.level_id = 2
-                ) as nbar on nbar.acquisition_id=acquisition.acquisition_id
-            join
-                (
-                select
-                    dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
-                from tile
-                join dataset on dataset.dataset_id=tile.dataset_id
-                where dataset.level_id = 3
-                ) as pq on
-                    pq.acquisition_id=acquisition.acquisition_id
-                    and pq.x_index=nbar.x_index and pq.y_index=nbar.y_index
-                    and pq.tile_type_id=nbar.tile_type_id and pq.tile_class_id=nbar.tile_class_id
-            join
-                (
-                select
-                    dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
-                from tile
-                join dataset on dataset.dataset_id=tile.dataset_id
-                where dataset.level_id = 4
-                ) as fc on
-                    fc.acquisition_id=acquisition.acquisition_id
-                    and fc.x_index=nbar.x_index and fc.y_index=nbar.y_index
-                    and fc.tile_type_id=nbar.tile_type_id and fc.tile_class_id=nbar.tile_class_id
-            join tile_footprint on
-                tile_footprint.x_index = nbar.x_index
-                and tile_footprint.y_index = nbar.y_index
-                and tile_footprint.tile_type_id = nbar.tile_type_id
-
-            where
-                nbar.tile_type_id = ANY(%(tile_type)s) and nbar.tile_class_id = ANY(%(tile_class)s) -- mandatory
-                and satellite.satellite_tag = ANY(%(satellite)s)
-                and st_intersects(tile_footprint.bbox, st_geomfromtext(%(polygon)s, 4326))
-                and extract(year from end_datetime) = ANY(%(year)s)
+                    nbar.acquisition_id, nbar.satellite_tag as satellite, nbar.start_datetime, nbar.end_datetime,
+                    nbar.end_datetime_year, nbar.end_datetime_month,
+                    nbar.x_index, nbar.y_index, point(nbar.x_index, nbar.y_index) as xy, nbar.dataset_path,
+                    ARRAY[
+                        ['ARG25', nbar.nbar_tile_pathname],
+                        ['PQ25', nbar.pqa_tile_pathname],
+                        ['FC25', nbar.fc_tile_pathname]
+                        ] as datasets
+                from tile_index as nbar
+                join tile_footprint on
+                    tile_footprint.x_index = nbar.x_index
+                    and tile_footprint.y_index = nbar.y_index
+                    and tile_footprint.tile_type_id = nbar.tile_type_id
+
+                where
+                    nbar.tile_type_id = ANY(%(tile_type)s) and nbar.tile_class_id = ANY(%(tile_class)s) -- mandatory
+                    and nbar.satellite_tag = ANY(%(satellite)s)
+                    and nbar.nbar_tile_pathname is not null
+                    and nbar.pqa_tile_pathname is not null
+                    and nbar.fc_tile_pathname is not null
+                    and st_intersects(tile_footprint.bbox, st_geomfromtext(%(polygon)s, 4326))
+                    and nbar.end_datetime_year = ANY(%(year)s)
+
+                order by nbar.end_datetime asc, satellite asc
+                ;
+            """
 
-            order by end_datetime asc, satellite asc
-            ;
-        """
+        else:
+            sql = """
+                select
+                    acquisition.acquisition_id, satellite_tag as satellite, start_datetime, end_datetime,
+                    extract(year from end_datetime)::integer as end_datetime_year, extract(month from end_datetime)::integer as end_datetime_month,
+                    nbar.x_index, nbar.y_index, point(nbar.x_index, nbar.y_index) as xy,
+                    ARRAY[
+                        ['ARG25', nbar.tile_pathname],
+                        ['PQ25', pq.tile_pathname],
+                        ['FC25', fc.tile_pathname]
+                        ] as datasets
+                from acquisition
+                join satellite on satellite.satellite_id=acquisition.satellite_id
+                join
+                    (
+                    select
+                        dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
+                    from tile
+                    join dataset on dataset.dataset_id=tile.dataset_id
+                    where dataset.level_id = 2
+                    ) as nbar on nbar.acquisition_id=acquisition.acquisition_id
+                join
+                    (
+                    select
+                        dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
+                    from tile
+                    join dataset on dataset.dataset_id=tile.dataset_id
+                    where dataset.level_id = 3
+                    ) as pq on
+                        pq.acquisition_id=acquisition.acquisition_id
+                        and pq.x_index=nbar.x_index and pq.y_index=nbar.y_index
+                        and pq.tile_type_id=nbar.tile_type_id and pq.tile_class_id=nbar.tile_class_id
+                join
+                    (
+                    select
+                        dataset.acquisition_id, tile.dataset_id, tile.x_index, tile.y_index, tile.tile_pathname, tile.tile_type_id, tile.tile_class_id
+                    from tile
+                    join dataset on dataset.dataset_id=tile.dataset_id
+                    where dataset.level_id = 4
+                    ) as fc on
+                        fc.acquisition_id=acquisition.acquisition_id
+                        and fc.x_index=nbar.x_index and fc.y_index=nbar.y_index
+                        and fc.tile_type_id=nbar.tile_type_id and fc.tile_class_id=nbar.tile_class_id
+                join tile_footprint on
+                    tile_footprint.x_index = nbar.x_index
+                    and tile_footprint.y_index = nbar.y_index
+                    and tile_footprint.tile_type_id = nbar.tile_type_id
+
+                where
+                    nbar.tile_type_id = ANY(%(tile_type)s) and nbar.tile_class_id = ANY(%(tile_class)s) -- mandatory
+                    and satellite.satellite_tag = ANY(%(satellite)s)
+                    and st_intersects(tile_footprint.bbox, st_geomfromtext(%(polygon)s, 4326))
+                    and extract(year from end_datetime) = ANY(%(year)s)
+
+                order by end_datetime asc, satellite asc
+                ;
+            """
 
         params = {"tile_type": [1], "tile_class": [tile_class.value for tile_class in TILE_CLASSES],
                   "satellite": [satellite.value for satellite in satellites],
@@ -2200,11 +2934,14 @@ def list_tiles_wkt(wkt, satellites, years, datasets, sort=SortType.ASC, config=N
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -2386,7 +3123,7 @@ def list_cells_wkb_as_list(wkb, satellites, acq_min, acq_max, dataset_types, sor
     return list(list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types, sort, config))
 
 
-def list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None):
+def list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types, sort=SortType.ASC, config=None, itersize=DEFAULT_ITERSIZE):
 
     """
     Return a list of cells matching the criteria as a SINGLE-USE generator
@@ -2405,6 +3142,8 @@ def list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types
     :type sort: datacube.api.query.SortType
     :param config: Config
     :type config: datacube.config.Config
+    :param itersize: Number of rows fetched from the server at a time
+    :type itersize: int
 
     :return: List of cells
     :rtype: list[datacube.api.model.Cell]
@@ -2415,7 +3154,7 @@ def list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config, itersize=itersize)
 
         sql, params = build_list_cells_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, dataset_types, sort)
 
@@ -2423,18 +3162,21 @@ def list_cells_wkb_as_generator(wkb, satellites, acq_min, acq_max, dataset_types
 
         cursor.execute(sql, params)
 
-        for record in result_generator(cursor):
+        for record in stream_records(cursor):
             _log.debug(record)
             yield Cell.from_db_record(record)
 
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -2466,7 +3208,7 @@ def list_cells_wkb_to_file(wkb, satellites, acq_min, acq_max, dataset_types, fil
     try:
         # connect to database
 
-        conn, cursor = connect_to_db(config=config)
+        conn, cursor = get_db_connection(config=config)
 
         sql, params = build_list_cells_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, dataset_types, sort)
 
@@ -2481,11 +3223,14 @@ def list_cells_wkb_to_file(wkb, satellites, acq_min, acq_max, dataset_types, fil
     except Exception as e:
 
         _log.error("Caught exception %s", e)
-        conn.rollback()
+        if conn:
+            conn.rollback()
         raise
 
     finally:
 
+        release_db_connection(conn, cursor, config=config)
+
         conn = cursor = None
 
 
@@ -2844,7 +3589,7 @@ def build_list_cells_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, datas
 #     try:
 #         # connect to database
 #
-#         conn, cursor = connect_to_db(config=config)
+#         conn, cursor = get_db_connection(config=config)
 #
 #         sql, params = build_list_tiles_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, dataset_types, sort)
 #
@@ -2895,7 +3640,7 @@ def build_list_cells_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, datas
 #     try:
 #         # connect to database
 #
-#         conn, cursor = connect_to_db(config=config)
+#         conn, cursor = get_db_connection(config=config)
 #
 #         sql, params = build_list_tiles_wkb_sql_and_params(wkb, satellites, acq_min, acq_max, dataset_types, sort)
 #
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import numpy
+from enum import Enum
+
+
+_log = logging.getLogger(__name__)
+
+
+class Statistic(Enum):
+    __order__ = "COUNT COUNT_OBSERVED MIN MAX MEAN SUM STANDARD_DEVIATION VARIANCE PERCENTILE_25 PERCENTILE_50 PERCENTILE_75 PERCENTILE_90 PERCENTILE_95"
+
+    COUNT = "COUNT"
+    COUNT_OBSERVED = "COUNT_OBSERVED"
+    MIN = "MIN"
+    MAX = "MAX"
+    MEAN = "MEAN"
+    SUM = "SUM"
+    STANDARD_DEVIATION = "STANDARD_DEVIATION"
+    VARIANCE = "VARIANCE"
+    PERCENTILE_25 = "PERCENTILE_25"
+    PERCENTILE_50 = "PERCENTILE_50"
+    PERCENTILE_75 = "PERCENTILE_75"
+    PERCENTILE_90 = "PERCENTILE_90"
+    PERCENTILE_95 = "PERCENTILE_95"
+
+
+PERCENTILES = {
+    Statistic.PERCENTILE_25: 25,
+    Statistic.PERCENTILE_50: 50,
+    Statistic.PERCENTILE_75: 75,
+    Statistic.PERCENTILE_90: 90,
+    Statistic.PERCENTILE_95: 95
+}
+
+
+def statistic_arg(s):
+    if s in [statistic.name for statistic in Statistic]:
+        return Statistic[s]
+    raise ValueError("{0} is not a supported statistic".format(s))
+
+
+class StatisticsAccumulator(object):
+
+    """
+    Calculate per pixel temporal statistics of a stack of observations added one time slice at a time
+
+    The moments (count, min, max, sum, mean and variance) are accumulated as each slice is added (using Welford's
+    algorithm for the mean and variance) so need memory for a few slices only.  Percentiles need all the observations
+    so the slices are only kept if a percentile is requested - they are then calculated together from a single sort of
+    the stack.
+
+    Observations that are NaN or the no data value are ignored.  The statistics (other than the counts and the sum)
+    are NaN for pixels with no observations - the sum is 0, as numpy.nansum (which the pixel statistics used before).
+    As numpy's nan* functions the variance is the population variance and the percentiles are linearly interpolated.
+    """
+
+    def __init__(self, shape, statistics=None, ndv=None):
+
+        """
+        :param shape: The shape of a slice
+        :type shape: (int, int)
+        :param statistics: The statistics to calculate (default all)
+        :type statistics: list[Statistic]
+        :param ndv: The no data value of the observations (in addition to NaN)
+        """
+
+        self.shape = shape
+        self.statistics = statistics or [s for s in Statistic]
+        self.ndv = ndv
+
+        self.count = 0
+
+        self.count_observed = numpy.zeros(shape, dtype=numpy.int32)
+
+        self.min = numpy.empty(shape, dtype=numpy.float32)
+        self.min.fill(numpy.nan)
+
+        self.max = numpy.empty(shape, dtype=numpy.float32)
+        self.max.fill(numpy.nan)
+
+        self.sum = numpy.zeros(shape, dtype=numpy.float64)
+        self.mean = numpy.zeros(shape, dtype=numpy.float64)
+        self.m2 = numpy.zeros(shape, dtype=numpy.float64)
+
+        self.slices = None
+
+        if any([s in PERCENTILES for s in self.statistics]):
+            self.slices = list()
+
+    def add(self, data):
+
+        """
+        Add a time slice
+
+        :param data: The observations
+        :type data: numpy.array
+        """
+
+        data = numpy.asarray(data)
+
+        assert data.shape == self.shape
+
+        valid = ~numpy.isnan(data) if data.dtype.kind == "f" else numpy.ones(self.shape, dtype=numpy.bool_)
+
+        if self.ndv is not None:
+            valid &= data != self.ndv
+
+        x = numpy.where(valid, data, numpy.nan).astype(numpy.float32)
+
+        self.count += 1
+
+        self.count_observed += valid
+
+        # fmin/fmax ignore NaN
+
+        numpy.fmin(self.min, x, out=self.min)
+        numpy.fmax(self.max, x, out=self.max)
+
+        xd = numpy.where(valid, x, 0).astype(numpy.float64)
+
+        self.sum += xd
+
+        # Welford's update of the mean and sum of squared differences (for the observed pixels only)
+
+        delta = xd - self.mean
+        self.mean += numpy.where(valid, delta / numpy.maximum(self.count_observed, 1), 0)
+        self.m2 += numpy.where(valid, delta * (xd - self.mean), 0)
+
+        del delta, xd
+
+        if self.slices is not None:
+            self.slices.append(x)
+
+    def get(self, statistic):
+
+        """
+        Get a statistic
+
+        :type statistic: Statistic
+        :rtype: numpy.array
+        """
+
+        return self.get_all([statistic])[statistic]
+
+    def get_all(self, statistics=None):
+
+        """
+        Get the statistics
+
+        :param statistics: The statistics (default those requested)
+        :type statistics: list[Statistic]
+        :return: statistic -> float32 array
+        :rtype: dict[Statistic, numpy.array]
+        """
+
+        statistics = statistics or self.statistics
+
+        observed = self.count_observed > 0
+
+        out = dict()
+
+        for statistic in statistics:
+
+            if statistic == Statistic.COUNT:
+                value = numpy.empty(self.shape, dtype=numpy.float32)
+                value.fill(self.count)
+
+            elif statistic == Statistic.COUNT_OBSERVED:
+                value = self.count_observed
+
+            elif statistic == Statistic.MIN:
+                value = self.min
+
+            elif statistic == Statistic.MAX:
+                value = self.max
+
+            elif statistic == Statistic.SUM:
+                value = self.sum
+
+            elif statistic == Statistic.MEAN:
+                value = numpy.where(observed, self.mean, numpy.nan)
+
+            elif statistic == Statistic.VARIANCE:
+                value = numpy.where(observed, self.m2 / numpy.maximum(self.count_observed, 1), numpy.nan)
+
+            elif statistic == Statistic.STANDARD_DEVIATION:
+                value = numpy.sqrt(numpy.where(observed, self.m2 / numpy.maximum(self.count_observed, 1), numpy.nan))
+
+            else:
+                continue
+
+            out[statistic] = value.astype(numpy.float32)
+
+        percentiles = [s for s in statistics if s in PERCENTILES]
+
+        if percentiles:
+            assert self.slices is not None, "Percentiles were not requested"
+            out.update(zip(percentiles, calculate_percentiles(self.slices, [PERCENTILES[s] for s in percentiles],
+                                                              shape=self.shape)))
+
+        return out
+
+
+def calculate_percentiles(slices, percentiles, shape=None):
+
+    """
+    Calculate percentiles across a stack of slices ignoring NaN values - all percentiles from a single sort
+
+    :param slices: The slices
+    :type slices: list[numpy.array]
+    :param percentiles: The percentiles (0 - 100)
+    :type percentiles: list[float]
+    :param shape: The shape of a slice (required if there may be no slices)
+    :type shape: (int, int)
+    :return: The percentiles (NaN where there are no values)
+    :rtype: list[numpy.array]
+    """
+
+    if not slices:
+        assert shape is not None, "The shape is required when there are no slices"
+        return [numpy.full(shape, numpy.nan, dtype=numpy.float32) for _ in percentiles]
+
+    stack = numpy.array(slices, dtype=numpy.float32)
+
+    count = (~numpy.isnan(stack)).sum(axis=0)
+
+    # NaN sorts to the end so the values of each pixel are at the start
+
+    stack.sort(axis=0)
+
+    rows, cols = numpy.ogrid[0:stack.shape[1], 0:stack.shape[2]]
+
+    out = list()
+
+    for percentile in percentiles:
+
+        # The same linear interpolation between the closest ranks as numpy.percentile
+
+        rank = (count - 1) * (percentile / 100.0)
+
+        lower = numpy.floor(rank).astype(numpy.int32)
+        upper = numpy.ceil(rank).astype(numpy.int32)
+
+        numpy.clip(lower, 0, stack.shape[0] - 1, out=lower)
+        numpy.clip(upper, 0, stack.shape[0] - 1, out=upper)
+
+        fraction = (rank - lower).astype(numpy.float32)
+
+        lower_value = stack[lower, rows, cols]
+        upper_value = stack[upper, rows, cols]
+
+        value = lower_value + (upper_value - lower_value) * fraction
+
+        out.append(numpy.where(count > 0, value, numpy.nan).astype(numpy.float32))
+
+    return out
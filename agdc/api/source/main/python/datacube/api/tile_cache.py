@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from datacube.api.model import Tile
+from datacube.api.query import build_list_tiles_sql_and_params, get_db_connection, release_db_connection
+from datacube.api.query import get_use_tile_index, make_record_class, SortType, DEFAULT_ITERSIZE
+from datacube.api.utils import get_satellite_string, format_date
+
+
+_log = logging.getLogger(__name__)
+
+
+# Tile catalogue caches are local files holding the result of a list_tiles query for one cell, stored column by column
+# (with the raw DB values) so that loading them needs no parsing.
+#
+# A cache older than the maximum age is refreshed incrementally - tiles acquired on or after the date of its latest
+# acquisition (its watermark) are re-queried and replace the cached ones from that date.
+
+TILE_CACHE_VERSION = 1
+
+DEFAULT_MAX_AGE = 12 * 60 * 60
+
+
+def get_tile_cache_filename(directory, x, y, satellites, acq_min, acq_max, dataset_types):
+
+    """
+    Get the tile cache filename for a cell and query parameters
+
+    :param directory: The cache directory
+    :type directory: str
+    :param x: X index of the cell
+    :type x: int
+    :param y: Y index of the cell
+    :type y: int
+    :param satellites: Satellites
+    :type satellites: list[datacube.api.model.Satellite]
+    :param acq_min: Acquisition date range
+    :type acq_min: datetime.date
+    :param acq_max: Acquisition date range
+    :type acq_max: datetime.date
+    :param dataset_types: Dataset types
+    :type dataset_types: list[datacube.api.model.DatasetType]
+    :return: The filename
+    :rtype: str
+    """
+
+    dataset_types_key = hashlib.md5(",".join(sorted(dataset_type.name for dataset_type in dataset_types))).hexdigest()
+
+    return os.path.join(
+        directory,
+        "tiles_{satellites}_{x:03d}_{y:04d}_{acq_min}_{acq_max}_{dataset_types}.cache".format(
+            satellites=get_satellite_string(satellites), x=x, y=y,
+            acq_min=format_date(acq_min), acq_max=format_date(acq_max),
+            dataset_types=dataset_types_key[:8]))
+
+
+def query_tile_records(x, y, satellites, acq_min, acq_max, dataset_types, config=None):
+
+    """
+    Query the raw list_tiles records for a cell
+
+    :return: The column names and the rows
+    :rtype: (list[str], list[tuple])
+    """
+
+    conn, cursor = None, None
+
+    try:
+        conn, cursor = get_db_connection(config=config, itersize=DEFAULT_ITERSIZE)
+
+        sql, params = build_list_tiles_sql_and_params(x=[x], y=[y], satellites=satellites,
+                                                      acq_min=acq_min, acq_max=acq_max,
+                                                      dataset_types=dataset_types, sort=SortType.ASC,
+                                                      use_tile_index=get_use_tile_index(config))
+
+        cursor.execute(sql, params)
+
+        rows = [tuple(row) for row in cursor]
+        columns = [column[0] for column in cursor.description] if cursor.description else None
+
+        return columns, rows
+
+    except Exception as e:
+
+        _log.error("Caught exception %s", e)
+        if conn:
+            conn.rollback()
+        raise
+
+    finally:
+
+        release_db_connection(conn, cursor, config=config)
+
+        conn = cursor = None
+
+
+def read_tile_cache(filename):
+
+    """
+    Read a tile cache file
+
+    :return: The cache contents (or None if the file is not a readable cache of the current version)
+    :rtype: dict
+    """
+
+    try:
+        with open(filename, "rb") as f:
+            cache = cPickle.load(f)
+
+    except (IOError, EOFError, cPickle.UnpicklingError) as e:
+        _log.debug("Unable to read tile cache [%s] [%s]", filename, e)
+        return None
+
+    if cache.get("version") != TILE_CACHE_VERSION:
+        return None
+
+    return cache
+
+
+def write_tile_cache(filename, columns, rows, watermark):
+
+    """
+    Write a tile cache file atomically (so concurrent tasks never read a partial file)
+    """
+
+    cache = {"version": TILE_CACHE_VERSION, "created": time.time(), "watermark": watermark,
+             "columns": dict((name, [row[i] for row in rows]) for i, name in enumerate(columns or [])),
+             "column_names": columns or [], "count": len(rows)}
+
+    handle, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", suffix=".tmp")
+
+    try:
+        with os.fdopen(handle, "wb") as f:
+            cPickle.dump(cache, f, cPickle.HIGHEST_PROTOCOL)
+
+        os.rename(temp_filename, filename)
+
+    except Exception:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+    return cache
+
+
+def get_watermark(columns, rows):
+
+    """
+    Get the acquisition watermark (the latest end_datetime) of the rows
+    """
+
+    if not rows or not columns:
+        return None
+
+    index = columns.index("end_datetime")
+
+    return max(row[index] for row in rows)
+
+
+def get_cache_rows(cache):
+
+    """
+    Get the rows of a cache (as tuples, in column_names order)
+    """
+
+    return zip(*[cache["columns"][name] for name in cache["column_names"]]) if cache["count"] else []
+
+
+def build_tile_cache(filename, x, y, satellites, acq_min, acq_max, dataset_types, config=None):
+
+    """
+    Query the tiles for a cell and write them to a tile cache
+
+    :return: The cache contents
+    :rtype: dict
+    """
+
+    _log.info("Building tile cache [%s]", filename)
+
+    columns, rows = query_tile_records(x, y, satellites, acq_min, acq_max, dataset_types, config=config)
+
+    return write_tile_cache(filename, columns, rows, get_watermark(columns, rows))
+
+
+def refresh_tile_cache(filename, cache, x, y, satellites, acq_min, acq_max, dataset_types, config=None):
+
+    """
+    Refresh a tile cache from its watermark - the cached tiles acquired on or after the watermark date are replaced by
+    those in the DB
+
+    :return: The cache contents
+    :rtype: dict
+    """
+
+    watermark = cache["watermark"]
+
+    if not watermark:
+        return build_tile_cache(filename, x, y, satellites, acq_min, acq_max, dataset_types, config=config)
+
+    watermark_date = watermark.date()
+
+    _log.info("Refreshing tile cache [%s] from [%s]", filename, watermark_date)
+
+    columns, new_rows = query_tile_records(x, y, satellites, max(acq_min, watermark_date), acq_max, dataset_types,
+                                           config=config)
+
+    columns = columns or cache["column_names"]
+
+    index = columns.index("end_datetime")
+
+    rows = [row for row in get_cache_rows(cache) if row[index].date() < watermark_date] + new_rows
+
+    return write_tile_cache(filename, columns, rows, get_watermark(columns, rows) or watermark)
+
+
+def load_tiles(cache):
+
+    """
+    Make the tiles of a tile cache
+
+    :param cache: The cache contents
+    :type cache: dict
+    :rtype: list[datacube.api.model.Tile]
+    """
+
+    record_class = make_record_class(cache["column_names"])
+
+    return [Tile.from_db_record(record_class(row)) for row in get_cache_rows(cache)]
+
+
+def get_tiles(directory, x, y, satellites, acq_min, acq_max, dataset_types, max_age=DEFAULT_MAX_AGE, config=None):
+
+    """
+    Get the tiles for a cell from the tile cache, building it or refreshing it as required
+
+    :param directory: The cache directory
+    :type directory: str
+    :param x: X index of the cell
+    :type x: int
+    :param y: Y index of the cell
+    :type y: int
+    :param satellites: Satellites
+    :type satellites: list[datacube.api.model.Satellite]
+    :param acq_min: Acquisition date range
+    :type acq_min: datetime.date
+    :param acq_max: Acquisition date range
+    :type acq_max: datetime.date
+    :param dataset_types: Dataset types
+    :type dataset_types: list[datacube.api.model.DatasetType]
+    :param max_age: Age (seconds) after which the cache is refreshed
+    :type max_age: int
+    :param config: Config
+    :type config: datacube.config.Config
+    :rtype: list[datacube.api.model.Tile]
+    """
+
+    filename = get_tile_cache_filename(directory, x, y, satellites, acq_min, acq_max, dataset_types)
+
+    cache = read_tile_cache(filename)
+
+    if not cache:
+        cache = build_tile_cache(filename, x, y, satellites, acq_min, acq_max, dataset_types, config=config)
+
+    elif time.time() - cache["created"] > max_age:
+        cache = refresh_tile_cache(filename, cache, x, y, satellites, acq_min, acq_max, dataset_types, config=config)
+
+    return load_tiles(cache)
@@ -326,32 +326,9 @@ class AoiTool(Tool):
 
     def extract_feature_geometry_wkb(self, epsg=4326):
 
-        import ogr
-        import osr
-        from gdalconst import GA_ReadOnly
-
-        vector = ogr.Open(self.vector_file, GA_ReadOnly)
-        assert vector
-
-        layer = vector.GetLayer(self.vector_layer)
-        assert layer
-
-        feature = layer.GetFeature(self.vector_feature)
-        assert feature
-
-        projection = osr.SpatialReference()
-        projection.ImportFromEPSG(epsg)
-
-        geom = feature.GetGeometryRef()
-
-        # Transform if required
-
-        if not projection.IsSame(geom.GetSpatialReference()):
-            geom.TransformTo(projection)
-
-        _log.info("Geometry is [%s]", geom.ExportToWkt())
+        from datacube.api.utils import extract_feature_geometry_wkb
 
-        return geom.ExportToWkb()
+        return extract_feature_geometry_wkb(self.vector_file, self.vector_layer, self.vector_feature, epsg=epsg)
 
     def extract_bounds_from_vector(self, epsg=4326):
 
@@ -407,57 +384,9 @@ class AoiTool(Tool):
 
     def get_mask_aoi_cell(self, x, y, width=4000, height=4000, epsg=4326):
 
-        import gdal
-        import osr
-
-        driver = gdal.GetDriverByName("MEM")
-        assert driver
-
-        raster = driver.Create("", width, height, 1, gdal.GDT_Byte)
-        assert raster
-
-        raster.SetGeoTransform((x, 0.00025, 0.0, y+1, 0.0, -0.00025))
-
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(epsg)
-
-        raster.SetProjection(srs.ExportToWkt())
-
-        import ogr
-        from gdalconst import GA_ReadOnly
-
-        vector = ogr.Open(self.vector_file, GA_ReadOnly)
-        assert vector
-
-        layer = vector.GetLayer(self.vector_layer)
-        assert layer
-
-        # Transform if required
-
-        feature = layer.GetFeature(self.vector_feature)
-        assert feature
-
-        projection = osr.SpatialReference()
-        projection.ImportFromEPSG(epsg)
-
-        geom = feature.GetGeometryRef()
-
-        if not projection.IsSame(geom.GetSpatialReference()):
-            geom.TransformTo(projection)
-
-        layer.SetAttributeFilter("FID={fid}".format(fid=self.vector_feature))
-
-        gdal.RasterizeLayer(raster, [1], layer, burn_values=[1])
-
-        del layer
-
-        band = raster.GetRasterBand(1)
-        assert band
-
-        data = band.ReadAsArray()
-        import numpy
+        from datacube.api.utils import get_mask_vector_for_cell
 
-        _log.debug("Read [%s] from memory AOI mask dataset", numpy.shape(data))
-        return numpy.ma.masked_not_equal(data, 1, copy=False).mask
+        return get_mask_vector_for_cell(x, y, self.vector_file, self.vector_layer, self.vector_feature,
+                                        width=width, height=height, epsg=epsg)
 
 
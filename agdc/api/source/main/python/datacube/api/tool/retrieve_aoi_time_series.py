@@ -184,7 +184,7 @@ class RetrieveAoiTimeSeries(AoiTool):
 
             pixel_count = 4000 * 4000
 
-            pixel_count_aoi = (mask_aoi == False).sum()
+            pixel_count_aoi = numpy.count_nonzero(~mask_aoi)
 
             _log.debug("mask_aoi is [%s]\n[%s]", numpy.shape(mask_aoi), mask_aoi)
 
@@ -250,36 +250,39 @@ class RetrieveAoiTimeSeries(AoiTool):
 
                     for band in bands:
 
-                        data[band] = numpy.ma.masked_equal(data[band], NDV)
-                        _log.debug("masked data is [%s] [%d]\n[%s]", numpy.shape(data), numpy.ma.count(data), data)
+                        valid = data[band] != NDV
 
-                        pixel_count_data[band] = numpy.ma.count(data[band])
+                        pixel_count_data[band] = numpy.count_nonzero(valid)
 
                         if pqa:
-                            data[band].mask = numpy.ma.mask_or(data[band].mask, mask_pqa)
-                            _log.debug("PQA masked data is [%s] [%d]\n[%s]", numpy.shape(data[band]), numpy.ma.count(data[band]), data[band])
+                            valid &= ~mask_pqa
 
-                        pixel_count_data_pqa[band] = numpy.ma.count(data[band])
+                        pixel_count_data_pqa[band] = numpy.count_nonzero(valid)
 
                         if wofs:
-                            data[band].mask = numpy.ma.mask_or(data[band].mask, mask_wofs)
-                            _log.debug("WOFS masked data is [%s] [%d]\n[%s]", numpy.shape(data[band]), numpy.ma.count(data[band]), data[band])
+                            valid &= ~mask_wofs
 
-                        pixel_count_data_pqa_wofs[band] = numpy.ma.count(data[band])
+                        pixel_count_data_pqa_wofs[band] = numpy.count_nonzero(valid)
 
-                        data[band].mask = numpy.ma.mask_or(data[band].mask, mask_aoi)
-                        _log.debug("AOI masked data is [%s] [%d]\n[%s]", numpy.shape(data[band]), numpy.ma.count(data[band]), data[band])
+                        valid &= ~mask_aoi
 
-                        pixel_count_data_pqa_wofs_aoi[band] = numpy.ma.count(data[band])
+                        pixel_count_data_pqa_wofs_aoi[band] = numpy.count_nonzero(valid)
 
-                        mmin[band] = numpy.ma.min(data[band])
-                        mmax[band] = numpy.ma.max(data[band])
-                        mmean[band] = numpy.ma.mean(data[band])
+                        values = data[band][valid]
 
-                        # Convert the mean to an int...which is actually trickier than you would expect due to masking....
+                        _log.debug("masked data is [%s] [%d]\n[%s]", numpy.shape(values), numpy.size(values), values)
 
-                        if numpy.ma.count(mmean[band]) != 0:
-                            mmean[band] = mmean[band].astype(numpy.int16)
+                        # No values are written as masked (i.e. "--") values
+
+                        if numpy.size(values) == 0:
+                            mmin[band] = mmax[band] = mmean[band] = numpy.ma.masked
+
+                        else:
+                            mmin[band] = values.min()
+                            mmax[band] = values.max()
+                            mmean[band] = values.mean().astype(numpy.int16)
+
+                        del valid, values
 
                     # Should we output if no data values found?
                     pixel_count_data_pqa_wofs_aoi_all_bands = reduce(operator.add, pixel_count_data_pqa_wofs_aoi.itervalues())
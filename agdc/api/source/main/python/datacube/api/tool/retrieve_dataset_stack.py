@@ -170,67 +170,76 @@ class RetrieveDatasetStackTool(CellTool):
 
     def go(self):
 
-        # If we are applying a vector mask then calculate it not (once as it is the same for all tiles)
+        # If we are applying a vector mask then calculate it now (once as it is the same for all tiles)
 
-        mask = None
+        mask_vector = None
 
         if self.mask_vector_apply:
-            mask = get_mask_vector_for_cell(self.x, self.y, self.mask_vector_file, self.mask_vector_layer, self.mask_vector_feature)
+            mask_vector = get_mask_vector_for_cell(self.x, self.y, self.mask_vector_file, self.mask_vector_layer, self.mask_vector_feature)
 
         # TODO move the dicking around with bands stuff into utils?
 
-        import gdal
-
-        driver = raster = None
-        metadata = None
-        data_type = ndv = None
-
         tiles = self.get_tiles()
         _log.info("Total tiles found [%d]", len(tiles))
 
+        # Work out up front which tiles go into the stack for each band so that each tile is then visited only once -
+        # reading its masks once and only the requested bands - with each band written to its own stack
+
+        relevant_tiles = dict()
+
         for band_name in self.bands:
-            _log.info("Creating stack for band [%s]", band_name)
+            relevant_tiles[band_name] = []
 
-            relevant_tiles = []
+        for tile in tiles:
 
-            for tile in tiles:
+            dataset = self.dataset_type in tile.datasets and tile.datasets[self.dataset_type] or None
 
-                dataset = self.dataset_type in tile.datasets and tile.datasets[self.dataset_type] or None
+            if not dataset:
+                _log.info("No applicable [%s] dataset for [%s]", self.dataset_type.name, tile.end_datetime)
+                continue
 
-                if not dataset:
-                    _log.info("No applicable [%s] dataset for [%s]", self.dataset_type.name, tile.end_datetime)
-                    continue
+            band_names = [b.name for b in dataset.bands]
 
-                if band_name in [b.name for b in tile.datasets[self.dataset_type].bands]:
-                    relevant_tiles.append(tile)
+            for band_name in self.bands:
+                if band_name in band_names:
+                    relevant_tiles[band_name].append(tile)
 
-            _log.info("Total tiles for band [%s] is [%d]", band_name, len(relevant_tiles))
+        for band_name in self.bands:
+            _log.info("Total tiles for band [%s] is [%d]", band_name, len(relevant_tiles[band_name]))
 
-            for index, tile in enumerate(relevant_tiles, start=1):
+            if self.list_only:
+                for tile in relevant_tiles[band_name]:
+                    _log.info("Would stack band [%s] from dataset [%s]", band_name, tile.datasets[self.dataset_type].path)
 
-                dataset = tile.datasets[self.dataset_type]
-                assert dataset
+        if self.list_only:
+            return
 
-                band = dataset.bands[band_name]
-                assert band
+        # The stack band index for each band of each tile
 
-                if self.list_only:
-                    _log.info("Would stack band [%s] from dataset [%s]", band.name, dataset.path)
-                    continue
+        stack_index = dict()
 
-                pqa = (self.mask_pqa_apply and DatasetType.PQ25 in tile.datasets) and tile.datasets[DatasetType.PQ25] or None
-                wofs = (self.mask_wofs_apply and DatasetType.WATER in tile.datasets) and tile.datasets[DatasetType.WATER] or None
+        for band_name in self.bands:
+            for index, tile in enumerate(relevant_tiles[band_name], start=1):
+                stack_index.setdefault(id(tile), dict())[band_name] = index
+
+        metadata = None
+        data_type = ndv = None
+
+        rasters = dict()
+
+        try:
+            for tile in tiles:
 
-                if self.dataset_type not in tile.datasets:
-                    _log.debug("No [%s] dataset present for [%s] - skipping", self.dataset_type.name, tile.end_datetime)
+                if id(tile) not in stack_index:
                     continue
 
-                filename = os.path.join(self.output_directory,
-                                        get_dataset_band_stack_filename(dataset, band,
-                                                                        output_format=self.output_format,
-                                                                        mask_pqa_apply=self.mask_pqa_apply,
-                                                                        mask_wofs_apply=self.mask_wofs_apply,
-                                                                        mask_vector_apply=self.mask_vector_apply))
+                dataset = tile.datasets[self.dataset_type]
+                assert dataset
+
+                bands = [dataset.bands[band_name] for band_name in self.bands if band_name in stack_index[id(tile)]]
+
+                pqa = (self.mask_pqa_apply and DatasetType.PQ25 in tile.datasets) and tile.datasets[DatasetType.PQ25] or None
+                wofs = (self.mask_wofs_apply and DatasetType.WATER in tile.datasets) and tile.datasets[DatasetType.WATER] or None
 
                 if not metadata:
                     metadata = get_dataset_metadata(dataset)
@@ -244,31 +253,24 @@ class RetrieveDatasetStackTool(CellTool):
                     ndv = get_dataset_ndv(dataset)
                     assert ndv
 
-                if not driver:
-
-                    if self.output_format == OutputFormat.GEOTIFF:
-                        driver = gdal.GetDriverByName("GTiff")
-                    elif self.output_format == OutputFormat.ENVI:
-                        driver = gdal.GetDriverByName("ENVI")
+                for band in bands:
 
-                    assert driver
+                    if band.name not in rasters:
 
-                if not raster:
+                        filename = os.path.join(self.output_directory,
+                                                get_dataset_band_stack_filename(dataset, band,
+                                                                                output_format=self.output_format,
+                                                                                mask_pqa_apply=self.mask_pqa_apply,
+                                                                                mask_wofs_apply=self.mask_wofs_apply,
+                                                                                mask_vector_apply=self.mask_vector_apply))
 
-                    if self.output_format == OutputFormat.GEOTIFF:
-                        raster = driver.Create(filename, metadata.shape[0], metadata.shape[1], len(tiles), data_type, options=["BIGTIFF=YES", "INTERLEAVE=BAND"])
-                    elif self.output_format == OutputFormat.ENVI:
-                        raster = driver.Create(filename, metadata.shape[0], metadata.shape[1], len(tiles), data_type, options=["INTERLEAVE=BSQ"])
+                        _log.info("Creating stack for band [%s] in [%s]", band.name, filename)
 
-                    assert raster
+                        rasters[band.name] = self.create_stack(filename, metadata, data_type, ndv, len(tiles))
 
-                    # NOTE: could do this without the metadata!!
-                    raster.SetGeoTransform(metadata.transform)
-                    raster.SetProjection(metadata.projection)
+                # The mask for this tile is the vector mask plus this tile's PQA and WOFS masks
 
-                raster.SetMetadata(self.generate_raster_metadata())
-
-                # mask = None
+                mask = mask_vector
 
                 if pqa:
                     mask = get_mask_pqa(pqa, self.mask_pqa_mask, mask=mask)
@@ -276,32 +278,63 @@ class RetrieveDatasetStackTool(CellTool):
                 if wofs:
                     mask = get_mask_wofs(wofs, self.mask_wofs_mask, mask=mask)
 
-                _log.info("Stacking [%s] band data from [%s] with PQA [%s] and PQA mask [%s] and WOFS [%s] and WOFS mask [%s] to [%s]",
-                          band.name, dataset.path,
+                _log.info("Stacking [%s] band data from [%s] with PQA [%s] and PQA mask [%s] and WOFS [%s] and WOFS mask [%s]",
+                          " ".join([band.name for band in bands]), dataset.path,
                           pqa and pqa.path or "",
                           pqa and self.mask_pqa_mask or "",
-                          wofs and wofs.path or "", wofs and self.mask_wofs_mask or "",
-                          filename)
+                          wofs and wofs.path or "", wofs and self.mask_wofs_mask or "")
 
-                data = get_dataset_data_masked(dataset, mask=mask, ndv=ndv)
+                data = get_dataset_data_masked(dataset, bands=bands, mask=mask, ndv=ndv)
 
                 _log.debug("data is [%s]", data)
 
-                stack_band = raster.GetRasterBand(index)
+                for band in bands:
+
+                    index = stack_index[id(tile)][band.name]
 
-                stack_band.SetDescription(os.path.basename(dataset.path))
-                stack_band.SetNoDataValue(ndv)
-                stack_band.WriteArray(data[band])
-                stack_band.ComputeStatistics(True)
-                stack_band.SetMetadata({"ACQ_DATE": format_date(tile.end_datetime), "SATELLITE": dataset.satellite.name})
+                    rasters[band.name].write_band(index, data[band])
+                    rasters[band.name].set_band_metadata(index, description=os.path.basename(dataset.path),
+                                                         metadata={"ACQ_DATE": format_date(tile.end_datetime),
+                                                                   "SATELLITE": dataset.satellite.name})
 
-                stack_band.FlushCache()
-                del stack_band
+                del data
+
+        finally:
+
+            for raster in rasters.values():
+                raster.close()
+
+            rasters.clear()
+
+    def create_stack(self, filename, metadata, data_type, ndv, band_count):
+
+        """
+        Create an output stack
+
+        :param filename: The output filename
+        :type filename: str
+        :param metadata: Metadata of the (first) dataset being stacked
+        :type metadata: datacube.api.utils.DatasetMetaData
+        :param data_type: GDAL data type of the stack
+        :param ndv: No data value of the stack
+        :param band_count: Number of bands (tiles) in the stack
+        :type band_count: int
+        :return: The stack writer
+        :rtype: datacube.api.writer.RasterWriter
+        """
+
+        from datacube.api.writer import RasterWriter, get_geotiff_options
+
+        if self.output_format == OutputFormat.GEOTIFF:
+            driver_name, options = "GTiff", get_geotiff_options(data_type, bigtiff=True)
+
+        else:
+            driver_name, options = "ENVI", ["INTERLEAVE=BSQ"]
 
-            if raster:
-                raster.FlushCache()
-                del raster
-                raster = None
+        # NOTE: could do this without the metadata!!
+        return RasterWriter(filename, metadata.shape[0], metadata.shape[1], band_count, data_type,
+                            metadata.transform, metadata.projection, ndv, driver_name=driver_name, options=options,
+                            dataset_metadata=self.generate_raster_metadata())
 
     def generate_raster_metadata(self):
         return {
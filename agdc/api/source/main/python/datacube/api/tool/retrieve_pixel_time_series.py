@@ -21,11 +21,14 @@ __author__ = "Simon Oldfield"
 
 
 import csv
+import gdal
 import logging
+import math
 import os
 import sys
+from collections import namedtuple, OrderedDict
 from enum import Enum
-from datacube.api import dataset_type_arg, writeable_dir
+from datacube.api import dataset_type_arg, writeable_dir, readable_file
 from datacube.api.model import DatasetType, Wofs25Bands, Satellite
 from datacube.api.tool import Tool
 from datacube.api.utils import latlon_to_cell, latlon_to_xy, UINT16_MAX, BYTE_MAX, get_mask_pqa, get_band_name_union
@@ -57,6 +60,8 @@ class RetrievePixelTimeSeriesTool(Tool):
         self.latitude = None
         self.longitude = None
 
+        self.points_file = None
+
         self.output_no_data = None
 
         self.dataset_type = None
@@ -72,10 +77,13 @@ class RetrievePixelTimeSeriesTool(Tool):
         # super(self.__class__, self).setup_arguments()
         Tool.setup_arguments(self)
 
-        self.parser.add_argument("--lat", help="Latitude value of pixel", action="store", dest="latitude", type=float,
-                                 required=True)
-        self.parser.add_argument("--lon", help="Longitude value of pixel", action="store", dest="longitude", type=float,
-                                 required=True)
+        self.parser.add_argument("--lat", help="Latitude value of pixel", action="store", dest="latitude", type=float)
+        self.parser.add_argument("--lon", help="Longitude value of pixel", action="store", dest="longitude", type=float)
+
+        self.parser.add_argument("--points-file",
+                                 help="File of pixels to retrieve (instead of --lat/--lon) - either a CSV file with "
+                                      "latitude, longitude and (optional) id columns or a vector file of points",
+                                 action="store", dest="points_file", type=readable_file)
 
         self.parser.add_argument("--hide-no-data", help="Don't output records that are completely no data value(s)",
                                  action="store_false", dest="output_no_data", default=True)
@@ -118,6 +126,11 @@ class RetrievePixelTimeSeriesTool(Tool):
         self.latitude = args.latitude
         self.longitude = args.longitude
 
+        self.points_file = args.points_file
+
+        if not self.points_file and (self.latitude is None or self.longitude is None):
+            self.parser.error("Either --lat and --lon or --points-file is required")
+
         self.output_no_data = args.output_no_data
 
         self.dataset_type = args.dataset_type
@@ -138,15 +151,18 @@ class RetrievePixelTimeSeriesTool(Tool):
         Tool.log_arguments(self)
 
         _log.info("""
-        longitude = {longitude:f}
-        latitude = {latitude:f}
+        longitude = {longitude}
+        latitude = {latitude}
+        points file = {points_file}
         datasets to retrieve = {dataset_type}
         bands to retrieve = {bands}
         output no data values = {output_no_data}
         output = {output}
         over write = {overwrite}
         delimiter = {delimiter}
-        """.format(longitude=self.longitude, latitude=self.latitude,
+        """.format(longitude=self.longitude is not None and "{0:f}".format(self.longitude) or "",
+                   latitude=self.latitude is not None and "{0:f}".format(self.latitude) or "",
+                   points_file=self.points_file or "",
                    dataset_type=self.dataset_type.name,
                    bands=self.bands,
                    output_no_data=self.output_no_data,
@@ -179,9 +195,7 @@ class RetrievePixelTimeSeriesTool(Tool):
                                dataset_types=dataset_types):
             yield tile
 
-    def go(self):
-
-        cell_x, cell_y = latlon_to_cell(self.latitude, self.longitude)
+    def get_ndv(self):
 
         # TODO - PQ is UNIT16 and WOFS is BYTE (others are INT16) and so -999 NDV doesn't work
         ndv = NDV
@@ -195,6 +209,18 @@ class RetrievePixelTimeSeriesTool(Tool):
         elif self.dataset_type in [DatasetType.NDVI, DatasetType.EVI, DatasetType.NBR, DatasetType.TCI]:
             ndv = NAN
 
+        return ndv
+
+    def go(self):
+
+        if self.points_file:
+            self.go_points()
+            return
+
+        cell_x, cell_y = latlon_to_cell(self.latitude, self.longitude)
+
+        ndv = self.get_ndv()
+
         with self.get_output_file(self.dataset_type, self.overwrite) as csv_file:
 
             csv_writer = csv.writer(csv_file, delimiter=self.delimiter)
@@ -219,6 +245,49 @@ class RetrievePixelTimeSeriesTool(Tool):
                     csv_writer.writerow([dataset.satellite.name, format_date_time(tile.end_datetime)] +
                                         decode_data(self.dataset_type, dataset, self.bands, data))
 
+    def go_points(self):
+
+        # Each tile of each cell is visited once, reading all the points in the cell from it
+
+        points = read_points(self.points_file)
+        _log.info("Total points [%d]", len(points))
+
+        ndv = self.get_ndv()
+
+        with self.get_output_file(self.dataset_type, self.overwrite) as csv_file:
+
+            csv_writer = csv.writer(csv_file, delimiter=self.delimiter)
+
+            # Output a HEADER
+
+            csv_writer.writerow(["POINT ID", "LATITUDE", "LONGITUDE", "SATELLITE", "ACQUISITION DATE"] + self.bands)
+
+            for (cell_x, cell_y), cell_points in group_points_by_cell(points).iteritems():
+
+                _log.info("Retrieving [%d] points from cell [%03d/%04d]", len(cell_points), cell_x, cell_y)
+
+                for tile in self.get_tiles(x=cell_x, y=cell_y):
+
+                    if self.dataset_type not in tile.datasets:
+                        _log.debug("No [%s] dataset present for [%s] - skipping", self.dataset_type.name, tile.end_datetime)
+                        continue
+
+                    dataset = tile.datasets[self.dataset_type]
+                    pqa = (self.mask_pqa_apply and DatasetType.PQ25 in tile.datasets) and tile.datasets[DatasetType.PQ25] or None
+                    wofs = (self.mask_wofs_apply and DatasetType.WATER in tile.datasets) and tile.datasets[DatasetType.WATER] or None
+
+                    values = retrieve_pixel_values(dataset, pqa, self.mask_pqa_mask, wofs, self.mask_wofs_mask, cell_points, ndv=ndv)
+
+                    for point, data in zip(cell_points, values):
+
+                        if data is None:
+                            continue
+
+                        if has_data(dataset.bands, data, no_data_value=ndv) or self.output_no_data:
+                            csv_writer.writerow([point.id, point.latitude, point.longitude,
+                                                 dataset.satellite.name, format_date_time(tile.end_datetime)] +
+                                                decode_data(self.dataset_type, dataset, self.bands, data))
+
     def get_output_file(self, dataset_type, overwrite=False):
 
         if not self.output_directory:
@@ -235,11 +304,17 @@ class RetrievePixelTimeSeriesTool(Tool):
 
         return open(self.get_output_filename(dataset_type), "wb")
 
+    def get_output_location_string(self):
+
+        if self.points_file:
+            return os.path.splitext(os.path.basename(self.points_file))[0]
+
+        return "{longitude:03.5f}_{latitude:03.5f}".format(latitude=self.latitude, longitude=self.longitude)
+
     def get_output_filename(self, dataset_type):
 
         if dataset_type == DatasetType.WATER:
-            return os.path.join(self.output_directory,"LS_WOFS_{longitude:03.5f}_{latitude:03.5f}_{acq_min}_{acq_max}.csv".format(latitude=self.latitude,
-                                                                                              longitude=self.longitude,
+            return os.path.join(self.output_directory,"LS_WOFS_{location}_{acq_min}_{acq_max}.csv".format(location=self.get_output_location_string(),
                                                                                               acq_min=self.acq_min,
                                                                                               acq_max=self.acq_max))
         satellite_str = ""
@@ -280,8 +355,8 @@ class RetrievePixelTimeSeriesTool(Tool):
             dataset_str += "_WITH_WATER"
 
         return os.path.join(self.output_directory,
-                            "{satellite}_{dataset}_{longitude:03.5f}_{latitude:03.5f}_{acq_min}_{acq_max}.csv".format(satellite=satellite_str, dataset=dataset_str, latitude=self.latitude,
-                                                                                          longitude=self.longitude,
+                            "{satellite}_{dataset}_{location}_{acq_min}_{acq_max}.csv".format(satellite=satellite_str, dataset=dataset_str,
+                                                                                          location=self.get_output_location_string(),
                                                                                           acq_min=self.acq_min,
                                                                                           acq_max=self.acq_max))
 
@@ -343,6 +418,186 @@ def retrieve_pixel_value(dataset, pqa, pqa_masks, wofs, wofs_masks, latitude, lo
     return data
 
 
+Point = namedtuple("Point", ["id", "latitude", "longitude"])
+
+
+def read_points(filename):
+
+    """
+    Read the points from a CSV file (with latitude, longitude and optional id columns) or a vector file
+
+    :param filename: The points file
+    :type filename: str
+    :rtype: list[Point]
+    """
+
+    if filename.lower().endswith((".csv", ".txt")):
+        return read_points_csv(filename)
+
+    return read_points_vector(filename)
+
+
+def read_points_csv(filename, delimiter=","):
+
+    with open(filename, "rb") as f:
+
+        reader = csv.DictReader(f, delimiter=delimiter)
+
+        fields = dict((field.strip().lower(), field) for field in reader.fieldnames or [])
+
+        latitude_field = fields.get("latitude") or fields.get("lat")
+        longitude_field = fields.get("longitude") or fields.get("lon")
+        id_field = fields.get("id")
+
+        if not latitude_field or not longitude_field:
+            raise Exception("Points file [%s] has no latitude and longitude columns" % filename)
+
+        return [Point(id_field and row[id_field] or str(index), float(row[latitude_field]), float(row[longitude_field]))
+                for index, row in enumerate(reader, start=1)]
+
+
+def read_points_vector(filename, epsg=4326):
+
+    import ogr
+    import osr
+    from gdalconst import GA_ReadOnly
+
+    vector = ogr.Open(filename, GA_ReadOnly)
+    assert vector
+
+    projection = osr.SpatialReference()
+    projection.ImportFromEPSG(epsg)
+
+    points = list()
+
+    for layer_index in range(vector.GetLayerCount()):
+
+        layer = vector.GetLayer(layer_index)
+        assert layer
+
+        for feature in layer:
+
+            geom = feature.GetGeometryRef()
+
+            # Transform if required
+
+            if not projection.IsSame(geom.GetSpatialReference()):
+                geom.TransformTo(projection)
+
+            points.append(Point(str(feature.GetFID()), geom.GetY(), geom.GetX()))
+
+    return points
+
+
+def group_points_by_cell(points):
+
+    """
+    Group the points by the cell containing them
+
+    :type points: list[Point]
+    :return: cell (as x, y pair) -> points
+    :rtype: dict[(int, int), list[Point]]
+    """
+
+    cells = OrderedDict()
+
+    for point in sorted(points, key=lambda p: latlon_to_cell(p.latitude, p.longitude)):
+        cells.setdefault(latlon_to_cell(point.latitude, point.longitude), list()).append(point)
+
+    return cells
+
+
+# Points are read in windows covering the points within a block of this size (in pixels)
+
+DEFAULT_WINDOW_SIZE = 256
+
+
+def get_pixel_windows(pixels, window_size=DEFAULT_WINDOW_SIZE):
+
+    """
+    Group pixels into windows - the bounding box of the pixels falling within each (window_size x window_size) block
+
+    :param pixels: pixels as x, y pairs
+    :type pixels: list[(int, int)]
+    :return: x, y, x_size, y_size and the indexes of the pixels for each window
+    :rtype: list[(int, int, int, int, list[int])]
+    """
+
+    blocks = dict()
+
+    for index, (x, y) in enumerate(pixels):
+        blocks.setdefault((y // window_size, x // window_size), list()).append(index)
+
+    windows = list()
+
+    for block in sorted(blocks):
+
+        indexes = blocks[block]
+
+        x_min = min(pixels[i][0] for i in indexes)
+        x_max = max(pixels[i][0] for i in indexes)
+        y_min = min(pixels[i][1] for i in indexes)
+        y_max = max(pixels[i][1] for i in indexes)
+
+        windows.append((x_min, y_min, x_max - x_min + 1, y_max - y_min + 1, indexes))
+
+    return windows
+
+
+def retrieve_pixel_values(dataset, pqa, pqa_masks, wofs, wofs_masks, points, ndv=NDV, window_size=DEFAULT_WINDOW_SIZE):
+
+    """
+    Retrieve the pixel values for a list of points from a dataset, reading (and masking) each window of points once
+
+    :param points: the points (all within the dataset's cell)
+    :type points: list[Point]
+    :return: for each point a dictionary of band/data as (1 x 1) numpy array (or None if the point is not in the dataset)
+    :rtype: list[dict]
+    """
+
+    _log.debug(
+        "Retrieving [%d] pixel value(s) from [%s] with pqa [%s] and paq mask [%s] and wofs [%s] and wofs mask [%s]",
+        len(points), dataset.path, pqa and pqa.path or "", pqa and pqa_masks or "",
+        wofs and wofs.path or "", wofs and wofs_masks or "")
+
+    metadata = get_dataset_metadata(dataset)
+
+    # As latlon_to_xy but calculating the reverse GeoTransform once
+
+    _, transform = gdal.InvGeoTransform(metadata.transform)
+
+    pixels = [(int(math.floor(transform[0] + transform[1] * point.longitude)),
+               int(math.floor(transform[3] + transform[5] * point.latitude))) for point in points]
+
+    values = [None] * len(points)
+
+    inside = [index for index, (x, y) in enumerate(pixels)
+              if 0 <= x < metadata.shape[0] and 0 <= y < metadata.shape[1]]
+
+    for x, y, x_size, y_size, indexes in get_pixel_windows([pixels[i] for i in inside], window_size=window_size):
+
+        _log.debug("Retrieving [%d] value(s) from window x=[%d] y=[%d] x_size=[%d] y_size=[%d]", len(indexes), x, y, x_size, y_size)
+
+        mask = None
+
+        if pqa:
+            mask = get_mask_pqa(pqa, pqa_masks, x=x, y=y, x_size=x_size, y_size=y_size)
+
+        if wofs:
+            mask = get_mask_wofs(wofs, wofs_masks, x=x, y=y, x_size=x_size, y_size=y_size, mask=mask)
+
+        data = get_dataset_data_masked(dataset, x=x, y=y, x_size=x_size, y_size=y_size, mask=mask, ndv=ndv)
+
+        for index in indexes:
+
+            index = inside[index]
+            px, py = pixels[index][0] - x, pixels[index][1] - y
+
+            values[index] = dict((band, data[band][py:py + 1, px:px + 1].copy()) for band in data)
+
+    return values
+
+
 # A WaterTile stores 1 data layer encoded as unsigned BYTE values as described in the WaterConstants.py file.
 #
 # Note - legal (decimal) values are:
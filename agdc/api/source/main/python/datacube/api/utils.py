@@ -23,10 +23,14 @@ import logging
 import numpy
 import gdal
 import os
+import threading
+from collections import OrderedDict
 from gdalconst import *
 from enum import Enum
 from datacube.api.model import Pq25Bands, Ls57Arg25Bands, Satellite, DatasetType, Ls8Arg25Bands, Wofs25Bands, NdviBands
 from datacube.api.model import get_bands, EviBands, NbrBands, TciBands
+from datacube.api import kernels
+from datacube.api.writer import raster_write
 from datetime import datetime
 
 
@@ -158,28 +162,181 @@ class DatasetMetaData:
         self.lr = (self.ul[0] + self.pixel_size_x * self.shape[0], self.ul[1] + self.pixel_size_y * self.shape[1])
 
 
+# Open GDAL datasets (and their metadata) are cached as opening a file on the (Lustre/NFS) tile store is often more
+# expensive than reading from it
+
+DEFAULT_DATASET_CACHE_SIZE = 64
+
+
+def get_file_mtime(path):
+
+    """
+    Return the modification time of a file (or None if it can't be determined e.g. for a GDAL virtual file)
+    """
+
+    try:
+        return os.stat(path).st_mtime
+
+    except OSError:
+        return None
+
+
+class DatasetCache(object):
+
+    """
+    A size bounded, thread safe, LRU cache of open (read only) GDAL datasets and their metadata, keyed on path (and,
+    for the metadata, what it was read for)
+
+    GDAL dataset handles can't be used concurrently so each thread gets its own handle to a file.  Entries are
+    invalidated when the file's modification time changes and the whole cache is dropped in a forked process.
+    """
+
+    def __init__(self, max_size=DEFAULT_DATASET_CACHE_SIZE):
+
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self.pid = os.getpid()
+
+        # (path, thread) -> (mtime, raster) and (path, key) -> (mtime, metadata)
+        self._rasters = OrderedDict()
+        self._metadata = OrderedDict()
+
+        self._lock = threading.Lock()
+
+    def _lookup(self, entries, key, mtime):
+
+        # Must be called holding the lock
+
+        if self.pid != os.getpid():
+            self._rasters.clear()
+            self._metadata.clear()
+            self.pid = os.getpid()
+
+        entry = entries.pop(key, None)
+
+        if entry and entry[0] == mtime:
+            # Re-insert as the most recently used
+            entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def _store(self, entries, key, mtime, value):
+
+        with self._lock:
+            entries.pop(key, None)
+            entries[key] = (mtime, value)
+
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def get_raster(self, path):
+
+        """
+        Return an open (read only) GDAL dataset for the file
+
+        :param path: The file
+        :type path: str
+        :return: The GDAL dataset
+        """
+
+        key = (path, threading.current_thread().ident)
+        mtime = get_file_mtime(path)
+
+        with self._lock:
+            raster = self._lookup(self._rasters, key, mtime)
+
+        if raster is None:
+            raster = gdal.Open(path, GA_ReadOnly)
+            assert raster
+
+            self._store(self._rasters, key, mtime, raster)
+
+        return raster
+
+    def get_metadata(self, path, read_metadata, key=None):
+
+        """
+        Return the metadata for the file
+
+        :param path: The file
+        :type path: str
+        :param read_metadata: Function to read the metadata from the GDAL dataset if it isn't cached
+        :param key: What distinguishes the metadata read from the same file (e.g. the bands it is read for)
+        :return: The metadata
+        :rtype: DatasetMetaData
+        """
+
+        mtime = get_file_mtime(path)
+
+        with self._lock:
+            metadata = self._lookup(self._metadata, (path, key), mtime)
+
+        if metadata is None:
+            metadata = read_metadata(self.get_raster(path))
+
+            self._store(self._metadata, (path, key), mtime, metadata)
+
+        return metadata
+
+    def clear(self):
+
+        with self._lock:
+            self._rasters.clear()
+            self._metadata.clear()
+
+    def get_stats(self):
+
+        """
+        Return the cache statistics
+
+        :return: hits, misses and the number of cached rasters and metadata
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "rasters": len(self._rasters), "metadata": len(self._metadata)}
+
+
+_dataset_cache = DatasetCache()
+
+
+def get_dataset_cache():
+
+    """
+    Return the process wide dataset cache used by the dataset readers
+
+    :rtype: DatasetCache
+    """
+
+    return _dataset_cache
+
+
 def get_dataset_metadata(dataset):
 
-    raster = gdal.Open(dataset.path, GA_ReadOnly)
-    assert raster
+    def read_metadata(raster):
 
-    band_metadata = dict()
+        band_metadata = dict()
 
-    for band in dataset.bands:
-        raster_band = raster.GetRasterBand(band.value)
-        assert raster_band
+        for band in dataset.bands:
+            raster_band = raster.GetRasterBand(band.value)
+            assert raster_band
 
-        band_metadata[band] = DatasetBandMetaData(raster_band.GetNoDataValue(), raster_band.DataType)
+            band_metadata[band] = DatasetBandMetaData(raster_band.GetNoDataValue(), raster_band.DataType)
 
-        raster_band.FlushCache()
-        del raster_band
+            del raster_band
 
-    dataset_metadata = DatasetMetaData((raster.RasterXSize, raster.RasterYSize), raster.GetGeoTransform(), raster.GetProjection(), band_metadata)
+        return DatasetMetaData((raster.RasterXSize, raster.RasterYSize), raster.GetGeoTransform(), raster.GetProjection(), band_metadata)
 
-    raster.FlushCache()
-    del raster
+    # The derived (NDVI, EVI, ...) datasets share the NBAR file but their metadata is keyed by their own bands
 
-    return dataset_metadata
+    return _dataset_cache.get_metadata(dataset.path, read_metadata, key=(dataset.dataset_type, dataset.bands))
 
 
 def get_dataset_data(dataset, bands=None, x=0, y=0, x_size=None, y_size=None):
@@ -275,8 +432,7 @@ def read_dataset_data(dataset, bands=None, x=0, y=0, x_size=None, y_size=None):
 
     out = dict()
 
-    raster = gdal.Open(dataset.path, GA_ReadOnly)
-    assert raster
+    raster = _dataset_cache.get_raster(dataset.path)
 
     if not x_size:
         x_size = raster.RasterXSize
@@ -295,12 +451,8 @@ def read_dataset_data(dataset, bands=None, x=0, y=0, x_size=None, y_size=None):
         data = band.ReadAsArray(x, y, x_size, y_size)
         out[b] = data
 
-        band.FlushCache()
         del band
 
-    raster.FlushCache()
-    del raster
-
     return out
 
 
@@ -362,7 +514,23 @@ def get_dataset_data_with_pq(dataset, dataset_pqa, bands=None, x=0, y=0, x_size=
 
 
 def apply_mask(data, mask, ndv=NDV):
-    return numpy.ma.array(data, mask=mask).filled(ndv)
+
+    """
+    Set the masked pixels of the data to the no data value - the data is updated in place
+
+    :param data: The data
+    :type data: numpy.array
+    :param mask: The mask (True where the pixel is masked out)
+    :type mask: numpy.array
+    :param ndv: The no data value
+    :return: The data
+    :rtype: numpy.array
+    """
+
+    if mask is not None:
+        numpy.putmask(data, mask, ndv)
+
+    return data
 
 
 def get_mask_pqa(pqa, pqa_masks=DEFAULT_MASK_PQA, x=0, y=0, x_size=None, y_size=None, mask=None):
@@ -376,20 +544,10 @@ def get_mask_pqa(pqa, pqa_masks=DEFAULT_MASK_PQA, x=0, y=0, x_size=None, y_size=
     :return: the mask
     """
 
-    # Consolidate the list of (bit) masks into a single (bit) mask
-    pqa_mask = consolidate_masks(pqa_masks)
-
     # Read the PQA dataset
     data = get_dataset_data(pqa, [Pq25Bands.PQ], x=x, y=y, x_size=x_size, y_size=y_size)[Pq25Bands.PQ]
 
-    # Create an empty mask if none provided - just to avoid an if below :)
-    if mask is None:
-        mask = numpy.ma.make_mask_none(numpy.shape(data))
-
-    # Mask out values where the requested bits in the PQ value are not set
-    mask = numpy.ma.mask_or(mask, numpy.ma.masked_where(data & pqa_mask != pqa_mask, data).mask)
-
-    return mask
+    return calculate_mask_pqa(data, pqa_masks=pqa_masks, mask=mask)
 
 
 def consolidate_masks(masks):
@@ -401,6 +559,63 @@ def consolidate_masks(masks):
     return mask
 
 
+# The PQ value is a 16 bit field so the mask for a set of bits can be pre-calculated for every possible PQ value - the
+# mask is then a single lookup (gather) of the PQ data rather than a chain of full size temporaries
+
+_pqa_mask_tables = dict()
+
+
+def get_pqa_mask_table(pqa_mask):
+
+    """
+    Return the (65536 entry) lookup table of whether each PQ value is masked out by the (consolidated) bit mask
+
+    :param pqa_mask: The consolidated bit mask
+    :type pqa_mask: int
+    :rtype: numpy.array
+    """
+
+    table = _pqa_mask_tables.get(pqa_mask)
+
+    if table is None:
+        values = numpy.arange(UINT16_MAX + 1, dtype=numpy.uint32)
+        table = (values & pqa_mask) != pqa_mask
+        _pqa_mask_tables[pqa_mask] = table
+
+    return table
+
+
+def calculate_mask_pqa(data, pqa_masks=DEFAULT_MASK_PQA, mask=None, lookup=True):
+
+    """
+    Return a pixel quality mask from PQ data
+
+    :param data: The PQ data
+    :type data: numpy.array
+    :param pqa_masks: which PQ flags to use
+    :param mask: an optional existing mask to combine with (it isn't modified)
+    :param lookup: use the lookup table (for uint16 PQ data)
+    :return: the mask (True where the pixel is masked out)
+    :rtype: numpy.array
+    """
+
+    # Consolidate the list of (bit) masks into a single (bit) mask
+    pqa_mask = consolidate_masks(pqa_masks)
+
+    # Mask out values where the requested bits in the PQ value are not set
+
+    if lookup and data.dtype == numpy.uint16:
+        out = get_pqa_mask_table(pqa_mask)[data]
+
+    else:
+        out = (data & pqa_mask) != pqa_mask
+
+    if mask is not None:
+        out |= mask
+
+    return out
+
+
 DEFAULT_MASK_WOFS = [WofsMask.WET]
 
 
@@ -418,18 +633,42 @@ def get_mask_wofs(wofs, wofs_masks=DEFAULT_MASK_WOFS, x=0, y=0, x_size=None, y_s
     # Read the WOFS dataset
     data = get_dataset_data(wofs, bands=[Wofs25Bands.WATER], x=x, y=y, x_size=x_size, y_size=y_size)[Wofs25Bands.WATER]
 
-    if mask is None:
-        mask = numpy.ma.make_mask_none(numpy.shape(data))
+    return calculate_mask_wofs(data, wofs_masks=wofs_masks, mask=mask)
+
+
+def calculate_mask_wofs(data, wofs_masks=DEFAULT_MASK_WOFS, mask=None):
+
+    """
+    Return a WOFS mask from WOFS data
+
+    :param data: The WOFS data
+    :type data: numpy.array
+    :param wofs_masks: which WOFS values to mask
+    :param mask: an optional existing mask to combine with (it isn't modified)
+    :return: the mask (True where the pixel is masked out)
+    :rtype: numpy.array
+    """
+
+    values = [wofs_mask.value for wofs_mask in wofs_masks]
 
     # Mask out values where the WOFS value is one of the requested mask values
-    for wofs_mask in wofs_masks:
-        mask = numpy.ma.mask_or(mask, numpy.ma.masked_equal(data, wofs_mask.value).mask)
 
-    return mask
+    if data.dtype == numpy.uint8:
+        table = numpy.zeros(BYTE_MAX + 1, dtype=numpy.bool_)
+        table[values] = True
+        out = table[data]
+
+    else:
+        out = numpy.in1d(data, values).reshape(numpy.shape(data))
+
+    if mask is not None:
+        out |= mask
+
+    return out
 
 
 def get_mask_vector_for_cell(x, y, vector_file, vector_layer, vector_feature, width=4000, height=4000,
-                             pixel_size_x=0.00025, pixel_size_y=-0.00025):
+                             pixel_size_x=0.00025, pixel_size_y=-0.00025, epsg=4326):
 
     """
     Return a mask for the given cell based on the specified feature in the vector file
@@ -452,190 +691,204 @@ def get_mask_vector_for_cell(x, y, vector_file, vector_layer, vector_feature, wi
     :type pixel_size_x: float
     :param pixel_size_y: Y pixel size
     :type pixel_size_y: float
+    :param epsg: The projection of the cell
+    :type epsg: int
 
-    :return: The mask
-    :rtype: numpy.ma.MaskedArray.mask (array of boolean)
+    :return: The mask (True outside the feature)
+    :rtype: numpy.array
     """
 
-    import gdal
-    import osr
-
-    driver = gdal.GetDriverByName("MEM")
-    assert driver
+    from datacube.api.mask_cache import get_aoi_mask_cache
 
-    raster = driver.Create("", width, height, 1, gdal.GDT_Byte)
-    assert raster
+    geometry_wkb = extract_feature_geometry_wkb(vector_file, vector_layer=vector_layer, vector_feature=vector_feature,
+                                                epsg=epsg)
 
-    raster.SetGeoTransform((x, pixel_size_x, 0.0, y+1, 0.0, pixel_size_y))
+    return get_aoi_mask_cache().get_mask(geometry_wkb, x, y, width=width, height=height,
+                                         pixel_size_x=pixel_size_x, pixel_size_y=pixel_size_y, epsg=epsg)
 
-    srs = osr.SpatialReference()
-    srs.ImportFromEPSG(4326)
 
-    raster.SetProjection(srs.ExportToWkt())
+def raster_create(path, data, transform, projection, no_data_value, data_type, options=None,
+                  width=None, height=None, dataset_metadata=None, band_ids=None, overviews=None,
+                  cloud_optimised=False):
+    raster_create_geotiff(path, data, transform, projection, no_data_value, data_type, options, width, height,
+                          dataset_metadata, band_ids, overviews=overviews, cloud_optimised=cloud_optimised)
 
-    _log.debug("Reading feature [%d] from layer [%d] of file [%s]", vector_feature, vector_layer, vector_file)
 
-    import ogr
-    from gdalconst import GA_ReadOnly
+# TODO I've dodgied this to get band names in.  Should redo it properly so you pass in a lit of band data structures
+# that have a name, the data, the NDV, etc
 
-    vector = ogr.Open(vector_file, GA_ReadOnly)
-    assert vector
+def raster_create_geotiff(path, data, transform, projection, no_data_value, data_type, options=None,
+                          width=None, height=None, dataset_metadata=None, band_ids=None, overviews=None,
+                          cloud_optimised=False):
+    """
+    Create a raster from a list of numpy arrays (or generators of (y offset, data) row blocks)
 
-    # layer = vector.GetLayer()
-    # assert layer
+    :param path: path to the output raster
+    :param data: list of numpy arrays (or generators of row blocks - in which case width and height are required)
+    :param transform: geo transform
+    :param projection: projection
+    :param no_data_value: no data value
+    :param data_type: data type
+    :param options: raster creation options (default is tiled and compressed - see datacube.api.writer)
+    :param overviews: overview levels to build
+    :param cloud_optimised: write a cloud optimised GeoTIFF
+    """
 
-    # layer = vector.GetLayerByName(vector_layer)
-    # assert layer
+    width = width or numpy.shape(data[0])[1]
+    height = height or numpy.shape(data[0])[0]
 
-    layer = vector.GetLayerByIndex(vector_layer)
-    assert layer
+    _log.debug("filename=%s | shape = %s | bands = %d | data type = %s", path, (height, width), len(data), data_type)
 
-    layer.SetAttributeFilter("FID={fid}".format(fid=vector_feature))
+    raster_write(path, data, width, height, data_type, transform, projection, no_data_value,
+                 driver_name="GTiff", options=options, dataset_metadata=dataset_metadata, band_ids=band_ids,
+                 overviews=overviews, cloud_optimised=cloud_optimised)
 
-    gdal.RasterizeLayer(raster, [1], layer, burn_values=[1])
 
-    del layer
+def raster_create_envi(path, data, transform, projection, no_data_value, data_type, options=["INTERLEAVE=BSQ"],
+                       width=None, height=None, dataset_metadata=None, band_ids=None):
+    """
+    Create a raster from a list of numpy arrays (or generators of (y offset, data) row blocks)
 
-    band = raster.GetRasterBand(1)
-    assert band
+    :param path: path to the output raster
+    :param data: list of numpy arrays (or generators of row blocks - in which case width and height are required)
+    :param transform: geo transform
+    :param projection: projection
+    :param no_data_value: no data value
+    :param data_type: data type
+    :param options: raster creation options
+    """
 
-    data = band.ReadAsArray()
-    import numpy
+    width = width or numpy.shape(data[0])[1]
+    height = height or numpy.shape(data[0])[0]
 
-    _log.debug("Read [%s] from memory AOI mask dataset", numpy.shape(data))
-    return numpy.ma.masked_not_equal(data, 1, copy=False).mask
+    _log.debug("filename=%s | shape = %s | bands = %d | data type = %s", path, (height, width), len(data), data_type)
 
+    raster_write(path, data, width, height, data_type, transform, projection, no_data_value,
+                 driver_name="ENVI", options=options, dataset_metadata=dataset_metadata, band_ids=band_ids)
 
-# TODO generalise/refactor this!!!
 
-def raster_create(path, data, transform, projection, no_data_value, data_type,
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=2", "ZLEVEL=9"]):
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=1", "ZLEVEL=6"]):
-                  options=["INTERLEAVE=PIXEL"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW", "TILED=YES"],
-                  width=None, height=None, dataset_metadata=None, band_ids=None):
-    raster_create_geotiff(path, data, transform, projection, no_data_value, data_type, options, width, height,
-                          dataset_metadata, band_ids)
+def propagate_using_selected_pixel(a, b, c, d, ndv=NDV):
+    return numpy.where((a == b) & (a != ndv), c, d)
 
 
-# TODO I've dodgied this to get band names in.  Should redo it properly so you pass in a lit of band data structures
-# that have a name, the data, the NDV, etc
+class BestPixelComposite(object):
 
-def raster_create_geotiff(path, data, transform, projection, no_data_value, data_type,
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=2", "ZLEVEL=9"]):
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=1", "ZLEVEL=6"]):
-                  options=["INTERLEAVE=PIXEL"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW", "TILED=YES"],
-                  width=None, height=None, dataset_metadata=None, band_ids=None):
     """
-    Create a raster from a list of numpy arrays
+    A best pixel composite - for each pixel select the observation with the greatest (or least) value of a selection
+    criterion and carry the values of any number of bands from that observation
 
-    :param path: path to the output raster
-    :param data: list of numpy arrays
-    :param transform: geo transform
-    :param projection: projection
-    :param no_data_value: no data value
-    :param data_type: data type
-    :param options: raster creation options
+    The selection is worked out once per observation and applied, in place, to all the carried bands a block of rows
+    at a time so the memory used is the output arrays plus a block's worth of temporaries.  Ties go to the most recent
+    observation.
+
+    e.g. the bare soil composite carries the NBAR and FC bands (and satellite/date provenance) of the observation with
+    the greatest bare soil fraction; a "most recent pixel" mosaic would use the acquisition date as the criterion.
     """
 
-    _log.debug("creating output raster %s", path)
-    _log.debug("filename=%s | shape = %s | bands = %d | data type = %s", path, (numpy.shape(data[0])[0], numpy.shape(data[0])[1]),
-               len(data), data_type)
+    def __init__(self, shape, maximise=True, block_rows=kernels.DEFAULT_BLOCK_ROWS):
 
-    driver = gdal.GetDriverByName("GTiff")
-    assert driver
+        """
+        :param shape: The shape of the composite
+        :type shape: (int, int)
+        :param maximise: Select the greatest value of the criterion (True) or the least (False)
+        :type maximise: bool
+        :param block_rows: Number of rows to update at a time
+        :type block_rows: int
+        """
 
-    width = width or numpy.shape(data[0])[1]
-    height = height or numpy.shape(data[0])[0]
+        self.shape = shape
+        self.maximise = maximise
+        self.block_rows = block_rows
 
-    raster = driver.Create(path, width, height, len(data), data_type, options)
-    assert raster
+        self.best = None
+        self.selected = numpy.zeros(shape, dtype=numpy.bool_)
 
-    raster.SetGeoTransform(transform)
-    raster.SetProjection(projection)
+        self.bands = dict()
 
-    if dataset_metadata:
-        raster.SetMetadata(dataset_metadata)
+    def add_band(self, key, dtype=numpy.int16, ndv=NDV):
 
-    for i in range(0, len(data)):
-        _log.debug("Writing band %d", i + 1)
+        """
+        Add a band to carry
 
-        band = raster.GetRasterBand(i + 1)
+        :param key: The key of the band (e.g. a band enum or "DATE")
+        :param dtype: The data type of the composite band
+        :param ndv: The no data value of the composite band (where no observation was selected)
+        :return: The composite band
+        :rtype: numpy.array
+        """
 
-        if band_ids and len(band_ids) - 1 >= i:
-            band.SetDescription(band_ids[i])
-        band.SetNoDataValue(no_data_value)
-        band.WriteArray(data[i])
-        band.ComputeStatistics(True)
+        self.bands[key] = empty_array(self.shape, dtype=dtype, ndv=ndv)
 
-        band.FlushCache()
-        del band
+        return self.bands[key]
 
-    raster.FlushCache()
-    del raster
+    def update(self, criterion, values, valid=None):
 
+        """
+        Update the composite with an observation
 
-def raster_create_envi(path, data, transform, projection, no_data_value, data_type,
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=2", "ZLEVEL=9"]):
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=DEFLATE", "PREDICTOR=1", "ZLEVEL=6"]):
-                  options=["INTERLEAVE=BSQ"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW"],
-                  # options=["INTERLEAVE=PIXEL", "COMPRESS=LZW", "TILED=YES"],
-                  width=None, height=None, dataset_metadata=None, band_ids=None):
-    """
-    Create a raster from a list of numpy arrays
+        :param criterion: The selection criterion of the observation (NaN is never selected)
+        :type criterion: numpy.array
+        :param values: key -> data for each carried band - either an array or a scalar (e.g. the acquisition date)
+        :type values: dict
+        :param valid: Optional mask of the pixels of the observation that can be selected
+        :type valid: numpy.array
+        :return: The number of pixels selected from this observation
+        :rtype: int
+        """
 
-    :param path: path to the output raster
-    :param data: list of numpy arrays
-    :param transform: geo transform
-    :param projection: projection
-    :param no_data_value: no data value
-    :param data_type: data type
-    :param options: raster creation options
-    """
+        if self.best is None:
+            self.best = numpy.zeros(self.shape, dtype=numpy.asarray(criterion).dtype)
 
-    _log.debug("creating output raster %s", path)
-    _log.debug("filename=%s | shape = %s | bands = %d | data type = %s", path, (numpy.shape(data[0])[0], numpy.shape(data[0])[1]),
-               len(data), data_type)
+        count = 0
 
-    driver = gdal.GetDriverByName("ENVI")
-    assert driver
+        rows = self.shape[0]
 
-    width = width or numpy.shape(data[0])[1]
-    height = height or numpy.shape(data[0])[0]
+        for start in range(0, rows, self.block_rows):
 
-    raster = driver.Create(path, width, height, len(data), data_type, options)
-    assert raster
+            block = slice(start, min(start + self.block_rows, rows))
 
-    raster.SetGeoTransform(transform)
-    raster.SetProjection(projection)
+            # Views of the block so the updates below are in place
 
-    if dataset_metadata:
-        raster.SetMetadata(dataset_metadata)
+            best = self.best[block]
+            selected = self.selected[block]
 
-    for i in range(0, len(data)):
-        _log.debug("Writing band %d", i + 1)
+            c = criterion[block]
 
-        band = raster.GetRasterBand(i + 1)
+            if self.maximise:
+                better = c >= best
+            else:
+                better = c <= best
 
-        if band_ids and len(band_ids) - 1 >= i:
-            band.SetDescription(band_ids[i])
-        band.SetNoDataValue(no_data_value)
-        band.WriteArray(data[i])
-        band.ComputeStatistics(True)
+            # Anything beats nothing
 
-        band.FlushCache()
-        del band
+            better |= ~selected
 
-    raster.FlushCache()
-    del raster
+            if c.dtype.kind == "f":
+                better &= ~numpy.isnan(c)
 
+            if valid is not None:
+                better &= valid[block]
 
-def propagate_using_selected_pixel(a, b, c, d, ndv=NDV):
-    return numpy.where((a == b) & (a != ndv), c, d)
+            best[better] = c[better]
+            selected |= better
+
+            for key, value in values.iteritems():
+                if numpy.isscalar(value):
+                    self.bands[key][block][better] = value
+                else:
+                    self.bands[key][block][better] = value[block][better]
+
+            count += numpy.count_nonzero(better)
+
+        return count
+
+    def is_complete(self):
+
+        """
+        Have all the pixels had an observation selected
+        """
+
+        return bool(self.selected.all())
 
 
 # def calculate_ndvi(red, nir, input_ndv=NDV, output_ndv=INT16_MAX):
@@ -656,13 +909,7 @@ def calculate_ndvi(red, nir, input_ndv=NDV, output_ndv=NDV):
     NDVI is defined as (NIR - RED) / (NIR + RED)
     """
 
-    red = numpy.ma.masked_equal(red, input_ndv)
-    nir = numpy.ma.masked_equal(nir, input_ndv)
-
-    ndvi = numpy.true_divide(nir - red, nir + red)
-    ndvi = ndvi.filled(output_ndv)
-
-    return ndvi
+    return kernels.ndvi(red, nir, input_ndv=input_ndv, output_ndv=output_ndv)
 
 
 def calculate_evi(red, blue, nir, l=1, c1=6, c2=7.5, input_ndv=NDV, output_ndv=NDV):
@@ -674,14 +921,7 @@ def calculate_evi(red, blue, nir, l=1, c1=6, c2=7.5, input_ndv=NDV, output_ndv=N
     Defaults to the standard MODIS EVI of L=1 C1=6 C2=7.5
     """
 
-    red = numpy.ma.masked_equal(red, input_ndv)
-    blue = numpy.ma.masked_equal(blue, input_ndv)
-    nir = numpy.ma.masked_equal(nir, input_ndv)
-
-    evi = 2.5 * numpy.true_divide(nir - red, nir + c1 * red - c2 * blue + 1)
-    evi = evi.filled(output_ndv)
-
-    return evi
+    return kernels.evi(red, blue, nir, l=l, c1=c1, c2=c2, input_ndv=input_ndv, output_ndv=output_ndv)
 
 
 def calculate_nbr(nir, swir, input_ndv=NDV, output_ndv=NDV):
@@ -691,13 +931,7 @@ def calculate_nbr(nir, swir, input_ndv=NDV, output_ndv=NDV):
     NBR is defined as (NIR - SWIR 2) / (NIR + SWIR 2)
     """
 
-    nir = numpy.ma.masked_equal(nir, input_ndv)
-    swir = numpy.ma.masked_equal(swir, input_ndv)
-
-    nbr = numpy.true_divide(nir - swir, nir + swir)
-    nbr = nbr.filled(output_ndv)
-
-    return nbr
+    return kernels.nbr(nir, swir, input_ndv=input_ndv, output_ndv=output_ndv)
 
 
 class TasselCapIndex(Enum):
@@ -876,32 +1110,33 @@ def calculate_tassel_cap_index(bands, coefficients, input_ndv=NDV, output_ndv=nu
     :param output_ndv:
     :return:
     """
-    bands_masked = dict()
 
-    # Drop out no data values - do I need this???
+    # Reflectance values are scaled by 10000
 
-    for b in bands.iterkeys():
-        bands_masked[b] = numpy.ma.masked_equal(bands[b], input_ndv).astype(numpy.float32) / 10000
+    return kernels.linear_combination(bands, coefficients, 10000, input_ndv=input_ndv, output_ndv=output_ndv)
 
-    tci = 0
 
-    for b in bands:
-        if b in coefficients:
-            tci += bands_masked[b] * coefficients[b]
-
-    tci = tci.filled(output_ndv)
+def calculate_medoid(X, dist=None):
 
-    return tci
+    """
+    Return the medoid of the observations (columns) of X - the observation with the least total distance to the others
 
+    :param X: (bands x observations) array
+    :param dist: optional distance function between two observations (default Euclidean)
+    :return: the medoid observation
+    """
 
-def calculate_medoid(X, dist=None):
     _log.debug("X is \n%s", X)
     _log.debug("X.ndim is %d", X.ndim)
 
-    if dist is None:
-        dist = lambda x, y: numpy.sqrt(numpy.square(x-y).sum())
     if X.ndim == 1:
         return X
+
+    if dist is None:
+        X = numpy.asarray(X, dtype=numpy.float64)
+        d = numpy.sqrt(numpy.square(X[:, :, None] - X[:, None, :]).sum(axis=0)).sum(axis=1)
+        return X[:, numpy.argmin(d)]
+
     _, n = X.shape
     d = numpy.empty(n)
     for i in range(n):
@@ -909,6 +1144,91 @@ def calculate_medoid(X, dist=None):
     return X[:, numpy.argmin(d)]
 
 
+# The (time x time) pairwise distances are calculated for this many bytes worth of pixels at a time
+
+DEFAULT_MEDOID_MAX_BYTES = 64 * 1024 * 1024
+
+
+def calculate_medoid_composite(stack, ndv=NDV, max_bytes=DEFAULT_MEDOID_MAX_BYTES):
+
+    """
+    Calculate the per pixel medoid composite of a stack - for each pixel the observation with the least total
+    (Euclidean, across the bands) distance to the other observations of that pixel
+
+    Observations with the no data value in any band are ignored.
+
+    :param stack: (time x band x y x x) array
+    :type stack: numpy.array
+    :param ndv: The no data value
+    :param max_bytes: Limit on the memory used for the pairwise distances (which are calculated for chunks of pixels)
+    :type max_bytes: int
+    :return: the (band x y x x) composite (the no data value where there are no observations) and the (y x x) index
+        (into time) of the observation selected for each pixel (-1 where there are no observations)
+    :rtype: (numpy.array, numpy.array)
+    """
+
+    times, bands, rows, cols = numpy.shape(stack)
+
+    pixels = rows * cols
+
+    data = numpy.reshape(stack, (times, bands, pixels))
+
+    composite = numpy.empty((bands, pixels), dtype=data.dtype)
+    composite.fill(ndv)
+
+    index = numpy.empty(pixels, dtype=numpy.int32)
+    index.fill(-1)
+
+    # A (time x time) float32 distance array and a temporary of the same size per pixel
+
+    chunk = max(1, max_bytes // (times * times * 4 * 2))
+
+    for start in range(0, pixels, chunk):
+
+        block = slice(start, min(start + chunk, pixels))
+
+        block_data = data[:, :, block]
+
+        if isinstance(ndv, float) and math.isnan(ndv):
+            valid = numpy.all(~numpy.isnan(block_data), axis=1)
+        else:
+            valid = numpy.all(block_data != ndv, axis=1)
+
+        # Zero the invalid observations so they can't make the distances NaN (as a NaN no data value would)
+
+        x = numpy.where(valid[:, None, :], block_data, 0).astype(numpy.float32)
+
+        distance = numpy.zeros((times, times, x.shape[2]), dtype=numpy.float32)
+
+        for band in range(bands):
+            difference = x[:, None, band, :] - x[None, :, band, :]
+            numpy.square(difference, out=difference)
+            distance += difference
+
+        del difference
+
+        numpy.sqrt(distance, out=distance)
+
+        # Only distances to (and from) valid observations count
+
+        distance *= valid[None, :, :]
+
+        total = distance.sum(axis=1)
+        total[~valid] = numpy.inf
+
+        del distance
+
+        medoid = numpy.argmin(total, axis=0)
+        found = valid.any(axis=0)
+
+        selected = block_data[medoid, :, numpy.arange(len(medoid))]
+
+        composite[:, block] = numpy.where(found[None, :], selected.T, composite[:, block])
+        index[block] = numpy.where(found, medoid, -1)
+
+    return numpy.reshape(composite, (bands, rows, cols)), numpy.reshape(index, (rows, cols))
+
+
 # def calculate_medoid_simon(X):
 #
 #     _log.debug("shape of X is %s", numpy.shape(X))
@@ -959,8 +1279,10 @@ def latlon_to_cell(lat, lon):
     :param lon: longitude
     :return: cell as x, y pair
     """
-    x = int(lon)
-    y = int(lat) - 1
+    # floor/ceil rather than int (which truncates towards zero) so that negative longitudes and positive latitudes
+    # are in the right cell
+    x = int(math.floor(lon))
+    y = int(math.ceil(lat)) - 1
 
     return x, y
 
@@ -1220,8 +1542,37 @@ def format_date_time(d):
     return None
 
 
+# The feature geometries are cached (per process) so a vector file is only opened once per feature
+
+_feature_geometries = dict()
+
+
 def extract_feature_geometry_wkb(vector_file, vector_layer=0, vector_feature=0, epsg=4326):
 
+    """
+    Return the geometry (as WKB in the given projection) of a feature in a vector file
+
+    :param vector_file: Vector file containing the feature
+    :type vector_file: str
+    :param vector_layer: Layer (index starts at 0) within the vector file
+    :type vector_layer: int
+    :param vector_feature: Feature id (index starts at 0) within the layer
+    :type vector_feature: int
+    :param epsg: The projection
+    :type epsg: int
+    :rtype: str
+    """
+
+    key = (os.path.abspath(vector_file), get_file_mtime(vector_file), vector_layer, vector_feature, epsg)
+
+    if key not in _feature_geometries:
+        _feature_geometries[key] = read_feature_geometry_wkb(vector_file, vector_layer, vector_feature, epsg)
+
+    return _feature_geometries[key]
+
+
+def read_feature_geometry_wkb(vector_file, vector_layer=0, vector_feature=0, epsg=4326):
+
     import ogr
     import osr
     from gdalconst import GA_ReadOnly
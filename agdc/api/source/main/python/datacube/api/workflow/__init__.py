@@ -319,36 +319,25 @@ class SummaryTask(Task):
         return [DatasetType.ARG25, DatasetType.PQ25]
 
 
-class CellTask(Task):
+class CellTilesMixin(object):
 
-    __metaclass__ = abc.ABCMeta
-
-    x = luigi.IntParameter()
-    y = luigi.IntParameter()
-
-    acq_min = luigi.DateParameter()
-    acq_max = luigi.DateParameter()
-
-    satellites = luigi.Parameter(is_list=True)
-
-    output_directory = luigi.Parameter()
-
-    csv = luigi.BooleanParameter()
-
-    dummy = luigi.BooleanParameter()
-
-    mask_pqa_apply = luigi.BooleanParameter()
-    mask_pqa_mask = luigi.Parameter()
+    """
+    Get the tiles of a cell task - from the tile list CSV (if pre-created) or the tile cache with --csv, otherwise from
+    the DB
 
-    mask_wofs_apply = luigi.BooleanParameter()
-    mask_wofs_mask = luigi.Parameter()
+    Used by tasks with x, y, acq_min, acq_max, satellites, output_directory and csv parameters and a get_dataset_types
+    method.
+    """
 
     def get_tiles(self):
 
-        # get list of tiles from CSV
+        # get list of tiles from CSV (if pre-created) or the tile cache
 
         if self.csv:
-            return list(self.get_tiles_from_csv())
+            if os.path.isfile(self.get_tile_csv_filename()):
+                return list(self.get_tiles_from_csv())
+
+            return self.get_tiles_from_cache()
 
         # get list of tiles from DB
 
@@ -381,6 +370,14 @@ class CellTask(Task):
                 acq_min=acq_min, acq_max=acq_max
             ))
 
+    def get_tiles_from_cache(self):
+
+        from datacube.api.tile_cache import get_tiles
+
+        return get_tiles(self.output_directory, x=self.x, y=self.y, acq_min=self.acq_min, acq_max=self.acq_max,
+                         satellites=[satellite for satellite in self.satellites],
+                         dataset_types=self.get_dataset_types())
+
     def get_tiles_from_db(self):
 
         from datacube.api.query import list_tiles
@@ -393,6 +390,31 @@ class CellTask(Task):
                                dataset_types=self.get_dataset_types()):
             yield tile
 
+
+class CellTask(CellTilesMixin, Task):
+
+    __metaclass__ = abc.ABCMeta
+
+    x = luigi.IntParameter()
+    y = luigi.IntParameter()
+
+    acq_min = luigi.DateParameter()
+    acq_max = luigi.DateParameter()
+
+    satellites = luigi.Parameter(is_list=True)
+
+    output_directory = luigi.Parameter()
+
+    csv = luigi.BooleanParameter()
+
+    dummy = luigi.BooleanParameter()
+
+    mask_pqa_apply = luigi.BooleanParameter()
+    mask_pqa_mask = luigi.Parameter()
+
+    mask_wofs_apply = luigi.BooleanParameter()
+    mask_wofs_mask = luigi.Parameter()
+
     @staticmethod
     def get_dataset_types():
 
@@ -160,9 +160,9 @@ class BandStackCellDatasetBandTask(CellDatasetBandTask):
 
         # TODO move the dicking around with bands stuff into utils?
 
-        import gdal
+        from datacube.api.writer import RasterWriter, get_geotiff_options
 
-        driver = raster = None
+        raster = None
         metadata = None
         data_type = ndv = None
 
@@ -215,29 +215,17 @@ class BandStackCellDatasetBandTask(CellDatasetBandTask):
                 ndv = get_dataset_ndv(dataset)
                 assert ndv
 
-            if not driver:
-
-                if self.output_format == OutputFormat.GEOTIFF:
-                    driver = gdal.GetDriverByName("GTiff")
-                elif self.output_format == OutputFormat.ENVI:
-                    driver = gdal.GetDriverByName("ENVI")
-
-                assert driver
-
             if not raster:
 
                 if self.output_format == OutputFormat.GEOTIFF:
-                    raster = driver.Create(filename, metadata.shape[0], metadata.shape[1], len(tiles), data_type, options=["BIGTIFF=YES", "INTERLEAVE=BAND"])
-                elif self.output_format == OutputFormat.ENVI:
-                    raster = driver.Create(filename, metadata.shape[0], metadata.shape[1], len(tiles), data_type, options=["INTERLEAVE=BSQ"])
-
-                assert raster
+                    driver_name, options = "GTiff", get_geotiff_options(data_type, bigtiff=True)
+                else:
+                    driver_name, options = "ENVI", ["INTERLEAVE=BSQ"]
 
                 # NOTE: could do this without the metadata!!
-                raster.SetGeoTransform(metadata.transform)
-                raster.SetProjection(metadata.projection)
-
-            raster.SetMetadata(self.generate_raster_metadata())
+                raster = RasterWriter(filename, metadata.shape[0], metadata.shape[1], len(tiles), data_type,
+                                      metadata.transform, metadata.projection, ndv, driver_name=driver_name,
+                                      options=options, dataset_metadata=self.generate_raster_metadata())
 
             mask = None
 
@@ -258,21 +246,15 @@ class BandStackCellDatasetBandTask(CellDatasetBandTask):
 
             _log.debug("data is [%s]", data)
 
-            stack_band = raster.GetRasterBand(index)
-
-            stack_band.SetDescription(os.path.basename(dataset.path))
-            stack_band.SetNoDataValue(ndv)
-            stack_band.WriteArray(data[band])
-            stack_band.ComputeStatistics(True)
-            stack_band.SetMetadata({"ACQ_DATE": format_date(tile.end_datetime), "SATELLITE": dataset.satellite.name})
+            raster.write_band(index, data[band])
+            raster.set_band_metadata(index, description=os.path.basename(dataset.path),
+                                     metadata={"ACQ_DATE": format_date(tile.end_datetime),
+                                               "SATELLITE": dataset.satellite.name})
 
-            stack_band.FlushCache()
-            del stack_band
+            del data
 
         if raster:
-            raster.FlushCache()
-            del raster
-            raster = None
+            raster.close()
 
     def generate_raster_metadata(self):
         return {
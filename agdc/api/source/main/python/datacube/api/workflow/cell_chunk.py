@@ -24,9 +24,7 @@ import abc
 import datacube.api.workflow as workflow
 import logging
 import luigi
-import os
-from datacube.api.model import DatasetType, Tile
-from datacube.api.utils import get_satellite_string
+from datacube.api.model import DatasetType
 
 
 _log = logging.getLogger()
@@ -121,7 +119,7 @@ class CellTask(workflow.CellTask):
         raise Exception("Abstract method should be overridden")
 
 
-class CellChunkTask(workflow.Task):
+class CellChunkTask(workflow.CellTilesMixin, workflow.Task):
 
     __metaclass__ = abc.ABCMeta
 
@@ -150,56 +148,6 @@ class CellChunkTask(workflow.Task):
     chunk_size_x = luigi.IntParameter()
     chunk_size_y = luigi.IntParameter()
 
-    def get_tiles(self):
-
-        # get list of tiles from CSV
-
-        if self.csv:
-            return list(self.get_tiles_from_csv())
-
-        # get list of tiles from DB
-
-        else:
-            return list(self.get_tiles_from_db())
-
-    def get_tiles_from_csv(self):
-
-        if os.path.isfile(self.get_tile_csv_filename()):
-            with open(self.get_tile_csv_filename(), "rb") as f:
-                import csv
-
-                reader = csv.DictReader(f)
-                for record in reader:
-                    _log.debug("Found CSV record [%s]", record)
-                    yield Tile.from_csv_record(record)
-
-    def get_tile_csv_filename(self):
-
-        acq_min = workflow.format_date(self.acq_min)
-        acq_max = workflow.format_date(self.acq_max)
-
-        # TODO other distinguishing characteristics (e.g. dataset types)
-
-        return os.path.join(
-            self.output_directory,
-            "tiles_{satellites}_{x_min:03d}_{x_max:03d}_{y_min:04d}_{y_max:04d}_{acq_min}_{acq_max}.csv".format(
-                satellites=get_satellite_string(self.satellites),
-                x_min=self.x, x_max=self.x, y_min=self.y, y_max=self.y,
-                acq_min=acq_min, acq_max=acq_max
-            ))
-
-    def get_tiles_from_db(self):
-
-        from datacube.api.query import list_tiles
-
-        x_list = [self.x]
-        y_list = [self.y]
-
-        for tile in list_tiles(x=x_list, y=y_list, acq_min=self.acq_min, acq_max=self.acq_max,
-                               satellites=[satellite for satellite in self.satellites],
-                               dataset_types=self.get_dataset_types()):
-            yield tile
-
     @staticmethod
     def get_dataset_types():
 
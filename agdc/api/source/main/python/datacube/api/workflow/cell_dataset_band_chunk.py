@@ -24,7 +24,7 @@ import abc
 import datacube.api.workflow as workflow
 import logging
 import luigi
-from datacube.api.model import Ls57Arg25Bands, get_bands
+from datacube.api.model import DatasetType, Ls57Arg25Bands, get_bands
 
 
 _log = logging.getLogger()
@@ -190,7 +190,7 @@ class CellDatasetBandTask(workflow.Task):
         raise Exception("Abstract method should be overridden")
 
 
-class CellDatasetBandChunkTask(workflow.Task):
+class CellDatasetBandChunkTask(workflow.CellTilesMixin, workflow.Task):
 
     __metaclass__ = abc.ABCMeta
 
@@ -218,3 +218,7 @@ class CellDatasetBandChunkTask(workflow.Task):
 
     chunk_size_x = luigi.IntParameter()
     chunk_size_y = luigi.IntParameter()
+
+    def get_dataset_types(self):
+
+        return [self.dataset_type, DatasetType.PQ25]
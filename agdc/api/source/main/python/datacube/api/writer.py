@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import gdal
+import logging
+import math
+import numpy
+import os
+from enum import Enum
+
+
+_log = logging.getLogger(__name__)
+
+
+# Output rasters are written as tiled, compressed, GeoTIFFs a block at a time - so callers can write from a generator of
+# row blocks rather than holding the whole array.  The band statistics are accumulated as the blocks are written rather
+# than by re-reading each band with ComputeStatistics.
+
+class Compression(Enum):
+    __order__ = "NONE DEFLATE LZW"
+
+    NONE = "NONE"
+    DEFLATE = "DEFLATE"
+    LZW = "LZW"
+
+
+DEFAULT_COMPRESSION = Compression.DEFLATE
+
+DEFAULT_ZLEVEL = 6
+
+DEFAULT_BLOCK_SIZE = 512
+
+DEFAULT_OVERVIEWS = [2, 4, 8, 16]
+
+DEFAULT_OVERVIEW_RESAMPLING = "NEAREST"
+
+FLOAT_DATA_TYPES = [gdal.GDT_Float32, gdal.GDT_Float64]
+
+
+def get_geotiff_options(data_type, compression=DEFAULT_COMPRESSION, tiled=True, block_size=DEFAULT_BLOCK_SIZE,
+                        interleave="BAND", bigtiff=False, zlevel=DEFAULT_ZLEVEL):
+
+    """
+    Return the GeoTIFF creation options
+
+    :param data_type: The GDAL data type (to choose the predictor)
+    :param compression: The compression
+    :type compression: Compression
+    :param tiled: Write a tiled (rather than striped) GeoTIFF
+    :type tiled: bool
+    :param block_size: The tile size
+    :type block_size: int
+    :param interleave: BAND or PIXEL
+    :type interleave: str
+    :param bigtiff: Force a BigTIFF (otherwise one is written if it might be needed)
+    :type bigtiff: bool
+    :param zlevel: The DEFLATE compression level
+    :type zlevel: int
+    :rtype: list[str]
+    """
+
+    options = ["INTERLEAVE={interleave}".format(interleave=interleave),
+               "BIGTIFF={bigtiff}".format(bigtiff=bigtiff and "YES" or "IF_SAFER")]
+
+    if tiled:
+        options += ["TILED=YES",
+                    "BLOCKXSIZE={size}".format(size=block_size),
+                    "BLOCKYSIZE={size}".format(size=block_size)]
+
+    if compression and compression != Compression.NONE:
+        options.append("COMPRESS={compression}".format(compression=compression.value))
+
+        # Horizontal differencing for integers and the floating point predictor for floats
+
+        options.append("PREDICTOR={predictor}".format(predictor=data_type in FLOAT_DATA_TYPES and 3 or 2))
+
+        if compression == Compression.DEFLATE:
+            options.append("ZLEVEL={zlevel}".format(zlevel=zlevel))
+
+    return options
+
+
+class BandStatistics(object):
+
+    """
+    Band statistics (as GDAL's ComputeStatistics - the min, max, mean and population standard deviation of the
+    pixels that aren't the no data value) accumulated a block at a time
+    """
+
+    def __init__(self, no_data_value=None):
+
+        self.no_data_value = no_data_value
+
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, data):
+
+        data = numpy.asarray(data)
+
+        valid = numpy.ones(numpy.shape(data), dtype=numpy.bool_)
+
+        if self.no_data_value is not None and not numpy.isnan(self.no_data_value):
+            valid &= data != self.no_data_value
+
+        if data.dtype.kind == "f":
+            valid &= numpy.isfinite(data)
+
+        values = data[valid].astype(numpy.float64)
+
+        if values.size == 0:
+            return
+
+        # Combine the block's mean and sum of squared differences with the running ones (Chan et al)
+
+        count = values.size
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+
+        delta = mean - self.mean
+        total = self.count + count
+
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+        if self.min is None:
+            self.min, self.max = values.min(), values.max()
+
+        else:
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+
+    def get(self):
+
+        """
+        :return: min, max, mean, standard deviation (or None if there were no valid pixels)
+        """
+
+        if self.count == 0:
+            return None
+
+        return float(self.min), float(self.max), float(self.mean), math.sqrt(self.m2 / self.count)
+
+
+class RasterWriter(object):
+
+    """
+    Write a raster a block at a time
+
+    e.g.
+
+        with RasterWriter(path, 4000, 4000, 1, gdal.GDT_Int16, transform, projection, NDV) as writer:
+            for y_offset, data in blocks:
+                writer.write(1, data, y_offset=y_offset)
+
+    The statistics of each band are accumulated from the written data so each pixel should be written once.
+    """
+
+    def __init__(self, path, width, height, band_count, data_type, transform, projection, no_data_value,
+                 driver_name="GTiff", options=None, dataset_metadata=None, band_ids=None, overviews=None,
+                 overview_resampling=DEFAULT_OVERVIEW_RESAMPLING, cloud_optimised=False, statistics=True):
+
+        """
+        :param path: The output file
+        :type path: str
+        :param width: Width
+        :type width: int
+        :param height: Height
+        :type height: int
+        :param band_count: Number of bands
+        :type band_count: int
+        :param data_type: GDAL data type
+        :param transform: Geo transform
+        :param projection: Projection
+        :param no_data_value: No data value of the bands
+        :param driver_name: GDAL driver (GTiff or ENVI)
+        :type driver_name: str
+        :param options: Creation options (default is tiled and compressed for GTiff)
+        :type options: list[str]
+        :param dataset_metadata: Metadata
+        :type dataset_metadata: dict
+        :param band_ids: Band descriptions
+        :type band_ids: list[str]
+        :param overviews: Overview levels to build (e.g. [2, 4, 8, 16])
+        :type overviews: list[int]
+        :param overview_resampling: Overview resampling (e.g. NEAREST or AVERAGE)
+        :type overview_resampling: str
+        :param cloud_optimised: Write a cloud optimised GeoTIFF (overviews and tiles ordered for range requests)
+        :type cloud_optimised: bool
+        :param statistics: Accumulate and set the band statistics
+        :type statistics: bool
+        """
+
+        if options is None:
+            options = driver_name == "GTiff" and get_geotiff_options(data_type) or list()
+
+        if cloud_optimised and not overviews:
+            overviews = DEFAULT_OVERVIEWS
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.band_count = band_count
+        self.options = options
+        self.overviews = overviews
+        self.overview_resampling = overview_resampling
+        self.cloud_optimised = cloud_optimised
+
+        # A cloud optimised GeoTIFF is a copy of a GeoTIFF with its overviews already built
+
+        self.filename = cloud_optimised and "{path}.tmp.tif".format(path=path) or path
+
+        _log.debug("Creating output raster [%s] [%d x %d x %d] data type [%s] options [%s]",
+                   path, width, height, band_count, data_type, options)
+
+        driver = gdal.GetDriverByName(driver_name)
+        assert driver
+
+        self.raster = driver.Create(self.filename, width, height, band_count, data_type, options)
+        assert self.raster
+
+        self.raster.SetGeoTransform(transform)
+        self.raster.SetProjection(projection)
+
+        if dataset_metadata:
+            self.raster.SetMetadata(dataset_metadata)
+
+        for i in range(band_count):
+            band = self.raster.GetRasterBand(i + 1)
+
+            if band_ids and len(band_ids) - 1 >= i:
+                band.SetDescription(band_ids[i])
+
+            band.SetNoDataValue(no_data_value)
+
+            del band
+
+        self.statistics = statistics and [BandStatistics(no_data_value) for _ in range(band_count)] or None
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.close()
+
+    def get_block_rows(self):
+
+        """
+        Return the number of rows to write at a time - a whole number of the raster's blocks
+        """
+
+        band = self.raster.GetRasterBand(1)
+
+        block_rows = band.GetBlockSize()[1]
+
+        del band
+
+        return block_rows * int(math.ceil(float(DEFAULT_BLOCK_SIZE) / block_rows))
+
+    def set_band_metadata(self, band_number, description=None, metadata=None):
+
+        """
+        Set the description and/or metadata of a band
+
+        :param band_number: The band (starting at 1)
+        :type band_number: int
+        :type description: str
+        :type metadata: dict
+        """
+
+        band = self.raster.GetRasterBand(band_number)
+        assert band
+
+        if description:
+            band.SetDescription(description)
+
+        if metadata:
+            band.SetMetadata(metadata)
+
+        del band
+
+    def write(self, band_number, data, x_offset=0, y_offset=0):
+
+        """
+        Write a block of a band
+
+        :param band_number: The band (starting at 1)
+        :type band_number: int
+        :param data: The data
+        :type data: numpy.array
+        :param x_offset: The pixel offset of the block
+        :type x_offset: int
+        :param y_offset: The line offset of the block
+        :type y_offset: int
+        """
+
+        band = self.raster.GetRasterBand(band_number)
+        assert band
+
+        band.WriteArray(data, x_offset, y_offset)
+
+        del band
+
+        if self.statistics:
+            self.statistics[band_number - 1].update(data)
+
+    def write_blocks(self, band_number, blocks):
+
+        """
+        Write a band from a generator of row blocks
+
+        :param band_number: The band (starting at 1)
+        :type band_number: int
+        :param blocks: (y offset, data) of each block
+        """
+
+        for y_offset, data in blocks:
+            self.write(band_number, data, y_offset=y_offset)
+
+    def write_band(self, band_number, data):
+
+        """
+        Write a whole band (a block of rows at a time)
+
+        :param band_number: The band (starting at 1)
+        :type band_number: int
+        :param data: The data
+        :type data: numpy.array
+        """
+
+        self.write_blocks(band_number, iter_row_blocks(data, self.get_block_rows()))
+
+    def close(self):
+
+        if self.raster is None:
+            return
+
+        if self.statistics:
+            for i, statistics in enumerate(self.statistics):
+                values = statistics.get()
+
+                if values:
+                    band = self.raster.GetRasterBand(i + 1)
+                    band.SetStatistics(*values)
+                    del band
+
+        self.raster.FlushCache()
+
+        if self.overviews:
+            _log.debug("Building overviews [%s] of [%s]", self.overviews, self.filename)
+            self.raster.BuildOverviews(self.overview_resampling, self.overviews)
+
+        if self.cloud_optimised:
+            driver = gdal.GetDriverByName("GTiff")
+            assert driver
+
+            options = [o for o in self.options if not o.startswith("TILED")] + ["TILED=YES", "COPY_SRC_OVERVIEWS=YES"]
+
+            copy = driver.CreateCopy(self.path, self.raster, 0, options)
+            assert copy
+
+            copy.FlushCache()
+            del copy
+
+        self.raster = None
+
+        if self.cloud_optimised:
+            gdal.GetDriverByName("GTiff").Delete(self.filename)
+
+
+def iter_row_blocks(data, rows):
+
+    """
+    Generate (y offset, data) blocks of rows of an array
+
+    :param data: The data
+    :type data: numpy.array
+    :param rows: Number of rows in each block
+    :type rows: int
+    """
+
+    height = numpy.shape(data)[0]
+
+    for y_offset in range(0, height, rows):
+        yield y_offset, data[y_offset:y_offset + rows]
+
+
+def raster_write(path, bands, width, height, data_type, transform, projection, no_data_value, **kwargs):
+
+    """
+    Write a raster from a list of bands - each either an array or a generator of (y offset, data) row blocks
+
+    :param bands: The bands
+    :type bands: list
+    :param kwargs: Other RasterWriter arguments
+    """
+
+    with RasterWriter(path, width, height, len(bands), data_type, transform, projection, no_data_value,
+                      **kwargs) as writer:
+
+        for i, band in enumerate(bands):
+            _log.debug("Writing band %d", i + 1)
+
+            if isinstance(band, numpy.ndarray):
+                writer.write_band(i + 1, band)
+
+            else:
+                writer.write_blocks(i + 1, band)
@@ -27,6 +27,7 @@ class Config:
 
     class Section(Enum):
         DATABASE = "DATABASE"
+        QUERY = "QUERY"
 
     class DatabaseKey(Enum):
         HOST = "host"
@@ -35,6 +36,9 @@ class Config:
         USERNAME = "username"
         PASSWORD = "password"
 
+    class QueryKey(Enum):
+        USE_TILE_INDEX = "use_tile_index"
+
     _config = None
 
     def __init__(self, path=None):
@@ -56,6 +60,9 @@ class Config:
     def _get_int(self, section, key):
         return int(self._config.get(section.value, key.value))
 
+    def _get_boolean(self, section, key):
+        return self._config.getboolean(section.value, key.value)
+
     def get_db_host(self):
         '''
         Get the DB host
@@ -76,6 +83,14 @@ class Config:
     def get_db_password(self):
         return self._get_string(Config.Section.DATABASE, Config.DatabaseKey.PASSWORD)
 
+    def get_query_use_tile_index(self):
+        '''
+        Get whether the queries should use the (denormalised) tile_index table rather than joining the tile tables
+
+        :return:
+        '''
+        return self._get_boolean(Config.Section.QUERY, Config.QueryKey.USE_TILE_INDEX)
+
     def to_str(self):
         return [(k.value, self._get_string(Config.Section.DATABASE, k)) for k in Config.DatabaseKey]
 
@@ -89,5 +104,8 @@ port: 5432
 database: datacubev1
 username: cube_user
 password: GAcube0
+
+[QUERY]
+use_tile_index: false
 """
 
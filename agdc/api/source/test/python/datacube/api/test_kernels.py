@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import numpy
+import timeit
+from datacube.api import kernels
+from datacube.api.model import Ls57Arg25Bands, Satellite
+from datacube.api.utils import calculate_ndvi, calculate_evi, calculate_nbr, calculate_tassel_cap_index
+from datacube.api.utils import TCI_COEFFICIENTS, TasselCapIndex, NDV
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+# Reference (numpy.ma) implementations of the indices - as they were before the kernels
+
+def reference_ndvi(red, nir, input_ndv=NDV, output_ndv=NDV):
+
+    red = numpy.ma.masked_equal(red, input_ndv)
+    nir = numpy.ma.masked_equal(nir, input_ndv)
+
+    return numpy.true_divide(nir - red, nir + red).filled(output_ndv)
+
+
+def reference_evi(red, blue, nir, l=1, c1=6, c2=7.5, input_ndv=NDV, output_ndv=NDV):
+
+    red = numpy.ma.masked_equal(red, input_ndv).astype(numpy.float64)
+    blue = numpy.ma.masked_equal(blue, input_ndv).astype(numpy.float64)
+    nir = numpy.ma.masked_equal(nir, input_ndv).astype(numpy.float64)
+
+    return (2.5 * numpy.true_divide(nir - red, nir + c1 * red - c2 * blue + l)).filled(output_ndv)
+
+
+def reference_tassel_cap_index(bands, coefficients, input_ndv=NDV, output_ndv=numpy.nan):
+
+    tci = 0
+
+    for b in bands:
+        if b in coefficients:
+            tci += numpy.ma.masked_equal(bands[b], input_ndv).astype(numpy.float32) / 10000 * coefficients[b]
+
+    return tci.filled(output_ndv)
+
+
+def make_bands(shape=(300, 40), seed=0):
+
+    random = numpy.random.RandomState(seed)
+
+    bands = dict()
+
+    for band in Ls57Arg25Bands:
+        data = random.randint(0, 10000, size=shape).astype(numpy.int16)
+        data[random.rand(*shape) < 0.05] = NDV
+        bands[band] = data
+
+    # Zero denominators
+    bands[Ls57Arg25Bands.RED][0, :] = 0
+    bands[Ls57Arg25Bands.NEAR_INFRARED][0, :] = 0
+
+    return bands
+
+
+def assert_index_equal(actual, expected):
+
+    assert actual.shape == expected.shape
+    assert numpy.allclose(actual, expected, rtol=1e-5, atol=1e-5, equal_nan=True)
+
+
+def test_ndvi():
+
+    bands = make_bands()
+
+    red, nir = bands[Ls57Arg25Bands.RED], bands[Ls57Arg25Bands.NEAR_INFRARED]
+
+    assert_index_equal(calculate_ndvi(red, nir), reference_ndvi(red, nir))
+
+    # Row blocks and numpy (rather than numexpr)
+    assert_index_equal(kernels.evaluate_index("(nir - red) / (nir + red)", {"red": red, "nir": nir}, NDV, NDV,
+                                              block_rows=7, numexpr_enabled=False),
+                       reference_ndvi(red, nir))
+
+
+def test_evi():
+
+    bands = make_bands()
+
+    red, blue, nir = bands[Ls57Arg25Bands.RED], bands[Ls57Arg25Bands.BLUE], bands[Ls57Arg25Bands.NEAR_INFRARED]
+
+    assert_index_equal(calculate_evi(red, blue, nir), reference_evi(red, blue, nir))
+
+
+def test_nbr():
+
+    bands = make_bands()
+
+    nir, swir = bands[Ls57Arg25Bands.NEAR_INFRARED], bands[Ls57Arg25Bands.SHORT_WAVE_INFRARED_2]
+
+    assert_index_equal(calculate_nbr(nir, swir), reference_ndvi(swir, nir))
+
+
+def test_tassel_cap_index():
+
+    bands = make_bands()
+
+    for index in TasselCapIndex:
+        coefficients = TCI_COEFFICIENTS[Satellite.LS5][index]
+
+        assert_index_equal(calculate_tassel_cap_index(bands, coefficients),
+                           reference_tassel_cap_index(bands, coefficients))
+
+
+def benchmark(shape=(4000, 4000), number=3):
+
+    """
+    Time the kernels against the reference implementations for a (4000 x 4000) tile
+    """
+
+    bands = make_bands(shape=shape)
+
+    red, blue, nir = bands[Ls57Arg25Bands.RED], bands[Ls57Arg25Bands.BLUE], bands[Ls57Arg25Bands.NEAR_INFRARED]
+
+    wetness = TCI_COEFFICIENTS[Satellite.LS5][TasselCapIndex.WETNESS]
+
+    for name, reference, kernel in [
+            ("NDVI", lambda: reference_ndvi(red, nir), lambda: calculate_ndvi(red, nir)),
+            ("EVI", lambda: reference_evi(red, blue, nir), lambda: calculate_evi(red, blue, nir)),
+            ("WETNESS", lambda: reference_tassel_cap_index(bands, wetness),
+             lambda: calculate_tassel_cap_index(bands, wetness))]:
+
+        reference_time = min(timeit.repeat(reference, number=1, repeat=number))
+        kernel_time = min(timeit.repeat(kernel, number=1, repeat=number))
+
+        _log.info("%s reference [%.3f]s kernel [%.3f]s numexpr [%s] speed up [%.1f]x",
+                  name, reference_time, kernel_time, kernels.use_numexpr(), reference_time / kernel_time)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import numpy
+import ogr
+import shutil
+import tempfile
+from datacube.api.mask_cache import AoiMaskCache, pack_mask, unpack_mask, rasterise_aoi_mask
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+# A small cell grid (100 x 100 pixels of 0.01 degrees) so the masks are quick to rasterise
+
+GRID = {"width": 100, "height": 100, "pixel_size_x": 0.01, "pixel_size_y": -0.01}
+
+
+def get_polygon_wkb(ulx, uly, lrx, lry):
+
+    return ogr.CreateGeometryFromWkt(
+        "POLYGON(({ulx} {uly}, {lrx} {uly}, {lrx} {lry}, {ulx} {lry}, {ulx} {uly}))".format(
+            ulx=ulx, uly=uly, lrx=lrx, lry=lry)).ExportToWkb()
+
+
+def test_pack_mask():
+
+    mask = numpy.random.RandomState(0).rand(37, 53) < 0.5
+
+    assert numpy.array_equal(unpack_mask(pack_mask(mask), mask.shape), mask)
+
+
+def test_aoi_mask_cache():
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = AoiMaskCache(directory=directory)
+
+        # Polygon covering the left half of cell (120, -25) and wholly containing cell (119, -25)
+
+        wkb = get_polygon_wkb(118.5, -23.5, 120.5, -25.5)
+
+        # Cell (120, -25) is partially inside - the mask is the rasterised polygon
+
+        mask = cache.get_mask(wkb, 120, -25, **GRID)
+
+        expected = rasterise_aoi_mask(wkb, 120, -25, epsg=4326, **GRID)
+
+        assert numpy.array_equal(mask, expected)
+        assert not mask[:, :50].any() and mask[:, 50:].all()
+
+        # Cell (119, -25) is wholly inside and (122, -25) wholly outside
+
+        assert not cache.get_mask(wkb, 119, -25, **GRID).any()
+        assert cache.get_mask(wkb, 122, -25, **GRID).all()
+
+        assert cache.get_stats()["misses"] == 3
+
+        # Memory hit
+
+        assert numpy.array_equal(cache.get_mask(wkb, 120, -25, **GRID), expected)
+        assert cache.get_stats()["hits"] == 1
+
+        # Disk hit from a new cache
+
+        cache = AoiMaskCache(directory=directory)
+
+        assert numpy.array_equal(cache.get_mask(wkb, 120, -25, **GRID), expected)
+        assert cache.get_stats()["disk_hits"] == 1 and cache.get_stats()["misses"] == 0
+
+        # A changed geometry is a different mask
+
+        assert cache.get_mask(get_polygon_wkb(121.5, -23.5, 122.5, -25.5), 120, -25, **GRID).all()
+        assert cache.get_stats()["misses"] == 1
+
+    finally:
+        shutil.rmtree(directory)
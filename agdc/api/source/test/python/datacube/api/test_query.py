@@ -21,12 +21,24 @@ __author__ = "Simon Oldfield"
 
 
 import logging
+import re
+import threading
+import time
+from datetime import date
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from datacube.api import parse_date_min, parse_date_max, Satellite, DatasetType
 from datacube.api.query import list_cells_as_list, list_tiles_as_list
 from datacube.api.query import list_cells_vector_file_as_list
 from datacube.api.query import MONTHS_BY_SEASON, Season
 from datacube.api.query import LS7_SLC_OFF_EXCLUSION, LS7_SLC_OFF_ACQ_MIN
 from datacube.api.query import LS8_PRE_WRS_2_EXCLUSION, LS8_PRE_WRS_2_ACQ_MAX
+from datacube.api.query import make_record_class, ProcessingLevel
+from datacube.api.query import build_list_cells_missing_sql_and_params, build_list_cells_sql_and_params
+from datacube.api.query import build_list_tiles_sql_and_params, SatelliteDateExclusion
+from datacube.api.query import ConnectionPool, ConnectionPoolTimeoutError
+from datacube.api.query import get_connection_string, get_db_connection
+import datacube.api.query
+from datacube.config import Config
 
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
@@ -263,3 +275,199 @@ def test_list_cells_act_2005_ls578(config=None):
 #                and (ds in tile.datasets for ds in dataset_types)
 #                and tile.end_datetime_month in [m.value for m in MONTHS_BY_SEASON[Season.SUMMER]])
 
+
+def test_make_record_class():
+
+    record_class = make_record_class(["x_index", "y_index"])
+
+    record = record_class((120, -25))
+
+    assert record["x_index"] == record[0] == 120
+    assert record["y_index"] == record[1] == -25
+    assert tuple(record) == (120, -25)
+
+
+def test_use_tile_index_default():
+
+    assert not Config().get_query_use_tile_index()
+
+
+def test_build_list_tiles_tile_index_sql_and_params():
+
+    sql, params = build_list_tiles_sql_and_params(x=[TEST_CELL_X], y=[TEST_CELL_Y],
+                                                  satellites=[Satellite.LS5, Satellite.LS7],
+                                                  acq_min=parse_date_min(TEST_YEAR_STR),
+                                                  acq_max=parse_date_max(TEST_YEAR_STR),
+                                                  dataset_types=[DatasetType.ARG25, DatasetType.PQ25, DatasetType.DSM],
+                                                  months=TEST_MONTHS, exclude=[LS7_SLC_OFF_EXCLUSION],
+                                                  use_tile_index=True)
+
+    assert "from tile_index as nbar" in sql
+    assert "acquisition" not in sql.replace("acquisition_id", "")
+
+    assert "['PQ25', nbar.pqa_tile_pathname]" in sql
+    assert "nbar.pqa_tile_pathname is not null" in sql
+    assert "['DSM', dsm.tile_pathname]" in sql
+
+    assert params["level_dsm"] == ProcessingLevel.DSM.value
+    assert "level_nbar" not in params and "level_pqa" not in params
+
+    assert params["exclude_acq_min_0"] == LS7_SLC_OFF_ACQ_MIN
+    assert params["month"] == [month.value for month in TEST_MONTHS]
+
+
+def test_build_list_cells_missing_tile_index_sql_and_params():
+
+    sql, params = build_list_cells_missing_sql_and_params(x=[TEST_CELL_X], y=[TEST_CELL_Y],
+                                                          satellites=[Satellite.LS8],
+                                                          acq_min=parse_date_min(TEST_YEAR_STR),
+                                                          acq_max=parse_date_max(TEST_YEAR_STR),
+                                                          dataset_types=[DatasetType.ARG25, DatasetType.FC25,
+                                                                         DatasetType.DEM],
+                                                          use_tile_index=True)
+
+    assert "from tile_index as nbar" in sql
+    assert "nbar.fc_tile_pathname is null" in sql
+    assert "left outer join" in sql and "dem.x_index is null" in sql
+
+    assert params["level_dem"] == ProcessingLevel.DEM.value
+
+
+def get_exclusion_predicates(sql):
+
+    # The exclusion terms without their table aliases (which differ between the flavours)
+
+    return re.findall(r"(?:\w+\.)?((?:satellite_tag|end_datetime) (?:<>|not between|<|>) %\(exclude_\w+\)s"
+                      r"(?: and %\(exclude_\w+\)s)?)", sql)
+
+
+def test_exclusions_tile_index_same_as_tiles():
+
+    exclude = [LS7_SLC_OFF_EXCLUSION, LS8_PRE_WRS_2_EXCLUSION,
+               SatelliteDateExclusion(satellite=Satellite.LS5, acq_min=date(2003, 1, 1), acq_max=date(2003, 12, 31))]
+
+    for build_sql_and_params in [build_list_cells_sql_and_params, build_list_tiles_sql_and_params]:
+
+        sql, params = build_sql_and_params(x=[TEST_CELL_X], y=[TEST_CELL_Y],
+                                           satellites=[Satellite.LS5, Satellite.LS7, Satellite.LS8],
+                                           acq_min=parse_date_min(TEST_YEAR_STR), acq_max=parse_date_max(TEST_YEAR_STR),
+                                           dataset_types=[DatasetType.ARG25], exclude=exclude)
+
+        tile_index_sql, tile_index_params = build_sql_and_params(x=[TEST_CELL_X], y=[TEST_CELL_Y],
+                                                                 satellites=[Satellite.LS5, Satellite.LS7,
+                                                                             Satellite.LS8],
+                                                                 acq_min=parse_date_min(TEST_YEAR_STR),
+                                                                 acq_max=parse_date_max(TEST_YEAR_STR),
+                                                                 dataset_types=[DatasetType.ARG25], exclude=exclude,
+                                                                 use_tile_index=True)
+
+        predicates = get_exclusion_predicates(sql)
+
+        assert len(predicates) == 6
+        assert "end_datetime not between %(exclude_acq_min_2)s and %(exclude_acq_max_2)s" in predicates
+        assert predicates == get_exclusion_predicates(tile_index_sql)
+
+        assert dict((k, v) for k, v in params.items() if k.startswith("exclude_")) == \
+            dict((k, v) for k, v in tile_index_params.items() if k.startswith("exclude_"))
+
+
+class FakeConnection(object):
+
+    closed = False
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+
+def test_connection_pool_get_timeout():
+
+    pool = ConnectionPool("dbname=agdc", max_size=0, timeout=0.1)
+
+    start = time.time()
+
+    try:
+        pool.get()
+        assert False, "Expected ConnectionPoolTimeoutError"
+
+    except ConnectionPoolTimeoutError:
+        assert time.time() - start >= 0.1
+
+
+def test_connection_pool_get_waits_for_put():
+
+    pool = ConnectionPool("dbname=agdc", max_size=1, timeout=0.1)
+
+    # The only connection is in use until it is returned by another thread
+    pool._size = 1
+    connection = FakeConnection()
+
+    timer = threading.Timer(0.1, pool.put, (connection,))
+    timer.start()
+
+    try:
+        assert pool.get(timeout=10) is connection
+    finally:
+        timer.join()
+
+
+def test_list_cells_exhausted_pool():
+
+    config = Config()
+    connection_string = get_connection_string(config)
+
+    # All (no) connections of the configuration's pool are in use
+    pools = datacube.api.query._connection_pools
+    pools[connection_string] = ConnectionPool(connection_string, max_size=0, timeout=0.1)
+
+    try:
+        list_cells_as_list(x=[TEST_CELL_X], y=[TEST_CELL_Y],
+                           acq_min=parse_date_min(TEST_YEAR_STR), acq_max=parse_date_max(TEST_YEAR_STR),
+                           satellites=[Satellite.LS5, Satellite.LS7], dataset_types=[DatasetType.ARG25],
+                           config=config)
+        assert False, "Expected ConnectionPoolTimeoutError"
+
+    except ConnectionPoolTimeoutError:
+        pass
+
+    finally:
+        del pools[connection_string]
+
+
+class BrokenCursorConnection(FakeConnection):
+
+    def cursor(self, *args, **kwargs):
+        raise RuntimeError("No cursor")
+
+
+def test_get_db_connection_cursor_error_returns_connection():
+
+    config = Config()
+    connection_string = get_connection_string(config)
+
+    pool = ConnectionPool(connection_string, max_size=1, timeout=0.1)
+
+    connection = BrokenCursorConnection()
+    pool._size = 1
+    pool.put(connection)
+
+    pools = datacube.api.query._connection_pools
+    pools[connection_string] = pool
+
+    try:
+        for itersize in [None, 10]:
+            try:
+                get_db_connection(config=config, itersize=itersize)
+                assert False, "Expected RuntimeError"
+
+            except RuntimeError:
+                pass
+
+            # The connection is back in the pool rather than its slot being lost
+            assert pool._size == 1
+            assert [c for c, _ in pool._idle] == [connection]
+
+    finally:
+        del pools[connection_string]
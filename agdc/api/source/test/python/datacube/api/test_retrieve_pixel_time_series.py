@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import os
+import shutil
+import tempfile
+from datacube.api.tool.retrieve_pixel_time_series import Point, read_points_csv, group_points_by_cell
+from datacube.api.tool.retrieve_pixel_time_series import get_pixel_windows
+from datacube.api.utils import latlon_to_xy
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+# The transform of the 120/-20 cell
+
+TEST_CELL_TRANSFORM = (120.0, 0.00025, 0.0, -19.0, 0.0, -0.00025)
+
+
+def write_points_csv(lines):
+
+    directory = tempfile.mkdtemp()
+
+    path = os.path.join(directory, "points.csv")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    return directory, path
+
+
+def test_read_points_csv():
+
+    directory, path = write_points_csv(["ID, Latitude ,Longitude", "a,-19.5,120.5", "b,-20.25,121.75"])
+
+    try:
+        assert read_points_csv(path) == [Point("a", -19.5, 120.5), Point("b", -20.25, 121.75)]
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_read_points_csv_without_ids():
+
+    directory, path = write_points_csv(["lon,lat", "120.5,-19.5", "-0.5,51.5"])
+
+    try:
+        assert read_points_csv(path) == [Point("1", -19.5, 120.5), Point("2", 51.5, -0.5)]
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_read_points_csv_without_coordinates():
+
+    directory, path = write_points_csv(["id,x,y", "a,120.5,-19.5"])
+
+    try:
+        read_points_csv(path)
+        assert False, "Expected an exception"
+
+    except Exception as e:
+        assert "no latitude and longitude" in str(e)
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_group_points_by_cell():
+
+    points = [Point("a", -19.5, 120.5),
+              Point("b", -25.1, 150.1),
+              Point("c", -19.9, 120.1),
+              Point("d", -19.1, 120.9)]
+
+    cells = group_points_by_cell(points)
+
+    assert cells.keys() == [(120, -20), (150, -26)]
+    assert cells[(120, -20)] == [points[0], points[2], points[3]]
+    assert cells[(150, -26)] == [points[1]]
+
+
+def test_group_points_by_cell_edges():
+
+    # A cell x/y contains longitudes x to x + 1 (excluding x + 1) and latitudes y to y + 1 (excluding y) - the tile's
+    # top left corner is at x, y + 1
+
+    cells = group_points_by_cell([Point("top left", -19.0, 120.0),
+                                  Point("bottom", -20.0, 120.5),
+                                  Point("right", -19.5, 121.0),
+                                  Point("west", -19.5, -0.5),
+                                  Point("west edge", -19.5, -1.0),
+                                  Point("north", 0.5, 120.5),
+                                  Point("north edge", 1.0, 120.5),
+                                  Point("equator", 0.0, 120.5),
+                                  Point("north west", 51.5, -0.1)])
+
+    assert dict((point.id, cell) for cell, points in cells.items() for point in points) == {
+        "top left": (120, -20),
+        "bottom": (120, -21),
+        "right": (121, -20),
+        "west": (-1, -20),
+        "west edge": (-1, -20),
+        "north": (120, 0),
+        "north edge": (120, 0),
+        "equator": (120, -1),
+        "north west": (-1, 51)
+    }
+
+
+def test_get_pixel_windows():
+
+    pixels = [(10, 20), (300, 5), (100, 200), (12, 250), (511, 511), (256, 256)]
+
+    windows = get_pixel_windows(pixels, window_size=256)
+
+    # One window per (256 x 256) block covering the pixels in it, with the indexes of those pixels
+
+    assert windows == [(10, 20, 91, 231, [0, 2, 3]),
+                       (300, 5, 1, 1, [1]),
+                       (256, 256, 256, 256, [4, 5])]
+
+    assert get_pixel_windows([]) == []
+
+
+def test_get_pixel_windows_for_cell_group():
+
+    # Pixel centres (so rounding can't move them into the neighbouring pixel)
+
+    points = [Point("a", -19.250125, 120.250125),
+              Point("b", -19.250375, 120.250625),
+              Point("c", -19.000125, 120.000125),
+              Point("d", -19.999875, 120.999875)]
+
+    cells = group_points_by_cell(points)
+
+    assert cells.keys() == [(120, -20)]
+
+    pixels = [latlon_to_xy(point.latitude, point.longitude, TEST_CELL_TRANSFORM) for point in cells[(120, -20)]]
+
+    assert pixels == [(1000, 1000), (1002, 1001), (0, 0), (3999, 3999)]
+
+    windows = get_pixel_windows(pixels, window_size=256)
+
+    assert windows == [(0, 0, 1, 1, [2]),
+                       (1000, 1000, 3, 2, [0, 1]),
+                       (3999, 3999, 1, 1, [3])]
+
+    # Each pixel is inside its window
+
+    for x, y, x_size, y_size, indexes in windows:
+        for index in indexes:
+            px, py = pixels[index]
+            assert x <= px < x + x_size and y <= py < y + y_size
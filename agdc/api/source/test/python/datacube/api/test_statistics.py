@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import numpy
+import warnings
+from datacube.api.statistics import Statistic, StatisticsAccumulator, PERCENTILES
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+def make_stack(depth=20, shape=(30, 40), seed=0):
+
+    random = numpy.random.RandomState(seed)
+
+    stack = random.normal(size=(depth,) + shape).astype(numpy.float32) * 1000
+
+    stack[random.rand(depth, *shape) < 0.3] = numpy.nan
+
+    # A pixel with no observations and a pixel with only one
+
+    stack[:, 0, 0] = numpy.nan
+    stack[1:, 0, 1] = numpy.nan
+
+    return stack
+
+
+def test_statistics_accumulator():
+
+    stack = make_stack()
+
+    accumulator = StatisticsAccumulator(stack.shape[1:])
+
+    for data in stack:
+        accumulator.add(data)
+
+    statistics = accumulator.get_all()
+
+    # The nan* functions warn about the pixel with no observations
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        expected = {
+            Statistic.COUNT: numpy.full(stack.shape[1:], len(stack), dtype=numpy.float32),
+            Statistic.COUNT_OBSERVED: (~numpy.isnan(stack)).sum(axis=0),
+            Statistic.MIN: numpy.nanmin(stack, axis=0),
+            Statistic.MAX: numpy.nanmax(stack, axis=0),
+            Statistic.MEAN: numpy.nanmean(stack, axis=0),
+            Statistic.STANDARD_DEVIATION: numpy.nanstd(stack.astype(numpy.float64), axis=0),
+            Statistic.VARIANCE: numpy.nanvar(stack.astype(numpy.float64), axis=0)
+        }
+
+        for statistic, percentile in PERCENTILES.iteritems():
+            expected[statistic] = numpy.nanpercentile(stack, percentile, axis=0)
+
+    for statistic in Statistic:
+
+        if statistic == Statistic.SUM:
+            continue
+
+        _log.debug("Checking [%s]", statistic.name)
+
+        assert statistics[statistic].dtype == numpy.float32
+        assert numpy.allclose(statistics[statistic], expected[statistic], rtol=1e-4, atol=1e-2, equal_nan=True)
+
+    # The sum is 0 (rather than NaN) where there are no observations
+
+    assert numpy.allclose(statistics[Statistic.SUM], numpy.nansum(stack, axis=0), rtol=1e-4, atol=1e-2)
+    assert (statistics[Statistic.SUM][statistics[Statistic.COUNT_OBSERVED] == 0] == 0).all()
+
+
+def test_statistics_accumulator_ndv():
+
+    stack = make_stack()
+
+    data = numpy.where(numpy.isnan(stack), -999, stack).astype(numpy.int16)
+
+    accumulator = StatisticsAccumulator(stack.shape[1:], statistics=[Statistic.MEAN, Statistic.PERCENTILE_50],
+                                        ndv=-999)
+
+    for d in data:
+        accumulator.add(d)
+
+    expected = numpy.ma.masked_equal(data, -999)
+
+    assert numpy.allclose(accumulator.get(Statistic.MEAN), expected.mean(axis=0).filled(numpy.nan),
+                          rtol=1e-4, atol=1e-2, equal_nan=True)
+
+    assert set(accumulator.get_all()) == set([Statistic.MEAN, Statistic.PERCENTILE_50])
+
+
+def test_statistics_accumulator_no_slices():
+
+    # e.g. a chunk with no tiles
+
+    shape = (30, 40)
+
+    accumulator = StatisticsAccumulator(shape)
+
+    statistics = accumulator.get_all()
+
+    assert set(statistics) == set(Statistic)
+
+    for statistic in Statistic:
+
+        _log.debug("Checking [%s]", statistic.name)
+
+        assert statistics[statistic].shape == shape
+        assert statistics[statistic].dtype == numpy.float32
+
+        if statistic in [Statistic.COUNT, Statistic.COUNT_OBSERVED, Statistic.SUM]:
+            assert (statistics[statistic] == 0).all()
+        else:
+            assert numpy.isnan(statistics[statistic]).all()
+
+    # As the pixel statistics workflow saves them
+
+    assert numpy.array([statistics[s] for s in Statistic], dtype=numpy.float32).shape == (len(Statistic),) + shape
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import logging
+import os
+import shutil
+import tempfile
+import datacube.api.tile_cache as tile_cache
+from datetime import date, datetime
+from datacube.api.model import Satellite, DatasetType
+from datacube.api.tile_cache import get_tiles, get_tile_cache_filename, read_tile_cache
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+TEST_CELL_X = 120
+TEST_CELL_Y = -25
+
+COLUMNS = ["acquisition_id", "dataset_path", "x_index", "y_index", "start_datetime", "end_datetime",
+           "end_datetime_year", "end_datetime_month", "satellite", "datasets"]
+
+
+def make_row(acquisition_id, satellite, acquired, dataset_types=(DatasetType.ARG25, DatasetType.PQ25), version=1):
+
+    sensor = satellite == Satellite.LS5 and "TM" or "ETM"
+
+    name = "{satellite}_{sensor}_{{type}}_{x:03d}_{y:04d}_{acquired}.{version:06d}.tif".format(
+        satellite=satellite.name, sensor=sensor, x=TEST_CELL_X, y=TEST_CELL_Y,
+        acquired=acquired.strftime("%Y-%m-%dT%H-%M-%S"), version=version)
+
+    datasets = [(dataset_type.name, os.path.join("/tiles", name.format(type=dataset_type.name)))
+                for dataset_type in dataset_types]
+
+    return (acquisition_id, datasets[0][1], TEST_CELL_X, TEST_CELL_Y, acquired, acquired,
+            acquired.year, acquired.month, satellite.name, datasets)
+
+
+class FakeTileDB(object):
+
+    """
+    Stands in for query_tile_records - returns the rows matching the query as the list_tiles query would
+    """
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = []
+
+    def query_tile_records(self, x, y, satellites, acq_min, acq_max, dataset_types, config=None):
+
+        self.queries.append((acq_min, acq_max))
+
+        rows = [row for row in self.rows
+                if row[2] == x and row[3] == y
+                and row[8] in [satellite.name for satellite in satellites]
+                and acq_min <= row[5].date() <= acq_max
+                and set(dataset_type.name for dataset_type in dataset_types) <= set(t for t, _ in row[9])]
+
+        return COLUMNS, sorted(rows, key=lambda row: row[5])
+
+
+class TileCacheTest(object):
+
+    """
+    Context replacing query_tile_records with a FakeTileDB and providing a temporary cache directory
+    """
+
+    def __init__(self, rows):
+        self.db = FakeTileDB(rows)
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp()
+        self.query_tile_records = tile_cache.query_tile_records
+        tile_cache.query_tile_records = self.db.query_tile_records
+        return self
+
+    def __exit__(self, *args):
+        tile_cache.query_tile_records = self.query_tile_records
+        shutil.rmtree(self.directory)
+
+    def get_tiles(self, satellites=(Satellite.LS5, Satellite.LS7), acq_min=date(2005, 1, 1),
+                  acq_max=date(2005, 12, 31), dataset_types=(DatasetType.ARG25, DatasetType.PQ25), max_age=60):
+
+        return get_tiles(self.directory, TEST_CELL_X, TEST_CELL_Y, list(satellites), acq_min, acq_max,
+                         list(dataset_types), max_age=max_age)
+
+    def get_cache(self, satellites=(Satellite.LS5, Satellite.LS7), acq_min=date(2005, 1, 1),
+                  acq_max=date(2005, 12, 31), dataset_types=(DatasetType.ARG25, DatasetType.PQ25)):
+
+        return read_tile_cache(get_tile_cache_filename(self.directory, TEST_CELL_X, TEST_CELL_Y, list(satellites),
+                                                       acq_min, acq_max, list(dataset_types)))
+
+
+def test_build_tile_cache():
+
+    rows = [make_row(1, Satellite.LS5, datetime(2005, 1, 1, 1, 0)),
+            make_row(2, Satellite.LS7, datetime(2005, 1, 9, 1, 0)),
+            make_row(3, Satellite.LS5, datetime(2005, 1, 17, 1, 0))]
+
+    with TileCacheTest(rows) as test:
+
+        assert test.get_cache() is None
+
+        tiles = test.get_tiles()
+
+        assert [tile.acquisition_id for tile in tiles] == [1, 2, 3]
+        assert test.db.queries == [(date(2005, 1, 1), date(2005, 12, 31))]
+
+        tile = tiles[1]
+
+        assert (tile.x, tile.y) == (TEST_CELL_X, TEST_CELL_Y)
+        assert tile.end_datetime == datetime(2005, 1, 9, 1, 0)
+        assert set(tile.datasets) == set([DatasetType.ARG25, DatasetType.PQ25])
+        assert tile.datasets[DatasetType.ARG25].satellite == Satellite.LS7
+        assert tile.datasets[DatasetType.PQ25].path == rows[1][9][1][1]
+
+        cache = test.get_cache()
+
+        assert cache["count"] == 3
+        assert cache["watermark"] == datetime(2005, 1, 17, 1, 0)
+
+        # A cache younger than the maximum age is used as is
+
+        assert [tile.acquisition_id for tile in test.get_tiles()] == [1, 2, 3]
+        assert len(test.db.queries) == 1
+
+
+def test_build_empty_tile_cache():
+
+    with TileCacheTest([]) as test:
+
+        assert test.get_tiles() == []
+
+        cache = test.get_cache()
+
+        assert cache["count"] == 0
+        assert cache["watermark"] is None
+
+
+def test_refresh_tile_cache():
+
+    rows = [make_row(1, Satellite.LS5, datetime(2005, 1, 1, 1, 0)),
+            make_row(2, Satellite.LS7, datetime(2005, 1, 9, 1, 0)),
+            make_row(3, Satellite.LS5, datetime(2005, 1, 17, 1, 0))]
+
+    with TileCacheTest(rows) as test:
+
+        test.get_tiles()
+
+        # Since the cache was built - an acquisition on the watermark date was reprocessed, one was acquired after it
+        # and one before it was removed (which the refresh doesn't see)
+
+        test.db.rows = [rows[0],
+                        make_row(3, Satellite.LS5, datetime(2005, 1, 17, 1, 0), version=2),
+                        make_row(4, Satellite.LS7, datetime(2005, 1, 25, 1, 0))]
+
+        tiles = test.get_tiles(max_age=-1)
+
+        # Only the tiles from the watermark date are queried
+
+        assert test.db.queries[1] == (date(2005, 1, 17), date(2005, 12, 31))
+
+        # The cached tiles before the watermark date are kept and replaced from it
+
+        assert [tile.acquisition_id for tile in tiles] == [1, 2, 3, 4]
+        assert tiles[2].datasets[DatasetType.ARG25].path == test.db.rows[1][9][0][1]
+
+        cache = test.get_cache()
+
+        assert cache["count"] == 4
+        assert cache["watermark"] == datetime(2005, 1, 25, 1, 0)
+
+        # Refreshing again with nothing new re-queries the watermark date only
+
+        tiles = test.get_tiles(max_age=-1)
+
+        assert test.db.queries[2] == (date(2005, 1, 25), date(2005, 12, 31))
+        assert [tile.acquisition_id for tile in tiles] == [1, 2, 3, 4]
+        assert test.get_cache()["watermark"] == datetime(2005, 1, 25, 1, 0)
+
+
+def test_refresh_empty_tile_cache():
+
+    with TileCacheTest([]) as test:
+
+        test.get_tiles()
+
+        test.db.rows = [make_row(1, Satellite.LS5, datetime(2005, 1, 1, 1, 0))]
+
+        # A cache without a watermark is rebuilt
+
+        assert [tile.acquisition_id for tile in test.get_tiles(max_age=-1)] == [1]
+        assert test.db.queries[1] == (date(2005, 1, 1), date(2005, 12, 31))
+
+
+def test_get_tiles_filtered():
+
+    rows = [make_row(1, Satellite.LS5, datetime(2004, 12, 24, 1, 0)),
+            make_row(2, Satellite.LS5, datetime(2005, 1, 1, 1, 0)),
+            make_row(3, Satellite.LS7, datetime(2005, 1, 9, 1, 0)),
+            make_row(4, Satellite.LS5, datetime(2005, 1, 17, 1, 0), dataset_types=[DatasetType.ARG25]),
+            make_row(5, Satellite.LS7, datetime(2005, 1, 25, 1, 0))]
+
+    with TileCacheTest(rows) as test:
+
+        assert [tile.acquisition_id for tile in test.get_tiles()] == [2, 3, 5]
+
+        # Each query has its own cache
+
+        assert [tile.acquisition_id for tile in test.get_tiles(satellites=[Satellite.LS5])] == [2]
+        assert [tile.acquisition_id for tile in test.get_tiles(satellites=[Satellite.LS7])] == [3, 5]
+
+        assert [tile.acquisition_id for tile in test.get_tiles(acq_min=date(2004, 1, 1),
+                                                               acq_max=date(2005, 1, 9))] == [1, 2, 3]
+
+        assert [tile.acquisition_id for tile in test.get_tiles(acq_min=date(2005, 1, 9),
+                                                               acq_max=date(2005, 1, 20))] == [3]
+
+        tiles = test.get_tiles(dataset_types=[DatasetType.ARG25])
+
+        assert [tile.acquisition_id for tile in tiles] == [2, 3, 4, 5]
+        assert set(tiles[2].datasets) == set([DatasetType.ARG25])
+
+        assert len(test.db.queries) == 6
+
+        # The original query's cache is unchanged
+
+        assert [tile.acquisition_id for tile in test.get_tiles()] == [2, 3, 5]
+        assert len(test.db.queries) == 6
+
+        assert len(set(get_tile_cache_filename(test.directory, TEST_CELL_X, TEST_CELL_Y, satellites, date(2005, 1, 1),
+                                               date(2005, 12, 31), dataset_types)
+                       for satellites, dataset_types in [([Satellite.LS5], [DatasetType.ARG25]),
+                                                         ([Satellite.LS7], [DatasetType.ARG25]),
+                                                         ([Satellite.LS5], [DatasetType.PQ25]),
+                                                         ([Satellite.LS5], [DatasetType.ARG25, DatasetType.PQ25])])) == 4
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import gdal
+import logging
+import numpy
+import os
+import shutil
+import tempfile
+from datacube.api.model import DatasetTile, NdviBands, Pq25Bands
+from datacube.api.utils import DatasetCache, get_dataset_cache, get_dataset_metadata, read_dataset_data
+from datacube.api.utils import calculate_medoid, calculate_medoid_composite, NDV
+from datacube.api.utils import BestPixelComposite, empty_array, propagate_using_selected_pixel
+from datacube.api.utils import PqaMask, WofsMask, UINT16_MAX, apply_mask, calculate_mask_pqa, calculate_mask_wofs
+from datacube.api.utils import consolidate_masks
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+TEST_PQA_FILENAME = "LS5_TM_PQA_120_-025_2005-01-01T00-00-00.000000.tif"
+
+
+def create_test_pqa(directory, value, filename=TEST_PQA_FILENAME):
+
+    path = os.path.join(directory, filename)
+
+    raster = gdal.GetDriverByName("GTiff").Create(path, 10, 10, 1, gdal.GDT_UInt16)
+    raster.SetGeoTransform((120.0, 0.00025, 0.0, -24.0, 0.0, -0.00025))
+    raster.GetRasterBand(1).WriteArray(numpy.full((10, 10), value, dtype=numpy.uint16))
+    raster.FlushCache()
+    del raster
+
+    return DatasetTile("LS5", "PQ25", path)
+
+
+def test_dataset_cache():
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        cache = DatasetCache(max_size=1)
+
+        path = create_test_pqa(directory, 16383).path
+
+        raster = cache.get_raster(path)
+        assert cache.get_raster(path) is raster
+        assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 1
+
+        # A different file evicts it
+        other = create_test_pqa(directory, 0, filename="other.tif").path
+
+        cache.get_raster(other)
+        assert cache.get_raster(path) is not raster
+        assert cache.get_stats()["rasters"] == 1
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_dataset_cache_mtime():
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        pqa = create_test_pqa(directory, 16383)
+
+        assert read_dataset_data(pqa, bands=[Pq25Bands.PQ])[Pq25Bands.PQ][0, 0] == 16383
+
+        metadata = get_dataset_metadata(pqa)
+        assert get_dataset_metadata(pqa) is metadata
+        assert metadata.shape == (10, 10)
+
+        # Replace the file - the cached handle and metadata are no longer valid
+
+        os.rename(create_test_pqa(directory, 0, filename="new.tif").path, pqa.path)
+        os.utime(pqa.path, (0, 0))
+
+        assert read_dataset_data(pqa, bands=[Pq25Bands.PQ])[Pq25Bands.PQ][0, 0] == 0
+        assert get_dataset_metadata(pqa) is not metadata
+
+    finally:
+        get_dataset_cache().clear()
+        shutil.rmtree(directory)
+
+
+def test_dataset_metadata_dataset_types():
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        pqa = create_test_pqa(directory, 16383)
+
+        # A derived dataset type reading the same file (as NDVI etc. do the NBAR file)
+        ndvi = DatasetTile("LS5", "NDVI", pqa.path)
+
+        assert get_dataset_metadata(pqa).bands.keys() == [Pq25Bands.PQ]
+        assert get_dataset_metadata(ndvi).bands.keys() == [NdviBands.NDVI]
+        assert get_dataset_metadata(pqa).bands.keys() == [Pq25Bands.PQ]
+
+    finally:
+        get_dataset_cache().clear()
+        shutil.rmtree(directory)
+
+
+def test_calculate_medoid_composite():
+
+    random = numpy.random.RandomState(0)
+
+    stack = random.randint(0, 10000, size=(7, 3, 5, 4)).astype(numpy.int16)
+
+    # Some no data observations, and a pixel with none at all
+    stack[2, 1, 0, 0] = NDV
+    stack[4, 0, 1, 2] = NDV
+    stack[:, :, 3, 3] = NDV
+
+    # Small enough to be done in several chunks
+    composite, index = calculate_medoid_composite(stack, max_bytes=7 * 7 * 8 * 3)
+
+    for y in range(5):
+        for x in range(4):
+
+            valid = [t for t in range(7) if (stack[t, :, y, x] != NDV).all()]
+
+            if not valid:
+                assert index[y, x] == -1
+                assert (composite[:, y, x] == NDV).all()
+                continue
+
+            expected = calculate_medoid(stack[valid, :, y, x].T)
+
+            assert (composite[:, y, x] == expected).all()
+            assert (stack[index[y, x], :, y, x] == expected).all()
+
+
+def test_calculate_medoid_composite_nan_ndv():
+
+    random = numpy.random.RandomState(0)
+
+    stack = random.uniform(0, 10000, size=(7, 3, 5, 4)).astype(numpy.float32)
+
+    # Some no data observations, and a pixel with none at all
+    stack[2, 1, 0, 0] = numpy.nan
+    stack[4, 0, 1, 2] = numpy.nan
+    stack[0, :, 2, 1] = numpy.nan
+    stack[:, :, 3, 3] = numpy.nan
+
+    composite, index = calculate_medoid_composite(stack, ndv=numpy.nan, max_bytes=7 * 7 * 8 * 3)
+
+    assert composite.dtype == numpy.float32
+
+    for y in range(5):
+        for x in range(4):
+
+            valid = [t for t in range(7) if (~numpy.isnan(stack[t, :, y, x])).all()]
+
+            if not valid:
+                assert index[y, x] == -1
+                assert numpy.isnan(composite[:, y, x]).all()
+                continue
+
+            expected = calculate_medoid(stack[valid, :, y, x].T)
+
+            assert index[y, x] in valid
+            assert numpy.allclose(composite[:, y, x], expected)
+            assert numpy.allclose(stack[index[y, x], :, y, x], expected)
+
+
+def test_best_pixel_composite():
+
+    random = numpy.random.RandomState(0)
+
+    shape = (50, 30)
+
+    composite = BestPixelComposite(shape, maximise=True, block_rows=7)
+    composite.add_band("DATA")
+    composite.add_band("DATE", dtype=numpy.int32)
+
+    # Reference using propagate_using_selected_pixel
+
+    best = empty_array(shape, ndv=NDV)
+    best_data = empty_array(shape, ndv=NDV)
+    best_date = empty_array(shape, dtype=numpy.int32, ndv=NDV)
+
+    for date in range(20050101, 20050111):
+
+        criterion = random.randint(0, 100, size=shape).astype(numpy.int16)
+        data = random.randint(0, 10000, size=shape).astype(numpy.int16)
+
+        valid = random.rand(*shape) > 0.3
+
+        composite.update(criterion, {"DATA": data, "DATE": date}, valid=valid)
+
+        criterion = numpy.where(valid, criterion, NDV)
+
+        best = numpy.fmax(best, criterion)
+
+        best_data = propagate_using_selected_pixel(best, criterion, data, best_data)
+        best_date = propagate_using_selected_pixel(best, criterion, numpy.full(shape, date, dtype=numpy.int32),
+                                                   best_date)
+
+    assert numpy.array_equal(composite.bands["DATA"], best_data)
+    assert numpy.array_equal(composite.bands["DATE"], best_date)
+
+    assert composite.is_complete() == numpy.all(best != NDV)
+
+
+def test_calculate_mask_pqa():
+
+    random = numpy.random.RandomState(0)
+
+    data = random.randint(0, UINT16_MAX + 1, size=(50, 30)).astype(numpy.uint16)
+
+    for pqa_masks in [[PqaMask.PQ_MASK_CLEAR], [PqaMask.PQ_MASK_LAND, PqaMask.PQ_MASK_CLOUD_ACCA]]:
+
+        pqa_mask = consolidate_masks(pqa_masks)
+
+        expected = numpy.ma.masked_where(data & pqa_mask != pqa_mask, data).mask
+
+        assert numpy.array_equal(calculate_mask_pqa(data, pqa_masks), expected)
+        assert numpy.array_equal(calculate_mask_pqa(data, pqa_masks, lookup=False), expected)
+
+        # Combined with an existing mask which is left unchanged
+
+        mask = random.rand(*data.shape) < 0.5
+        original = mask.copy()
+
+        assert numpy.array_equal(calculate_mask_pqa(data, pqa_masks, mask=mask), expected | mask)
+        assert numpy.array_equal(mask, original)
+
+
+def test_calculate_mask_wofs():
+
+    random = numpy.random.RandomState(0)
+
+    data = random.choice([m.value for m in WofsMask], size=(50, 30)).astype(numpy.uint8)
+
+    wofs_masks = [WofsMask.WET, WofsMask.CLOUD]
+
+    expected = (data == WofsMask.WET.value) | (data == WofsMask.CLOUD.value)
+
+    assert numpy.array_equal(calculate_mask_wofs(data, wofs_masks), expected)
+    assert numpy.array_equal(calculate_mask_wofs(data.astype(numpy.int16), wofs_masks), expected)
+
+
+def test_apply_mask():
+
+    data = numpy.arange(12, dtype=numpy.int16).reshape((3, 4))
+    mask = data % 3 == 0
+
+    expected = numpy.ma.array(data, mask=mask).filled(NDV)
+
+    assert apply_mask(data, mask, ndv=NDV) is data
+    assert numpy.array_equal(data, expected)
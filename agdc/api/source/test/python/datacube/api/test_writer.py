@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# ===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ===============================================================================
+
+
+__author__ = "Simon Oldfield"
+
+
+import gdal
+import logging
+import numpy
+import os
+import shutil
+import tempfile
+from datacube.api.writer import BandStatistics, Compression, get_geotiff_options, iter_row_blocks, raster_write
+
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s %(message)s')
+
+
+_log = logging.getLogger()
+
+
+NDV = -999
+
+
+def test_get_geotiff_options():
+
+    assert "PREDICTOR=2" in get_geotiff_options(gdal.GDT_Int16)
+    assert "PREDICTOR=3" in get_geotiff_options(gdal.GDT_Float32)
+
+    assert not [o for o in get_geotiff_options(gdal.GDT_Int16, compression=Compression.NONE)
+                if o.startswith("PREDICTOR") or o.startswith("COMPRESS")]
+
+
+def test_band_statistics():
+
+    data = numpy.random.RandomState(0).randint(-100, 1000, size=(300, 200)).astype(numpy.int16)
+    data[data < 0] = NDV
+
+    statistics = BandStatistics(NDV)
+
+    for _, block in iter_row_blocks(data, 64):
+        statistics.update(block)
+
+    valid = data[data != NDV].astype(numpy.float64)
+
+    assert numpy.allclose(statistics.get(), (valid.min(), valid.max(), valid.mean(), valid.std()))
+
+    assert BandStatistics(NDV).get() is None
+
+
+def test_raster_write():
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        path = os.path.join(directory, "test.tif")
+
+        data = numpy.random.RandomState(0).randint(0, 1000, size=(600, 500)).astype(numpy.int16)
+
+        # One band from an array and one from a generator of row blocks
+
+        raster_write(path, [data, iter_row_blocks(data * 2, 100)], 500, 600, gdal.GDT_Int16,
+                     (120, 0.00025, 0.0, -24, 0.0, -0.00025), "", NDV, overviews=[2, 4])
+
+        raster = gdal.Open(path)
+        assert raster
+
+        for i, expected in enumerate([data, data * 2]):
+            band = raster.GetRasterBand(i + 1)
+
+            assert numpy.array_equal(band.ReadAsArray(), expected)
+            assert band.GetNoDataValue() == NDV
+            assert band.GetOverviewCount() == 2
+            assert numpy.allclose(band.GetStatistics(False, False)[:2], (expected.min(), expected.max()))
+
+            del band
+
+        del raster
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,98 @@
+-- tile index
+--
+-- A denormalised copy of the tiles of the acquisition based levels - one row per acquisition, cell, tile type and
+-- tile class with the tile of each of the NBAR (2), PQA (3) and FC (4) levels - so the api can find the tiles of a
+-- time series without joining the tile, dataset, acquisition and satellite tables once per level.
+--
+-- The ingester keeps the rows of the acquisitions it changes current with refresh_tile_index(). The whole index is
+-- rebuilt with rebuild_tile_index() (e.g. python -m agdc.tile_index).
+
+create table tile_index (
+    acquisition_id     bigint    not null,
+    satellite_tag      text,
+    start_datetime     timestamp without time zone,
+    end_datetime       timestamp without time zone,
+    end_datetime_year  integer,
+    end_datetime_month integer,
+    x_index            integer   not null,
+    y_index            integer   not null,
+    tile_type_id       bigint    not null,
+    tile_class_id      integer,
+    dataset_path       text,
+    nbar_tile_pathname text,
+    pqa_tile_pathname  text,
+    fc_tile_pathname   text
+);
+
+alter table tile_index owner to cube_admin;
+
+comment on table tile_index is 'Denormalised index of the NBAR, PQA and FC tiles of each acquisition and cell';
+
+-- one row per acquisition and tile (also used to delete the rows of an acquisition when refreshing)
+
+create unique index tile_index_acquisition_tile_idx
+    on tile_index (acquisition_id, x_index, y_index, tile_type_id, tile_class_id) ;
+
+-- time series of cells
+
+create index tile_index_cell_end_datetime_idx on tile_index (tile_type_id, x_index, y_index, end_datetime) ;
+
+-- all cells over a date range or in given years/months
+
+create index tile_index_end_datetime_idx on tile_index (tile_type_id, end_datetime) ;
+create index tile_index_year_month_idx on tile_index (end_datetime_year, end_datetime_month) ;
+
+-- the rows of the tile index as derived from the tile table
+
+create view tile_index_view as
+    select
+        acquisition.acquisition_id, satellite.satellite_tag, acquisition.start_datetime, acquisition.end_datetime,
+        extract(year from acquisition.end_datetime)::integer as end_datetime_year,
+        extract(month from acquisition.end_datetime)::integer as end_datetime_month,
+        tile.x_index, tile.y_index, tile.tile_type_id, tile.tile_class_id,
+        max(case when dataset.level_id = 2 then dataset.dataset_path end) as dataset_path,
+        max(case when dataset.level_id = 2 then tile.tile_pathname end) as nbar_tile_pathname,
+        max(case when dataset.level_id = 3 then tile.tile_pathname end) as pqa_tile_pathname,
+        max(case when dataset.level_id = 4 then tile.tile_pathname end) as fc_tile_pathname
+    from tile
+    join dataset on dataset.dataset_id=tile.dataset_id
+    join acquisition on acquisition.acquisition_id=dataset.acquisition_id
+    join satellite on satellite.satellite_id=acquisition.satellite_id
+    where dataset.level_id in (2, 3, 4)
+    group by
+        acquisition.acquisition_id, satellite.satellite_tag, acquisition.start_datetime, acquisition.end_datetime,
+        tile.x_index, tile.y_index, tile.tile_type_id, tile.tile_class_id ;
+
+alter view tile_index_view owner to cube_admin;
+
+-- replace the rows of the given acquisitions
+--
+-- A transaction level advisory lock on each acquisition (taken in acquisition_id order, so two refreshes can't
+-- deadlock) serialises concurrent refreshes of the same acquisition (e.g. of its NBAR and PQA datasets being ingested
+-- at the same time) until the refreshing transaction ends. Refreshes of other acquisitions and queries of the index
+-- are not blocked.
+
+create or replace function refresh_tile_index(bigint[]) returns void as $$
+    select pg_advisory_xact_lock(acquisition_id)
+    from (select distinct unnest($1) as acquisition_id order by acquisition_id) as acquisitions ;
+    delete from tile_index where acquisition_id = any($1) ;
+    insert into tile_index select * from tile_index_view where acquisition_id = any($1) ;
+$$ language sql ;
+
+alter function refresh_tile_index(bigint[]) owner to cube_admin;
+
+-- replace all the rows
+--
+-- The table lock blocks refreshes (but not queries) until the rebuilding transaction ends.
+
+create or replace function rebuild_tile_index() returns void as $$
+    lock table tile_index in share row exclusive mode ;
+    delete from tile_index ;
+    insert into tile_index select * from tile_index_view ;
+$$ language sql ;
+
+alter function rebuild_tile_index() owner to cube_admin;
+
+select rebuild_tile_index() ;
+
+analyze tile_index ;
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""Tests for the pqa_builder.py module."""
+
+import unittest
+
+import numpy
+
+import agdc.pqa_builder as pqa_builder
+
+#
+# Test cases
+#
+
+# pylint: disable=too-many-public-methods
+#
+# Disabled to avoid complaints about the unittest.TestCase class.
+#
+
+
+class TestComputePQA(unittest.TestCase):
+    """Unit tests for the PQA lookup table kernel."""
+
+    MODULE = 'pqa_builder'
+    SUITE = 'TestComputePQA'
+
+    CFMASK_VALUES = numpy.array([[0, 1, 2], [3, 4, 255]], dtype=numpy.uint8)
+
+    def test_ls7_cfmask(self):
+        """Test the FMASK cloud and cloud shadow bits for LS7."""
+
+        clear = numpy.zeros((2, 3), dtype=numpy.uint8)
+        mask_dict = {'_sr_fill_qa.tif': clear,
+                     '_sr_land_water_qa.tif': clear,
+                     '_sr_cloud_qa.tif': clear,
+                     '_cfmask.tif': self.CFMASK_VALUES,
+                     '_sr_cloud_shadow_qa.tif': clear}
+        lut_dict = pqa_builder.make_lookup_tables(pqa_builder.LS57_PQA_BITS)
+
+        pqa = pqa_builder.compute_pqa(mask_dict, lut_dict)
+
+        expected = numpy.array([[16383, 16383, 16383 - 8192],
+                                [16383, 16383 - 2048, 16383]])
+        self.assertEqual(pqa.dtype, numpy.uint16)
+        self.assertTrue((pqa == expected).all())
+
+    def test_ls7_qa_masks(self):
+        """Test that a flagged (255) LS7 qa mask clears its bit only."""
+
+        clear = numpy.zeros((1, 1), dtype=numpy.uint8)
+        flagged = numpy.array([[255]], dtype=numpy.uint8)
+        lut_dict = pqa_builder.make_lookup_tables(pqa_builder.LS57_PQA_BITS)
+
+        for suffix, bit in [('_sr_fill_qa.tif', 8),
+                            ('_sr_land_water_qa.tif', 9),
+                            ('_sr_cloud_qa.tif', 10),
+                            ('_sr_cloud_shadow_qa.tif', 12)]:
+            mask_dict = dict((mask_suffix, clear) for mask_suffix in lut_dict)
+            mask_dict[suffix] = flagged
+            pqa = pqa_builder.compute_pqa(mask_dict, lut_dict)
+            self.assertEqual(pqa[0, 0], 16383 - (1 << bit))
+
+    def test_ls8(self):
+        """Test the LS8 cfmask values and sr_cloud bit flags."""
+
+        lut_dict = pqa_builder.make_lookup_tables(pqa_builder.LS8_PQA_BITS)
+        sr_cloud = numpy.array([[0, 2, 8], [10, 1, 4]], dtype=numpy.uint8)
+        mask_dict = {'_cfmask.tif': self.CFMASK_VALUES,
+                     '_sr_cloud.tif': sr_cloud}
+
+        pqa = pqa_builder.compute_pqa(mask_dict, lut_dict)
+
+        expected = numpy.array([[16383,
+                                 16383 - 512 - 1024,
+                                 16383 - 8192 - 4096],
+                                [16383 - 1024 - 4096,
+                                 16383 - 2048,
+                                 16383 - 256]])
+        self.assertTrue((pqa == expected).all())
+
+    def test_get_instrument(self):
+        """Test the instrument is found from the scene id."""
+
+        self.assertEqual(pqa_builder.get_instrument('/data/LE71130802015092ASA00'),
+                         'ls7')
+        self.assertEqual(pqa_builder.get_instrument('LC81650602013106LGN01'),
+                         'ls8')
+
+#
+# Test suite
+#
+
+
+def the_suite():
+    """Returns a test suite of all the tests in this module."""
+
+    test_classes = [TestComputePQA]
+
+    suite_list = map(unittest.defaultTestLoader.loadTestsFromTestCase,
+                     test_classes)
+
+    suite = unittest.TestSuite(suite_list)
+
+    return suite
+
+#
+# Run unit tests if in __main__
+#
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(the_suite())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""Tests for the pqa_mask.py module."""
+
+import unittest
+
+import numpy
+from scipy import ndimage
+
+import agdc.pqa_mask as pqa_mask
+
+#
+# Test cases
+#
+
+# pylint: disable=too-many-public-methods
+#
+# Disabled to avoid complaints about the unittest.TestCase class.
+#
+
+
+def reference_pqa_mask(pqa_array, good_pixel_masks, dilation):
+    """Erode the clear pixels of each bit separately with scipy."""
+
+    pqa_array = pqa_array.astype(numpy.uint16) | 64
+    structure = numpy.ones((3, 3), dtype=numpy.bool_)
+
+    for bit in range(10, 14):
+        clear = ((pqa_array >> bit) & 1).astype(numpy.bool_)
+        eroded = ndimage.binary_erosion(clear, structure,
+                                        iterations=dilation, border_value=1)
+        pqa_array[clear & ~eroded] &= ~numpy.uint16(1 << bit)
+
+    mask = numpy.zeros(pqa_array.shape, dtype=numpy.bool_)
+    for good_pixel_mask in good_pixel_masks:
+        mask |= pqa_array == good_pixel_mask
+
+    return mask
+
+
+class TestPqaMask(unittest.TestCase):
+    """Unit tests for the PQA mask dilation."""
+
+    MODULE = 'pqa_mask'
+    SUITE = 'TestPqaMask'
+
+    GOOD_PIXEL_MASKS = [32767, 16383, 2457]
+
+    @staticmethod
+    def make_pqa(shape=(101, 67), seed=0):
+        """Return a PQA array of mostly good pixels with scattered cloud,
+        cloud shadow and non-contiguous pixels."""
+
+        random = numpy.random.RandomState(seed)
+        pqa_array = numpy.full(shape, 16383, dtype=numpy.int16)
+        for bit in range(10, 14):
+            pqa_array[random.rand(*shape) < 0.01] &= ~(1 << bit)
+        pqa_array[random.rand(*shape) < 0.05] = 16383 - 256
+        return pqa_array
+
+    def test_compute_pqa_mask(self):
+        """Test the mask is that of eroding each bit separately."""
+
+        pqa_array = self.make_pqa()
+
+        for dilation in (0, 1, 3):
+            self.assertTrue(numpy.array_equal(
+                pqa_mask.compute_pqa_mask(pqa_array, self.GOOD_PIXEL_MASKS,
+                                          dilation),
+                reference_pqa_mask(pqa_array, self.GOOD_PIXEL_MASKS,
+                                   dilation)))
+
+    def test_compute_pqa_mask_blocks(self):
+        """Test blocks with a halo give the same mask as the whole array."""
+
+        pqa_array = self.make_pqa()
+        dilation = 3
+        expected = pqa_mask.compute_pqa_mask(pqa_array, self.GOOD_PIXEL_MASKS,
+                                             dilation)
+
+        y_size = pqa_array.shape[0]
+        for y_offset in range(0, y_size, 16):
+            rows = min(16, y_size - y_offset)
+            halo_top = min(dilation, y_offset)
+            halo_bottom = min(dilation, y_size - y_offset - rows)
+            block = pqa_array[y_offset - halo_top:
+                              y_offset + rows + halo_bottom]
+
+            self.assertTrue(numpy.array_equal(
+                pqa_mask.compute_pqa_mask(block, self.GOOD_PIXEL_MASKS,
+                                          dilation, (halo_top, halo_bottom)),
+                expected[y_offset:y_offset + rows]))
+
+#
+# Test suite
+#
+
+
+def the_suite():
+    """Returns a test suite of all the tests in this module."""
+
+    test_classes = [TestPqaMask]
+
+    suite_list = map(unittest.defaultTestLoader.loadTestsFromTestCase,
+                     test_classes)
+
+    suite = unittest.TestSuite(suite_list)
+
+    return suite
+
+#
+# Run unit tests if in __main__
+#
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(the_suite())
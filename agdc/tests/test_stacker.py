@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""Tests for the stacker.py module."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import agdc.stacker as stacker_module
+from agdc.lock_manager import LockManager
+from agdc.stacker import Stacker
+
+#
+# Fake database connection
+#
+
+
+class FakeCursor(object):
+    """Cursor recording the executed query and returning the given records."""
+
+    def __init__(self, records):
+        self.records = records
+        self.sql = None
+        self.params = None
+
+    def mogrify(self, sql, params):
+        return sql
+
+    def execute(self, sql, params):
+        self.sql = sql
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class FakeConnection(object):
+    """Connection handing out a single FakeCursor."""
+
+    def __init__(self, records=(), name='parent'):
+        self.fake_cursor = FakeCursor(list(records))
+        self.name = name
+
+    def cursor(self):
+        return self.fake_cursor
+
+
+def make_record(x_index, y_index, start_datetime, level_name):
+    """Returns a row of the get_cell_stack_info query for a tile."""
+
+    return (1, x_index, y_index,
+            start_datetime, start_datetime,
+            'LS7', 'ETM+',
+            '/tiles/%s_%d_%d_%s.tif' % (level_name, x_index, y_index,
+                                        start_datetime.strftime('%Y%m%d')),
+            92, 84, 84,
+            level_name,
+            -999, 100, 0.0)
+
+#
+# Stacker deriving datasets without a database
+#
+
+
+class FakeLockManager(object):
+    """Lock manager with a named lock connection."""
+
+    def __init__(self):
+        self.lock_connection = FakeConnection(name='parent lock')
+
+
+class DerivingStacker(Stacker):
+    """Stacker whose derived datasets record where they were derived.
+
+    Later timeslices are derived faster, so that the worker processes
+    finish them out of order.
+    """
+
+    def __init__(self, timeslice_count):
+        # pylint: disable=super-init-not-called
+        self.timeslice_count = timeslice_count
+        self.db_connection = FakeConnection()
+        self.lock_manager = FakeLockManager()
+        self.default_tile_type_id = 1
+        self.tile_type_dict = {1: {}}
+        self.processes = 1
+        self.refresh = False
+
+    def create_connection(self, autocommit=True):
+        return FakeConnection(name='worker %d' % os.getpid())
+
+    def get_static_info(self, level_name=None, x_index=None, y_index=None,
+                        tile_type_id=None):
+        return {}
+
+    def derive_datasets(self, input_dataset_dict, stack_output_info,
+                        tile_type_info):
+        timeslice_info = input_dataset_dict['NBAR']
+        time.sleep(0.05 * (self.timeslice_count - timeslice_info['index']))
+
+        return {'/stacks/NDVI.vrt': {'index': timeslice_info['index'],
+                                     'pid': os.getpid(),
+                                     'db_connection': self.db_connection.name}}
+
+
+def get_worker_state(_):
+    """Returns the state of the stacker of a worker process."""
+
+    worker_stacker = stacker_module._worker_stacker  # pylint: disable=protected-access
+    return {'pid': os.getpid(),
+            'db_connection': worker_stacker.db_connection.name,
+            'lock_manager': isinstance(worker_stacker.lock_manager, LockManager),
+            'lock_datacube': worker_stacker.lock_manager.datacube is worker_stacker,
+            'lock_connection': worker_stacker.lock_manager.lock_connection,
+            'inherited_connections': [connection.name for connection in
+                                      stacker_module._inherited_connections]}  # pylint: disable=protected-access
+
+#
+# Test cases
+#
+
+# pylint: disable=too-many-public-methods
+#
+# Disabled to avoid complaints about the unittest.TestCase class.
+#
+
+
+class TestStacker(unittest.TestCase):
+    """Unit tests for the Stacker's tile queries."""
+
+    MODULE = 'stacker'
+    SUITE = 'TestStacker'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def make_stacker(records=()):
+        """Returns a Stacker querying a FakeConnection (without reading a
+        config file or connecting to a database)."""
+
+        stacker = Stacker.__new__(Stacker)
+        stacker.db_connection = FakeConnection(records)
+        stacker.default_tile_type_id = 1
+
+        return stacker
+
+    def test_find_missing_files(self):
+        """Test only the pathnames of files which don't exist are returned."""
+
+        existing_pathname = os.path.join(self.temp_dir, 'a.tif')
+        open(existing_pathname, 'w').close()
+
+        missing_pathname = os.path.join(self.temp_dir, 'b.tif')
+        missing_dir_pathname = os.path.join(self.temp_dir, 'missing', 'c.tif')
+
+        self.assertEqual(
+            Stacker.find_missing_files([missing_dir_pathname,
+                                        existing_pathname,
+                                        missing_pathname]),
+            sorted([missing_pathname, missing_dir_pathname]))
+
+        self.assertEqual(Stacker.find_missing_files([existing_pathname]), [])
+        self.assertEqual(Stacker.find_missing_files([]), [])
+
+    def test_date_range_sql(self):
+        """Test there is one parameterised predicate per date range."""
+
+        date_ranges = [(datetime(2000, 1, 1), datetime(2001, 1, 1)),
+                       (None, datetime(1995, 1, 1))]
+
+        stacker = self.make_stacker()
+        stacker.get_cell_stack_info(cells=[[150, -25], [151, -25]],
+                                    date_ranges=date_ranges,
+                                    check_files=False)
+        cursor = stacker.db_connection.fake_cursor
+
+        for range_index, (start_datetime, end_datetime) in \
+                enumerate(date_ranges):
+            self.assertEqual(
+                cursor.params['start_datetime_%d' % range_index],
+                start_datetime)
+            self.assertEqual(cursor.params['end_datetime_%d' % range_index],
+                             end_datetime)
+            self.assertTrue(
+                ('((%%(start_datetime_%d)s is null or '
+                 'start_datetime >= %%(start_datetime_%d)s)' %
+                 (range_index, range_index)) in cursor.sql)
+            self.assertTrue(
+                ('(%%(end_datetime_%d)s is null or '
+                 'end_datetime < %%(end_datetime_%d)s))' %
+                 (range_index, range_index)) in cursor.sql)
+
+        self.assertFalse('start_datetime_2' in cursor.params)
+        self.assertEqual(cursor.sql.count('start_datetime >='), 2)
+        self.assertEqual(cursor.params['tile_indices'],
+                         ((150, -25), (151, -25)))
+        self.assertTrue('(x_index, y_index) in %(tile_indices)s' in cursor.sql)
+        self.assertFalse('%(satellites)s' in cursor.sql)
+
+    def test_open_date_range_sql(self):
+        """Test no date range gives a single open ended range."""
+
+        stacker = self.make_stacker()
+        stacker.get_cell_stack_info(check_files=False)
+        cursor = stacker.db_connection.fake_cursor
+
+        self.assertEqual(cursor.params['start_datetime_0'], None)
+        self.assertEqual(cursor.params['end_datetime_0'], None)
+        self.assertFalse('start_datetime_1' in cursor.params)
+        self.assertFalse('%(tile_indices)s' in cursor.sql)
+
+    def test_cell_stack_info(self):
+        """Test the tiles are grouped by cell, timeslice and level."""
+
+        first_datetime = datetime(2000, 1, 1)
+        second_datetime = datetime(2000, 1, 17)
+        records = [make_record(150, -25, first_datetime, 'NBAR'),
+                   make_record(150, -25, first_datetime, 'PQA'),
+                   make_record(150, -25, second_datetime, 'NBAR'),
+                   make_record(151, -25, first_datetime, 'NBAR')]
+
+        cell_stack_info_dict = self.make_stacker(records).get_cell_stack_info(
+            levels=['NBAR', 'PQA'], check_files=False)
+
+        self.assertEqual(sorted(cell_stack_info_dict.keys()),
+                         [(1, 150, -25), (1, 151, -25)])
+        self.assertEqual(cell_stack_info_dict[(1, 151, -25)], {})
+
+        stack_info_dict = cell_stack_info_dict[(1, 150, -25)]
+        self.assertEqual(stack_info_dict.keys(), [first_datetime])
+        self.assertEqual(sorted(stack_info_dict[first_datetime].keys()),
+                         ['NBAR', 'PQA'])
+
+    def test_stack_tile_first_tile_wins(self):
+        """Test the first cell's tile of each timeslice and level is kept
+        when stacking without a cell."""
+
+        first_datetime = datetime(2000, 1, 1)
+        second_datetime = datetime(2000, 1, 17)
+        records = [make_record(151, -25, first_datetime, 'NBAR'),
+                   make_record(151, -25, first_datetime, 'PQA'),
+                   make_record(150, -25, first_datetime, 'NBAR'),
+                   make_record(150, -25, second_datetime, 'NBAR')]
+
+        stack_info_dict = self.make_stacker(records).stack_tile(
+            None, None, create_band_stacks=False, check_files=False)
+
+        self.assertEqual(sorted(stack_info_dict.keys()),
+                         [first_datetime, second_datetime])
+
+        timeslice_dict = stack_info_dict[first_datetime]
+        self.assertEqual(sorted(timeslice_dict.keys()), ['NBAR', 'PQA'])
+        self.assertEqual(timeslice_dict['NBAR']['x_index'], 150)
+        self.assertEqual(timeslice_dict['PQA']['x_index'], 151)
+
+        self.assertEqual(stack_info_dict[second_datetime]['NBAR']['x_index'],
+                         150)
+
+
+
+class TestStackDerived(unittest.TestCase):
+    """Unit tests for deriving datasets in worker processes."""
+
+    MODULE = 'stacker'
+    SUITE = 'TestStackDerived'
+
+    TIMESLICE_COUNT = 6
+
+    def make_stack_info_dict(self):
+        """Returns a stack info dict of TIMESLICE_COUNT timeslices."""
+
+        first_datetime = datetime(2000, 1, 1)
+        return {first_datetime + timedelta(days=16 * index):
+                {'NBAR': {'index': index}}
+                for index in range(self.TIMESLICE_COUNT)}
+
+    def test_stack_derived_order(self):
+        """Test the derived datasets are stacked in timeslice order when
+        derived by worker processes."""
+
+        stacker = DerivingStacker(self.TIMESLICE_COUNT)
+        derived_stack_dict = stacker.stack_derived(
+            150, -25, '/stacks', create_stacks=False,
+            stack_info_dict=self.make_stack_info_dict(), processes=2)
+
+        timeslice_info_list = derived_stack_dict['/stacks/NDVI.vrt']
+        self.assertEqual([timeslice_info['index']
+                          for timeslice_info in timeslice_info_list],
+                         range(self.TIMESLICE_COUNT))
+
+        for timeslice_info in timeslice_info_list:
+            self.assertNotEqual(timeslice_info['pid'], os.getpid())
+            self.assertEqual(timeslice_info['db_connection'],
+                             'worker %d' % timeslice_info['pid'])
+
+        # The parent's state is unchanged
+        self.assertEqual(stacker.db_connection.name, 'parent')
+        self.assertEqual(type(stacker.lock_manager), FakeLockManager)
+
+    def test_stack_derived_single_process(self):
+        """Test the derived datasets are the same without a pool."""
+
+        stacker = DerivingStacker(self.TIMESLICE_COUNT)
+        derived_stack_dict = stacker.stack_derived(
+            150, -25, '/stacks', create_stacks=False,
+            stack_info_dict=self.make_stack_info_dict())
+
+        timeslice_info_list = derived_stack_dict['/stacks/NDVI.vrt']
+        self.assertEqual([timeslice_info['index']
+                          for timeslice_info in timeslice_info_list],
+                         range(self.TIMESLICE_COUNT))
+        self.assertEqual(set(timeslice_info['db_connection']
+                             for timeslice_info in timeslice_info_list),
+                         set(['parent']))
+
+    def test_init_stacker_worker(self):
+        """Test a worker's stacker has its own database and lock
+        connections and keeps the inherited ones."""
+
+        stacker = DerivingStacker(self.TIMESLICE_COUNT)
+
+        pool = Pool(1, stacker_module._init_stacker_worker,  # pylint: disable=protected-access
+                    (stacker,))
+        try:
+            worker_state = pool.map(get_worker_state, [None])[0]
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertNotEqual(worker_state['pid'], os.getpid())
+        self.assertEqual(worker_state['db_connection'],
+                         'worker %d' % worker_state['pid'])
+        self.assertTrue(worker_state['lock_manager'])
+        self.assertTrue(worker_state['lock_datacube'])
+        # The lock connection is opened when the first lock is taken
+        self.assertTrue(worker_state['lock_connection'] is None)
+        self.assertEqual(worker_state['inherited_connections'],
+                         ['parent', 'parent lock'])
+
+        # The parent's state is unchanged
+        self.assertEqual(stacker.db_connection.name, 'parent')
+        self.assertEqual(type(stacker.lock_manager), FakeLockManager)
+
+#
+# Test suite
+#
+
+
+def the_suite():
+    """Returns a test suite of all the tests in this module."""
+
+    test_classes = [TestStacker, TestStackDerived]
+
+    suite_list = map(unittest.defaultTestLoader.loadTestsFromTestCase,
+                     test_classes)
+
+    suite = unittest.TestSuite(suite_list)
+
+    return suite
+
+#
+# Run unit tests if in __main__
+#
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(the_suite())
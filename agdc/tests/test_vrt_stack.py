@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""Tests for the vrt_stack.py module."""
+
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import agdc.vrt_stack as vrt_stack
+
+#
+# Test cases
+#
+
+# pylint: disable=too-many-public-methods
+#
+# Disabled to avoid complaints about the unittest.TestCase class.
+#
+
+
+class TestVrtStack(unittest.TestCase):
+    """Unit tests for the VRT stack generator."""
+
+    MODULE = 'vrt_stack'
+    SUITE = 'TestVrtStack'
+
+    TILE_TYPE_INFO = {'crs': 'EPSG:4326',
+                      'x_origin': 0.0,
+                      'y_origin': 0.0,
+                      'x_size': 1.0,
+                      'y_size': 1.0,
+                      'x_pixels': 4000,
+                      'y_pixels': 4000,
+                      'x_pixel_size': 0.00025,
+                      'y_pixel_size': 0.00025}
+
+    def test_get_stack_geometry(self):
+        """Test the geotransform is that of the top left of the cell."""
+
+        geometry = vrt_stack.get_stack_geometry(self.TILE_TYPE_INFO, 150, -25)
+
+        self.assertEqual(geometry['geotransform'],
+                         (150.0, 0.00025, 0.0, -24.0, 0.0, -0.00025))
+        self.assertEqual((geometry['x_pixels'], geometry['y_pixels']),
+                         (4000, 4000))
+
+    def test_make_stack_vrt(self):
+        """Test a stack has one band per timeslice from the right source band."""
+
+        geometry = {'x_pixels': 4000,
+                    'y_pixels': 4000,
+                    'geotransform': (150.0, 0.00025, 0.0, -24.0, 0.0, -0.00025),
+                    'projection': 'WKT'}
+        source_properties = {'data_type': 'Int16', 'block_size': (4000, 1)}
+        timeslice_info_list = [{'tile_pathname': '/tiles/a.tif',
+                                'tile_layer': 3,
+                                'nodata_value': -999,
+                                'level_name': 'NBAR'},
+                               {'tile_pathname': '/tiles/b & c.tif',
+                                'tile_layer': 3,
+                                'nodata_value': None,
+                                'level_name': 'NBAR'}]
+
+        vrt = ElementTree.fromstring(vrt_stack.make_stack_vrt(
+            timeslice_info_list, geometry, source_properties))
+
+        bands = vrt.findall('VRTRasterBand')
+        self.assertEqual(len(bands), 2)
+        self.assertEqual([band.get('band') for band in bands], ['1', '2'])
+
+        self.assertEqual(bands[0].find('NoDataValue').text, '-999')
+        self.assertEqual(bands[0].find('ComplexSource/NODATA').text, '-999')
+        self.assertEqual(bands[0].find('ComplexSource/SourceBand').text, '3')
+        self.assertEqual(
+            bands[0].find("Metadata/MDI[@key='level_name']").text, 'NBAR')
+
+        self.assertTrue(bands[1].find('NoDataValue') is None)
+        self.assertEqual(bands[1].find('SimpleSource/SourceFilename').text,
+                         '/tiles/b & c.tif')
+        self.assertEqual(
+            bands[1].find('SimpleSource/SourceProperties').get('DataType'),
+            'Int16')
+
+#
+# Test suite
+#
+
+
+def the_suite():
+    """Returns a test suite of all the tests in this module."""
+
+    test_classes = [TestVrtStack]
+
+    suite_list = map(unittest.defaultTestLoader.loadTestsFromTestCase,
+                     test_classes)
+
+    suite = unittest.TestSuite(suite_list)
+
+    return suite
+
+#
+# Run unit tests if in __main__
+#
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(the_suite())
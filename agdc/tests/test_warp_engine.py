@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+#===============================================================================
+# Copyright 2015 Geoscience Australia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#===============================================================================
+
+"""Tests that the in-process warp engine of tile_contents.py gives the same
+tiles as the gdalwarp subprocess."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+import numpy
+from osgeo import gdal, osr
+
+import agdc.abstract_ingester.tile_contents as tile_contents
+
+#
+# Synthetic band stack
+#
+
+
+class FakeBandStack(object):
+    """The parts of a band stack used by the warp engines."""
+
+    def __init__(self, vrt_name, nodata_value):
+        self.vrt_name = vrt_name
+        self.nodata_list = [nodata_value]
+        self.band_dict = {1: {'resampling_method': 'near',
+                              'tile_layer': 1,
+                              'nodata_value': nodata_value}}
+
+
+def create_source(path, nodata_value):
+    """Write a small UTM zone 56S Int16 GeoTIFF which partly covers the
+    (150, -25) cell, with some no data pixels."""
+
+    random = numpy.random.RandomState(0)
+
+    data = random.randint(0, 10000, size=(300, 300)).astype(numpy.int16)
+    data[random.rand(300, 300) < 0.05] = nodata_value
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32756)
+
+    dataset = gdal.GetDriverByName('GTiff').Create(path, 300, 300, 1,
+                                                   gdal.GDT_Int16)
+    dataset.SetGeoTransform((246000.0, 100.0, 0.0, 7290000.0, 0.0, -100.0))
+    dataset.SetProjection(srs.ExportToWkt())
+
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(nodata_value)
+    band.WriteArray(data)
+
+    dataset.FlushCache()
+    del dataset
+
+#
+# Test cases
+#
+
+# pylint: disable=too-many-public-methods
+#
+# Disabled to avoid complaints about the unittest.TestCase class.
+#
+
+
+class TestWarpEngine(unittest.TestCase):
+    """Compare the tiles made by the two warp engines."""
+
+    MODULE = 'tile_contents'
+    SUITE = 'TestWarpEngine'
+
+    NODATA_VALUE = -999
+    TILE_FOOTPRINT = (150, -25)
+
+    TILE_TYPE_INFO = {'tile_type_id': 1,
+                      'crs': 'EPSG:4326',
+                      'x_origin': 0.0,
+                      'y_origin': 0.0,
+                      'x_size': 1.0,
+                      'y_size': 1.0,
+                      'x_pixel_size': 0.01,
+                      'y_pixel_size': 0.01,
+                      'file_format': 'GTiff',
+                      'file_extension': '.tif',
+                      'format_options': 'COMPRESS=LZW,TILED=YES'}
+
+    def setUp(self):
+        if not find_executable('gdalwarp'):
+            self.skipTest('gdalwarp not found')
+
+        self.temp_dir = tempfile.mkdtemp()
+
+        # Only the cells in tile_contents.CellSet are tiled
+        self.added_cell = self.TILE_FOOTPRINT not in tile_contents.CellSet
+        tile_contents.CellSet.add(self.TILE_FOOTPRINT)
+
+        source_path = os.path.join(self.temp_dir, 'source.tif')
+        create_source(source_path, self.NODATA_VALUE)
+        self.band_stack = FakeBandStack(source_path, self.NODATA_VALUE)
+
+    def tearDown(self):
+        tile_contents.release_warp_source(self.band_stack)
+
+        if self.added_cell:
+            tile_contents.CellSet.discard(self.TILE_FOOTPRINT)
+
+        shutil.rmtree(self.temp_dir)
+
+    def check_same_tile(self, path, expected_path):
+        """Assert two tiles have the same pixels, georeferencing and no data
+        value."""
+
+        dataset = gdal.Open(path)
+        expected_dataset = gdal.Open(expected_path)
+
+        self.assertEqual(dataset.RasterCount, expected_dataset.RasterCount)
+        self.assertEqual((dataset.RasterXSize, dataset.RasterYSize),
+                         (expected_dataset.RasterXSize,
+                          expected_dataset.RasterYSize))
+        self.assertEqual(dataset.GetGeoTransform(),
+                         expected_dataset.GetGeoTransform())
+        self.assertEqual(dataset.GetProjection(),
+                         expected_dataset.GetProjection())
+
+        for band_no in range(1, dataset.RasterCount + 1):
+            band = dataset.GetRasterBand(band_no)
+            expected_band = expected_dataset.GetRasterBand(band_no)
+
+            self.assertEqual(band.DataType, expected_band.DataType)
+            self.assertEqual(band.GetNoDataValue(),
+                             expected_band.GetNoDataValue())
+            self.assertTrue(numpy.array_equal(band.ReadAsArray(),
+                                              expected_band.ReadAsArray()))
+
+    def test_same_tile(self):
+        """Test the in-process warp gives the same tile as gdalwarp."""
+
+        gdalwarp_path = os.path.join(self.temp_dir, 'gdalwarp.tif')
+        gdal_path = os.path.join(self.temp_dir, 'gdal.tif')
+
+        self.assertTrue(tile_contents._reproject(  # pylint: disable=protected-access
+            self.TILE_TYPE_INFO, self.TILE_FOOTPRINT, self.band_stack,
+            gdalwarp_path) is not None)
+        self.assertTrue(tile_contents._reproject_in_process(  # pylint: disable=protected-access
+            self.TILE_TYPE_INFO, self.TILE_FOOTPRINT, self.band_stack,
+            gdal_path) is not None)
+
+        self.check_same_tile(gdal_path, gdalwarp_path)
+
+        # The tile is of the cell, and only partly covered by the source
+        dataset = gdal.Open(gdal_path)
+        self.assertEqual((dataset.RasterXSize, dataset.RasterYSize),
+                         (100, 100))
+        self.assertEqual(dataset.GetRasterBand(1).GetNoDataValue(),
+                         self.NODATA_VALUE)
+
+        data = dataset.GetRasterBand(1).ReadAsArray()
+        self.assertTrue((data == self.NODATA_VALUE).any())
+        self.assertTrue((data != self.NODATA_VALUE).any())
+
+    def test_same_tile_reused_source(self):
+        """Test a second in-process warp from the shared source handle
+        (overwriting the tile) gives the same tile as gdalwarp."""
+
+        gdalwarp_path = os.path.join(self.temp_dir, 'gdalwarp.tif')
+        gdal_path = os.path.join(self.temp_dir, 'gdal.tif')
+
+        tile_contents._reproject(  # pylint: disable=protected-access
+            self.TILE_TYPE_INFO, self.TILE_FOOTPRINT, self.band_stack,
+            gdalwarp_path)
+
+        for _ in range(2):
+            tile_contents._reproject_in_process(  # pylint: disable=protected-access
+                self.TILE_TYPE_INFO, self.TILE_FOOTPRINT, self.band_stack,
+                gdal_path)
+
+        self.check_same_tile(gdal_path, gdalwarp_path)
+
+#
+# Test suite
+#
+
+
+def the_suite():
+    """Returns a test suite of all the tests in this module."""
+
+    test_classes = [TestWarpEngine]
+
+    suite_list = map(unittest.defaultTestLoader.loadTestsFromTestCase,
+                     test_classes)
+
+    suite = unittest.TestSuite(suite_list)
+
+    return suite
+
+#
+# Run unit tests if in __main__
+#
+
+if __name__ == '__main__':
+    unittest.TextTestRunner(verbosity=2).run(the_suite())
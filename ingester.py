@@ -12,9 +12,16 @@ Faster ingester
 import psutil
 
 import argparse
-from multiprocessing import Process
+from multiprocessing import Process, Pool
 import re
 import os
+import shutil
+import subprocess
+
+# Ingester script for each instrument (as used by ingest_dir.sh)
+INGESTER_SCRIPTS = {'ls5': 'ls5_ingester.sh',
+                    'ls7': 'generic_ingester.sh',
+                    'ls8': 'ls8_ingester.sh'}
 
 def ingest_file(can_del=False,file_paths=[],tmp_dir='/tmp/',instrument='ls7'):
     
@@ -41,6 +48,42 @@ def ingest_file(can_del=False,file_paths=[],tmp_dir='/tmp/',instrument='ls7'):
             os.system('rm -rf '+dname)
     
 
+def build_archive_pqa(args):
+    """
+    Build the PQA file for an archive, reading the masks in place (no untar)
+    """
+    (file_path, pqa_dir, instrument) = args
+    from agdc.abstract_ingester.dataset_source import ArchiveSource, get_scene_id
+    from agdc.pqa_builder import build_pqa
+    from agdc.cube_util import DatasetError
+    source = ArchiveSource(file_path)
+    sid = get_scene_id(source.list_files())
+    try:
+        return build_pqa(source.vsi_path+'/'+sid, pqa_dir, instrument)
+    except DatasetError as e:
+        print e
+
+def stream_ingest(can_del=False,file_paths=[],tmp_dir='/tmp/',instrument='ls7',workers=1):
+    """
+    Ingest tar balls in place through GDAL's /vsitar/ file system.
+    Only the PQA files are written to tmp_dir; the ingester's own scheduler
+    runs the datasets concurrently.
+    """
+    pqa_dir = os.path.join(tmp_dir,'pqa')
+    if not os.path.isdir(pqa_dir):
+        os.makedirs(pqa_dir)
+    pool = Pool(workers)
+    pool.map(build_archive_pqa,[(file_path,pqa_dir,instrument) for file_path in file_paths])
+    pool.close()
+    pool.join()
+    subprocess.call(['bash',INGESTER_SCRIPTS[instrument],
+                     '--archive',
+                     '--source',','.join(file_paths),
+                     '--pqadir',pqa_dir,
+                     '--ingestworkers',str(workers)])
+    if can_del:
+        shutil.rmtree(pqa_dir,ignore_errors=True)
+
 if __name__ == '__main__':
     threads = []
     thread_library = []
@@ -49,6 +92,7 @@ if __name__ == '__main__':
     parser.add_argument("-d","--dir",required=True,type=str,help="Directory containing level 2 sr products")
     parser.add_argument("-t","--tmp",required=True,type=str,help="Directory to work in")
     parser.add_argument("-y","--yes",required=False,action="store_true",help="Yes to prompts (auto delete archive contents)")
+    parser.add_argument("-s","--stream",required=False,action="store_true",help="Read archives in place instead of untarring them to the tmp directory")
     args = parser.parse_args()
     cpuc = psutil.cpu_count() #number of threads
     #max_threads = int(cpuc/2)
@@ -57,6 +101,10 @@ if __name__ == '__main__':
         max_threads = 1
     files = [os.path.abspath(os.path.join(args.dir,f)) for f in os.listdir(args.dir) if os.path.isfile(os.path.join(args.dir,f))]
     
+    if args.stream:
+        stream_ingest(args.yes,files,os.path.abspath(args.tmp),args.instrument,max_threads)
+        raise SystemExit(0)
+
     count = 0
     for i in range(max_threads):
         thread_library.append([])